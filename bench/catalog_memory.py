@@ -0,0 +1,191 @@
+# bench/catalog_memory.py
+
+"""
+Peak memory of loading the NOAA station catalog: the streaming decoder the app uses
+now against the previous whole-document path (response.json(), a list of station
+tuples, then the store built from Python lists).
+
+    # against the stub's synthetic catalog at a few sizes
+    python bench/catalog_memory.py --stations 3000,30000,100000
+
+    # against the live NOAA API
+    python bench/catalog_memory.py --live
+
+Each implementation runs in a fresh process per catalog size, so one run's garbage
+can't hide another's peak. Reported per run: peak RSS growth over the process's RSS
+before the fetch, peak traced Python allocations (a separate tracemalloc run, since
+tracing itself costs memory), the size of the finished store's arrays, and wall time.
+Results are also written to bench/results/ as JSON.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(BENCH_DIR), "my_tide_app")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+RESULT_SCHEMA_VERSION = 1
+
+sys.path.insert(0, BENCH_DIR)
+from run_benchmark import StubProcess, _git_revision # noqa: E402
+from stub_server import app_environment # noqa: E402
+
+IMPLEMENTATIONS = ("streaming", "legacy")
+
+
+# --- The previous implementation, kept here as the baseline ---
+
+def legacy_fetch(url):
+    import numpy as np
+    import requests
+    from station_store import StationStore
+
+    stations_data = requests.get(url, timeout=60).json()
+    station_records = []
+    for station in stations_data['stations']:
+        active = station.get('active')
+        if (active is True or active is None) and station.get('lat') is not None and station.get('lng') is not None:
+            station_records.append((station['id'], station['name'], station['lat'], station['lng']))
+
+    ids, names, lats, lons = [], [], [], []
+    for station_id, name, lat, lon in station_records:
+        ids.append(str(station_id).encode("ascii"))
+        names.append(str(name).encode("utf-8"))
+        lats.append(lat)
+        lons.append(lon)
+    name_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    np.cumsum([len(n) for n in names], out=name_offsets[1:])
+    id_width = max((len(i) for i in ids), default=1)
+    return StationStore(
+        ids=np.array(ids, dtype=f"S{id_width}"),
+        lat=np.array(lats, dtype=np.float64),
+        lon=np.array(lons, dtype=np.float64),
+        name_offsets=name_offsets,
+        names=np.frombuffer(b"".join(names), dtype=np.uint8),
+    )
+
+
+def streaming_fetch(url):
+    from services import geocoding
+    return geocoding._fetch_noaa_tide_stations()
+
+
+# --- Measuring (in a child process) ---
+
+def _current_rss_kb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError: # Not Linux; the lifetime peak is the best there is
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(implementation, url, trace):
+    """Loads the catalog once and returns this process's measurements."""
+    sys.path.insert(0, APP_DIR)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        import numpy # noqa: F401  (imported up front so it isn't counted)
+        import requests # noqa: F401
+        from services import geocoding # noqa: F401
+    fetch = streaming_fetch if implementation == "streaming" else legacy_fetch
+
+    if trace:
+        import tracemalloc
+        tracemalloc.start()
+    rss_before = _current_rss_kb()
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        store = fetch(url)
+    seconds = time.perf_counter() - start
+    result = {"stations": len(store), "seconds": seconds,
+              "store_kb": sum(a.nbytes for a in (store.ids, store.lat, store.lon, store.name_offsets, store.names)) / 1024}
+    if trace:
+        result["traced_peak_kb"] = tracemalloc.get_traced_memory()[1] / 1024
+    else:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss # KB on Linux
+        result["rss_growth_kb"] = max(0, peak - rss_before)
+    return result
+
+
+def run_child(implementation, url, trace):
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", implementation, "--url", url]
+    if trace:
+        cmd.append("--trace")
+    output = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory of loading the NOAA station catalog.")
+    parser.add_argument("--stations", default="3000,30000,100000",
+                        help="Comma-separated synthetic catalog sizes (stub only)")
+    parser.add_argument("--live", action="store_true", help="Use the real NOAA catalog instead of the stub")
+    parser.add_argument("--output", help="Result file path (default: bench/results/<timestamp>-<rev>-catalog-memory.json)")
+    parser.add_argument("--child", choices=IMPLEMENTATIONS, help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    parser.add_argument("--trace", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        os.environ["NOAA_STATIONS_URL"] = args.url
+        print(json.dumps(measure(args.child, args.url, args.trace)))
+        return
+
+    stub = None
+    sizes = [None] if args.live else [int(s) for s in args.stations.split(",") if s.strip()]
+    if not args.live:
+        stub = StubProcess(SimpleNamespace(stations=sizes[0], latency=None, error_rate=None,
+                                           timeout_rate=None, strict=False))
+        os.environ.update(app_environment(stub.base_url))
+    url = os.environ.get("NOAA_STATIONS_URL",
+                         "https://api.tidesandcurrents.noaa.gov/mdapi/prod/webapi/stations.json?type=tidepredictions")
+
+    results = []
+    try:
+        import requests
+        for size in sizes:
+            if stub is not None:
+                requests.post(f"{stub.base_url}/_stub/config", json={"station_count": size}, timeout=5)
+                requests.get(url, timeout=120) # Let the stub synthesize the catalog before timing anything
+            row = {"catalog_size": size}
+            for implementation in IMPLEMENTATIONS:
+                measured = run_child(implementation, url, trace=False)
+                measured["traced_peak_kb"] = run_child(implementation, url, trace=True)["traced_peak_kb"]
+                row[implementation] = measured
+                print(f"{size or 'live':>7} {implementation:>9}: {measured['stations']} stations, "
+                      f"peak RSS +{measured['rss_growth_kb'] / 1024:.1f} MB, "
+                      f"traced peak {measured['traced_peak_kb'] / 1024:.1f} MB, "
+                      f"store {measured['store_kb'] / 1024:.2f} MB, {measured['seconds']:.2f}s")
+            results.append(row)
+    finally:
+        if stub is not None:
+            stub.stop()
+
+    report = {
+        "schema_version": RESULT_SCHEMA_VERSION,
+        "kind": "catalog_memory",
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_revision": _git_revision(),
+        "source": "live" if args.live else "stub",
+        "results": results,
+    }
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{report['git_revision']}-catalog-memory.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
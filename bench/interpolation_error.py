@@ -0,0 +1,144 @@
+# bench/interpolation_error.py
+
+"""
+Accuracy of services.noaa.interpolate_tide_heights() against NOAA's own 6-minute
+predictions: hourly and high/low predictions are interpolated onto the 6-minute
+timestamps and compared with the real thing.
+
+    # against the stub (recorded fixtures where present, synthetic curves otherwise)
+    python bench/interpolation_error.py
+
+    # recorded fixtures only; stations without recordings are reported as failures
+    python bench/interpolation_error.py --strict --stations 8571858,8638610
+
+    # against the live NOAA API
+    python bench/interpolation_error.py --live --stations 8571858,9414290,1612340
+
+Prints MAE / RMSE / p95 / max absolute error in feet per station and method, and
+writes the same to bench/results/ as JSON.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(BENCH_DIR), "my_tide_app")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+RESULT_SCHEMA_VERSION = 1
+
+sys.path.insert(0, BENCH_DIR)
+from run_benchmark import StubProcess, _git_revision # noqa: E402
+from stub_server import app_environment # noqa: E402
+
+METHODS = ("spline", "cosine", "auto")
+
+
+def error_stats(estimate, truth):
+    errors = np.abs(estimate - truth)
+    errors = errors[~np.isnan(errors)]
+    if not len(errors):
+        return {"samples": 0}
+    return {
+        "samples": int(len(errors)),
+        "mae_ft": float(errors.mean()),
+        "rmse_ft": float(np.sqrt((errors ** 2).mean())),
+        "p95_ft": float(np.percentile(errors, 95)),
+        "max_ft": float(errors.max()),
+    }
+
+
+def evaluate_station(noaa, station_id, begin_date, end_date):
+    """Fetches the three prediction products for one station and scores each method."""
+    fetched = {
+        interval: noaa.get_tide_data(station_id, begin_date, end_date, product="predictions",
+                                     datum="MLLW", time_zone="gmt", interval=interval)
+        for interval in ("6", "h", "hilo")
+    }
+    missing = [interval for interval, df in fetched.items() if df is None or df.empty]
+    if missing:
+        return {"station_id": station_id, "error": f"no predictions for interval(s) {', '.join(missing)}"}
+
+    truth_df = fetched["6"]
+    truth = truth_df['height_ft'].to_numpy(dtype=np.float64)
+    results = {"station_id": station_id, "methods": {}}
+    for method in METHODS:
+        start = time.perf_counter()
+        estimate = noaa.interpolate_tide_heights(truth_df['datetime'], hilo_df=fetched["hilo"],
+                                                 hourly_df=fetched["h"], method=method)
+        stats = error_stats(estimate, truth)
+        stats["eval_ms"] = (time.perf_counter() - start) * 1000.0
+        results["methods"][method] = stats
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score tide interpolation against 6-minute predictions.")
+    parser.add_argument("--stations", default="8571858,8000017,8000025,8000033",
+                        help="Comma-separated NOAA station IDs")
+    parser.add_argument("--days", type=int, default=3, help="Days of predictions to compare")
+    parser.add_argument("--live", action="store_true", help="Use the real NOAA API instead of the stub")
+    parser.add_argument("--strict", action="store_true", help="Stub serves recorded fixtures only")
+    parser.add_argument("--output", help="Result file path (default: bench/results/<timestamp>-<rev>-interpolation.json)")
+    args = parser.parse_args()
+
+    stub = None
+    if not args.live:
+        stub = StubProcess(SimpleNamespace(stations=3000, latency=None, error_rate=None,
+                                           timeout_rate=None, strict=args.strict))
+        os.environ.update(app_environment(stub.base_url))
+    sys.path.insert(0, APP_DIR)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        from services import noaa
+
+    begin = datetime.now(timezone.utc)
+    begin_date = begin.strftime("%Y%m%d")
+    end_date = (begin + timedelta(days=args.days - 1)).strftime("%Y%m%d")
+    results = []
+    try:
+        for station_id in [s.strip() for s in args.stations.split(",") if s.strip()]:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                result = evaluate_station(noaa, station_id, begin_date, end_date)
+            results.append(result)
+            if "error" in result:
+                print(f"{station_id}: {result['error']}")
+                continue
+            for method, stats in result["methods"].items():
+                if not stats["samples"]:
+                    print(f"{station_id} {method:>6}: no overlap with the 6-minute predictions")
+                    continue
+                print(f"{station_id} {method:>6}: n={stats['samples']:<5} mae={stats['mae_ft']:.4f} "
+                      f"rmse={stats['rmse_ft']:.4f} p95={stats['p95_ft']:.4f} max={stats['max_ft']:.4f} ft "
+                      f"({stats['eval_ms']:.2f} ms)")
+    finally:
+        if stub is not None:
+            stub.stop()
+
+    report = {
+        "schema_version": RESULT_SCHEMA_VERSION,
+        "kind": "interpolation",
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_revision": _git_revision(),
+        "source": "live" if args.live else ("fixtures" if args.strict else "stub"),
+        "window": {"begin_date": begin_date, "end_date": end_date},
+        "results": results,
+    }
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{report['git_revision']}-interpolation.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+# bench/run_benchmark.py
+
+"""
+Latency/throughput benchmark for the full index() request path, run against the
+replay stub in bench/stub_server.py so results are repeatable offline.
+
+    # run the default matrix and save results to bench/results/
+    python bench/run_benchmark.py run
+
+    # slower upstreams, more concurrency
+    python bench/run_benchmark.py run --latency noaa=200:40 --latency weather=300:60 --concurrency 1,8,32
+
+    # benchmark a running gunicorn instead of the in-process app
+    python bench/run_benchmark.py run --url http://127.0.0.1:5000
+
+    # compare two saved runs
+    python bench/run_benchmark.py compare bench/results/a.json bench/results/b.json
+
+Each result file is JSON: run metadata plus one entry per (scenario, concurrency)
+with p50/p95/p99/mean/max latency in milliseconds, throughput and error counts.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(BENCH_DIR), "my_tide_app")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+RESULT_SCHEMA_VERSION = 1
+
+sys.path.insert(0, BENCH_DIR)
+from stub_server import app_environment # noqa: E402
+
+# ZIP codes cycled through by the POST scenario
+BENCH_ZIPS = (
+    "21871", "21401", "23451", "28480", "29401", "31401", "32082", "33139", "33040", "32541",
+    "70112", "77550", "78401", "92101", "94965", "97365", "98101", "99501", "96815", "02109",
+)
+
+
+def scenario_get(i):
+    return "GET", "/", None
+
+
+def scenario_zip_post(i):
+    return "POST", "/", {"zip_code": BENCH_ZIPS[i % len(BENCH_ZIPS)]}
+
+
+def scenario_get_stream(i):
+    return "GET", "/?stream=1", None
+
+
+# name -> function(request_number) returning (method, path, form_data)
+SCENARIOS = {
+    "get": scenario_get,
+    "zip_post": scenario_zip_post,
+    "get_stream": scenario_get_stream,
+}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies_s, errors, wall_s):
+    ms = sorted(v * 1000.0 for v in latencies_s)
+    completed = len(ms)
+    return {
+        "requests": completed + errors,
+        "errors": errors,
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+        "mean_ms": sum(ms) / completed if completed else None,
+        "max_ms": ms[-1] if ms else None,
+        "throughput_rps": completed / wall_s if wall_s > 0 else None,
+        "wall_s": wall_s,
+    }
+
+
+class InProcessTarget:
+    """Drives the Flask app through its test client, one client per thread."""
+
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self._local = threading.local()
+
+    def request(self, method, path, data):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, data=data)
+        response.get_data() # drain streamed bodies
+        return response.status_code
+
+
+class HttpTarget:
+    """Drives a running server over HTTP, one session per thread."""
+
+    def __init__(self, base_url):
+        import requests
+        self._requests = requests
+        self.base_url = base_url.rstrip("/")
+        self._local = threading.local()
+
+    def request(self, method, path, data):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        response = session.request(method, self.base_url + path, data=data, timeout=60)
+        return response.status_code
+
+
+def run_level(target, scenario, concurrency, total_requests):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    counter = iter(range(total_requests))
+
+    def worker():
+        nonlocal errors
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            method, path, data = scenario(i)
+            start = time.perf_counter()
+            try:
+                status = target.request(method, path, data)
+                ok = status < 500
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    return summarize(latencies, errors, time.perf_counter() - wall_start)
+
+
+def _git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                             capture_output=True, text=True, timeout=10)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BENCH_DIR,
+                               capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() + ("-dirty" if dirty.stdout.strip() else "")
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+class StubProcess:
+    """
+    Runs bench/stub_server.py in its own process so synthesizing responses does not
+    compete with the app under test for the GIL.
+    """
+
+    def __init__(self, args):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        cmd = [sys.executable, os.path.join(BENCH_DIR, "stub_server.py"), "--port", str(port),
+               "--stations", str(args.stations)]
+        for flag, values in (("--latency", args.latency), ("--error-rate", args.error_rate),
+                             ("--timeout-rate", args.timeout_rate)):
+            for value in values or []:
+                cmd += [flag, value]
+        if getattr(args, "strict", False):
+            cmd.append("--strict")
+        self.process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+        self._wait_until_ready()
+
+    def _wait_until_ready(self, timeout_s=15):
+        import requests
+        deadline = time.monotonic() + timeout_s
+        while time.monotonic() < deadline:
+            try:
+                self.config = requests.get(f"{self.base_url}/_stub/config", timeout=1).json()
+                return
+            except requests.exceptions.RequestException:
+                time.sleep(0.1)
+        self.stop()
+        raise SystemExit("Stub server did not start")
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait(timeout=10)
+
+
+def load_app(base_url):
+    """Imports the Flask app with its upstream URLs pointed at the stub."""
+    os.environ.update(app_environment(base_url))
+    os.chdir(APP_DIR)
+    sys.path.insert(0, APP_DIR)
+    import app as tide_app
+    return tide_app.app
+
+
+def command_run(args):
+    stub = None
+    if args.url:
+        target = HttpTarget(args.url)
+    else:
+        stub = StubProcess(args)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            target = InProcessTarget(load_app(stub.base_url))
+
+    scenarios = args.scenarios.split(",")
+    levels = [int(c) for c in args.concurrency.split(",")]
+    results = []
+    devnull = open(os.devnull, "w")
+
+    for name in scenarios:
+        scenario = SCENARIOS[name]
+        for concurrency in levels:
+            # The app prints debug lines on every request; keep them out of the report
+            with contextlib.redirect_stdout(devnull) if not args.verbose else contextlib.nullcontext():
+                if args.warmup:
+                    run_level(target, scenario, min(concurrency, args.warmup), args.warmup)
+                stats = run_level(target, scenario, concurrency, args.requests)
+            stats.update({"scenario": name, "concurrency": concurrency})
+            results.append(stats)
+            print(f"{name:>10} c={concurrency:<3} p50={_fmt(stats['p50_ms'])} p95={_fmt(stats['p95_ms'])} "
+                  f"p99={_fmt(stats['p99_ms'])} rps={_fmt(stats['throughput_rps'], 1)} errors={stats['errors']}")
+
+    report = {
+        "schema_version": RESULT_SCHEMA_VERSION,
+        "label": args.label,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "target": args.url or "in-process",
+        "requests_per_level": args.requests,
+        "stub_config": stub.config if stub else None,
+        "results": results,
+    }
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{report['git_revision']}{'-' + args.label if args.label else ''}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    devnull.close()
+    if stub is not None:
+        stub.stop()
+
+
+def _fmt(value, digits=1):
+    return "n/a" if value is None else f"{value:.{digits}f}"
+
+
+def command_compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    for report in (baseline, candidate):
+        if report.get("schema_version") != RESULT_SCHEMA_VERSION:
+            raise SystemExit(f"Unsupported result schema version {report.get('schema_version')}")
+
+    base_index = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    print(f"baseline:  {baseline['git_revision']} {baseline.get('label') or ''} ({baseline['created_at']})")
+    print(f"candidate: {candidate['git_revision']} {candidate.get('label') or ''} ({candidate['created_at']})")
+    print(f"{'scenario':>10} {'conc':>4} {'metric':>14} {'baseline':>10} {'candidate':>10} {'change':>8}")
+    for result in candidate["results"]:
+        base = base_index.get((result["scenario"], result["concurrency"]))
+        if base is None:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            old, new = base.get(metric), result.get(metric)
+            change = f"{(new - old) / old * 100:+.1f}%" if old and new is not None else "n/a"
+            print(f"{result['scenario']:>10} {result['concurrency']:>4} {metric:>14} {_fmt(old):>10} {_fmt(new):>10} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tide app request path against stubbed upstreams.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Run the benchmark matrix and save the results")
+    run.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated, from: {', '.join(SCENARIOS)}")
+    run.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    run.add_argument("--requests", type=int, default=200, help="Requests per (scenario, concurrency) level")
+    run.add_argument("--warmup", type=int, default=10, help="Unmeasured requests before each level")
+    run.add_argument("--latency", action="append", metavar="UPSTREAM=MS[:JITTER]", help="Injected stub latency")
+    run.add_argument("--error-rate", action="append", metavar="UPSTREAM=FRACTION", help="Injected stub error rate")
+    run.add_argument("--timeout-rate", action="append", metavar="UPSTREAM=FRACTION", help="Injected stub timeouts")
+    run.add_argument("--stations", type=int, default=3000, help="Size of the synthetic station catalog")
+    run.add_argument("--url", help="Benchmark a running server at this URL instead of the in-process app")
+    run.add_argument("--label", default="", help="Free-form label stored with the results")
+    run.add_argument("--output", help="Result file path (default: bench/results/<timestamp>-<rev>.json)")
+    run.add_argument("--verbose", action="store_true", help="Keep the app's debug output")
+    run.set_defaults(func=command_run)
+
+    compare = sub.add_parser("compare", help="Compare two result files")
+    compare.add_argument("baseline")
+    compare.add_argument("candidate")
+    compare.set_defaults(func=command_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,626 @@
+# bench/stub_server.py
+
+"""
+Local stand-in for every upstream API the tide app talks to:
+
+    NOAA datagetter      /api/prod/datagetter
+    NOAA mdapi stations  /mdapi/prod/webapi/stations.json
+    Pirate Weather       /forecast/<key>/<lat>,<lon>[,<time>]
+    OpenCage             /geocode/v1/json
+
+Responses are replayed from recordings under bench/fixtures/ when one matches the
+request, and otherwise synthesized deterministically in the same shape as the real
+APIs (so the suite works fully offline). Run with --record to proxy misses to the
+real services and save what comes back as new fixtures.
+
+Latency and failures can be injected per upstream, either on the command line or at
+runtime through the /_stub/config endpoint:
+
+    python bench/stub_server.py --port 8099 --latency noaa=150:50 --error-rate weather=0.05
+
+    curl -X POST localhost:8099/_stub/config -d '{"latency": {"weather": [2000, 0]}}'
+
+Point the app at it with the environment variables printed on startup.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import requests
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Upstream names used for fixtures, latency and error injection
+UPSTREAMS = ("noaa", "stations", "weather", "geocode")
+
+REAL_BASE_URLS = {
+    "noaa": "https://api.tidesandcurrents.noaa.gov/api/prod/datagetter",
+    "stations": "https://api.tidesandcurrents.noaa.gov/mdapi/prod/webapi/stations.json",
+    "weather": "https://api.pirateweather.net",
+    "geocode": "https://api.opencagedata.com/geocode/v1/json",
+}
+
+# Query parameters that identify a recording. Dates are left out on purpose:
+# recorded tide and weather series are shifted in time to the requested window.
+FIXTURE_KEY_PARAMS = {
+    "noaa": ("station", "product", "interval", "datum", "time_zone", "span_days"),
+    "stations": (),
+    "weather": ("lat", "lon", "mode"),
+    "geocode": ("q",),
+}
+
+
+class StubConfig:
+    """Thread-safe holder for the injected latency and error settings."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {name: (0.0, 0.0) for name in UPSTREAMS} # name -> (mean_ms, jitter_ms)
+        self.error_rate = {name: 0.0 for name in UPSTREAMS}
+        self.error_status = 503
+        self.timeout_rate = {name: 0.0 for name in UPSTREAMS}
+        self.timeout_seconds = 15.0
+        self.station_count = 3000
+        self.seed = 1234
+
+    def update(self, changes):
+        with self._lock:
+            for name, value in changes.get("latency", {}).items():
+                self.latency[name] = (float(value[0]), float(value[1]) if len(value) > 1 else 0.0)
+            for name, value in changes.get("error_rate", {}).items():
+                self.error_rate[name] = float(value)
+            for name, value in changes.get("timeout_rate", {}).items():
+                self.timeout_rate[name] = float(value)
+            for key in ("error_status", "timeout_seconds", "station_count", "seed"):
+                if key in changes:
+                    setattr(self, key, type(getattr(self, key))(changes[key]))
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "latency": {k: list(v) for k, v in self.latency.items()},
+                "error_rate": dict(self.error_rate),
+                "timeout_rate": dict(self.timeout_rate),
+                "error_status": self.error_status,
+                "timeout_seconds": self.timeout_seconds,
+                "station_count": self.station_count,
+                "seed": self.seed,
+            }
+
+    def fault_for(self, upstream, rng):
+        """Returns (delay_seconds, error_status_or_None) for one request."""
+        with self._lock:
+            mean_ms, jitter_ms = self.latency[upstream]
+            if rng.random() < self.timeout_rate[upstream]:
+                return self.timeout_seconds, None
+            delay = max(0.0, rng.gauss(mean_ms, jitter_ms) if jitter_ms else mean_ms) / 1000.0
+            if rng.random() < self.error_rate[upstream]:
+                return delay, self.error_status
+            return delay, None
+
+
+# --- Fixture storage ---
+
+def fixture_key(upstream, params):
+    wanted = FIXTURE_KEY_PARAMS[upstream]
+    canonical = "&".join(f"{k}={params.get(k, '')}" for k in wanted)
+    return hashlib.sha1(canonical.encode()).hexdigest()[:16]
+
+
+def fixture_path(upstream, params):
+    return os.path.join(FIXTURES_DIR, upstream, fixture_key(upstream, params) + ".json")
+
+
+def load_fixture(upstream, params):
+    path = fixture_path(upstream, params)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_fixture(upstream, params, body, recorded_at):
+    path = fixture_path(upstream, params)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    record = {"upstream": upstream, "params": params, "recorded_at": recorded_at, "body": body}
+    with open(path, "w") as f:
+        json.dump(record, f)
+
+
+# --- Date handling shared by replay and synthesis ---
+
+def _parse_noaa_date(value):
+    for fmt in ("%Y%m%d %H:%M", "%Y%m%d"):
+        try:
+            return datetime.strptime(value, fmt)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def _noaa_window(query):
+    """Returns (begin, end) naive datetimes for a datagetter query."""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    if query.get("date") == "latest":
+        return now - timedelta(minutes=18), now
+    begin = _parse_noaa_date(query.get("begin_date"))
+    end = _parse_noaa_date(query.get("end_date"))
+    if query.get("range"):
+        hours = float(query["range"])
+        if begin is None and end is None:
+            return now - timedelta(hours=hours), now
+        if begin is not None:
+            return begin, begin + timedelta(hours=hours)
+        return end - timedelta(hours=hours), end
+    begin = begin or now.replace(hour=0, minute=0, second=0, microsecond=0)
+    end = end or begin
+    if len(query.get("end_date", "")) == 8:
+        end = end + timedelta(days=1) - timedelta(minutes=1) # whole days are inclusive
+    return begin, end
+
+
+def _shift_noaa_times(rows, delta):
+    shifted = []
+    for row in rows:
+        row = dict(row)
+        t = datetime.strptime(row["t"], "%Y-%m-%d %H:%M") + delta
+        row["t"] = t.strftime("%Y-%m-%d %H:%M")
+        shifted.append(row)
+    return shifted
+
+
+def _shift_weather_times(body, delta_s):
+    body = json.loads(json.dumps(body))
+    for block in ("currently",):
+        if block in body and "time" in body[block]:
+            body[block]["time"] += delta_s
+    for block in ("hourly", "daily", "minutely"):
+        for item in body.get(block, {}).get("data", []):
+            item["time"] += delta_s
+    return body
+
+
+# --- Synthetic responses ---
+
+def _station_phase(station_id):
+    """Deterministic per-station tidal parameters derived from the station id."""
+    h = zlib.crc32(str(station_id).encode())
+    amplitude = 0.8 + (h % 1000) / 1000.0 * 2.5
+    phase = (h >> 10) % 360 * math.pi / 180.0
+    mean = 0.5 + ((h >> 20) % 100) / 100.0
+    return amplitude, phase, mean
+
+
+def synthetic_tide_height(station_id, when):
+    """Simple M2 + S2 + K1 tide curve in feet above MLLW for a naive GMT datetime."""
+    amplitude, phase, mean = _station_phase(station_id)
+    hours = (when - datetime(2000, 1, 1)).total_seconds() / 3600.0
+    m2 = amplitude * math.cos(2 * math.pi * hours / 12.4206 + phase)
+    s2 = 0.23 * amplitude * math.cos(2 * math.pi * hours / 12.0 + phase / 2)
+    k1 = 0.15 * amplitude * math.cos(2 * math.pi * hours / 23.9345 + phase / 3)
+    return mean + amplitude + m2 + s2 + k1
+
+
+def _synthetic_series(station_id, begin, end, step, lst_offset_hours):
+    rows = []
+    t = begin
+    while t <= end:
+        gmt = t - timedelta(hours=lst_offset_hours)
+        rows.append({"t": t.strftime("%Y-%m-%d %H:%M"), "v": f"{synthetic_tide_height(station_id, gmt):.3f}"})
+        t += step
+    return rows
+
+
+def _synthetic_hilo(station_id, begin, end, lst_offset_hours):
+    # Sample every minute, then keep local extrema
+    rows = []
+    step = timedelta(minutes=1)
+    prev_t = begin - step
+    prev_v = synthetic_tide_height(station_id, prev_t - timedelta(hours=lst_offset_hours))
+    t = begin
+    cur_v = synthetic_tide_height(station_id, t - timedelta(hours=lst_offset_hours))
+    while t <= end:
+        next_v = synthetic_tide_height(station_id, t + step - timedelta(hours=lst_offset_hours))
+        if cur_v > prev_v and cur_v >= next_v:
+            rows.append({"t": t.strftime("%Y-%m-%d %H:%M"), "v": f"{cur_v:.3f}", "type": "H"})
+        elif cur_v < prev_v and cur_v <= next_v:
+            rows.append({"t": t.strftime("%Y-%m-%d %H:%M"), "v": f"{cur_v:.3f}", "type": "L"})
+        prev_v, cur_v = cur_v, next_v
+        t += step
+    return rows
+
+
+def synthesize_noaa(query):
+    station_id = query.get("station", "0000000")
+    begin, end = _noaa_window(query)
+    lst_offset_hours = 0 if query.get("time_zone", "lst").lower() == "gmt" else -5
+    product = query.get("product", "predictions")
+    interval = query.get("interval", "6")
+
+    if product == "water_level":
+        now_lst = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(hours=lst_offset_hours)
+        end = min(end, now_lst)
+        start = begin.replace(minute=begin.minute - begin.minute % 6, second=0, microsecond=0)
+        rows = _synthetic_series(station_id, start, end, timedelta(minutes=6), lst_offset_hours)
+        rng = random.Random(zlib.crc32(station_id.encode()))
+        for i, row in enumerate(rows):
+            surge = 0.3 * math.sin(i / 40.0) + rng.gauss(0, 0.03)
+            row["v"] = f"{float(row['v']) + surge:.3f}"
+            row.update({"s": "0.010", "f": "0,0,0,0", "q": "p"})
+        if not rows:
+            return {"error": {"message": "No data was found. This product may not be offered at this station at the requested time."}}
+        return {"metadata": {"id": station_id, "name": f"Station {station_id}", "lat": "0", "lon": "0"}, "data": rows}
+
+    if interval == "hilo":
+        rows = _synthetic_hilo(station_id, begin, end, lst_offset_hours)
+    else:
+        minutes = {"h": 60, "1": 1, "5": 5, "6": 6, "10": 10, "15": 15, "30": 30, "60": 60}.get(interval, 6)
+        start = begin.replace(second=0, microsecond=0)
+        start -= timedelta(minutes=start.minute % minutes) if minutes < 60 else timedelta(minutes=start.minute)
+        rows = _synthetic_series(station_id, start, end, timedelta(minutes=minutes), lst_offset_hours)
+    return {"predictions": rows}
+
+
+_US_COAST_SEGMENTS = (
+    # (lat0, lon0, lat1, lon1, state) rough coastline segments
+    (44.8, -67.0, 40.6, -74.0, "ME"), (40.6, -74.0, 36.9, -76.0, "VA"),
+    (36.9, -76.0, 30.4, -81.4, "GA"), (30.4, -81.4, 25.2, -80.4, "FL"),
+    (25.2, -80.4, 29.9, -84.0, "FL"), (29.9, -84.0, 29.5, -94.5, "LA"),
+    (29.5, -94.5, 26.0, -97.2, "TX"), (32.6, -117.1, 38.0, -123.0, "CA"),
+    (38.0, -123.0, 48.4, -124.7, "WA"), (57.0, -135.0, 61.2, -150.0, "AK"),
+    (19.0, -155.5, 22.2, -159.7, "HI"),
+)
+
+
+def synthesize_stations(count, seed):
+    rng = random.Random(seed)
+    stations = [{
+        "id": "8571858", "name": "Sharptown, Nanticoke River", "state": "MD",
+        "lat": 38.5417, "lng": -75.7217, "tidal": True, "greatlakes": False,
+        "shefcode": "SHRM2", "timezonecorr": -5, "type": "S",
+        "self": "https://api.tidesandcurrents.noaa.gov/mdapi/prod/webapi/stations/8571858.json",
+    }]
+    for i in range(count - 1):
+        lat0, lon0, lat1, lon1, state = rng.choice(_US_COAST_SEGMENTS)
+        f = rng.random()
+        station_id = str(8000001 + i * 8)
+        station = {
+            "id": station_id,
+            "name": f"Synthetic Gauge {i}",
+            "state": state,
+            "lat": round(lat0 + (lat1 - lat0) * f + rng.gauss(0, 0.05), 4),
+            "lng": round(lon0 + (lon1 - lon0) * f + rng.gauss(0, 0.05), 4),
+            "tidal": True,
+            "greatlakes": False,
+            "shefcode": "",
+            "timezonecorr": {"AK": -9, "HI": -10, "CA": -8, "WA": -8, "TX": -6, "LA": -6}.get(state, -5),
+            "type": "S" if i % 3 else "R",
+            "self": f"https://api.tidesandcurrents.noaa.gov/mdapi/prod/webapi/stations/{station_id}.json",
+        }
+        # The real catalog has a few stations without coordinates or flagged inactive
+        if i % 250 == 0:
+            station["lat"] = None
+        if i % 300 == 1:
+            station["active"] = False
+        stations.append(station)
+    return {"count": len(stations), "units": None, "stations": stations,
+            "self": REAL_BASE_URLS["stations"]}
+
+
+_SUMMARIES = ("Clear", "Partly Cloudy", "Mostly Cloudy", "Light Rain", "Breezy", "Drizzle", "Overcast")
+
+
+def _weather_point(lat, lon, t):
+    rng = random.Random(zlib.crc32(f"{lat:.2f},{lon:.2f},{t // 3600}".encode()))
+    day_phase = math.sin(2 * math.pi * ((t % 86400) / 86400.0 - 0.375))
+    temp = 60 + 15 * day_phase + rng.gauss(0, 2)
+    precip = max(0.0, min(1.0, rng.betavariate(0.6, 3)))
+    return {
+        "time": t,
+        "summary": _SUMMARIES[rng.randrange(len(_SUMMARIES))],
+        "icon": "clear-day",
+        "precipIntensity": round(precip * 0.1, 4),
+        "precipProbability": round(precip, 2),
+        "temperature": round(temp, 2),
+        "apparentTemperature": round(temp - 2, 2),
+        "dewPoint": round(temp - 12, 2),
+        "humidity": round(rng.uniform(0.4, 0.95), 2),
+        "pressure": round(1013 + rng.gauss(0, 4), 1),
+        "windSpeed": round(abs(rng.gauss(9, 5)), 2),
+        "windGust": round(abs(rng.gauss(16, 6)), 2),
+        "windBearing": rng.randrange(360),
+        "cloudCover": round(rng.random(), 2),
+        "uvIndex": max(0, round(6 * day_phase, 1)),
+        "visibility": round(rng.uniform(5, 10), 2),
+    }
+
+
+def synthesize_weather(lat, lon, time_unix, query):
+    now = int(time.time())
+    if time_unix is not None:
+        return {"latitude": lat, "longitude": lon, "timezone": "America/New_York", "offset": -5,
+                "currently": _weather_point(lat, lon, time_unix)}
+    hour = now - now % 3600
+    hours = 168 if query.get("extend") == "hourly" else 48
+    body = {
+        "latitude": lat, "longitude": lon, "timezone": "America/New_York", "offset": -5,
+        "currently": _weather_point(lat, lon, now),
+        "hourly": {"summary": "Mixed conditions.", "icon": "partly-cloudy-day",
+                   "data": [_weather_point(lat, lon, hour + 3600 * i) for i in range(hours)]},
+        "daily": {"summary": "Mixed conditions.", "icon": "partly-cloudy-day",
+                  "data": [_weather_point(lat, lon, hour - hour % 86400 + 86400 * i) for i in range(8)]},
+    }
+    return body
+
+
+def synthesize_geocode(q):
+    # Spread ZIP codes over the coastal segments so closest-station search has real work to do
+    h = zlib.crc32(q.encode())
+    lat0, lon0, lat1, lon1, state = _US_COAST_SEGMENTS[h % len(_US_COAST_SEGMENTS)]
+    f = ((h >> 8) % 1000) / 1000.0
+    lat = lat0 + (lat1 - lat0) * f + 0.1
+    lng = lon0 + (lon1 - lon0) * f + 0.1
+    if q.strip() == "21871":
+        lat, lng, state = 38.1323, -75.7946, "MD"
+    return {
+        "documentation": "https://opencagedata.com/api",
+        "licenses": [],
+        "rate": {"limit": 2500, "remaining": 2499, "reset": int(time.time()) + 86400},
+        "results": [{
+            "components": {"postcode": q, "state_code": state, "country_code": "us", "_type": "postcode"},
+            "confidence": 7,
+            "formatted": f"{q}, {state}, United States of America",
+            "geometry": {"lat": round(lat, 5), "lng": round(lng, 5)},
+        }],
+        "status": {"code": 200, "message": "OK"},
+        "total_results": 1,
+    }
+
+
+# --- Request handling ---
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = "TideStub/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        if self.path.startswith("/_stub/config"):
+            length = int(self.headers.get("Content-Length") or 0)
+            changes = json.loads(self.rfile.read(length) or b"{}")
+            self.server.config.update(changes)
+            self._send_json(200, self.server.config.as_dict())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        if url.path.startswith("/_stub/config"):
+            self._send_json(200, self.server.config.as_dict())
+            return
+        if url.path.startswith("/_stub/stats"):
+            with self.server.stats_lock:
+                self._send_json(200, dict(self.server.stats))
+            return
+
+        if url.path.endswith("/datagetter"):
+            upstream = "noaa"
+        elif url.path.endswith("/stations.json"):
+            upstream = "stations"
+        elif url.path.startswith("/forecast/"):
+            upstream = "weather"
+        elif url.path.endswith("/geocode/v1/json"):
+            upstream = "geocode"
+        else:
+            self._send_json(404, {"error": f"unknown path {url.path}"})
+            return
+
+        with self.server.stats_lock:
+            self.server.stats[upstream] = self.server.stats.get(upstream, 0) + 1
+
+        rng = random.Random()
+        delay, error_status = self.server.config.fault_for(upstream, rng)
+        if delay:
+            time.sleep(delay)
+        if error_status:
+            self._send_json(error_status, {"error": "injected failure"})
+            return
+
+        status, body = getattr(self, f"_handle_{upstream}")(url, query)
+        self._send_json(status, body)
+
+    def _replay_or_synthesize(self, upstream, key_params, synthesize, shift, real_request):
+        record = load_fixture(upstream, key_params)
+        if record is not None:
+            return 200, shift(record)
+        if self.server.record:
+            response = real_request()
+            if response.status_code == 200:
+                body = response.json()
+                save_fixture(upstream, key_params, body, int(time.time()))
+                return 200, body
+            return response.status_code, {"error": response.text[:500]}
+        if self.server.strict:
+            return 404, {"error": f"no {upstream} fixture for {key_params}"}
+        return 200, synthesize()
+
+    def _handle_noaa(self, url, query):
+        begin, end = _noaa_window(query)
+        key_params = dict(query)
+        key_params["span_days"] = str(round((end - begin).total_seconds() / 86400))
+
+        def shift(record):
+            body = record["body"]
+            recorded = _noaa_window(record["params"])[0]
+            delta = timedelta(days=(begin.date() - recorded.date()).days)
+            for key in ("predictions", "data"):
+                if key in body:
+                    body = dict(body)
+                    body[key] = _shift_noaa_times(body[key], delta)
+            return body
+
+        return self._replay_or_synthesize(
+            "noaa", key_params, lambda: synthesize_noaa(query), shift,
+            lambda: requests.get(REAL_BASE_URLS["noaa"], params=query, timeout=30))
+
+    def _handle_stations(self, url, query):
+        config = self.server.config
+        return self._replay_or_synthesize(
+            "stations", {}, lambda: self.server.cached_stations(config.station_count, config.seed),
+            lambda record: record["body"],
+            lambda: requests.get(REAL_BASE_URLS["stations"], params=query, timeout=60))
+
+    def _handle_weather(self, url, query):
+        parts = url.path.split("/")
+        if len(parts) < 4:
+            return 400, {"error": "bad forecast path"}
+        api_key, coords = parts[2], parts[3].split(",")
+        lat, lon = float(coords[0]), float(coords[1])
+        time_unix = int(coords[2]) if len(coords) > 2 else None
+        key_params = {"lat": f"{lat:.3f}", "lon": f"{lon:.3f}", "mode": "timemachine" if time_unix else "forecast"}
+
+        def shift(record):
+            body = record["body"]
+            if time_unix is not None:
+                reference = body.get("currently", {}).get("time", time_unix)
+                return _shift_weather_times(body, time_unix - reference)
+            first = body.get("hourly", {}).get("data", [{}])[0].get("time")
+            now = int(time.time())
+            return _shift_weather_times(body, (now - now % 3600) - first) if first else body
+
+        return self._replay_or_synthesize(
+            "weather", key_params, lambda: synthesize_weather(lat, lon, time_unix, query), shift,
+            lambda: requests.get(f"{REAL_BASE_URLS['weather']}{url.path}", params=query, timeout=30))
+
+    def _handle_geocode(self, url, query):
+        q = query.get("q", "")
+        real_query = urlencode(query)
+        return self._replay_or_synthesize(
+            "geocode", {"q": q}, lambda: synthesize_geocode(q), lambda record: record["body"],
+            lambda: requests.get(f"{REAL_BASE_URLS['geocode']}?{real_query}", timeout=30))
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, config=None, record=False, strict=False, verbose=False):
+        super().__init__(address, StubHandler)
+        self.config = config or StubConfig()
+        self.record = record
+        self.strict = strict
+        self.verbose = verbose
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+        self._stations_cache = {}
+
+    def cached_stations(self, count, seed):
+        key = (count, seed)
+        if key not in self._stations_cache:
+            self._stations_cache = {key: synthesize_stations(count, seed)}
+        return self._stations_cache[key]
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def app_environment(self):
+        """Environment variables that point the tide app at this stub."""
+        return app_environment(self.base_url)
+
+    def start_in_thread(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def app_environment(base_url):
+    """Environment variables that point the tide app at a stub listening on `base_url`."""
+    netloc = urlparse(base_url).netloc
+    return {
+        "NOAA_DATAGETTER_URL": f"{base_url}/api/prod/datagetter",
+        "NOAA_STATIONS_URL": f"{base_url}/mdapi/prod/webapi/stations.json",
+        "PIRATE_WEATHER_BASE_URL": base_url,
+        "OPENCAGE_DOMAIN": netloc,
+        "OPENCAGE_SCHEME": "http",
+        "PIRATE_WEATHER_API_KEY": os.environ.get("PIRATE_WEATHER_API_KEY", "stub-key"),
+        "OPENCAGE_API_KEY": os.environ.get("OPENCAGE_API_KEY", "stub-key"),
+    }
+
+
+def _parse_pairs(values, convert):
+    """Parses repeated name=value options, e.g. --latency noaa=150:50."""
+    result = {}
+    for item in values or []:
+        name, _, value = item.partition("=")
+        if name not in UPSTREAMS:
+            raise SystemExit(f"Unknown upstream '{name}'. Expected one of: {', '.join(UPSTREAMS)}")
+        result[name] = convert(value)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay/synthesize upstream API responses for the tide app.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", action="append", metavar="UPSTREAM=MS[:JITTER]",
+                        help="Injected latency per upstream (repeatable)")
+    parser.add_argument("--error-rate", action="append", metavar="UPSTREAM=FRACTION",
+                        help="Fraction of requests answered with --error-status (repeatable)")
+    parser.add_argument("--timeout-rate", action="append", metavar="UPSTREAM=FRACTION",
+                        help="Fraction of requests that stall for --timeout-seconds (repeatable)")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--timeout-seconds", type=float, default=15.0)
+    parser.add_argument("--stations", type=int, default=3000, help="Size of the synthetic station catalog")
+    parser.add_argument("--record", action="store_true", help="Proxy fixture misses to the real APIs and save them")
+    parser.add_argument("--strict", action="store_true", help="Return 404 instead of synthesizing on fixture misses")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    config = StubConfig()
+    config.update({
+        "latency": _parse_pairs(args.latency, lambda v: [float(x) for x in v.split(":")]),
+        "error_rate": _parse_pairs(args.error_rate, float),
+        "timeout_rate": _parse_pairs(args.timeout_rate, float),
+        "error_status": args.error_status,
+        "timeout_seconds": args.timeout_seconds,
+        "station_count": args.stations,
+    })
+
+    server = StubServer((args.host, args.port), config, record=args.record, strict=args.strict, verbose=args.verbose)
+    print(f"Stub upstreams listening on {server.base_url}")
+    print("Point the app at it with:")
+    for key, value in server.app_environment().items():
+        print(f"  export {key}={value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
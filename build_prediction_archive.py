@@ -0,0 +1,215 @@
+"""
+Builds the prediction archive: a year of hourly and high/low tide predictions for
+every station in the NOAA catalog, in one file the web app memory-maps.
+
+    python build_prediction_archive.py --output /data/tide-predictions.bin
+    python build_prediction_archive.py --output preds.bin --days 400 --workers 16
+    python build_prediction_archive.py --output preds.bin --station 8571858 --station 8575512
+
+Stations are fetched in batches by a pool of processes (one per core by default),
+each turning NOAA's responses into the archive's compact arrays; the parent only
+stitches the arrays together. The archive starts the day before today (UTC), so
+stations west of Greenwich have all of their local "today" in it. Stations NOAA
+has no predictions for are left out, and the app keeps asking NOAA for those.
+Stations it only has high/low predictions for (subordinate stations) are kept, with
+no hourly heights.
+
+Requests go straight to NOAA, not through the app's cache, circuit breakers or rate
+limits, and are retried a few times. If a station still fails, nothing is written,
+since the archive would look complete while missing it; --allow-partial writes the
+stations that did build.
+
+Point the app's PREDICTION_ARCHIVE_PATH at the output. Rebuilding in place is safe:
+the new file is renamed over the old one and workers switch to it within
+PREDICTION_ARCHIVE_CHECK_SECONDS.
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import requests
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "my_tide_app")
+sys.path.insert(0, APP_DIR)
+
+from config import PREDICTION_ARCHIVE_PATH, UPSTREAM_TIMEOUT # noqa: E402
+from prediction_archive import PredictionArchive, DAY, HOUR # noqa: E402
+from services.geocoding import get_noaa_tide_stations # noqa: E402
+from services.noaa import request_tide_data # noqa: E402
+
+REQUEST_DAYS = 365 # NOAA serves at most a year of hourly predictions per request
+RETRIES = 3 # Further attempts at a failed request, 2, 4 then 8 seconds apart
+
+
+def _quiet_worker():
+    # The services print debug lines; only the parent reports progress
+    sys.stdout = open(os.devnull, "w")
+
+
+def _request(station_id, first, last, interval):
+    """One year's predictions, retrying failed requests; None if NOAA has none."""
+    for attempt in range(RETRIES + 1):
+        try:
+            return request_tide_data(station_id, first.strftime("%Y%m%d"), last.strftime("%Y%m%d"), "predictions",
+                                     "MLLW", "gmt", interval, UPSTREAM_TIMEOUT)
+        except (requests.exceptions.RequestException, ValueError):
+            if attempt == RETRIES:
+                raise
+            time.sleep(2 ** (attempt + 1))
+
+
+def _fetch(station_id, start, days, interval):
+    """A station's predictions over the archive's days, fetched a year at a time, or None if NOAA has none."""
+    frames = []
+    for offset in range(0, days, REQUEST_DAYS):
+        first = datetime.fromtimestamp(start + offset * DAY, timezone.utc)
+        last = first + timedelta(days=min(REQUEST_DAYS, days - offset) - 1)
+        df = _request(station_id, first, last, interval)
+        if df is None:
+            return None
+        frames.append(df)
+    return frames
+
+
+def build_station(station_id, start, days):
+    """
+    Fetches one station and lays it out the archive's way.
+
+    Returns:
+        tuple: (station_id, hourly float32[days * 24], per-day high/low counts int64[days],
+                high/low times int32 (seconds since start), heights float32, types S1),
+               or None if NOAA has no predictions for it. Hourly heights are NaN
+               where NOAA has none, e.g. for every hour of a subordinate station.
+
+    Raises:
+        requests.exceptions.RequestException, ValueError: If NOAA couldn't be asked, even after retries.
+    """
+    hourly_frames = _fetch(station_id, start, days, "h")
+    hilo_frames = _fetch(station_id, start, days, "hilo")
+    if hourly_frames is None and hilo_frames is None:
+        return None
+
+    hourly = np.full(days * 24, np.nan, dtype=np.float32)
+    for df in hourly_frames or []:
+        offsets = df['datetime'].to_numpy(dtype="datetime64[s]").astype(np.int64) - start
+        on_grid = (offsets % HOUR == 0) & (offsets >= 0) & (offsets < days * DAY)
+        hourly[offsets[on_grid] // HOUR] = df['height_ft'].to_numpy(dtype=np.float32)[on_grid]
+
+    times, heights, types = [np.empty(0, np.int64)], [np.empty(0, np.float32)], [np.empty(0, "S1")]
+    for df in hilo_frames or []:
+        offsets = df['datetime'].to_numpy(dtype="datetime64[s]").astype(np.int64) - start
+        keep = (offsets >= 0) & (offsets < days * DAY) & df['tide_type'].isin(("H", "L")).to_numpy()
+        times.append(offsets[keep])
+        heights.append(df['height_ft'].to_numpy(dtype=np.float32)[keep])
+        types.append(df['tide_type'].to_numpy(dtype="S1")[keep])
+    times, heights, types = np.concatenate(times), np.concatenate(heights), np.concatenate(types)
+    order = np.argsort(times, kind="stable")
+    times, heights, types = times[order], heights[order], types[order]
+    counts = np.bincount(times // DAY, minlength=days).astype(np.int64)
+    return station_id, hourly, counts, times.astype(np.int32), heights, types
+
+
+def build_batch(station_ids, start, days):
+    """
+    build_station() for several stations, so each task is worth shipping to a process.
+
+    Returns:
+        tuple: (built results, IDs NOAA has no predictions for, (ID, error) for stations that failed)
+    """
+    built, missing, failed = [], [], []
+    for station_id in station_ids:
+        try:
+            result = build_station(station_id, start, days)
+        except Exception as e: # One bad station shouldn't sink its batch
+            failed.append((station_id, f"{type(e).__name__}: {e}"))
+            continue
+        if result is None:
+            missing.append(station_id)
+        else:
+            built.append(result)
+    return built, missing, failed
+
+
+def assemble(built, start, days):
+    """Stitches build_station() results into one PredictionArchive, stations sorted by ID."""
+    built = sorted(built, key=lambda result: result[0])
+    ids = np.array([result[0].encode("ascii") for result in built])
+    hourly = np.stack([result[1] for result in built]) if built else np.empty((0, days * 24), dtype=np.float32)
+    hilo_index = np.zeros((len(built), days + 1), dtype=np.int64)
+    base = 0
+    for row, result in enumerate(built):
+        np.cumsum(result[2], out=hilo_index[row, 1:])
+        hilo_index[row] += base
+        base = hilo_index[row, -1]
+    def joined(column, dtype):
+        return np.concatenate([result[column] for result in built]) if built else np.empty(0, dtype=dtype)
+    return PredictionArchive(ids if built else np.empty(0, dtype="S1"), start, hourly, hilo_index,
+                             joined(3, np.int32), joined(4, np.float32), joined(5, "S1"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute a year of tide predictions for every station.")
+    parser.add_argument("--output", default=PREDICTION_ARCHIVE_PATH, help="Archive file (default: PREDICTION_ARCHIVE_PATH)")
+    parser.add_argument("--days", type=int, default=367, help="Days covered, from yesterday (UTC) on (default: 367)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processes (default: one per core)")
+    parser.add_argument("--batch-size", type=int, default=8, help="Stations per task (default: 8)")
+    parser.add_argument("--station", action="append", help="Only these station IDs (repeatable)")
+    parser.add_argument("--allow-partial", action="store_true",
+                        help="Write the archive even if some stations failed to fetch")
+    args = parser.parse_args(argv)
+    if not args.output:
+        parser.error("give --output or set PREDICTION_ARCHIVE_PATH")
+
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    start = int((today - timedelta(days=1)).timestamp())
+    if args.station:
+        station_ids = sorted(set(args.station))
+    else:
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            catalog = get_noaa_tide_stations()
+        if catalog is None:
+            raise SystemExit("Couldn't retrieve the NOAA station list.")
+        station_ids = sorted({catalog.station_id(i) for i in range(len(catalog))})
+    batches = [station_ids[i:i + args.batch_size] for i in range(0, len(station_ids), args.batch_size)]
+    print(f"Building {args.days} days for {len(station_ids)} stations with {args.workers} processes...", file=sys.stderr)
+
+    run_start = time.perf_counter()
+    built, missing, failed = [], [], []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_quiet_worker) as pool:
+        futures = [pool.submit(build_batch, batch, start, args.days) for batch in batches]
+        for done, future in enumerate(as_completed(futures), 1):
+            batch_built, batch_missing, batch_failed = future.result()
+            built.extend(batch_built)
+            missing.extend(batch_missing)
+            failed.extend(batch_failed)
+            if done % 25 == 0 or done == len(futures):
+                print(f"  {len(built) + len(missing) + len(failed)}/{len(station_ids)} stations "
+                      f"({time.perf_counter() - run_start:.0f}s)", file=sys.stderr)
+
+    if missing:
+        print(f"No predictions for {len(missing)} stations (left out): {' '.join(sorted(missing)[:20])}"
+              f"{' ...' if len(missing) > 20 else ''}", file=sys.stderr)
+    if failed:
+        for station_id, error in sorted(failed)[:20]:
+            print(f"  FAIL {station_id}: {error}", file=sys.stderr)
+        print(f"Couldn't fetch {len(failed)} stations{' ...' if len(failed) > 20 else ''}", file=sys.stderr)
+        if not args.allow_partial:
+            print(f"Not writing {args.output}; rerun, or pass --allow-partial to leave them out.", file=sys.stderr)
+            return 1
+
+    archive = assemble(built, start, args.days)
+    archive.save(args.output)
+    size_mb = os.path.getsize(args.output) / 1e6
+    print(f"Wrote {args.output}: {len(archive)} stations, {len(archive.hilo_time)} highs/lows, {size_mb:.1f} MB "
+          f"in {time.perf_counter() - run_start:.1f}s", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
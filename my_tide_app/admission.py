@@ -0,0 +1,93 @@
+# my_tide_app/admission.py
+
+import fcntl
+import os
+import threading
+
+from config import ADMISSION_WORKER_LIMIT, ADMISSION_GLOBAL_LIMIT, ADMISSION_LOCK_DIR
+from instrumentation import register_gauge
+
+
+class Ticket:
+    """
+    One request's admission. `slot` is None if the request wasn't given a slot and so
+    must not call upstreams (shed). release() is safe to call more than once.
+    """
+
+    def __init__(self, control, slot):
+        self._control = control
+        self.slot = slot
+
+    @property
+    def shed(self):
+        return self.slot is None
+
+    def release(self):
+        if self.slot is not None:
+            slot, self.slot = self.slot, None
+            self._control._release(slot)
+
+
+class AdmissionControl:
+    """
+    Caps how many requests may be waiting on upstreams at once, so a burst of cold
+    lookups can't tie up every worker thread while requests the cache could answer in
+    milliseconds queue behind them.
+
+    Two caps apply: `worker_limit` requests in this process, and `global_limit` across
+    every process on the host. The host-wide slots are lock files; a slot is held by
+    keeping an exclusive flock on its file, so a worker that dies mid-request gives its
+    slot back with it. Admission never waits: a request either gets a slot now or is
+    shed, and the caller decides what a shed request still gets to do.
+    """
+
+    def __init__(self, worker_limit=ADMISSION_WORKER_LIMIT, global_limit=ADMISSION_GLOBAL_LIMIT,
+                 lock_dir=ADMISSION_LOCK_DIR):
+        self.worker_limit = worker_limit
+        self.global_limit = global_limit
+        self.lock_dir = lock_dir
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def admit(self):
+        """Returns a Ticket, holding a slot if one is free right now."""
+        with self._lock:
+            if self.worker_limit and self.in_flight >= self.worker_limit:
+                return Ticket(self, None)
+            self.in_flight += 1
+        host_slot = self._acquire_host_slot()
+        if host_slot is None:
+            with self._lock:
+                self.in_flight -= 1
+            return Ticket(self, None)
+        return Ticket(self, host_slot)
+
+    def _acquire_host_slot(self):
+        """An open file holding a host-wide slot's lock, True if there's no host cap, or None if all are taken."""
+        if not self.global_limit:
+            return True
+        for i in range(self.global_limit):
+            path = os.path.join(self.lock_dir, f"tide-admission.{i}.lock")
+            try:
+                # A fresh open per attempt: flock conflicts between open files even in one process
+                f = open(path, "a")
+            except OSError as e:
+                print(f"Admission lock {path} unavailable ({e}); capping this worker only.")
+                return True
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return f
+            except BlockingIOError:
+                f.close()
+        return None
+
+    def _release(self, slot):
+        if slot is not True:
+            slot.close() # Drops the flock
+        with self._lock:
+            self.in_flight -= 1
+
+
+admission = AdmissionControl()
+
+register_gauge("tide_admission_in_flight", lambda: [({}, admission.in_flight)])
@@ -1,6 +1,13 @@
 # my_tide_app/app.py
 
-from flask import Flask, render_template, request, flash, redirect, url_for
+from flask import (
+    Flask, Response, render_template, request, flash, redirect, url_for,
+    get_flashed_messages, session, stream_with_context, jsonify, make_response
+)
+from markupsafe import Markup, escape
+import contextvars
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta, timezone
@@ -11,14 +18,48 @@ from config import (
     PIRATE_WEATHER_API_KEY, OPENCAGE_API_KEY, SECRET_KEY,
     DEFAULT_STATION_ID, DEFAULT_STATION_NAME,
     DEFAULT_LATITUDE, DEFAULT_LONGITUDE,
-    LOCAL_TIMEZONE
+    REQUEST_LATENCY_BUDGET, ADMISSION_RETRY_AFTER,
+    STREAM_RESPONSES, STREAM_CHUNK_BYTES, BACKGROUND_WORKERS,
+    OBSERVATIONS_ENABLED, WINDOW_MAX_STATIONS, WINDOW_MAX_DAYS,
+    FORECAST_DAYS, NEARBY_DEFAULT_STATIONS, NEARBY_MAX_STATIONS, PLOT_MAX_DAYS, PLOT_CACHE_TTL,
+    FORECAST_MAX_HOURS, FORECAST_RESOLUTION_MINUTES, FORECAST_MIN_RESOLUTION_MINUTES,
+    FORECAST_MAX_RESOLUTION_MINUTES, TABLE_PAGE_ROWS, TABLE_MAX_PAGE_ROWS
+)
+from services.geocoding import (
+    get_coordinates_from_zip, get_noaa_tide_stations, find_closest_station, get_station_timezone,
+    coordinates_cached, stations_cached
+)
+from services.noaa import (
+    get_tide_data, predictions_cached, local_day_window, gmt_date_range, to_station_time, interpolate_tide_heights
 )
-from services.geocoding import get_coordinates_from_zip, get_noaa_tide_stations, find_closest_station
-from services.noaa import get_tide_data
-from services.pirate_weather import get_pirate_weather_report
+from services.pirate_weather import get_pirate_weather_report, hourly_weather_dataframe, forecast_cached
+from observations import get_residuals, summarize_residuals, BUFFER_HOURS
+from tide_windows import query_windows, windows_cached
+from nearby import compare_nearby, nearby_cached
+from tide_plot import plot_series, render_svg
+from forecast_table import (
+    parse_duration, table_window, fetch_window, build_forecast_table, match_weather
+)
+from cache import plot_cache, table_cache
+import instrumentation
+from instrumentation import stage, inc
+import profiling
+from resilience import start_budget
+import cache_snapshot
+from admission import admission
 
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
+instrumentation.init_app(app)
+profiling.init_app(app)
+# Warm caches from the last snapshot (if CACHE_SNAPSHOT_PATH is set) and keep it updated
+cache_snapshot.start()
+
+# Shared pool for upstream calls made off the request thread (e.g. weather while streaming)
+_background = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix="tide-bg")
+
+# Marker the streamed template outputs where everything so far should be flushed
+STREAM_FLUSH_MARKER = "<!--stream-flush-->"
 
 # Helper function to get weather icon (using emojis for simplicity)
 def get_weather_icon(summary):
@@ -42,231 +83,1068 @@ def get_weather_icon(summary):
     else:
         return '❓' # Question mark for unknown
 
-@app.route('/', methods=['GET', 'POST'])
-def index():
-    station_id = DEFAULT_STATION_ID
-    station_name = DEFAULT_STATION_NAME
-    current_latitude = DEFAULT_LATITUDE
-    current_longitude = DEFAULT_LONGITUDE
-    
-    # Initialize variables for template rendering
-    combined_forecast_data = [] # This will be a list of dicts for the table
-    next_tide_info = ""
-    
-    if request.method == 'POST':
-        zip_code_input = request.form.get('zip_code')
-        if zip_code_input:
-            if OPENCAGE_API_KEY == "YOUR_OPENCAGE_API_KEY":
-                flash("OpenCage API Key not set. Cannot perform ZIP code lookup. Using default Sharptown, MD.", "warning")
-            else:
+def resolve_station():
+    """
+    Works out which station this request is for. POSTs with a ZIP code are geocoded and
+    matched to the closest NOAA station; anything else gets the default Sharptown, MD station.
+    Flashes what happened along the way.
+
+    Returns:
+        dict: 'id', 'name', 'lat', 'lon' and 'tz' (its pytz time zone) of the station to show,
+              and 'origin', the (lat, lon) nearby stations are measured from: the ZIP
+              code's coordinates if one was looked up, otherwise the station's own.
+    """
+    station = _resolve_station()
+    station['tz'] = get_station_timezone(station['lat'], station['lon'])
+    station.setdefault('origin', (station['lat'], station['lon']))
+    return station
+
+
+def _resolve_station():
+    station = {
+        'id': DEFAULT_STATION_ID,
+        'name': DEFAULT_STATION_NAME,
+        'lat': DEFAULT_LATITUDE,
+        'lon': DEFAULT_LONGITUDE,
+    }
+    if request.method != 'POST':
+        return station
+
+    zip_code_input = request.form.get('zip_code')
+    if zip_code_input:
+        if OPENCAGE_API_KEY == "YOUR_OPENCAGE_API_KEY":
+            flash("OpenCage API Key not set. Cannot perform ZIP code lookup. Using default Sharptown, MD.", "warning")
+        else:
+            with stage("geocode"):
                 target_lat, target_lon = get_coordinates_from_zip(zip_code_input)
 
-                if target_lat is not None and target_lon is not None:
+            if target_lat is not None and target_lon is not None:
+                with stage("stations"):
                     all_noaa_stations = get_noaa_tide_stations()
-                    if all_noaa_stations is not None:
+                if all_noaa_stations is not None:
+                    with stage("closest_station"):
                         found_id, found_name, found_lat, found_lon = \
                             find_closest_station(target_lat, target_lon, all_noaa_stations)
 
-                        if found_id:
-                            station_id = found_id
-                            station_name = found_name
-                            current_latitude = found_lat
-                            current_longitude = found_lon
-                            flash(f"Closest station found to {zip_code_input}: {station_name} (ID: {station_id}) at Lat: {current_latitude:.4f}, Lon: {current_longitude:.4f}", "info")
-                        else:
-                            flash("Could not find a closest station. Using default Sharptown, MD station.", "warning")
+                    if found_id:
+                        station = {'id': found_id, 'name': found_name, 'lat': found_lat, 'lon': found_lon,
+                                   'origin': (target_lat, target_lon)}
+                        flash(f"Closest station found to {zip_code_input}: {found_name} (ID: {found_id}) at Lat: {found_lat:.4f}, Lon: {found_lon:.4f}", "info")
                     else:
-                        flash("Failed to retrieve NOAA station list. Using default Sharptown, MD station.", "warning")
+                        flash("Could not find a closest station. Using default Sharptown, MD station.", "warning")
                 else:
-                    flash("Failed to convert ZIP code to coordinates. Using default Sharptown, MD station.", "warning")
-        else:
-            flash("No ZIP code entered. Using default Sharptown, MD station.", "info")
-
-    # --- Date Range for API Calls ---
-    today_date = datetime.now(LOCAL_TIMEZONE)
-    end_date = today_date + timedelta(days=2) # Get data for today and the next two days
-    start_date_str = today_date.strftime("%Y%m%d")
-    end_date_str = end_date.strftime("%Y%m%d")
-
-    # --- Get Tide Predictions (Hourly and High/Low) ---
-    hourly_predictions_df = get_tide_data(
-        station_id=station_id,
-        start_date=start_date_str,
-        end_date=end_date_str,
-        product="predictions",
-        datum="MLLW",
-        time_zone="lst",
-        interval="h" # Request hourly predictions
-    )
+                    flash("Failed to retrieve NOAA station list. Using default Sharptown, MD station.", "warning")
+            else:
+                flash("Failed to convert ZIP code to coordinates. Using default Sharptown, MD station.", "warning")
+    else:
+        flash("No ZIP code entered. Using default Sharptown, MD station.", "info")
+    return station
 
-    hilo_tide_predictions_df = get_tide_data(
-        station_id=station_id,
-        start_date=start_date_str,
-        end_date=end_date_str,
-        product="predictions",
-        datum="MLLW",
-        time_zone="lst",
-        interval="hilo" # Request high/low predictions
-    )
 
-    # --- Localize Tide Data ---
-    if hourly_predictions_df is not None:
-        if hourly_predictions_df['datetime'].dt.tz is not None:
-            hourly_predictions_df['datetime'] = hourly_predictions_df['datetime'].dt.tz_localize(None)
-        hourly_predictions_df['datetime'] = hourly_predictions_df['datetime'].dt.tz_localize(LOCAL_TIMEZONE, ambiguous='infer', nonexistent='shift_forward')
-    
-    if hilo_tide_predictions_df is not None:
-        if hilo_tide_predictions_df['datetime'].dt.tz is not None:
-            hilo_tide_predictions_df['datetime'] = hilo_tide_predictions_df['datetime'].dt.tz_localize(None)
-        hilo_tide_predictions_df['datetime'] = hilo_tide_predictions_df['datetime'].dt.tz_localize(LOCAL_TIMEZONE, ambiguous='infer', nonexistent='shift_forward')
-
-    # --- Get General Weather Forecast ---
+def forecast_query(values, tz):
+    """
+    Reads the forecast table's horizon, resolution and cursor from request values.
+
+    Returns:
+        dict: 'hours', 'resolution' (minutes), 'cursor' (epoch seconds, or None for the
+              first page), the table's 'start' and 'end', and 'fetch_start' and
+              'fetch_end' for the predictions it is built from (aware datetimes in `tz`).
+
+    Raises:
+        ValueError: If a value can't be read or is out of range.
+    """
+    raw_horizon = (values.get('horizon') or '').strip()
+    raw_resolution = (values.get('resolution') or '').strip()
+    raw_cursor = (values.get('cursor') or '').strip()
+    try:
+        horizon = parse_duration(raw_horizon, 'h') if raw_horizon else FORECAST_DAYS * 24 * 60
+    except ValueError:
+        raise ValueError("horizon must be a duration like 36h or 7d")
+    if horizon % 60 or not 1 <= horizon // 60 <= FORECAST_MAX_HOURS:
+        raise ValueError(f"horizon must be a whole number of hours, up to {FORECAST_MAX_HOURS // 24}d")
+    try:
+        resolution = parse_duration(raw_resolution, 'm') if raw_resolution else FORECAST_RESOLUTION_MINUTES
+    except ValueError:
+        raise ValueError("resolution must be a duration like 6m or 1h")
+    if resolution % 1 or not FORECAST_MIN_RESOLUTION_MINUTES <= resolution <= FORECAST_MAX_RESOLUTION_MINUTES:
+        raise ValueError(f"resolution must be a whole number of minutes from {FORECAST_MIN_RESOLUTION_MINUTES}m "
+                         f"to {FORECAST_MAX_RESOLUTION_MINUTES // 60}h")
+    try:
+        cursor = int(raw_cursor) if raw_cursor else None
+    except ValueError:
+        raise ValueError("cursor must come from a previous page")
+
+    hours = int(horizon // 60)
+    start, end = table_window(tz, hours)
+    fetch_start, fetch_end = fetch_window(tz, end)
+    return {'hours': hours, 'resolution': int(resolution), 'cursor': cursor, 'start': start, 'end': end,
+            'fetch_start': fetch_start, 'fetch_end': fetch_end}
+
+
+# Offered on the page's form; the API takes any resolution within the limits
+RESOLUTION_CHOICES = (("6m", "6 minutes"), ("15m", "15 minutes"), ("30m", "30 minutes"),
+                      ("1h", "1 hour"), ("2h", "2 hours"), ("3h", "3 hours"))
+
+
+def plot_hours(forecast):
+    """Hours of the tide plot shown with a forecast_query(): the table's own horizon, from the same hour."""
+    return min(PLOT_MAX_DAYS * 24, forecast['hours'])
+
+
+def requested_forecast(tz):
+    """forecast_query() for the page, flashing (and falling back to the defaults for) a bad value."""
+    try:
+        return forecast_query(request.values, tz)
+    except ValueError as e:
+        flash(f"Couldn't show that forecast range: {e}. Showing the default.", "warning")
+        return forecast_query({}, tz)
+
+
+def fetch_tides(station, start, end, interval):
+    """
+    Gets tide predictions ("h" for hourly, "hilo" for high/low) between aware datetimes
+    `start` and `end`, with datetimes in the station's time zone, or None if NOAA didn't answer.
+    """
+    start_date_str, end_date_str = gmt_date_range(start, end)
+    with stage(f"tides_{interval}"):
+        predictions_df = get_tide_data(
+            station_id=station['id'],
+            start_date=start_date_str,
+            end_date=end_date_str,
+            product="predictions",
+            datum="MLLW",
+            time_zone="gmt",
+            interval=interval
+        )
+
+    with stage("localize"):
+        return to_station_time(predictions_df, station['tz'], start, end)
+
+
+def fetch_weather(latitude, longitude, tz):
+    """
+    Gets the hourly Pirate Weather forecast as a DataFrame with renamed columns and
+    datetimes in `tz`.
+
+    Returns:
+        tuple: (weather_df, warning). weather_df is empty if no forecast is available,
+               in which case warning says why. Doesn't flash, so it is safe to run
+               outside the request thread.
+    """
     weather_df = pd.DataFrame() # Initialize empty DataFrame
-    if PIRATE_WEATHER_API_KEY != "YOUR_PIRATE_WEATHER_API_KEY":
+    if PIRATE_WEATHER_API_KEY == "YOUR_PIRATE_WEATHER_API_KEY":
+        return weather_df, "Skipping Pirate Weather requests. Please provide your API key."
+
+    with stage("weather"):
         general_weather_forecast = get_pirate_weather_report(
-            current_latitude,
-            current_longitude,
+            latitude,
+            longitude,
             time_unix=None # Request general forecast
         )
-        if general_weather_forecast and 'hourly' in general_weather_forecast and 'data' in general_weather_forecast['hourly']:
-            hourly_weather_data = general_weather_forecast['hourly']['data']
-            weather_df = pd.DataFrame(hourly_weather_data)
-            weather_df['time'] = pd.to_datetime(weather_df['time'], unit='s', utc=True)
-            weather_df['time'] = weather_df['time'].dt.tz_convert(LOCAL_TIMEZONE)
-            # Rename for consistency
-            weather_df.rename(columns={'time': 'datetime', 'summary': 'weather_summary',
-                                       'temperature': 'temp_f', 'apparentTemperature': 'feels_like_f',
-                                       'precipProbability': 'precip_prob', 'windSpeed': 'wind_speed_mph',
-                                       'humidity': 'humidity_percent', 'pressure': 'pressure_mb',
-                                       'dewPoint': 'dew_point_f', 'visibility': 'visibility_miles'}, inplace=True)
-            # Convert percentage fields
-            weather_df['precip_prob'] = weather_df['precip_prob'] * 100
-            weather_df['humidity_percent'] = weather_df['humidity_percent'] * 100
-        else:
-            flash("Could not retrieve general weather forecast or hourly data from Pirate Weather.", "warning")
+    hourly_df = hourly_weather_dataframe(general_weather_forecast, tz)
+    if hourly_df is not None:
+        return hourly_df, None
+    return weather_df, "Could not retrieve general weather forecast or hourly data from Pirate Weather."
+
+
+def fetch_forecast_table(station, forecast, hourly_predictions_df, hilo_tide_predictions_df):
+    """
+    The ForecastTable for a forecast_query(), built from the predictions fetched for it,
+    or None if there are none. Tables built from both kinds of predictions are cached, so
+    paging through a long horizon doesn't build it again.
+    """
+    def build():
+        return build_forecast_table(forecast['start'], forecast['end'], forecast['resolution'],
+                                    hourly_predictions_df, hilo_tide_predictions_df)
+
+    with stage("table"):
+        if hourly_predictions_df is None or hilo_tide_predictions_df is None:
+            return build() # Don't keep a table that is missing half its data
+        key = (station['id'], int(forecast['start'].timestamp()), int(forecast['end'].timestamp()),
+               forecast['resolution'])
+        return table_cache.get_or_load(key, build)
+
+
+def format_weather_cells(weather_summary, temp_f=np.nan, precip_prob=np.nan, wind_speed_mph=np.nan, humidity_percent=np.nan):
+    """Formats one set of weather readings into the table's display strings."""
+    return {
+        'Weather_Icon': get_weather_icon(weather_summary),
+        'Weather_Summary': weather_summary,
+        'Temp': f"{temp_f:.1f}°F" if pd.notna(temp_f) else '',
+        'Precip_Prob': f"{precip_prob:.0f}%" if pd.notna(precip_prob) else '',
+        'Wind': f"{wind_speed_mph:.1f} mph" if pd.notna(wind_speed_mph) else '',
+        'Humidity': f"{humidity_percent:.0f}%" if pd.notna(humidity_percent) else '',
+    }
+
+
+def weather_cells_for(times, weather_df):
+    """Formats the hourly forecast closest to each of `times` (epoch seconds) for the table."""
+    cells = []
+    for i in match_weather(times, weather_df):
+        if i < 0:
+            # No forecast within 30 minutes (or none at all)
+            cells.append(format_weather_cells('No forecast'))
+            continue
+        closest_weather = weather_df.iloc[i]
+        cells.append(format_weather_cells(
+            closest_weather.get('weather_summary', 'N/A'),
+            closest_weather.get('temp_f', np.nan),
+            closest_weather.get('precip_prob', np.nan),
+            closest_weather.get('wind_speed_mph', np.nan),
+            closest_weather.get('humidity_percent', np.nan),
+        ))
+    return cells
+
+
+def iter_tide_rows(table, page, tz):
+    """Yields the tide half of each table row on `page` (time, event, height and row class)."""
+    for i in range(page['offset'], page['stop']):
+        tide_type_hilo = table.events[i].decode()
+
+        # Determine row class for styling
+        if tide_type_hilo == 'H':
+            row_class = "row-high-tide"
+        elif tide_type_hilo == 'L':
+            row_class = "row-low-tide"
+        else: # Grid row; alternate by position among grid rows, across pages too
+            row_class = "row-hourly-odd" if table.grid_rank[i] % 2 == 0 else "row-hourly-even"
+
+        yield {
+            'Time': datetime.fromtimestamp(int(table.times[i]), tz).strftime('%Y-%m-%d %I:%M %p %Z'),
+            'Tide_Event': tide_type_hilo,
+            'Tide_Height': f"{table.heights[i]:.2f} ft",
+            'row_class': row_class
+        }
+
+
+def build_table_pager(table, page):
+    """The pager under the forecast table (earlier/later links and where this page is), or ""."""
+    if table is None or page is None or (page['prev_cursor'] is None and page['next_cursor'] is None):
+        return Markup("")
+    # The pager resubmits the request's values, but not its cursor, nor a profiling secret
+    # that would end up in every page link and access log line after it
+    form_values = [(name, value) for name, value in request.values.items(multi=True)
+                   if name != 'cursor' and name not in profiling.PROFILE_PARAMS]
+    return Markup(render_template('_table_pager.html', page=page, total=len(table), form_values=form_values))
+
+
+def iter_weather_only_rows(weather_df):
+    """Yields table rows for the weather forecast alone, used when tides are unavailable."""
+    for i, (_, weather) in enumerate(weather_df.iterrows()):
+        row = {
+            'Time': weather['datetime'].strftime('%Y-%m-%d %I:%M %p %Z'),
+            'Tide_Event': '',
+            'Tide_Height': '',
+            'row_class': "row-hourly-odd" if i % 2 == 0 else "row-hourly-even"
+        }
+        row.update(format_weather_cells(
+            weather.get('weather_summary', 'N/A'),
+            weather.get('temp_f', np.nan),
+            weather.get('precip_prob', np.nan),
+            weather.get('wind_speed_mph', np.nan),
+            weather.get('humidity_percent', np.nan),
+        ))
+        yield row
+
+
+def build_current_height_info(hilo_tide_predictions_df, hourly_predictions_df=None):
+    """Returns the "Tide Now" line, interpolated from predictions already fetched, or ""."""
+    now = datetime.now(timezone.utc)
+    heights = interpolate_tide_heights([now, now + timedelta(minutes=6)],
+                                       hilo_df=hilo_tide_predictions_df, hourly_df=hourly_predictions_df)
+    if np.isnan(heights).any():
+        return ""
+    trend = "rising" if heights[1] > heights[0] else "falling"
+    return f"<p><strong>Tide Now:</strong> {heights[0]:.2f} ft and {trend}</p>"
+
+
+def build_next_tide_info(hilo_tide_predictions_df, hourly_predictions_df=None):
+    """Returns the HTML for the "Next High/Low Tide" summary block."""
+    if hilo_tide_predictions_df is None:
+        return "<p>High/low tide predictions are unavailable right now.</p>"
+
+    # Determine next high/low tide for display (separate from the main table)
+    current_time_for_comparison = datetime.now(timezone.utc)
+    future_tides = hilo_tide_predictions_df[hilo_tide_predictions_df['datetime'] > current_time_for_comparison].copy()
+    if future_tides.empty:
+        return "<p>No future high/low tide predictions available for the specified date range.</p>"
+
+    next_tide_info = build_current_height_info(hilo_tide_predictions_df, hourly_predictions_df)
+    next_high_tide = future_tides[future_tides['tide_type'] == 'H'].sort_values(by='datetime').iloc[0] if not future_tides[future_tides['tide_type'] == 'H'].empty else None
+    next_low_tide = future_tides[future_tides['tide_type'] == 'L'].sort_values(by='datetime').iloc[0] if not future_tides[future_tides['tide_type'] == 'L'].empty else None
+
+    if next_high_tide is not None:
+        next_tide_info += f"<p><strong>Next High Tide:</strong> {next_high_tide['datetime'].strftime('%Y-%m-%d %I:%M %p %Z')} (Height: {next_high_tide['height_ft']:.2f} ft)</p>"
+    if next_low_tide is not None:
+        next_tide_info += f"<p><strong>Next Low Tide:</strong> {next_low_tide['datetime'].strftime('%Y-%m-%d %I:%M %p %Z')} (Height: {next_low_tide['height_ft']:.2f} ft)</p>"
+    return next_tide_info
+
+
+def fetch_observation_summary(station_id):
+    """Latest observed-vs-predicted figures for the last day, or None if unavailable or disabled."""
+    if not OBSERVATIONS_ENABLED:
+        return None
+    with stage("observations"):
+        return summarize_residuals(get_residuals(station_id, hours=24))
+
+
+def build_observed_info(summary, tz):
+    """Returns the HTML for the "Observed Water Level" block, or "" if there is nothing to show."""
+    if summary is None:
+        return ""
+    observed_time = summary['time'].astimezone(tz)
+    surge = summary['residual_ft']
+    info = (f"<p><strong>Observed Water Level:</strong> {summary['observed_ft']:.2f} ft at "
+            f"{observed_time.strftime('%Y-%m-%d %I:%M %p %Z')}</p>")
+    if pd.notna(surge):
+        direction = "above" if surge >= 0 else "below"
+        info += (f"<p><strong>Surge:</strong> {abs(surge):.2f} ft {direction} predicted "
+                 f"({summary['predicted_ft']:.2f} ft)</p>")
+    if summary['max_residual_ft'] is not None:
+        info += (f"<p>Last 24 hours: {summary['min_residual_ft']:+.2f} to "
+                 f"{summary['max_residual_ft']:+.2f} ft vs. predicted</p>")
+    return f'<div class="observed-info mb-6 p-6 bg-gray-50 rounded-lg shadow-sm">{info}</div>'
+
+
+# Query parameter -> query_windows() keyword
+WINDOW_PARAMETERS = {
+    'min_tide': 'min_tide_ft',
+    'max_tide': 'max_tide_ft',
+    'max_wind': 'max_wind_mph',
+    'max_precip': 'max_precip_pct',
+    'min_duration': 'min_duration_minutes',
+}
+
+
+def window_query(values, default_days=2):
+    """
+    Reads a tide window query from request values.
+
+    Returns:
+        tuple: (thresholds, days). thresholds is None if no threshold was given.
+
+    Raises:
+        ValueError: If a value isn't a number or days is out of range.
+    """
+    thresholds = {}
+    for param, keyword in WINDOW_PARAMETERS.items():
+        raw = (values.get(param) or '').strip()
+        if raw:
+            try:
+                thresholds[keyword] = float(raw)
+            except ValueError:
+                raise ValueError(f"{param} must be a number")
+    raw_days = (values.get('days') or '').strip()
+    try:
+        days = float(raw_days) if raw_days else default_days
+    except ValueError:
+        raise ValueError("days must be a number")
+    if not 0 < days <= WINDOW_MAX_DAYS:
+        raise ValueError(f"days must be between 0 and {WINDOW_MAX_DAYS}")
+    if not set(thresholds) - {'min_duration_minutes'}:
+        return None, days
+    return thresholds, days
+
+
+def build_windows_info(windows, days, tz):
+    """Returns the HTML for the "Good Tide Windows" block."""
+    if not windows:
+        info = f"<p>No times in the next {days:g} days meet all of your conditions.</p>"
     else:
-        flash("Skipping Pirate Weather requests. Please provide your API key.", "warning")
+        items = []
+        for window in windows:
+            start = window['start'].astimezone(tz)
+            end = window['end'].astimezone(tz)
+            details = f"peak {window['peak_tide_ft']:.2f} ft"
+            if window['max_wind_mph'] is not None:
+                details += f", wind up to {window['max_wind_mph']:.0f} mph"
+            if window['max_precip_pct'] is not None:
+                details += f", rain up to {window['max_precip_pct']:.0f}%"
+            if not window['weather_checked']:
+                details += " (beyond the weather forecast)"
+            items.append(f"<li>{start.strftime('%a %b %d %I:%M %p')} – {end.strftime('%I:%M %p %Z')} "
+                         f"({window['duration_minutes'] / 60:.1f} h; {details})</li>")
+        info = f"<ul class=\"list-disc pl-6\">{''.join(items)}</ul>"
+    return f'<div class="tide-windows mb-6 p-6 bg-gray-50 rounded-lg shadow-sm"><h3>Good Tide Windows</h3>{info}</div>'
 
-    # --- Prepare Combined Data for Template ---
-    if hourly_predictions_df is not None:
-        # Create a list of all relevant tide events (hourly and high/low)
-        all_tide_events = []
-        if hourly_predictions_df is not None:
-            for idx, row in hourly_predictions_df.iterrows():
-                all_tide_events.append({
-                    'datetime': row['datetime'],
-                    'height_ft': row['height_ft'],
-                    'type': 'hourly',
-                    'tide_type_hilo': None # Not a specific H/L event
-                })
-        
-        if hilo_tide_predictions_df is not None:
-            for idx, row in hilo_tide_predictions_df.iterrows():
-                all_tide_events.append({
-                    'datetime': row['datetime'],
-                    'height_ft': row['height_ft'],
-                    'type': f"{row['tide_type'].lower()}_tide", # 'h_tide' or 'l_tide'
-                    'tide_type_hilo': row['tide_type'] # 'H' or 'L'
-                })
-        
-        # Sort all events by datetime
-        all_tide_events.sort(key=lambda x: x['datetime'])
-
-        # Build the final display data list
-        row_counter = 0
-        for event in all_tide_events:
-            event_datetime = event['datetime']
-            event_type = event['type']
-            event_height = event['height_ft']
-            tide_type_hilo = event['tide_type_hilo']
-
-            # Find closest weather data for this event
-            weather_summary = 'N/A'
-            temp_f = np.nan
-            precip_prob = np.nan
-            wind_speed_mph = np.nan
-            humidity_percent = np.nan
-            weather_icon = '❓' # Default icon for unknown/no data
-
-            if not weather_df.empty:
-                # Check if event_datetime is within the range of available weather data
-                if weather_df['datetime'].min() <= event_datetime <= weather_df['datetime'].max():
-                    time_diff = (weather_df['datetime'] - event_datetime).abs()
-                    closest_weather_idx = time_diff.idxmin()
-                    closest_weather = weather_df.loc[closest_weather_idx]
-                    
-                    # Only use weather if it's reasonably close (e.g., within 30 minutes)
-                    if time_diff.loc[closest_weather_idx] <= timedelta(minutes=30):
-                        weather_summary = closest_weather.get('weather_summary', 'N/A')
-                        temp_f = closest_weather.get('temp_f', np.nan)
-                        precip_prob = closest_weather.get('precip_prob', np.nan)
-                        wind_speed_mph = closest_weather.get('wind_speed_mph', np.nan)
-                        humidity_percent = closest_weather.get('humidity_percent', np.nan)
-                        weather_icon = get_weather_icon(weather_summary)
-                    else:
-                        # Closest weather is too far, treat as no forecast for this specific point
-                        weather_summary = 'No forecast'
-                        weather_icon = get_weather_icon(weather_summary) # Will return '🚫'
+
+def fetch_windows_info(station):
+    """Good tide windows for the page, if the request asked for any; "" otherwise."""
+    try:
+        thresholds, days = window_query(request.values)
+    except ValueError as e:
+        flash(f"Couldn't search for tide windows: {e}.", "warning")
+        return ""
+    if thresholds is None:
+        return ""
+    with stage("windows"):
+        windows = query_windows([station], days, **thresholds)
+    return build_windows_info(windows, days, station['tz'])
+
+
+def nearby_count(raw, default=0, param='nearby'):
+    """
+    How many nearby stations to compare, from the raw value of query parameter `param`
+    (`default` if not given).
+
+    Raises:
+        ValueError: If it isn't a whole number between 0 and NEARBY_MAX_STATIONS.
+    """
+    raw = (raw or '').strip()
+    try:
+        k = int(raw) if raw else default
+    except ValueError:
+        raise ValueError(f"{param} must be a whole number")
+    if not 0 <= k <= NEARBY_MAX_STATIONS:
+        raise ValueError(f"{param} must be between 0 and {NEARBY_MAX_STATIONS}")
+    return k
+
+
+def build_nearby_info(stations, current_id):
+    """Returns the HTML for the "Nearby Stations" comparison block."""
+    if not stations:
+        info = "<p>The NOAA station list is unavailable right now.</p>"
+    else:
+        rows = []
+        for station in stations:
+            name = escape(station['name'])
+            if station['id'] == current_id:
+                name += Markup(" <em>(shown below)</em>")
+            cells = [f"{name}<br><span class=\"text-gray-500\">{station['id']}</span>",
+                     f"{station['distance_miles']:.1f} mi"]
+            for key in ('high', 'low'):
+                if station['tides'] is None:
+                    cells.append("unavailable")
+                elif station['tides'][key] is None:
+                    cells.append("–")
                 else:
-                    # Event datetime is outside the entire weather forecast range
-                    weather_summary = 'No forecast'
-                    weather_icon = get_weather_icon(weather_summary) # Will return '🚫'
-            else:
-                # No weather data was retrieved at all
-                weather_summary = 'No forecast'
-                weather_icon = get_weather_icon(weather_summary) # Will return '🚫'
-
-
-            # Determine row class for styling
-            row_class = ""
-            if event_type == 'h_tide':
-                row_class = "row-high-tide"
-            elif event_type == 'l_tide':
-                row_class = "row-low-tide"
-            else: # Hourly tide
-                row_class = "row-hourly-odd" if row_counter % 2 == 0 else "row-hourly-even"
-                row_counter += 1 # Only increment for hourly rows to maintain alternating pattern
-
-            combined_forecast_data.append({
-                'Time': event_datetime.strftime('%Y-%m-%d %I:%M %p %Z'),
-                'Tide_Event': tide_type_hilo if tide_type_hilo else '',
-                'Tide_Height': f"{event_height:.2f} ft" if pd.notna(event_height) else '',
-                'Weather_Icon': weather_icon,
-                'Weather_Summary': weather_summary,
-                'Temp': f"{temp_f:.1f}°F" if pd.notna(temp_f) else '',
-                'Precip_Prob': f"{precip_prob:.0f}%" if pd.notna(precip_prob) else '',
-                'Wind': f"{wind_speed_mph:.1f} mph" if pd.notna(wind_speed_mph) else '',
-                'Humidity': f"{humidity_percent:.0f}%" if pd.notna(humidity_percent) else '',
-                'row_class': row_class
-            })
-        
-        if not combined_forecast_data:
-            flash("No combined tide and weather forecast data available for the specified date range.", "info")
-
-        # Determine next high/low tide for display (separate from the main table)
-        current_time_for_comparison = datetime.now(LOCAL_TIMEZONE)
-        future_tides = hilo_tide_predictions_df[hilo_tide_predictions_df['datetime'] > current_time_for_comparison].copy()
-        
-        if not future_tides.empty:
-            next_high_tide = future_tides[future_tides['tide_type'] == 'H'].sort_values(by='datetime').iloc[0] if not future_tides[future_tides['tide_type'] == 'H'].empty else None
-            next_low_tide = future_tides[future_tides['tide_type'] == 'L'].sort_values(by='datetime').iloc[0] if not future_tides[future_tides['tide_type'] == 'L'].empty else None
-
-            if next_high_tide is not None:
-                next_tide_info += f"<p><strong>Next High Tide:</strong> {next_high_tide['datetime'].strftime('%Y-%m-%d %I:%M %p %Z')} (Height: {next_high_tide['height_ft']:.2f} ft)</p>"
-            if next_low_tide is not None:
-                next_tide_info += f"<p><strong>Next Low Tide:</strong> {next_low_tide['datetime'].strftime('%Y-%m-%d %I:%M %p %Z')} (Height: {next_low_tide['height_ft']:.2f} ft)</p>"
+                    tide_time, height = station['tides'][key]
+                    cells.append(f"{tide_time.strftime('%a %I:%M %p %Z')}<br>{height:.2f} ft")
+            rows.append("<tr>" + "".join(f"<td>{cell}</td>" for cell in cells) + "</tr>")
+        info = ('<div class="table-container"><table class="table"><thead><tr><th>Station</th><th>Distance</th>'
+                f'<th>Next High</th><th>Next Low</th></tr></thead><tbody>{"".join(rows)}</tbody></table></div>')
+    return f'<div class="nearby-stations mb-6 p-6 bg-gray-50 rounded-lg shadow-sm"><h3>Nearby Stations</h3>{info}</div>'
+
+
+def fetch_nearby_info(station, k):
+    """The nearby stations block for `k` stations around the station's origin; "" if k is 0."""
+    if not k:
+        return ""
+    with stage("nearby"):
+        stations = compare_nearby(*station['origin'], k)
+    return build_nearby_info(stations, station['id'])
+
+
+def requested_nearby_count():
+    """nearby_count() for the page, flashing (and ignoring) a bad value."""
+    try:
+        return nearby_count(request.values.get('nearby'))
+    except ValueError as e:
+        flash(f"Couldn't compare nearby stations: {e}.", "warning")
+        return 0
+
+
+def station_cached():
+    """True if resolve_station() can answer without calling any upstream."""
+    zip_code = request.form.get('zip_code') if request.method == 'POST' else None
+    if zip_code and OPENCAGE_API_KEY != "YOUR_OPENCAGE_API_KEY":
+        # Otherwise resolve_station() would fall back to the default station; that isn't an answer
+        return coordinates_cached(zip_code) and stations_cached()
+    return True
+
+
+def servable_from_cache(station, forecast):
+    """
+    True if the page for `station` and the forecast_query() asked for can be built
+    without calling any upstream: the cache or the prediction archive has all of the
+    hourly and high/low predictions it needs, and the cache has the weather forecast,
+    plus whatever the nearby stations and tide windows blocks asked for need.
+    """
+    start_date_str, end_date_str = gmt_date_range(forecast['fetch_start'], forecast['fetch_end'])
+    if not all(predictions_cached(station['id'], start_date_str, end_date_str, interval) for interval in ("h", "hilo")):
+        return False
+    if PIRATE_WEATHER_API_KEY != "YOUR_PIRATE_WEATHER_API_KEY" and not forecast_cached(station['lat'], station['lon']):
+        return False
+
+    # A bad value is flashed (and the block left out) when the page is built
+    try:
+        k = nearby_count(request.values.get('nearby'))
+    except ValueError:
+        k = 0
+    if k and not nearby_cached(*station['origin'], k):
+        return False
+    try:
+        thresholds, days = window_query(request.values)
+    except ValueError:
+        thresholds = None
+    return thresholds is None or windows_cached([station], days)
+
+
+def busy_response():
+    """The fast 503 for a request turned away by admission control."""
+    response = Response("Tide lookups are busy right now. Please try again in a few seconds.\n",
+                        status=503, mimetype='text/plain')
+    response.headers['Retry-After'] = str(ADMISSION_RETRY_AFTER)
+    return response
+
+
+@app.route('/', methods=['GET', 'POST'])
+def index():
+    # A page the cache can answer is served from it without calling any upstream, so it
+    # neither waits for nor holds an admission slot. Only so many of the rest may wait
+    # on upstreams at once (see admission.py); one that can't get a slot is turned away
+    # at once, so cold lookups can't hold up requests the cache can answer.
+    if station_cached():
+        flashes = list(session.get('_flashes', []))
+        start_budget(REQUEST_LATENCY_BUDGET, cache_only=True)
+        station = resolve_station()
+        forecast = requested_forecast(station['tz'])
+        if servable_from_cache(station, forecast):
+            inc("tide_admission_total", decision="cached")
+            return serve_index(station, forecast)
+        # Resolved again below; its messages go out once, with the page
+        if flashes:
+            session['_flashes'] = flashes
         else:
-            next_tide_info = "<p>No future high/low tide predictions available for the specified date range.</p>"
+            session.pop('_flashes', None)
+
+    ticket = admission.admit()
+    if ticket.shed:
+        inc("tide_admission_total", decision="rejected")
+        return busy_response()
+    inc("tide_admission_total", decision="admitted")
+    try:
+        # Every upstream call below gets whatever is left of this budget, so one slow
+        # dependency can't hold the worker for the sum of all their timeouts.
+        start_budget(REQUEST_LATENCY_BUDGET)
+        station = resolve_station()
+        response = make_response(serve_index(station, requested_forecast(station['tz'])))
+    except BaseException:
+        ticket.release()
+        raise
+    # A streamed page is still fetching until the last chunk goes out
+    response.call_on_close(ticket.release)
+    return response
+
 
+def serve_index(station, forecast):
+    # Nearby stations are fetched alongside this station's own data rather than after it
+    nearby_future = submit_background(fetch_nearby_info, station, requested_nearby_count())
+    if wants_streaming():
+        return stream_index(station, nearby_future, forecast)
+
+    combined_forecast_data = [] # This will be a list of dicts for the table
+    next_tide_info = ""
+    table_pager = ""
+
+    # Predictions are fetched for whole days; the table takes its horizon out of them
+    hourly_predictions_df = fetch_tides(station, forecast['fetch_start'], forecast['fetch_end'], "h")
+    hilo_tide_predictions_df = fetch_tides(station, forecast['fetch_start'], forecast['fetch_end'], "hilo")
+    table = fetch_forecast_table(station, forecast, hourly_predictions_df, hilo_tide_predictions_df)
+
+    weather_df, weather_warning = fetch_weather(station['lat'], station['lon'], station['tz'])
+    if weather_warning:
+        flash(weather_warning, "warning")
+
+    observed_info = build_observed_info(fetch_observation_summary(station['id']), station['tz'])
+    windows_info = fetch_windows_info(station)
+    nearby_info = nearby_future.result()
+
+    # --- Prepare Combined Data for Template ---
+    with stage("join"):
+        if table is not None:
+            # Only this page's rows are built, however long the horizon
+            page = table.page(forecast['cursor'], TABLE_PAGE_ROWS)
+            cells = weather_cells_for(table.times[page['offset']:page['stop']], weather_df)
+            for row, weather_cells in zip(iter_tide_rows(table, page, station['tz']), cells):
+                row.update(weather_cells)
+                combined_forecast_data.append(row)
+            table_pager = build_table_pager(table, page)
+
+            if not combined_forecast_data:
+                flash("No combined tide and weather forecast data available for the specified date range.", "info")
+            if hourly_predictions_df is None:
+                flash("Hourly tide predictions are unavailable right now. Showing high/low tides only.", "warning")
+
+            next_tide_info = build_next_tide_info(hilo_tide_predictions_df, hourly_predictions_df)
+
+        elif not weather_df.empty:
+            # Tides are unavailable but the weather came back: show that rather than nothing
+            flash("Tide predictions are unavailable right now. Showing the weather forecast only.", "warning")
+            next_tide_info = "<p>Tide predictions are unavailable right now.</p>"
+            combined_forecast_data = list(iter_weather_only_rows(weather_df))
+        else:
+            flash("Failed to retrieve hourly tide data. Cannot generate combined forecast.", "error")
+
+    with stage("render"):
+        return render_template(
+            'index.html',
+            station_name=station['name'],
+            station_id=station['id'],
+            combined_forecast_data=combined_forecast_data, # Pass the list of dicts
+            table_pager=table_pager,
+            next_tide_info=next_tide_info,
+            observed_info=observed_info,
+            windows_info=windows_info,
+            nearby_info=nearby_info,
+            nearby_max=NEARBY_MAX_STATIONS,
+            plot_hours=plot_hours(forecast),
+            resolution_choices=RESOLUTION_CHOICES,
+            form_values=request.values
+        )
+
+
+def station_by_id(station_id):
+    """
+    Looks a station ID up in the catalog. The default station is known without it, and
+    placed where the page places it, so its plot and the page share a weather forecast.
+
+    Returns:
+        dict: 'id', 'name', 'lat', 'lon' and 'tz', or None if the station is unknown.
+    """
+    if station_id == DEFAULT_STATION_ID:
+        name, lat, lon = DEFAULT_STATION_NAME, DEFAULT_LATITUDE, DEFAULT_LONGITUDE
     else:
-        flash("Failed to retrieve hourly tide data. Cannot generate combined forecast.", "error")
+        all_noaa_stations = get_noaa_tide_stations()
+        found = all_noaa_stations.lookup(station_id) if all_noaa_stations is not None else None
+        if found is None:
+            return None
+        station_id, name, lat, lon = found
+    return {'id': station_id, 'name': name, 'lat': lat, 'lon': lon, 'tz': get_station_timezone(lat, lon)}
+
+
+@app.route('/api/observations/<station_id>')
+def api_observations(station_id):
+    """
+    Observed and predicted water levels with residuals (surge) for a station, from the
+    observation buffer. ?hours= limits how far back to go (default 24, at most what the
+    buffer holds).
+    """
+    start_budget(REQUEST_LATENCY_BUDGET)
+    try:
+        hours = float(request.args.get('hours', 24))
+    except ValueError:
+        return jsonify({'error': "hours must be a number"}), 400
+    if not (np.isfinite(hours) and 0 < hours <= BUFFER_HOURS):
+        return jsonify({'error': f"hours must be more than 0 and at most {BUFFER_HOURS:g}"}), 400
+    if not OBSERVATIONS_ENABLED:
+        return jsonify({'error': "Observations are disabled on this server"}), 404
+
+    residuals = get_residuals(station_id, hours=hours)
+    if residuals is None:
+        return jsonify({'error': f"No observed water levels for station {station_id}"}), 404
+
+    def clean(value):
+        return None if np.isnan(value) else round(float(value), 3)
+
+    summary = summarize_residuals(residuals)
+    summary['time'] = summary['time'].isoformat()
+    return jsonify({
+        'station_id': station_id,
+        'datum': "MLLW",
+        'units': "ft",
+        'latest': {k: clean(v) if isinstance(v, float) else v for k, v in summary.items()},
+        'samples': [
+            {
+                'time': datetime.fromtimestamp(int(t), timezone.utc).isoformat(),
+                'observed_ft': clean(observed),
+                'predicted_ft': clean(predicted),
+                'residual_ft': clean(residual),
+            }
+            for t, observed, predicted, residual in zip(
+                residuals['times'], residuals['observed_ft'], residuals['predicted_ft'], residuals['residual_ft'])
+        ],
+    })
+
+
+@app.route('/api/windows')
+def api_windows():
+    """
+    Times when the tide and weather meet the given thresholds, across one or more stations.
+
+    Query parameters: stations (comma-separated IDs), min_tide, max_tide (ft), max_wind (mph),
+    max_precip (%), min_duration (minutes), days (default 7).
+    """
+    start_budget(REQUEST_LATENCY_BUDGET)
+    station_ids = [s.strip() for s in request.args.get('stations', DEFAULT_STATION_ID).split(',') if s.strip()]
+    if not station_ids or len(station_ids) > WINDOW_MAX_STATIONS:
+        return jsonify({'error': f"Give between 1 and {WINDOW_MAX_STATIONS} stations"}), 400
+    try:
+        thresholds, days = window_query(request.args, default_days=7)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if thresholds is None:
+        return jsonify({'error': "Give at least one of min_tide, max_tide, max_wind or max_precip"}), 400
+
+    stations, unknown = [], []
+    for station_id in station_ids:
+        station = station_by_id(station_id)
+        if station is None:
+            unknown.append(station_id)
+        else:
+            stations.append(station)
+    if unknown:
+        return jsonify({'error': f"Unknown stations: {', '.join(unknown)}"}), 404
+    timezones = {station['id']: station['tz'] for station in stations}
+
+    windows = query_windows(stations, days, **thresholds)
+    return jsonify({
+        'days': days,
+        'thresholds': thresholds,
+        'windows': [
+            {
+                'station_id': w['station_id'],
+                'station_name': w['station_name'],
+                'timezone': timezones[w['station_id']].zone,
+                'start': w['start'].astimezone(timezones[w['station_id']]).isoformat(timespec='seconds'),
+                'end': w['end'].astimezone(timezones[w['station_id']]).isoformat(timespec='seconds'),
+                'duration_minutes': round(w['duration_minutes'], 1),
+                'peak_tide_ft': round(w['peak_tide_ft'], 3),
+                'low_tide_ft': round(w['low_tide_ft'], 3),
+                'max_wind_mph': None if w['max_wind_mph'] is None else round(w['max_wind_mph'], 1),
+                'max_precip_pct': None if w['max_precip_pct'] is None else round(w['max_precip_pct'], 1),
+                'weather_checked': w['weather_checked'],
+            }
+            for w in windows
+        ],
+    })
+
 
-    return render_template(
-        'index.html',
-        station_name=station_name,
-        combined_forecast_data=combined_forecast_data, # Pass the list of dicts
-        next_tide_info=next_tide_info
+@app.route('/api/nearby')
+def api_nearby():
+    """
+    The stations closest to a point with their next high and low tides.
+
+    Query parameters: zip, or lat and lon, or station (an ID; default the Sharptown station),
+    and k (how many stations, default NEARBY_DEFAULT_STATIONS).
+    """
+    start_budget(REQUEST_LATENCY_BUDGET)
+    try:
+        k = nearby_count(request.args.get('k'), default=NEARBY_DEFAULT_STATIONS, param='k')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if k < 1:
+        return jsonify({'error': "k must be at least 1"}), 400
+
+    zip_code = (request.args.get('zip') or '').strip()
+    if zip_code:
+        target_lat, target_lon = get_coordinates_from_zip(zip_code)
+        if target_lat is None:
+            return jsonify({'error': f"Couldn't convert ZIP code {zip_code} to coordinates"}), 404
+    elif request.args.get('lat') or request.args.get('lon'):
+        try:
+            target_lat, target_lon = float(request.args['lat']), float(request.args['lon'])
+        except (KeyError, ValueError):
+            return jsonify({'error': "lat and lon must both be numbers"}), 400
+    else:
+        station_id = request.args.get('station', DEFAULT_STATION_ID)
+        station = station_by_id(station_id)
+        if station is None:
+            return jsonify({'error': f"Unknown station: {station_id}"}), 404
+        target_lat, target_lon = station['lat'], station['lon']
+
+    stations = compare_nearby(target_lat, target_lon, k)
+    if not stations:
+        return jsonify({'error': "The NOAA station list is unavailable right now"}), 503
+
+    def tide(station, key):
+        if station['tides'] is None or station['tides'][key] is None:
+            return None
+        time, height = station['tides'][key]
+        return {'time': time.isoformat(timespec='seconds'), 'height_ft': round(height, 3)}
+
+    return jsonify({
+        'origin': {'lat': target_lat, 'lon': target_lon},
+        'stations': [
+            {
+                'id': station['id'],
+                'name': station['name'],
+                'lat': station['lat'],
+                'lon': station['lon'],
+                'timezone': station['tz'].zone,
+                'distance_miles': round(station['distance_miles'], 2),
+                'tides_available': station['tides'] is not None,
+                'next_high': tide(station, 'high'),
+                'next_low': tide(station, 'low'),
+            }
+            for station in stations
+        ],
+    })
+
+@app.route('/api/forecast')
+def api_forecast():
+    """
+    A station's forecast table a page at a time: tide heights at the chosen resolution
+    plus the high and low tides, each with the closest hourly weather forecast, from the
+    start of the current hour.
+
+    Query parameters: station (an ID; default the Sharptown station), horizon (e.g. 36h
+    or 7d; default FORECAST_DAYS days), resolution (e.g. 6m or 1h; default hourly),
+    limit (rows per page, default TABLE_PAGE_ROWS), cursor (a next_cursor or prev_cursor
+    from an earlier page), weather (0 to leave the weather out).
+    """
+    start_budget(REQUEST_LATENCY_BUDGET)
+    station_id = request.args.get('station', DEFAULT_STATION_ID)
+    station = station_by_id(station_id)
+    if station is None:
+        return jsonify({'error': f"Unknown station: {station_id}"}), 404
+    try:
+        forecast = forecast_query(request.args, station['tz'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        limit = int(request.args.get('limit', TABLE_PAGE_ROWS))
+    except ValueError:
+        return jsonify({'error': "limit must be a whole number"}), 400
+    if not 1 <= limit <= TABLE_MAX_PAGE_ROWS:
+        return jsonify({'error': f"limit must be between 1 and {TABLE_MAX_PAGE_ROWS}"}), 400
+    weather = request.args.get('weather', '1').lower() not in ("0", "false", "no")
+
+    hourly_predictions_df = fetch_tides(station, forecast['fetch_start'], forecast['fetch_end'], "h")
+    hilo_tide_predictions_df = fetch_tides(station, forecast['fetch_start'], forecast['fetch_end'], "hilo")
+    table = fetch_forecast_table(station, forecast, hourly_predictions_df, hilo_tide_predictions_df)
+    if table is None:
+        return jsonify({'error': f"Tide predictions for station {station_id} are unavailable right now"}), 503
+
+    page = table.page(forecast['cursor'], limit)
+    times = table.times[page['offset']:page['stop']]
+    weather_df = fetch_weather(station['lat'], station['lon'], station['tz'])[0] if weather else None
+    matches = match_weather(times, weather_df) if weather else np.full(len(times), -1)
+
+    def clean(value):
+        return None if pd.isna(value) else round(float(value), 1)
+
+    def weather_at(i):
+        if i < 0:
+            return None
+        hour = weather_df.iloc[i]
+        return {
+            'summary': hour.get('weather_summary'),
+            'temp_f': clean(hour.get('temp_f')),
+            'precip_prob': clean(hour.get('precip_prob')),
+            'wind_speed_mph': clean(hour.get('wind_speed_mph')),
+            'humidity_percent': clean(hour.get('humidity_percent')),
+        }
+
+    tz = station['tz']
+    return jsonify({
+        'station_id': station['id'],
+        'station_name': station['name'],
+        'timezone': tz.zone,
+        'start': forecast['start'].isoformat(timespec='seconds'),
+        'end': forecast['end'].isoformat(timespec='seconds'),
+        'horizon_hours': forecast['hours'],
+        'resolution_minutes': forecast['resolution'],
+        'hourly_available': hourly_predictions_df is not None,
+        'total_rows': len(table),
+        'offset': page['offset'],
+        'next_cursor': page['next_cursor'],
+        'prev_cursor': page['prev_cursor'],
+        'rows': [
+            {
+                'time': datetime.fromtimestamp(int(t), tz).isoformat(timespec='seconds'),
+                'height_ft': round(float(table.heights[i]), 3),
+                'event': table.events[i].decode() or None,
+                'weather': weather_at(match) if weather else None,
+            }
+            for i, t, match in zip(range(page['offset'], page['stop']), times, matches)
+        ],
+    })
+
+
+def render_plot(station, start, end, width, height, weather):
+    """Loader for plot_cache: (svg bytes, etag), or None if NOAA didn't answer."""
+    with stage("plot_data"):
+        series = plot_series(station, start, end, weather=weather)
+    if series is None:
+        return None
+    with stage("plot_render"):
+        svg = render_svg(station, series, width=width, height=height).encode("utf-8")
+    return svg, hashlib.sha1(svg).hexdigest()
+
+
+@app.route('/plot/<station_id>.svg')
+def plot_svg(station_id):
+    """
+    The tide curve for a station as SVG, with H/L markers and (unless weather=0) the
+    forecast's rain chance and wind. Query parameters: hours (from the start of the
+    current hour, as the forecast table counts them) or days (whole local days from
+    midnight; default FORECAST_DAYS), up to PLOT_MAX_DAYS either way; width and height
+    (px). Rendered plots are cached and carry an ETag, so revalidating an unchanged plot
+    is a 304.
+    """
+    start_budget(REQUEST_LATENCY_BUDGET)
+    try:
+        hours = int(request.args['hours']) if 'hours' in request.args else None
+        days = int(request.args.get('days', FORECAST_DAYS))
+        width = int(request.args.get('width', 800))
+        height = int(request.args.get('height', 300))
+    except ValueError:
+        return jsonify({'error': "hours, days, width and height must be whole numbers"}), 400
+    if hours is not None and not 1 <= hours <= PLOT_MAX_DAYS * 24:
+        return jsonify({'error': f"hours must be between 1 and {PLOT_MAX_DAYS * 24}"}), 400
+    if not 1 <= days <= PLOT_MAX_DAYS:
+        return jsonify({'error': f"days must be between 1 and {PLOT_MAX_DAYS}"}), 400
+    if not (200 <= width <= 4000 and 120 <= height <= 2000):
+        return jsonify({'error': "width must be 200-4000 and height 120-2000"}), 400
+    weather = request.args.get('weather', '1').lower() not in ("0", "false", "no")
+
+    station = station_by_id(station_id)
+    if station is None:
+        return jsonify({'error': f"Unknown station: {station_id}"}), 404
+
+    if hours is not None:
+        start, end = table_window(station['tz'], hours)
+    else:
+        start, end = local_day_window(station['tz'], days)
+    # The window moves with the clock, so its start is part of the key
+    key = (station['id'], start.timestamp(), end.timestamp(), width, height, weather)
+    rendered = plot_cache.get_or_load(key, lambda: render_plot(station, start, end, width, height, weather))
+    if rendered is None:
+        return jsonify({'error': f"Tide predictions for station {station_id} are unavailable right now"}), 503
+
+    svg, etag = rendered
+    response = Response(svg, mimetype='image/svg+xml')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = PLOT_CACHE_TTL
+    return response.make_conditional(request)
+
+# --- Streamed rendering ---
+
+def wants_streaming():
+    """Streaming is on if STREAM_RESPONSES is set, and can be toggled per request with ?stream=1/0."""
+    requested = request.values.get('stream')
+    if requested is None:
+        return STREAM_RESPONSES
+    return requested.lower() in ("1", "true", "yes")
+
+
+def submit_background(fn, *args):
+    """Runs fn(*args) on the background pool, carrying over the request's latency budget."""
+    return _background.submit(contextvars.copy_context().run, fn, *args)
+
+
+class LazyHtml:
+    """Markup that is only computed when the template reaches it (used by the streamed page)."""
+
+    def __init__(self, fn):
+        self._fn = fn
+        self._value = None
+        self._done = False
+
+    def __html__(self):
+        if not self._done:
+            self._value = self._fn()
+            self._done = True
+        return self._value
+
+    __str__ = __html__
+
+
+def _buffered(chunks):
+    """
+    Coalesces Jinja's many small chunks into STREAM_CHUNK_BYTES writes, but sends
+    everything so far immediately wherever the template outputs STREAM_FLUSH_MARKER
+    (i.e. just before something that may have to wait on an upstream).
+    """
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        while STREAM_FLUSH_MARKER in chunk:
+            before, chunk = chunk.split(STREAM_FLUSH_MARKER, 1)
+            buffer.append(before)
+            yield "".join(buffer)
+            buffer, size = [], 0
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= STREAM_CHUNK_BYTES:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def stream_index(station, nearby_future, forecast):
+    """
+    Streams the page instead of rendering it in one go. The shell goes out at once; the
+    "Next High/Low Tide" block follows as soon as the hi/lo predictions arrive; table rows
+    are sent as they are built; weather columns are filled in by a script at the end of
+    the table, since the forecast is fetched in the background in the meantime.
+    """
+    # Consume flashes from resolve_station() now: the session cookie is sent with the
+    # headers, before the template gets to read them.
+    get_flashed_messages(with_categories=True)
+
+    start, end = forecast['fetch_start'], forecast['fetch_end']
+    weather_future = submit_background(fetch_weather, station['lat'], station['lon'], station['tz'])
+    observations_future = submit_background(fetch_observation_summary, station['id'])
+    state = {'hilo': None, 'table': None, 'page': None, 'weather_only': False}
+
+    def next_tide_info():
+        state['hilo'] = fetch_tides(station, start, end, "hilo")
+        return build_next_tide_info(state['hilo'])
+
+    def rows():
+        hourly_predictions_df = fetch_tides(station, start, end, "h")
+        if hourly_predictions_df is None and state['hilo'] is None:
+            weather_df, _ = weather_future.result()
+            if weather_df.empty:
+                flash("Failed to retrieve hourly tide data. Cannot generate combined forecast.", "error")
+                return
+            flash("Tide predictions are unavailable right now. Showing the weather forecast only.", "warning")
+            state['weather_only'] = True
+            yield from iter_weather_only_rows(weather_df)
+            return
+        if hourly_predictions_df is None:
+            flash("Hourly tide predictions are unavailable right now. Showing high/low tides only.", "warning")
+
+        table = state['table'] = fetch_forecast_table(station, forecast, hourly_predictions_df, state['hilo'])
+        if table is None:
+            return
+        page = state['page'] = table.page(forecast['cursor'], TABLE_PAGE_ROWS)
+        pending = format_weather_cells('')
+        pending['Weather_Icon'] = '…'
+        for row in iter_tide_rows(table, page, station['tz']):
+            row.update(pending)
+            yield row
+
+    def weather_fill():
+        weather_df, weather_warning = weather_future.result()
+        if weather_warning:
+            flash(weather_warning, "warning")
+        page = state['page']
+        if state['weather_only'] or page is None or page['offset'] == page['stop']:
+            return ""
+        with stage("join"):
+            cells = weather_cells_for(state['table'].times[page['offset']:page['stop']], weather_df)
+        return render_template('_weather_fill.html', cells=cells)
+
+    def late_messages():
+        # Flashes raised while streaming can't reach the session any more; show them here.
+        return session.pop('_flashes', [])
+
+    template = app.jinja_env.get_template('index.html')
+    chunks = template.generate(
+        station_name=station['name'],
+        station_id=station['id'],
+        next_tide_info=LazyHtml(next_tide_info),
+        observed_info=LazyHtml(lambda: build_observed_info(observations_future.result(), station['tz'])),
+        windows_info=LazyHtml(lambda: fetch_windows_info(station)),
+        nearby_info=LazyHtml(nearby_future.result),
+        nearby_max=NEARBY_MAX_STATIONS,
+        form_values=request.values,
+        combined_forecast_data=rows(),
+        table_pager=LazyHtml(lambda: build_table_pager(state['table'], state['page'])),
+        plot_hours=plot_hours(forecast),
+        resolution_choices=RESOLUTION_CHOICES,
+        streaming=True,
+        stream_flush=Markup(STREAM_FLUSH_MARKER),
+        weather_fill=LazyHtml(weather_fill),
+        late_messages=late_messages,
     )
+    return Response(stream_with_context(_buffered(chunks)), mimetype='text/html')
+
 
 if __name__ == '__main__':
     app.run(debug=True)
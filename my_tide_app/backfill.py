@@ -0,0 +1,355 @@
+# my_tide_app/backfill.py
+
+import fcntl
+import json
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+
+from resilience import get_quota
+from services.noaa import get_tide_data
+from services.pirate_weather import get_time_machine_day
+
+# Store layout: a directory holding
+#   manifest.json   rows committed, column dtypes, the station and summary dictionaries,
+#                   the run's settings and the days already done for each station
+#   <column>.bin    one little-endian array per column, rows appended in commit order
+# A chunk's rows are appended to every column file and fsynced, then the manifest is
+# replaced; only the manifest's row count is ever read, so a run killed mid-append
+# leaves nothing visible and the next append cuts the torn tail off first.
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+COLUMNS = {
+    "station": "<i4",            # Index into manifest "stations"
+    "time": "<i8",               # Tide time, UTC epoch seconds
+    "tide_type": "S1",           # b"H" or b"L"
+    "height_ft": "<f4",          # Above MLLW
+    "weather_time": "<i8",       # Time of the weather sample paired with the tide; 0 if none
+    "summary": "<i2",            # Index into manifest "summaries"; -1 if none
+    "temp_f": "<f4",
+    "precip_prob": "<f4",        # 0-100
+    "precip_intensity": "<f4",   # in/h
+    "wind_speed_mph": "<f4",
+    "wind_gust_mph": "<f4",
+    "wind_bearing": "<f4",
+    "pressure_mb": "<f4",
+    "humidity_percent": "<f4",   # 0-100
+    "cloud_cover": "<f4",        # 0-100
+}
+# Pirate Weather field -> (column, scale)
+WEATHER_FIELDS = {
+    "temperature": ("temp_f", 1), "precipProbability": ("precip_prob", 100),
+    "precipIntensity": ("precip_intensity", 1), "windSpeed": ("wind_speed_mph", 1),
+    "windGust": ("wind_gust_mph", 1), "windBearing": ("wind_bearing", 1),
+    "pressure": ("pressure_mb", 1), "humidity": ("humidity_percent", 100),
+    "cloudCover": ("cloud_cover", 100),
+}
+
+# A tide is paired with the closest weather sample only if it's this close
+WEATHER_MATCH_TOLERANCE = 30 * 60
+
+
+class QuotaExhausted(Exception):
+    """
+    Pirate Weather's daily quota (short of the site's reserve) is used up for today.
+
+    Attributes:
+        paired (int): Tides before this index had been paired with the weather.
+        weather (dict): The weather columns paired so far (see pair_weather()).
+        calls (int): Time-machine calls made, including the one that was refused.
+        partial (tuple): (first day, last day, rows, calls) for the whole days of the
+                         chunk that were finished before it ran out, so that weather
+                         isn't fetched twice, or None if there are none.
+    """
+
+    def __init__(self, message, paired=0, weather=None, calls=0):
+        super().__init__(message)
+        self.paired = paired
+        self.weather = weather if weather is not None else {}
+        self.calls = calls
+        self.partial = None
+
+
+class ChunkFailed(Exception):
+    """A chunk couldn't be fetched completely; it is left for the next run."""
+
+
+class BackfillStore:
+    """
+    Append-only columnar store of tides paired with the weather at the time.
+
+    Rows are only ever added, a whole chunk (one station, a run of days) at a time, and
+    the days already stored double as the job's checkpoint. Columns are read back as read-only
+    memory maps, so analysing years of rows doesn't mean loading them all.
+    """
+
+    def __init__(self, path, settings=None, readonly=False):
+        """
+        Opens (or creates) the store in directory `path`. `settings` (e.g. the tide source)
+        are recorded on creation; reopening with different ones raises ValueError, since
+        rows fetched differently shouldn't be mixed. A read-only store can be opened while
+        a backfill is writing to it and sees the rows committed when it was opened.
+        """
+        self.path = path
+        self._lock_file = None
+        if not readonly:
+            os.makedirs(path, exist_ok=True)
+            self._lock_file = open(os.path.join(path, "lock"), "a")
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB) # One writer per store
+            except BlockingIOError:
+                self._lock_file.close()
+                raise ValueError(f"{path} is being written by another backfill")
+        elif not os.path.exists(os.path.join(path, MANIFEST)):
+            raise ValueError(f"{path} is not a backfill store")
+        self.manifest = self._read_manifest(settings or {})
+
+    def close(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _read_manifest(self, settings):
+        try:
+            with open(os.path.join(self.path, MANIFEST)) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return {"version": FORMAT_VERSION, "rows": 0, "columns": COLUMNS, "settings": settings,
+                    "stations": [], "summaries": [], "done": {}, "updated_at": None}
+        if manifest.get("version") != FORMAT_VERSION or manifest.get("columns") != COLUMNS:
+            raise ValueError(f"{self.path} is not a version {FORMAT_VERSION} backfill store")
+        if settings and manifest["settings"] != settings:
+            raise ValueError(f"{self.path} was built with {manifest['settings']}, not {settings}")
+        return manifest
+
+    def _write_manifest(self):
+        self.manifest["updated_at"] = time.time()
+        manifest_path = os.path.join(self.path, MANIFEST)
+        tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, manifest_path)
+
+    def __len__(self):
+        return self.manifest["rows"]
+
+    def missing(self, station_id, first_day, last_day):
+        """The (first, last) date ranges within first_day..last_day not stored for the station yet."""
+        gaps, cursor = [], first_day.toordinal()
+        for done_first, done_last in self.manifest["done"].get(station_id, ()):
+            if done_first > cursor:
+                gaps.append((cursor, min(done_first - 1, last_day.toordinal())))
+            cursor = max(cursor, done_last + 1)
+            if cursor > last_day.toordinal():
+                break
+        if cursor <= last_day.toordinal():
+            gaps.append((cursor, last_day.toordinal()))
+        return [(date.fromordinal(a), date.fromordinal(b)) for a, b in gaps if a <= b]
+
+    def _mark_done(self, station_id, first_day, last_day):
+        # Kept as sorted, merged [first, last] day ordinals
+        ranges = self.manifest["done"].get(station_id, []) + [[first_day.toordinal(), last_day.toordinal()]]
+        merged = []
+        for a, b in sorted(ranges):
+            if merged and a <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], b)
+            else:
+                merged.append([a, b])
+        self.manifest["done"][station_id] = merged
+
+    def _code(self, dictionary, value):
+        values = self.manifest[dictionary]
+        try:
+            return values.index(value)
+        except ValueError:
+            values.append(value)
+            return len(values) - 1
+
+    def append(self, station_id, first_day, last_day, rows):
+        """
+        Commits a chunk: `rows` is {column: array} (equal lengths, 'station' and 'summary'
+        left out; summaries go in as a 'summary_text' list of str or None). Marks the
+        station's days first_day..last_day done even if there are no rows.
+        """
+        count = len(rows["time"])
+        columns = dict(rows)
+        columns["station"] = np.full(count, self._code("stations", station_id))
+        columns["summary"] = [-1 if text is None else self._code("summaries", text)
+                              for text in columns.pop("summary_text")]
+        committed = self.manifest["rows"]
+        for name, dtype in COLUMNS.items():
+            data = np.asarray(columns[name]).astype(dtype)
+            with open(os.path.join(self.path, f"{name}.bin"), "ab") as f:
+                f.truncate(committed * np.dtype(dtype).itemsize) # Drop a torn append from a killed run
+                f.write(data.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        self.manifest["rows"] = committed + count
+        self._mark_done(station_id, first_day, last_day)
+        self._write_manifest()
+
+    # --- Reading ---
+
+    def column(self, name):
+        """The committed rows of one column, memory-mapped read-only."""
+        rows = self.manifest["rows"]
+        if not rows:
+            return np.empty(0, dtype=COLUMNS[name])
+        return np.memmap(os.path.join(self.path, f"{name}.bin"), dtype=COLUMNS[name], mode="r", shape=(rows,))
+
+    def to_dataframe(self, columns=None):
+        """The store as a DataFrame, with station IDs, summaries and UTC datetimes decoded."""
+        import pandas as pd
+        df = pd.DataFrame({name: np.asarray(self.column(name), dtype=np.float64 if COLUMNS[name] == "<f4" else None)
+                           for name in (columns or COLUMNS)})
+        if "station" in df:
+            df["station"] = pd.Categorical.from_codes(df["station"], categories=self.manifest["stations"])
+        if "summary" in df:
+            df["summary"] = pd.Categorical.from_codes(df["summary"], categories=self.manifest["summaries"])
+        if "tide_type" in df:
+            df["tide_type"] = df["tide_type"].str.decode("ascii")
+        for name in ("time", "weather_time"):
+            if name in df:
+                df[name] = pd.to_datetime(df[name].where(df[name] > 0), unit="s", utc=True)
+        return df
+
+
+# --- Fetching ---
+
+def month_chunks(first_day, last_day):
+    """Splits first_day..last_day (dates, inclusive) at month boundaries into (first, last) pairs."""
+    while first_day <= last_day:
+        following = date(first_day.year + first_day.month // 12, first_day.month % 12 + 1, 1)
+        yield first_day, min(following - timedelta(days=1), last_day)
+        first_day = following
+
+
+def tide_events(station_id, first_day, last_day, source="predictions", tide_types=("H",)):
+    """
+    High (and optionally low) tides between two UTC dates, inclusive.
+
+    Args:
+        source (str): "predictions" (NOAA's hi/lo predictions) or "observed" (its verified
+                      highs and lows, which only exist where the station measures water level).
+
+    Returns:
+        tuple: (epoch seconds, heights in ft, tide types) arrays (empty if NOAA has none for
+               the range), or None if NOAA didn't answer.
+    """
+    product = "predictions" if source == "predictions" else "high_low"
+    df = get_tide_data(station_id, first_day.strftime("%Y%m%d"), last_day.strftime("%Y%m%d"),
+                       product=product, datum="MLLW", time_zone="gmt", interval="hilo")
+    if df is None:
+        return None
+    df = df[df['tide_type'].isin(tide_types)].sort_values(by='datetime')
+    times = df['datetime'].to_numpy(dtype="datetime64[s]").astype(np.int64) # Naive GMT
+    return times, df['height_ft'].to_numpy(dtype=np.float64), df['tide_type'].to_numpy(dtype="S1")
+
+
+def _weather_points(report):
+    """Every sample in a time-machine report (the hourly ones and 'currently'), sorted by time."""
+    points = list((report.get('hourly') or {}).get('data') or [])
+    if 'currently' in report:
+        points.append(report['currently'])
+    points = [point for point in points if 'time' in point]
+    points.sort(key=lambda point: point['time'])
+    return points
+
+
+def pair_weather(lat, lon, times):
+    """
+    Pairs each tide time with the closest weather sample within WEATHER_MATCH_TOLERANCE.
+
+    A time-machine call returns the whole day's hourly weather, so one call is made for
+    the earliest tide not yet paired and covers every other tide that day; where the API
+    only returns the instant asked for, that degrades to one call per tide.
+
+    Returns:
+        dict: Column arrays (as in COLUMNS) plus 'summary_text', and the number of calls made.
+
+    Raises:
+        QuotaExhausted: Today's non-essential Pirate Weather quota ran out.
+        ChunkFailed: A call failed for any other reason.
+    """
+    count = len(times)
+    out = {column: np.full(count, np.nan) for column, _ in WEATHER_FIELDS.values()}
+    out['weather_time'] = np.zeros(count, dtype=np.int64)
+    out['summary_text'] = [None] * count
+    pending = list(range(count)) # Indices of tides still unpaired, in time order
+    calls = 0
+    while pending:
+        report = get_time_machine_day(lat, lon, times[pending[0]])
+        calls += 1
+        if report is None:
+            quota = get_quota("pirate_weather")
+            if quota is not None and quota.exhausted(essential=False):
+                # Tides before pending[0] are done
+                raise QuotaExhausted("Pirate Weather quota used up for today", pending[0], out, calls)
+            raise ChunkFailed("Pirate Weather time-machine call failed")
+
+        points = _weather_points(report)
+        point_times = np.array([point['time'] for point in points], dtype=np.int64)
+        still_pending = []
+        for i in pending:
+            j = int(np.argmin(np.abs(point_times - times[i]))) if len(points) else None
+            if j is None or abs(point_times[j] - times[i]) > WEATHER_MATCH_TOLERANCE:
+                still_pending.append(i)
+                continue
+            point = points[j]
+            out['weather_time'][i] = point_times[j]
+            out['summary_text'][i] = point.get('summary')
+            for field, (column, scale) in WEATHER_FIELDS.items():
+                if point.get(field) is not None:
+                    out[column][i] = point[field] * scale
+        if still_pending and still_pending[0] == pending[0]:
+            still_pending.pop(0) # The API has nothing for the instant asked for; leave it unpaired
+        pending = still_pending
+    return out, calls
+
+
+def backfill_chunk(station, first_day, last_day, source="predictions", tide_types=("H",)):
+    """
+    Fetches one chunk: a station's tides between two UTC dates and the weather at each.
+
+    Returns:
+        tuple: (rows for BackfillStore.append(), time-machine calls made).
+    """
+    events = tide_events(station['id'], first_day, last_day, source, tide_types)
+    if events is None:
+        raise ChunkFailed(f"NOAA returned no {source} for {station['id']} {first_day} to {last_day}")
+    times, heights, types = events
+    try:
+        weather, calls = pair_weather(station['lat'], station['lon'], times)
+    except QuotaExhausted as e:
+        # Keep the days before the one being paired when the quota ran out
+        cutoff = datetime.fromtimestamp(int(times[e.paired]), timezone.utc).date()
+        keep = times < int(datetime.combine(cutoff, datetime.min.time(), timezone.utc).timestamp())
+        if cutoff > first_day:
+            rows = {'time': times[keep], 'height_ft': heights[keep], 'tide_type': types[keep],
+                    **{column: np.asarray(values)[keep] for column, values in e.weather.items()}}
+            rows['summary_text'] = list(rows['summary_text'])
+            e.partial = (first_day, cutoff - timedelta(days=1), rows, e.calls)
+        raise
+    return {'time': times, 'height_ft': heights, 'tide_type': types, **weather}, calls
+
+
+def pending_chunks(store, stations, start, end):
+    """
+    (station, first day, last day) for every stretch of start..end the store doesn't have
+    yet, at most a calendar month each, so an interrupted run loses at most that much.
+    """
+    # Only whole past days: the time machine has nothing for the future
+    end = min(end, datetime.now(timezone.utc).date() - timedelta(days=1))
+    return [(station, first_day, last_day)
+            for station in stations
+            for gap_first, gap_last in store.missing(station['id'], start, end)
+            for first_day, last_day in month_chunks(gap_first, gap_last)]
@@ -0,0 +1,135 @@
+# my_tide_app/cache.py
+
+import threading
+import time
+from collections import OrderedDict
+
+from config import (
+    STATIONS_CACHE_TTL, GEOCODE_CACHE_TTL, TIDE_CACHE_TTL, WEATHER_CACHE_TTL,
+    WEATHER_STALE_TTL, GEOCODE_STALE_TTL, PLOT_CACHE_TTL
+)
+from instrumentation import record_cache
+
+
+class TTLCache:
+    """
+    Thread-safe in-process cache with per-entry expiry and LRU eviction.
+
+    get_or_load() also collapses concurrent misses for the same key into a single
+    load, so a burst of requests (or a batch run) for one station only calls the
+    upstream once. With `stale_seconds`, expired entries are kept that much longer
+    and returned if the load fails (or is refused, e.g. by a quota).
+    """
+
+    def __init__(self, name, ttl_seconds, max_entries=1024, stale_seconds=0):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.stale_seconds = stale_seconds
+        self._entries = OrderedDict() # key -> (expires_at, value)
+        self._loading = {}            # key -> threading.Event for loads in progress
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached value, or None if missing or expired. Doesn't count as a lookup."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                if entry[0] + self.stale_seconds < time.time():
+                    del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def get_stale(self, key):
+        """Returns the value even if expired, as long as it's within `stale_seconds`; else None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] + self.stale_seconds < time.time():
+                return None
+            return entry[1]
+
+    def set(self, key, value, ttl_seconds=None):
+        expires_at = time.time() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_load(self, key, loader, ttl_seconds=None):
+        """
+        Returns the cached value for `key`, calling loader() on a miss.
+        None results (failed loads) aren't cached; the stale entry is returned
+        instead if there is one, otherwise None.
+        """
+        while True:
+            value = self.get(key)
+            if value is not None:
+                record_cache(self.name, True)
+                return value
+            with self._lock:
+                event = self._loading.get(key)
+                if event is None:
+                    event = self._loading[key] = threading.Event()
+                    break
+            # Someone else is loading this key; wait for them and look again
+            event.wait()
+
+        record_cache(self.name, False)
+        try:
+            value = loader()
+            if value is not None:
+                self.set(key, value, ttl_seconds)
+                return value
+            stale = self.get_stale(key)
+            if stale is not None:
+                record_cache(self.name, "stale")
+            return stale
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            event.set()
+
+    def export(self):
+        """Returns (key, expires_at, value) for every entry still usable (fresh or within `stale_seconds`)."""
+        cutoff = time.time() - self.stale_seconds
+        with self._lock:
+            return [(key, expires_at, value) for key, (expires_at, value) in self._entries.items()
+                    if expires_at >= cutoff]
+
+    def restore(self, entries):
+        """
+        Adds entries from export() (e.g. another process's), skipping ones that are no longer
+        usable and ones this cache already holds a fresher copy of. Returns how many were added.
+        """
+        cutoff = time.time() - self.stale_seconds
+        added = 0
+        with self._lock:
+            for key, expires_at, value in entries:
+                current = self._entries.get(key)
+                if expires_at < cutoff or (current is not None and current[0] >= expires_at):
+                    continue
+                self._entries[key] = (expires_at, value)
+                added += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return added
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+stations_cache = TTLCache("stations", STATIONS_CACHE_TTL, max_entries=4)
+geocode_cache = TTLCache("geocode", GEOCODE_CACHE_TTL, max_entries=10000, stale_seconds=GEOCODE_STALE_TTL)
+tide_cache = TTLCache("tides", TIDE_CACHE_TTL, max_entries=2000)
+weather_cache = TTLCache("weather", WEATHER_CACHE_TTL, max_entries=2000, stale_seconds=WEATHER_STALE_TTL)
+plot_cache = TTLCache("plots", PLOT_CACHE_TTL, max_entries=500) # Rendered SVGs
+table_cache = TTLCache("tables", TIDE_CACHE_TTL, max_entries=200) # ForecastTables built from predictions
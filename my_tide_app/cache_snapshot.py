@@ -0,0 +1,170 @@
+# my_tide_app/cache_snapshot.py
+
+import atexit
+import fcntl
+import hashlib
+import hmac
+import os
+import pickle
+import struct
+import threading
+import time
+
+import pandas as pd
+
+from config import CACHE_SNAPSHOT_PATH, CACHE_SNAPSHOT_SECONDS, SECRET_KEY, DEV_SECRET_KEY
+from cache import geocode_cache, tide_cache, weather_cache
+from instrumentation import inc
+
+# File layout: header, then a pickled payload
+#   header   MAGIC, version, payload_bytes, HMAC-SHA256(SECRET_KEY, payload)
+#   payload  {"created_at": float, "pandas": str, "caches": {name: [(key, expires_at, value), ...]}}
+# The payload is only unpickled once its HMAC checks out, so a truncated, corrupted or
+# foreign file is rejected before any of it is trusted. That only holds while SECRET_KEY is
+# secret, so snapshots are neither written nor read with the public DEV_SECRET_KEY. Bump
+# FORMAT_VERSION whenever the shape of a cached value changes.
+MAGIC = b"TIDESNAP"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8sIQ32s")
+
+# The station catalog isn't here: it already lives in its own file (STATION_STORE_PATH)
+SNAPSHOT_CACHES = {cache.name: cache for cache in (geocode_cache, tide_cache, weather_cache)}
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def _signature(payload):
+    if SECRET_KEY == DEV_SECRET_KEY:
+        # Anyone could sign a payload with the public key, and unpickling it runs their code
+        raise ValueError("SECRET_KEY is the public development default; set FLASK_SECRET_KEY to use snapshots")
+    return hmac.new(SECRET_KEY.encode("utf-8"), payload, hashlib.sha256).digest()
+
+
+def read_snapshot(path):
+    """
+    Reads and verifies a snapshot file. Raises FileNotFoundError if there is none, and
+    ValueError if it is of another version, truncated, fails its integrity check, was
+    written by a different pandas (pickled DataFrames don't always survive an upgrade)
+    or SECRET_KEY is the development default.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < _HEADER.size:
+        raise ValueError("too short to be a cache snapshot")
+    magic, version, payload_bytes, signature = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError(f"not a version {FORMAT_VERSION} cache snapshot")
+    payload = data[_HEADER.size:]
+    if len(payload) != payload_bytes:
+        raise ValueError(f"truncated ({len(payload)} of {payload_bytes} payload bytes)")
+    if not hmac.compare_digest(signature, _signature(payload)):
+        raise ValueError("integrity check failed")
+    snapshot = pickle.loads(payload)
+    if snapshot.get("pandas") != pd.__version__:
+        raise ValueError(f"written by pandas {snapshot.get('pandas')}, this is {pd.__version__}")
+    return snapshot
+
+
+def _read_or_empty(path):
+    try:
+        return read_snapshot(path)["caches"]
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        inc("tide_cache_snapshot_total", action="load", outcome="rejected")
+        print(f"Ignoring cache snapshot {path}: {e}")
+        return {}
+
+
+def write_snapshot(path):
+    """
+    Writes this process's caches to `path`, merged with what the other workers already
+    wrote there (the fresher copy of each entry wins). Returns the number of entries written.
+    Raises ValueError if SECRET_KEY is the development default.
+    """
+    _signature(b"") # Refuse before taking the lock or reading the old file
+    with open(f"{path}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX) # One writer at a time; the merge needs the latest file
+        on_disk = _read_or_empty(path)
+        now = time.time()
+        caches = {}
+        for name, cache in SNAPSHOT_CACHES.items():
+            merged = {}
+            for key, expires_at, value in on_disk.get(name, []) + cache.export():
+                if expires_at + cache.stale_seconds < now:
+                    continue
+                if key not in merged or merged[key][0] < expires_at:
+                    merged[key] = (expires_at, value)
+            # Keep what would survive in the cache anyway: the latest-expiring entries
+            newest = sorted(merged.items(), key=lambda item: item[1][0])[-cache.max_entries:]
+            caches[name] = [(key, expires_at, value) for key, (expires_at, value) in newest]
+
+        payload = pickle.dumps({"created_at": now, "pandas": pd.__version__, "caches": caches},
+                               protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(payload), _signature(payload)))
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    return sum(len(entries) for entries in caches.values())
+
+
+def save(path=CACHE_SNAPSHOT_PATH):
+    """write_snapshot() that logs instead of raising, for the timer and shutdown."""
+    start = time.perf_counter()
+    try:
+        written = write_snapshot(path)
+    except Exception as e:
+        inc("tide_cache_snapshot_total", action="save", outcome="error")
+        print(f"Error writing cache snapshot {path}: {e}")
+        return
+    inc("tide_cache_snapshot_total", action="save", outcome="ok")
+    print(f"Wrote {written} cache entries to {path} in {time.perf_counter() - start:.2f}s.")
+
+
+def restore(path=CACHE_SNAPSHOT_PATH):
+    """Loads a snapshot into the caches. Returns {cache name: entries added}."""
+    start = time.perf_counter()
+    snapshot = _read_or_empty(path)
+    added = {}
+    for name, entries in snapshot.items():
+        cache = SNAPSHOT_CACHES.get(name)
+        if cache is not None:
+            added[name] = cache.restore(entries)
+            inc("tide_cache_snapshot_entries_total", added[name], cache=name)
+    if snapshot:
+        inc("tide_cache_snapshot_total", action="load", outcome="ok")
+        print(f"Restored {sum(added.values())} cache entries from {path} in {time.perf_counter() - start:.2f}s.")
+    return added
+
+
+def _run(path):
+    while True:
+        time.sleep(CACHE_SNAPSHOT_SECONDS)
+        save(path)
+
+
+def start(path=CACHE_SNAPSHOT_PATH):
+    """
+    Warm-starts this worker's caches from the snapshot, then keeps the snapshot up to date
+    every CACHE_SNAPSHOT_SECONDS and once more at exit (gunicorn workers exit normally
+    on SIGTERM, so `docker stop` gets one too). Does nothing if snapshots are disabled
+    or SECRET_KEY is the development default.
+    """
+    global _started
+    if not path:
+        return
+    if SECRET_KEY == DEV_SECRET_KEY:
+        print(f"Cache snapshots disabled: {path} would be signed with the public development "
+              "SECRET_KEY, so anyone could forge one. Set FLASK_SECRET_KEY to enable them.")
+        return
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    restore(path)
+    threading.Thread(target=_run, args=(path,), name="tide-cache-snapshot", daemon=True).start()
+    atexit.register(save, path)
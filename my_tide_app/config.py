@@ -1,11 +1,12 @@
 # my_tide_app/config.py
 
 import os
+import tempfile
 from datetime import datetime, timedelta
 import pytz
 from dotenv import load_dotenv # For loading secrets from .env file
 import boto3
-from botocore.exceptions import ClientError
+from botocore.exceptions import BotoCoreError, ClientError
 import json
 import sys
 
@@ -37,7 +38,7 @@ def get_secret_from_secrets_manager(secret_name, region_name):
         get_secret_value_response = client.get_secret_value(
             SecretId=secret_name
         )
-    except ClientError as e:
+    except (ClientError, BotoCoreError) as e: # BotoCoreError covers missing credentials (local runs, benchmarks)
         print(f"Error fetching secret '{secret_name}' from Secrets Manager: {e}", file=sys.stderr)
         return None # Return None if there's an error
     else:
@@ -64,9 +65,12 @@ else:
     print(f"OPENCAGE_API_KEY loaded from AWS Secrets Manager.", file=sys.stderr)
 
 
+# Public, so nothing that trusts SECRET_KEY (sessions aside) may rely on it
+DEV_SECRET_KEY = "A_VERY_STRONG_DEFAULT_KEY_FOR_DEV_ONLY"
+
 SECRET_KEY = get_secret_from_secrets_manager(FLASK_SECRET_KEY_NAME, AWS_REGION)
 if SECRET_KEY is None:
-    SECRET_KEY = os.environ.get("FLASK_SECRET_KEY", "A_VERY_STRONG_DEFAULT_KEY_FOR_DEV_ONLY")
+    SECRET_KEY = os.environ.get("FLASK_SECRET_KEY", DEV_SECRET_KEY)
     print(f"FLASK_SECRET_KEY loaded from environment variable or default.", file=sys.stderr)
 else:
     print(f"FLASK_SECRET_KEY loaded from AWS Secrets Manager.", file=sys.stderr)
@@ -78,5 +82,140 @@ DEFAULT_STATION_NAME = "Sharptown, Nanticoke River, MD"
 DEFAULT_LATITUDE = 38.3970
 DEFAULT_LONGITUDE = -75.7600
 
+# --- Upstream API Endpoints ---
+# Overridable so the app can be pointed at the local replay stub in bench/stub_server.py.
+NOAA_DATAGETTER_URL = os.environ.get("NOAA_DATAGETTER_URL", "https://api.tidesandcurrents.noaa.gov/api/prod/datagetter")
+NOAA_STATIONS_URL = os.environ.get("NOAA_STATIONS_URL", "https://api.tidesandcurrents.noaa.gov/mdapi/prod/webapi/stations.json")
+PIRATE_WEATHER_BASE_URL = os.environ.get("PIRATE_WEATHER_BASE_URL", "https://api.pirateweather.net")
+OPENCAGE_DOMAIN = os.environ.get("OPENCAGE_DOMAIN", "api.opencagedata.com")
+OPENCAGE_SCHEME = os.environ.get("OPENCAGE_SCHEME", "https")
+
 # --- Timezone Configuration ---
 LOCAL_TIMEZONE = pytz.timezone('America/New_York')
+
+# --- Forecast Page ---
+FORECAST_DAYS = 3 # Today and the next two days, in the station's time zone
+# The forecast table's horizon (?horizon=, e.g. 36h or 7d; default FORECAST_DAYS) and
+# resolution (?resolution=, e.g. 6m or 1h) can be chosen within these limits
+FORECAST_MAX_HOURS = 30 * 24
+FORECAST_RESOLUTION_MINUTES = 60
+FORECAST_MIN_RESOLUTION_MINUTES = 6
+FORECAST_MAX_RESOLUTION_MINUTES = 3 * 60
+# Rows per page of the table; longer horizons are paged through with cursors
+TABLE_PAGE_ROWS = int(os.environ.get("TABLE_PAGE_ROWS", "100"))
+TABLE_MAX_PAGE_ROWS = 1000 # Largest ?limit= /api/forecast accepts
+
+# --- Instrumentation ---
+# When enabled, each request gets a Server-Timing header and /metrics exposes
+# Prometheus-format histograms and counters. Disabled by default.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# --- On-Demand Profiling ---
+# A request carrying this secret in an X-Tide-Profile header (or ?profile=) is run under
+# a profiler (see profiling.py). Unset, the hooks aren't even installed.
+PROFILE_SECRET = os.environ.get("PROFILE_SECRET") or None
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "tide-profiles"))
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", "0.001")) # Seconds between stack samples
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "50")) # Profiles kept on disk per worker host
+
+# --- Upstream Timeouts and Circuit Breakers ---
+# Per-call timeout, and the total time index() may spend waiting on upstreams.
+# Calls made late in a request get whatever is left of the budget.
+UPSTREAM_TIMEOUT = float(os.environ.get("UPSTREAM_TIMEOUT", "10"))
+REQUEST_LATENCY_BUDGET = float(os.environ.get("REQUEST_LATENCY_BUDGET", "12"))
+MIN_UPSTREAM_TIMEOUT = 0.25 # Don't bother starting a call with less time than this left
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_RESET_SECONDS = float(os.environ.get("BREAKER_RESET_SECONDS", "30"))
+
+# --- Admission Control ---
+# Caps on index() requests allowed to call upstreams at once: per worker process, and
+# across every worker on the host (counted with lock files in ADMISSION_LOCK_DIR).
+# Pages the cache can answer in full don't count. Past either cap, a request is turned
+# away with a 503 and Retry-After. 0 disables a cap.
+ADMISSION_WORKER_LIMIT = int(os.environ.get("ADMISSION_WORKER_LIMIT", "2"))
+ADMISSION_GLOBAL_LIMIT = int(os.environ.get("ADMISSION_GLOBAL_LIMIT", "4"))
+ADMISSION_LOCK_DIR = os.environ.get("ADMISSION_LOCK_DIR", tempfile.gettempdir())
+ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", "5")) # Seconds, sent with the 503
+
+# --- Streamed Rendering ---
+# Stream the page (shell and next tide first, rows as they're built) instead of
+# rendering it in one go. Can also be toggled per request with ?stream=1 / ?stream=0.
+STREAM_RESPONSES = os.environ.get("STREAM_RESPONSES", "false").lower() in ("1", "true", "yes")
+STREAM_CHUNK_BYTES = 8192
+# Threads per worker for upstream calls made off the request thread
+BACKGROUND_WORKERS = int(os.environ.get("BACKGROUND_WORKERS", "4"))
+
+# --- Caches (seconds) ---
+STATIONS_CACHE_TTL = int(os.environ.get("STATIONS_CACHE_TTL", str(24 * 3600)))
+GEOCODE_CACHE_TTL = int(os.environ.get("GEOCODE_CACHE_TTL", str(30 * 24 * 3600))) # ZIP centroids don't move
+TIDE_CACHE_TTL = int(os.environ.get("TIDE_CACHE_TTL", str(6 * 3600)))             # Predictions are fixed ahead of time
+WEATHER_CACHE_TTL = int(os.environ.get("WEATHER_CACHE_TTL", str(15 * 60)))
+HISTORICAL_WEATHER_CACHE_TTL = int(os.environ.get("HISTORICAL_WEATHER_CACHE_TTL", str(30 * 24 * 3600))) # Past weather doesn't change
+# How long past expiry an entry may still be served when the upstream can't be asked
+WEATHER_STALE_TTL = int(os.environ.get("WEATHER_STALE_TTL", str(6 * 3600)))
+GEOCODE_STALE_TTL = int(os.environ.get("GEOCODE_STALE_TTL", str(365 * 24 * 3600)))
+
+# Warm-start snapshot of the geocode, tide and weather caches (see cache_snapshot.py).
+# Written periodically and on shutdown, read by every new worker; point it at a mounted
+# volume so a redeploy doesn't start from cold caches. Unset disables snapshots, and so
+# does running with the development SECRET_KEY (the snapshot is signed with it).
+CACHE_SNAPSHOT_PATH = os.environ.get("CACHE_SNAPSHOT_PATH") or None
+CACHE_SNAPSHOT_SECONDS = int(os.environ.get("CACHE_SNAPSHOT_SECONDS", "300"))
+
+# Compact station catalog shared by all gunicorn workers on this host (see station_store.py).
+# The first worker to need it writes it; the rest map the same file read-only.
+STATION_STORE_PATH = os.environ.get("STATION_STORE_PATH", os.path.join(tempfile.gettempdir(), "tide-stations.bin"))
+# The catalog is decoded as it downloads, this many bytes at a time
+STATIONS_STREAM_CHUNK_BYTES = 64 * 1024
+
+# Hourly and high/low predictions for every station, precomputed offline by
+# build_prediction_archive.py. Lookups it covers never go to NOAA. Unset disables it.
+PREDICTION_ARCHIVE_PATH = os.environ.get("PREDICTION_ARCHIVE_PATH") or None
+PREDICTION_ARCHIVE_CHECK_SECONDS = int(os.environ.get("PREDICTION_ARCHIVE_CHECK_SECONDS", "60")) # Picks up rebuilds
+
+# --- Upstream Rate Limits (requests per second; 0 disables) ---
+# OpenCage's free tier allows 1 request per second.
+RATE_LIMITS = {
+    "opencage": float(os.environ.get("OPENCAGE_RATE_LIMIT", "1")),
+    "pirate_weather": float(os.environ.get("PIRATE_WEATHER_RATE_LIMIT", "0")),
+    "noaa_datagetter": float(os.environ.get("NOAA_RATE_LIMIT", "0")),
+    "noaa_mdapi": float(os.environ.get("NOAA_RATE_LIMIT", "0")),
+}
+
+# --- Daily Upstream Quotas (calls per UTC day; 0 disables) ---
+# Counted in QUOTA_STATE_PATH, which every worker on the host shares and which survives
+# restarts (mount it on a volume in Docker). Past QUOTA_RESERVE_FRACTION of the way to a
+# quota, calls that could be answered from a stale cache entry are refused so the rest
+# of the day's budget goes to lookups with no other answer.
+DAILY_QUOTAS = {
+    "opencage": int(os.environ.get("OPENCAGE_DAILY_QUOTA", "2500")),           # Free tier
+    "pirate_weather": int(os.environ.get("PIRATE_WEATHER_DAILY_QUOTA", "333")), # Free tier is 10,000 a month
+}
+QUOTA_RESERVE_FRACTION = float(os.environ.get("QUOTA_RESERVE_FRACTION", "0.2"))
+QUOTA_STATE_PATH = os.environ.get("QUOTA_STATE_PATH", os.path.join(tempfile.gettempdir(), "tide-quota.json"))
+
+# --- Observed Water Levels ---
+# Stations shown on the page are subscribed to a background poller that fetches only
+# the water_level samples published since its last poll (NOAA publishes every 6 minutes).
+OBSERVATIONS_ENABLED = os.environ.get("OBSERVATIONS_ENABLED", "true").lower() in ("1", "true", "yes")
+OBSERVATION_POLL_SECONDS = int(os.environ.get("OBSERVATION_POLL_SECONDS", "360"))
+OBSERVATION_BACKFILL_HOURS = int(os.environ.get("OBSERVATION_BACKFILL_HOURS", "24"))       # History fetched on first subscribe
+OBSERVATION_BUFFER_SIZE = int(os.environ.get("OBSERVATION_BUFFER_SIZE", str(3 * 24 * 10)))  # Samples kept per station (3 days)
+OBSERVATION_IDLE_SECONDS = int(os.environ.get("OBSERVATION_IDLE_SECONDS", "3600"))         # Unsubscribe after this long unviewed
+OBSERVATION_MAX_STATIONS = int(os.environ.get("OBSERVATION_MAX_STATIONS", "200"))
+OBSERVATION_RETRY_SECONDS = int(os.environ.get("OBSERVATION_RETRY_SECONDS", "3600"))       # Back-off for stations with no data
+OBSERVATION_ERROR_RETRY_SECONDS = int(os.environ.get("OBSERVATION_ERROR_RETRY_SECONDS", "30")) # First back-off after a failed poll; doubles
+
+# --- Tide Window Queries ---
+WINDOW_MAX_STATIONS = int(os.environ.get("WINDOW_MAX_STATIONS", "50"))
+WINDOW_MAX_DAYS = int(os.environ.get("WINDOW_MAX_DAYS", "30"))
+WINDOW_RESOLUTION_MINUTES = 6 # Grid the tide and weather curves are aligned on
+WINDOW_FETCH_WORKERS = int(os.environ.get("WINDOW_FETCH_WORKERS", "8"))
+
+# --- Nearby Station Comparison ---
+NEARBY_DEFAULT_STATIONS = int(os.environ.get("NEARBY_DEFAULT_STATIONS", "5"))
+NEARBY_MAX_STATIONS = int(os.environ.get("NEARBY_MAX_STATIONS", "10"))
+
+# --- Tide Plots ---
+PLOT_MAX_DAYS = int(os.environ.get("PLOT_MAX_DAYS", "30"))
+PLOT_CACHE_TTL = int(os.environ.get("PLOT_CACHE_TTL", str(15 * 60))) # Same as the weather it overlays
@@ -0,0 +1,152 @@
+# my_tide_app/forecast_table.py
+
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from config import FORECAST_DAYS
+from services.noaa import local_day_window, interpolate_tide_heights, to_epoch_seconds
+
+_MINUTES_PER_UNIT = {'m': 1, 'h': 60, 'd': 24 * 60}
+
+
+def parse_duration(raw, default_unit):
+    """
+    Minutes in a duration like "6m", "36h" or "7d"; a bare number is in `default_unit`
+    ("m", "h" or "d").
+
+    Raises:
+        ValueError: If it isn't a number with an optional m/h/d suffix.
+    """
+    raw = raw.strip().lower()
+    unit = default_unit
+    if raw and raw[-1] in _MINUTES_PER_UNIT:
+        raw, unit = raw[:-1], raw[-1]
+    minutes = float(raw) * _MINUTES_PER_UNIT[unit]
+    if not np.isfinite(minutes):
+        raise ValueError(f"not a duration: {raw}")
+    return minutes
+
+
+def table_window(tz, hours):
+    """
+    (start, end) of a forecast horizon as aware datetimes in `tz`: `hours` hours from
+    the start of the current hour, whatever the horizon, so 47h and 48h differ by an hour.
+    """
+    start = tz.normalize(datetime.now(tz).replace(minute=0, second=0, microsecond=0))
+    return start, tz.normalize(start + timedelta(hours=hours))
+
+
+def days_spanned(tz, end):
+    """Local days from today through the one `end` (exclusive) falls in."""
+    last = end.astimezone(tz) - timedelta(microseconds=1)
+    return (last.date() - datetime.now(tz).date()).days + 1
+
+
+def fetch_window(tz, end):
+    """
+    The whole local days of predictions to fetch for a table ending at `end`: from
+    midnight today through the day `end` falls in, and never less than the page's
+    FORECAST_DAYS, which the "Next High/Low Tide" block reads from the same data.
+    """
+    return local_day_window(tz, max(FORECAST_DAYS, days_spanned(tz, end)))
+
+
+class ForecastTable:
+    """
+    The forecast table's tide rows for one station, horizon and resolution, as arrays:
+    heights on a regular grid merged with the high and low tides, ordered by time.
+
+    Rows are never materialized all at once. page() picks a slice by cursor (the epoch
+    second of a row; times are strictly increasing, so a cursor always lands on the same
+    row) and only that slice is formatted, so a 30-day, 6-minute table costs the page
+    no more than a 3-day, hourly one.
+    """
+
+    def __init__(self, times, heights, events, resolution_minutes):
+        self.times = times # int64 epoch seconds
+        self.heights = heights # float64 ft above MLLW
+        self.events = events # S1: b"H" or b"L" for high/low tides, b"" for grid rows
+        self.resolution_minutes = resolution_minutes
+        # Position among the grid rows (-1 for high/lows), for alternating row shading
+        is_grid = events == b""
+        self.grid_rank = np.where(is_grid, np.cumsum(is_grid) - 1, -1)
+
+    def __len__(self):
+        return len(self.times)
+
+    def page(self, cursor=None, limit=100):
+        """
+        The rows from `cursor` (epoch seconds; the first row at or after it, or the first
+        row if None) on, at most `limit` of them.
+
+        Returns:
+            dict: 'offset' and 'stop' (the slice of rows), 'next_cursor' and 'prev_cursor'
+                  (None at either end).
+        """
+        offset = 0 if cursor is None else int(np.searchsorted(self.times, cursor))
+        offset = min(offset, len(self))
+        stop = min(offset + limit, len(self))
+        return {
+            'offset': offset,
+            'stop': stop,
+            'next_cursor': int(self.times[stop]) if stop < len(self) else None,
+            'prev_cursor': int(self.times[max(0, offset - limit)]) if offset > 0 else None,
+        }
+
+
+def build_forecast_table(start, end, resolution_minutes, hourly_df=None, hilo_df=None):
+    """
+    Builds the ForecastTable for [start, end) (aware datetimes) from hourly and high/low
+    predictions already fetched. Heights between the hourly predictions are
+    interpolated (see interpolate_tide_heights()), so finer resolutions don't cost
+    another NOAA call. A grid row falling exactly on a high or low tide is left out in
+    favour of it.
+
+    Returns:
+        ForecastTable, or None if there are no predictions to build it from.
+    """
+    first, last = int(start.timestamp()), int(end.timestamp())
+    grid = np.arange(first, last, resolution_minutes * 60, dtype=np.int64)
+    grid_heights = interpolate_tide_heights(grid, hilo_df=hilo_df, hourly_df=hourly_df)
+
+    hilo_times = np.empty(0, dtype=np.int64)
+    hilo_heights = np.empty(0, dtype=np.float64)
+    hilo_types = np.empty(0, dtype="S1")
+    if hilo_df is not None and not hilo_df.empty:
+        hilo_times = np.round(to_epoch_seconds(hilo_df['datetime'])).astype(np.int64)
+        keep = (hilo_times >= first) & (hilo_times < last)
+        hilo_times = hilo_times[keep]
+        hilo_heights = hilo_df['height_ft'].to_numpy(dtype=np.float64)[keep]
+        hilo_types = hilo_df['tide_type'].to_numpy(dtype="S1")[keep]
+
+    keep = ~np.isnan(grid_heights) & ~np.isin(grid, hilo_times)
+    times = np.concatenate((grid[keep], hilo_times))
+    if not len(times):
+        return None
+    order = np.argsort(times, kind="stable")
+    return ForecastTable(
+        times[order],
+        np.concatenate((grid_heights[keep], hilo_heights))[order],
+        np.concatenate((np.full(keep.sum(), b"", dtype="S1"), hilo_types))[order],
+        resolution_minutes,
+    )
+
+
+def match_weather(times, weather_df, tolerance_seconds=30 * 60):
+    """
+    For each of `times` (epoch seconds), the position in `weather_df` of the closest
+    hourly forecast, or -1 if there is none within `tolerance_seconds`.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    if weather_df is None or weather_df.empty:
+        return np.full(len(times), -1, dtype=np.int64)
+    weather_times = to_epoch_seconds(weather_df['datetime'])
+    order = np.argsort(weather_times, kind="stable")
+    sorted_times = weather_times[order]
+    right = np.clip(np.searchsorted(sorted_times, times), 1, len(sorted_times) - 1) if len(sorted_times) > 1 \
+        else np.zeros(len(times), dtype=np.int64)
+    left = np.maximum(right - 1, 0)
+    closest = np.where(np.abs(sorted_times[left] - times) <= np.abs(sorted_times[right] - times), left, right)
+    found = order[closest]
+    return np.where(np.abs(sorted_times[closest] - times) <= tolerance_seconds, found, -1)
@@ -0,0 +1,271 @@
+# my_tide_app/instrumentation.py
+
+import threading
+import time
+from contextvars import ContextVar
+
+from flask import Response, g, has_request_context, request
+
+from config import METRICS_ENABLED
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Metrics live in this process only. With several gunicorn workers, each scrape of
+# /metrics is answered by whichever worker picks it up, so it sees that worker's
+# counts alone, and counters appear to jump (or reset) as scrapes land on different
+# workers. Run one worker (the Dockerfile does, with threads) or read rates with that
+# in mind.
+_lock = threading.Lock()
+_histograms = {} # (name, labels) -> [bucket_counts, sum, count]
+_counters = {}   # (name, labels) -> value
+_gauges = {}     # name -> collect() returning [(labels dict, value), ...], called at scrape time
+
+# The profiling.RequestProfile collecting spans for the current request, if it is being profiled
+active_profile = ContextVar('tide_active_profile', default=None)
+
+_HELP = {
+    "tide_stage_duration_seconds": "Time spent in each stage of index().",
+    "tide_upstream_duration_seconds": "Time spent waiting on each upstream API.",
+    "tide_upstream_requests_total": "Upstream API calls by outcome.",
+    "tide_cache_requests_total": "Cache lookups by result.",
+    "tide_http_requests_total": "HTTP requests served by endpoint and status.",
+    "tide_request_duration_seconds": "Total time spent serving each request.",
+    "tide_observation_samples_total": "Observed water level samples added to the ring buffers.",
+    "tide_observation_polls_total": "Observed water level polls by outcome.",
+    "tide_upstream_skipped_total": "Upstream calls not made, by reason.",
+    "tide_cache_snapshot_total": "Cache snapshot saves and loads by outcome.",
+    "tide_cache_snapshot_entries_total": "Cache entries restored from snapshots, by cache.",
+    "tide_upstream_quota_used": "Calls made to each quota-limited upstream today (UTC), across all workers on the host.",
+    "tide_upstream_quota_limit": "Daily call quota of each quota-limited upstream.",
+    "tide_prediction_archive_total": "Prediction lookups answered from the prediction archive (hit) or not (miss).",
+    "tide_admission_total": "Page requests by admission decision (cached, admitted, rejected).",
+    "tide_admission_in_flight": "Page requests in this worker currently allowed to call upstreams.",
+}
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def observe(name, value, **labels):
+    """Records one observation of `value` (seconds) in histogram `name`."""
+    key = (name, _labels_key(labels))
+    with _lock:
+        entry = _histograms.get(key)
+        if entry is None:
+            entry = [[0] * len(LATENCY_BUCKETS), 0.0, 0]
+            _histograms[key] = entry
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                entry[0][i] += 1
+        entry[1] += value
+        entry[2] += 1
+
+
+def inc(name, amount=1, **labels):
+    """Increments counter `name` by `amount`."""
+    key = (name, _labels_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def register_gauge(name, collect):
+    """
+    Registers gauge `name`, whose current values come from collect() when /metrics is
+    scraped. collect() returns a list of (labels dict, value) pairs.
+    """
+    with _lock:
+        _gauges[name] = collect
+
+
+def _add_server_timing(name, duration_s=None, desc=None):
+    if not has_request_context():
+        return
+    entries = g.setdefault('server_timing', [])
+    entries.append((name, duration_s, desc))
+
+
+class _Span:
+    """
+    Times one block of work. Use through stage() or upstream_call().
+    The block may set `span.outcome` (e.g. "timeout", "http_error") before it exits.
+    """
+    __slots__ = ('kind', 'name', 'outcome', '_start', '_profile')
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.outcome = "ok"
+        self._profile = active_profile.get()
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        if self._profile is not None:
+            self._profile.watch_thread()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._start
+        if exc_type is not None and self.outcome == "ok":
+            self.outcome = "exception"
+        if self._profile is not None:
+            self._profile.unwatch_thread()
+            self._profile.record_span(self.kind, self.name, self._start, elapsed, self.outcome)
+        if not METRICS_ENABLED:
+            return False
+        if self.kind == "stage":
+            observe("tide_stage_duration_seconds", elapsed, stage=self.name)
+        else:
+            observe("tide_upstream_duration_seconds", elapsed, upstream=self.name)
+            inc("tide_upstream_requests_total", upstream=self.name, outcome=self.outcome)
+        _add_server_timing(self.name, elapsed, None if self.outcome == "ok" else self.outcome)
+        return False
+
+
+class _NoopSpan:
+    """Stand-in returned when metrics are disabled; costs one attribute lookup."""
+    __slots__ = ()
+    outcome = "ok"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def stage(name):
+    """
+    Context manager timing one stage of request handling (e.g. "geocode", "render").
+
+    Example:
+        with stage("join"):
+            rows = build_rows(...)
+    """
+    if not METRICS_ENABLED and active_profile.get() is None:
+        return _NOOP_SPAN
+    return _Span("stage", name)
+
+
+def upstream_call(name):
+    """
+    Context manager timing one call to an upstream API (e.g. "noaa_datagetter").
+    Set `span.outcome` inside the block to record failures that were handled.
+    """
+    if not METRICS_ENABLED and active_profile.get() is None:
+        return _NOOP_SPAN
+    return _Span("upstream", name)
+
+
+def record_cache(cache_name, hit):
+    """
+    Counts a cache lookup and notes it in the Server-Timing header. `hit` is True,
+    False, or "stale" for an expired entry served because the load failed.
+    """
+    if not METRICS_ENABLED:
+        return
+    result = hit if isinstance(hit, str) else ("hit" if hit else "miss")
+    inc("tide_cache_requests_total", cache=cache_name, result=result)
+    _add_server_timing(f"cache-{cache_name}", None, result)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def render_prometheus():
+    """Returns all metrics in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, (list(v[0]), v[1], v[2])) for key, v in _histograms.items())
+        gauges = sorted(_gauges.items())
+
+    lines = []
+    seen = set()
+    for (name, labels), value in counters:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for (name, labels), (buckets, total, count) in histograms:
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+        for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {bucket_count}")
+        lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+    for name, collect in gauges:
+        try:
+            values = collect()
+        except Exception as e: # A broken gauge shouldn't take the rest of /metrics down
+            print(f"Error collecting gauge {name}: {e}")
+            continue
+        lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in values:
+            lines.append(f"{name}{_format_labels(_labels_key(labels))} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+def _format_server_timing(entries):
+    parts = []
+    for name, duration_s, desc in entries:
+        part = name
+        if duration_s is not None:
+            part += f";dur={duration_s * 1000:.1f}"
+        if desc:
+            part += f';desc="{desc}"'
+        parts.append(part)
+    return ", ".join(parts)
+
+
+def init_app(app):
+    """
+    Wires instrumentation into a Flask app: per-request timing, the Server-Timing
+    response header and the /metrics endpoint. Does nothing when METRICS_ENABLED is off.
+    """
+    if not METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def _start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def _emit_server_timing(response):
+        start = g.get('request_start')
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        endpoint = request.endpoint or "unknown"
+        observe("tide_request_duration_seconds", elapsed, endpoint=endpoint)
+        inc("tide_http_requests_total", endpoint=endpoint, status=response.status_code)
+
+        entries = g.get('server_timing', [])
+        entries.append(("total", elapsed, None))
+        response.headers['Server-Timing'] = _format_server_timing(entries)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
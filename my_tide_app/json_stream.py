@@ -0,0 +1,101 @@
+# my_tide_app/json_stream.py
+
+import codecs
+import json
+
+_WHITESPACE = " \t\n\r"
+_NUMBER_CHARS = frozenset("0123456789.eE+-")
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """A text buffer over an iterable of byte chunks, refilled as parsing needs more."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.exhausted = False
+
+    def fill(self):
+        """Appends the next chunk, dropping what's been consumed. Returns False at end of input."""
+        if self.exhausted:
+            return False
+        for chunk in self._chunks:
+            if chunk:
+                self.buffer = self.buffer[self.pos:] + self._utf8.decode(chunk)
+                self.pos = 0
+                return True
+        self.buffer = self.buffer[self.pos:] + self._utf8.decode(b"", final=True)
+        self.pos = 0
+        self.exhausted = True
+        return False
+
+    def peek(self):
+        """The next non-whitespace character (not consumed), or "" at end of input."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"expected {char!r} at character {self.pos} of the current buffer")
+        self.pos += 1
+
+    def value(self):
+        """Decodes the next complete JSON value, reading more input until it's all there."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # A number that runs to the end of the buffer (or stops at a "." or "e" there)
+            # may continue in the next chunk
+            if (not self.exhausted and isinstance(value, (int, float))
+                    and all(c in _NUMBER_CHARS for c in self.buffer[end:])):
+                self.fill()
+                continue
+            self.pos = end
+            return value
+
+
+def iter_array(chunks, key):
+    """
+    Yields the items of the array under top-level `key` of a JSON object, one at a time,
+    from an iterable of byte chunks (e.g. response.iter_content()). Only the item being
+    decoded is held in memory, never the whole document. Top-level values before `key`
+    are decoded and thrown away; reading stops at the end of the array.
+
+    Raises:
+        ValueError: The document isn't an object, is malformed or truncated, or `key`
+                    isn't there or doesn't hold an array.
+    """
+    reader = _Reader(chunks)
+    reader.expect("{")
+    while True:
+        name = reader.value()
+        reader.expect(":")
+        if name == key:
+            break
+        reader.value()
+        if reader.peek() != ",":
+            raise ValueError(f"no {key!r} in the JSON object")
+        reader.expect(",")
+
+    reader.expect("[")
+    if reader.peek() == "]":
+        return
+    while True:
+        yield reader.value()
+        separator = reader.peek()
+        if separator == "]":
+            return
+        reader.expect(",")
@@ -0,0 +1,90 @@
+# my_tide_app/nearby.py
+
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from config import FORECAST_DAYS, WINDOW_FETCH_WORKERS
+from services.geocoding import get_noaa_tide_stations, find_closest_stations, get_station_timezone, stations_cached
+from services.noaa import get_tide_data, predictions_cached, local_day_window, gmt_date_range, to_station_time
+
+
+def nearest_stations(target_lat, target_lon, k):
+    """
+    The `k` stations closest to a point.
+
+    Returns:
+        list: Dicts with 'id', 'name', 'lat', 'lon', 'tz' and 'distance_miles', closest first.
+    """
+    found = find_closest_stations(target_lat, target_lon, get_noaa_tide_stations(), k)
+    return [
+        {'id': station_id, 'name': name, 'lat': lat, 'lon': lon,
+         'tz': get_station_timezone(lat, lon), 'distance_miles': distance}
+        for station_id, name, lat, lon, distance in found
+    ]
+
+
+def next_tides(station, now=None):
+    """
+    The next high and low tide at a station.
+
+    Uses the same high/low request (and so the same cache entry) as the station's own
+    forecast page, so comparing a station costs nothing once its page has been viewed.
+
+    Returns:
+        dict: 'high' and 'low', each a (datetime in the station's zone, height_ft) tuple or None.
+              None instead of the dict if NOAA didn't answer.
+    """
+    now = now or datetime.now(timezone.utc)
+    start, end = local_day_window(station['tz'], FORECAST_DAYS)
+    start_date_str, end_date_str = gmt_date_range(start, end)
+    hilo_df = to_station_time(get_tide_data(
+        station['id'], start_date_str, end_date_str,
+        product="predictions", datum="MLLW", time_zone="gmt", interval="hilo"
+    ), station['tz'], start, end)
+    if hilo_df is None:
+        return None
+
+    upcoming = hilo_df[hilo_df['datetime'] > now].sort_values(by='datetime')
+    tides = {}
+    for tide_type, key in (('H', 'high'), ('L', 'low')):
+        rows = upcoming[upcoming['tide_type'] == tide_type]
+        tides[key] = None if rows.empty else (rows['datetime'].iloc[0].to_pydatetime(), float(rows['height_ft'].iloc[0]))
+    return tides
+
+
+def nearby_cached(target_lat, target_lon, k):
+    """True if compare_nearby() can answer without calling any upstream."""
+    if not stations_cached():
+        return False
+    for station in nearest_stations(target_lat, target_lon, k):
+        start_date_str, end_date_str = gmt_date_range(*local_day_window(station['tz'], FORECAST_DAYS))
+        if not predictions_cached(station['id'], start_date_str, end_date_str, "hilo"):
+            return False
+    return True
+
+
+def compare_nearby(target_lat, target_lon, k, max_workers=WINDOW_FETCH_WORKERS):
+    """
+    The `k` stations closest to a point with their next high and low tides, fetched
+    concurrently (through the usual caches), so the whole comparison takes about as
+    long as the slowest single station.
+
+    Returns:
+        list: nearest_stations() dicts with 'tides' (next_tides() result, None if it
+              failed) added, closest first.
+    """
+    stations = nearest_stations(target_lat, target_lon, k)
+    if not stations:
+        return []
+    now = datetime.now(timezone.utc)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(stations)))) as pool:
+        # copy_context() carries the caller's request budget into the worker threads
+        futures = [pool.submit(contextvars.copy_context().run, next_tides, station, now) for station in stations]
+        for station, future in zip(stations, futures):
+            try:
+                station['tides'] = future.result()
+            except Exception as e: # One bad station shouldn't sink the comparison
+                print(f"Error comparing nearby station {station['id']}: {e}")
+                station['tides'] = None
+    return stations
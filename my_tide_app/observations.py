@@ -0,0 +1,279 @@
+# my_tide_app/observations.py
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from config import (
+    OBSERVATION_POLL_SECONDS, OBSERVATION_BACKFILL_HOURS, OBSERVATION_BUFFER_SIZE,
+    OBSERVATION_IDLE_SECONDS, OBSERVATION_MAX_STATIONS, OBSERVATION_RETRY_SECONDS,
+    OBSERVATION_ERROR_RETRY_SECONDS
+)
+from instrumentation import inc
+from resilience import cache_only
+from services.noaa import get_tide_data
+
+NOAA_DATETIME_FORMAT = "%Y%m%d %H:%M"
+SAMPLE_MINUTES = 6 # NOAA water levels come every 6 minutes
+BUFFER_HOURS = OBSERVATION_BUFFER_SIZE * SAMPLE_MINUTES / 60 # How far back the buffer reaches
+
+
+class RingBuffer:
+    """
+    Fixed-size buffer of (time, value) samples, oldest overwritten first.
+    Times are UTC epoch seconds and only ever move forward.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._times = np.zeros(capacity, dtype=np.int64)
+        self._values = np.zeros(capacity, dtype=np.float64)
+        self._start = 0 # Index of the oldest sample
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def last_time(self):
+        """Epoch seconds of the newest sample, or None if empty."""
+        if not self._count:
+            return None
+        return int(self._times[(self._start + self._count - 1) % self.capacity])
+
+    def extend(self, times, values):
+        """Appends samples newer than the newest one held. Returns how many were added."""
+        times = np.asarray(times, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        last = self.last_time
+        if last is not None:
+            newer = times > last
+            times, values = times[newer], values[newer]
+        if len(times) > self.capacity:
+            times, values = times[-self.capacity:], values[-self.capacity:]
+
+        added = len(times)
+        if not added:
+            return 0
+        positions = (self._start + self._count + np.arange(added)) % self.capacity
+        self._times[positions] = times
+        self._values[positions] = values
+        overflow = max(0, self._count + added - self.capacity)
+        self._start = (self._start + overflow) % self.capacity
+        self._count = min(self.capacity, self._count + added)
+        return added
+
+    def arrays(self, since=None):
+        """Returns (times, values) copies in time order, optionally only from epoch `since` on."""
+        order = (self._start + np.arange(self._count)) % self.capacity
+        times, values = self._times[order], self._values[order]
+        if since is not None:
+            keep = times >= since
+            times, values = times[keep], values[keep]
+        return times, values
+
+
+class _Subscription:
+    def __init__(self, station_id):
+        self.station_id = station_id
+        self.buffer = RingBuffer(OBSERVATION_BUFFER_SIZE)
+        self.lock = threading.Lock()
+        self.last_viewed = time.time()
+        self.last_polled = 0.0
+        self.retry_after = 0.0 # Don't poll before this (no sensor, or backing off after failures)
+        self.failures = 0      # Polls in a row that NOAA couldn't be asked
+
+
+class ObservationPoller:
+    """
+    Keeps recent observed water levels for the stations people are looking at.
+
+    Viewing a station subscribes it. A background thread then polls every subscribed
+    station each OBSERVATION_POLL_SECONDS, asking NOAA only for samples after the
+    newest one already buffered, and drops stations nobody has viewed for
+    OBSERVATION_IDLE_SECONDS. Each gunicorn worker runs its own poller.
+    """
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def subscribe(self, station_id):
+        """Subscribes `station_id` (or marks it viewed) and returns its subscription."""
+        with self._lock:
+            sub = self._subscriptions.get(station_id)
+            if sub is None:
+                if len(self._subscriptions) >= OBSERVATION_MAX_STATIONS:
+                    stalest = min(self._subscriptions.values(), key=lambda s: s.last_viewed)
+                    del self._subscriptions[stalest.station_id]
+                sub = self._subscriptions[station_id] = _Subscription(station_id)
+            sub.last_viewed = time.time()
+            self._ensure_thread()
+            return sub
+
+    def stations(self):
+        with self._lock:
+            return list(self._subscriptions)
+
+    def poll(self, sub):
+        """
+        Fetches samples newer than the newest buffered one for a subscription.
+        Returns the number of samples added.
+        """
+        if cache_only():
+            return 0 # The request may not call NOAA; that says nothing about the station
+        with sub.lock:
+            now = time.time()
+            if now < sub.retry_after:
+                return 0
+            sub.last_polled = now
+
+            now_utc = datetime.now(timezone.utc).replace(tzinfo=None)
+            earliest = now_utc - timedelta(hours=OBSERVATION_BACKFILL_HOURS)
+            last_time = sub.buffer.last_time
+            if last_time is None:
+                begin = earliest
+            else:
+                begin = max(earliest, datetime.fromtimestamp(last_time + 60, timezone.utc).replace(tzinfo=None))
+
+            observed_df = get_tide_data(
+                sub.station_id,
+                begin.strftime(NOAA_DATETIME_FORMAT),
+                now_utc.strftime(NOAA_DATETIME_FORMAT),
+                product="water_level",
+                datum="MLLW",
+                time_zone="gmt",
+                interval=None
+            )
+            if observed_df is None:
+                # Timeout, open circuit, spent budget or rate limit: nothing is known
+                # about the station, so try again soon rather than give up on it
+                sub.failures += 1
+                sub.retry_after = now + min(OBSERVATION_POLL_SECONDS,
+                                            OBSERVATION_ERROR_RETRY_SECONDS * 2 ** (sub.failures - 1))
+                inc("tide_observation_polls_total", outcome="unavailable")
+                return 0
+            sub.failures = 0
+            if observed_df.empty:
+                if last_time is None:
+                    # NOAA has nothing for it: probably no water level sensor; don't ask again for a while
+                    sub.retry_after = now + OBSERVATION_RETRY_SECONDS
+                inc("tide_observation_polls_total", outcome="no_data")
+                return 0
+
+            times = observed_df['datetime'].values.astype('datetime64[s]').astype(np.int64)
+            added = sub.buffer.extend(times, observed_df['height_ft'].to_numpy(dtype=np.float64))
+            inc("tide_observation_polls_total", outcome="ok")
+            inc("tide_observation_samples_total", added)
+            return added
+
+    def observations(self, station_id, since=None):
+        """
+        Returns (times, observed_ft) for a station as epoch-second and float arrays.
+        The first call for a station fetches its recent history; after that this
+        only reads the buffer the poller keeps up to date.
+        """
+        sub = self.subscribe(station_id)
+        if not len(sub.buffer) or time.time() - sub.last_polled > 2 * OBSERVATION_POLL_SECONDS:
+            self.poll(sub)
+        with sub.lock:
+            return sub.buffer.arrays(since)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="tide-observations", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(OBSERVATION_POLL_SECONDS):
+            idle_before = time.time() - OBSERVATION_IDLE_SECONDS
+            with self._lock:
+                for station_id, sub in list(self._subscriptions.items()):
+                    if sub.last_viewed < idle_before:
+                        del self._subscriptions[station_id]
+                subs = list(self._subscriptions.values())
+            for sub in subs:
+                try:
+                    self.poll(sub)
+                except Exception as e: # Keep polling the other stations
+                    inc("tide_observation_polls_total", outcome="error")
+                    print(f"Error polling observations for station {sub.station_id}: {e}")
+
+    def stop(self):
+        self._stop.set()
+
+
+poller = ObservationPoller()
+
+
+def predicted_at(station_id, times):
+    """
+    Predicted heights (ft above MLLW) at the given epoch-second times, from NOAA's
+    6-minute predictions (cached like every other prediction). NaN where unavailable.
+    """
+    if not len(times):
+        return np.array([], dtype=np.float64)
+    first = datetime.fromtimestamp(int(times[0]), timezone.utc)
+    last = datetime.fromtimestamp(int(times[-1]), timezone.utc)
+    predictions_df = get_tide_data(
+        station_id, first.strftime("%Y%m%d"), last.strftime("%Y%m%d"),
+        product="predictions", datum="MLLW", time_zone="gmt", interval="6"
+    )
+    if predictions_df is None or predictions_df.empty:
+        return np.full(len(times), np.nan)
+    predicted_times = predictions_df['datetime'].values.astype('datetime64[s]').astype(np.int64)
+    return np.interp(times, predicted_times, predictions_df['height_ft'].to_numpy(dtype=np.float64),
+                     left=np.nan, right=np.nan)
+
+
+def get_residuals(station_id, hours=None):
+    """
+    Observed vs. predicted water levels for a station. The residual (observed minus
+    predicted) is mostly storm surge or wind setup.
+
+    Args:
+        station_id (str): NOAA station ID.
+        hours (float): Only return the last `hours` of samples (default: everything buffered).
+
+    Returns:
+        dict: 'times' (epoch seconds), 'observed_ft', 'predicted_ft' and 'residual_ft' arrays,
+              or None if the station has no observations.
+    """
+    since = None if hours is None else int(time.time() - hours * 3600)
+    times, observed = poller.observations(station_id, since)
+    if not len(times):
+        return None
+    predicted = predicted_at(station_id, times)
+    return {
+        'times': times,
+        'observed_ft': observed,
+        'predicted_ft': predicted,
+        'residual_ft': observed - predicted,
+    }
+
+
+def summarize_residuals(residuals):
+    """
+    Latest reading and recent surge figures for display.
+
+    Returns:
+        dict: 'time' (UTC datetime), 'observed_ft', 'predicted_ft', 'residual_ft' for the newest
+              sample, plus 'max_residual_ft' / 'min_residual_ft' over the window, or None.
+    """
+    if residuals is None:
+        return None
+    valid = ~np.isnan(residuals['residual_ft'])
+    latest = len(residuals['times']) - 1
+    return {
+        'time': datetime.fromtimestamp(int(residuals['times'][latest]), timezone.utc),
+        'observed_ft': float(residuals['observed_ft'][latest]),
+        'predicted_ft': float(residuals['predicted_ft'][latest]),
+        'residual_ft': float(residuals['residual_ft'][latest]),
+        'max_residual_ft': float(residuals['residual_ft'][valid].max()) if valid.any() else None,
+        'min_residual_ft': float(residuals['residual_ft'][valid].min()) if valid.any() else None,
+        'samples': len(residuals['times']),
+    }
@@ -0,0 +1,209 @@
+# my_tide_app/prediction_archive.py
+
+import mmap
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from config import PREDICTION_ARCHIVE_PATH, PREDICTION_ARCHIVE_CHECK_SECONDS
+
+# File layout (little-endian), every section starting on an 8-byte boundary:
+#   header       MAGIC, version, stations, days, id_width, start (UTC epoch of day 0's
+#                midnight), built_at, hilo_count
+#   ids          S<id_width>[stations]        ASCII, NUL-padded, sorted
+#   hourly       float32[stations, days * 24]  ft above MLLW on the hour (GMT); NaN if missing
+#   hilo_index   int64[stations, days + 1]    station s's high/lows on day d are
+#                                             hilo_*[hilo_index[s, d]:hilo_index[s, d + 1]]
+#   hilo_time    int32[hilo_count]            seconds since start
+#   hilo_height  float32[hilo_count]
+#   hilo_type    S1[hilo_count]               b"H" or b"L"
+# Hourly values are a dense grid, so their station/day offset is arithmetic; high/lows
+# vary in number per day and go through hilo_index.
+MAGIC = b"TIDEPRED"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8sIIIIqdQ")
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+
+def _aligned(n):
+    return (n + 7) & ~7
+
+
+class PredictionArchive:
+    """
+    Precomputed hourly and high/low predictions for many stations over a fixed run of
+    days, built offline by build_prediction_archive.py.
+
+    Like StationStore, an archive mapped from a file is a set of read-only views onto the
+    page cache, shared by every worker on the host; lookups slice them without copying.
+    """
+
+    def __init__(self, ids, start, hourly, hilo_index, hilo_time, hilo_height, hilo_type,
+                 built_at=None, _mmap=None):
+        self.ids = ids
+        self.start = int(start)
+        self.days = hourly.shape[1] // 24
+        self.hourly_heights = hourly
+        self.hilo_index = hilo_index
+        self.hilo_time = hilo_time
+        self.hilo_height = hilo_height
+        self.hilo_type = hilo_type
+        self.built_at = time.time() if built_at is None else built_at
+        self._mmap = _mmap # Keeps the mapping alive for as long as the views are
+
+    @property
+    def end(self):
+        """UTC epoch seconds just past the last day covered."""
+        return self.start + self.days * DAY
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row(self, station_id):
+        """Row of `station_id`, or None if it isn't in the archive."""
+        key = str(station_id).encode("ascii")
+        i = int(np.searchsorted(self.ids, key))
+        return i if i < len(self.ids) and self.ids[i] == key else None
+
+    def covers(self, start, end):
+        """True if UTC epoch seconds [start, end) lie within the archive."""
+        return self.start <= start and end <= self.end
+
+    def hourly(self, station_id, start, end):
+        """
+        Hourly predictions in UTC epoch seconds [start, end).
+
+        Returns:
+            tuple: (times int64[n], heights float32[n] view into the archive), or None if
+                   the station or range isn't in the archive.
+        """
+        i = self.row(station_id)
+        if i is None or not self.covers(start, end):
+            return None
+        first = -((self.start - start) // HOUR) # First hour at or after start
+        last = -((self.start - end) // HOUR)
+        times = self.start + np.arange(first, last, dtype=np.int64) * HOUR
+        return times, self.hourly_heights[i, first:last]
+
+    def hilo(self, station_id, start, end):
+        """
+        High and low tides in UTC epoch seconds [start, end).
+
+        Returns:
+            tuple: (times int64[n], heights float32[n] view, types S1[n] view), or None if
+                   the station or range isn't in the archive.
+        """
+        i = self.row(station_id)
+        if i is None or not self.covers(start, end):
+            return None
+        first_day, last_day = (start - self.start) // DAY, -((self.start - end) // DAY)
+        lo, hi = self.hilo_index[i, first_day], self.hilo_index[i, last_day]
+        offsets = self.hilo_time[lo:hi]
+        # Trim the partial days at either end
+        a = lo + int(np.searchsorted(offsets, start - self.start))
+        b = lo + int(np.searchsorted(offsets, end - self.start))
+        return (self.start + self.hilo_time[a:b].astype(np.int64),
+                self.hilo_height[a:b], self.hilo_type[a:b])
+
+    # --- Serialization ---
+
+    def save(self, path):
+        """
+        Writes the archive to `path`. The file is written alongside and renamed into place,
+        so workers mapping the old file keep a consistent view.
+        """
+        id_width = self.ids.dtype.itemsize
+        sections = [
+            self.ids.tobytes(),
+            self.hourly_heights.astype("<f4", copy=False).tobytes(),
+            self.hilo_index.astype("<i8", copy=False).tobytes(),
+            self.hilo_time.astype("<i4", copy=False).tobytes(),
+            self.hilo_height.astype("<f4", copy=False).tobytes(),
+            self.hilo_type.astype("S1", copy=False).tobytes(),
+        ]
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(self), self.days, id_width,
+                                 self.start, self.built_at, len(self.hilo_time)))
+            for section in sections:
+                f.write(b"\0" * (_aligned(f.tell()) - f.tell()))
+                f.write(section)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Maps a file written by save() read-only. Raises ValueError if it isn't a
+        prediction archive of this version, or is truncated.
+        """
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(mapped) < _HEADER.size:
+                raise ValueError(f"{path} is too short to be a prediction archive")
+            magic, version, count, days, id_width, start, built_at, hilo_count = _HEADER.unpack_from(mapped, 0)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise ValueError(f"{path} is not a version {FORMAT_VERSION} prediction archive")
+
+            offset = _HEADER.size
+            arrays = []
+            for dtype, shape in ((f"S{id_width}", (count,)), ("<f4", (count, days * 24)),
+                                 ("<i8", (count, days + 1)), ("<i4", (hilo_count,)),
+                                 ("<f4", (hilo_count,)), ("S1", (hilo_count,))):
+                offset = _aligned(offset)
+                array = np.frombuffer(mapped, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+                offset += array.nbytes
+                arrays.append(array)
+        except (ValueError, struct.error) as e:
+            raise ValueError(f"Unreadable prediction archive {path}: {e}") from e
+
+        ids, hourly, hilo_index, hilo_time, hilo_height, hilo_type = arrays
+        return cls(ids, start, hourly, hilo_index, hilo_time, hilo_height, hilo_type,
+                   built_at=built_at, _mmap=mapped)
+
+
+# --- Shared instance ---
+
+_archive = None
+_archive_identity = None # (inode, mtime) of the file mapped
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_prediction_archive(path=PREDICTION_ARCHIVE_PATH):
+    """
+    The archive at PREDICTION_ARCHIVE_PATH, mapped once per process, or None if there is
+    none. Every PREDICTION_ARCHIVE_CHECK_SECONDS the file is checked again, so a rebuilt
+    archive is picked up without a restart.
+    """
+    global _archive, _archive_identity, _checked_at
+    if not path:
+        return None
+    if time.monotonic() - _checked_at < PREDICTION_ARCHIVE_CHECK_SECONDS:
+        return _archive
+    with _lock:
+        if time.monotonic() - _checked_at < PREDICTION_ARCHIVE_CHECK_SECONDS:
+            return _archive
+        _checked_at = time.monotonic()
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            _archive, _archive_identity = None, None
+            return None
+        identity = (stat.st_ino, stat.st_mtime_ns)
+        if identity != _archive_identity:
+            try:
+                _archive = PredictionArchive.load(path)
+                _archive_identity = identity
+                print(f"Mapped prediction archive {path}: {len(_archive)} stations, {_archive.days} days.")
+            except (OSError, ValueError) as e:
+                print(f"Ignoring prediction archive {path}: {e}")
+                _archive, _archive_identity = None, None
+        return _archive
@@ -0,0 +1,307 @@
+# my_tide_app/profiling.py
+
+import cProfile
+import glob
+import hmac
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from urllib.parse import urlencode
+
+from flask import Response, abort, g, jsonify, request, send_file
+
+from config import PROFILE_SECRET, PROFILE_DIR, PROFILE_SAMPLE_INTERVAL, PROFILE_KEEP
+from instrumentation import active_profile
+
+PROFILE_HEADER = "X-Tide-Profile"
+PROFILE_PARAMS = ("profile", "profile_mode") # Query parameters for profiling, never echoed back
+HOT_SPOTS = 15 # pandas functions listed in the summary
+
+# Only one request per worker is profiled at a time; cProfile can't nest and the
+# sampler's overhead shouldn't stack up.
+_busy = threading.Lock()
+
+
+def _frame_label(path, function):
+    """Label for a frame: its file's path from the package root, and the function."""
+    for marker in ("site-packages" + os.sep, "my_tide_app" + os.sep):
+        if marker in path:
+            path = path.split(marker, 1)[1]
+            break
+    else:
+        path = os.path.basename(path)
+    return f"{path}:{function}"
+
+
+def _is_pandas(label):
+    return label.startswith("pandas" + os.sep)
+
+
+class StackSampler:
+    """
+    Samples the stacks of a set of threads every `interval` seconds from a background
+    thread, counting each distinct stack. The counts are in the "folded" format that
+    flamegraph.pl, speedscope and inferno read: root;caller;callee count.
+    """
+
+    def __init__(self, thread_ids, interval=PROFILE_SAMPLE_INTERVAL):
+        self.thread_ids = thread_ids # Shared; threads come and go while sampling
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="tide-profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in list(self.thread_ids):
+                frame = frames.get(thread_id)
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame.f_code.co_filename, frame.f_code.co_name))
+                    frame = frame.f_back
+                if labels:
+                    self.stacks[";".join(reversed(labels))] += 1
+                    self.samples += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def pandas_hot_spots(self):
+        """Seconds spent under each pandas entry point (the first pandas frame below app code)."""
+        spent = Counter()
+        for stack, count in self.stacks.items():
+            labels = stack.split(";")
+            for i, label in enumerate(labels):
+                if _is_pandas(label):
+                    caller = labels[i - 1] if i else "?"
+                    spent[f"{label} (from {caller})"] += count * self.interval
+                    break
+        return [{'function': name, 'seconds': round(seconds, 4)} for name, seconds in spent.most_common(HOT_SPOTS)]
+
+
+class RequestProfile:
+    """
+    Everything recorded while profiling one request: stack samples (or a cProfile run),
+    plus each stage() and upstream_call() span, which instrumentation reports here via
+    the active_profile context variable. Spans also tell the sampler which background
+    threads are doing work for this request, and only while they are: pool threads go
+    on to serve other requests.
+    """
+
+    def __init__(self, mode, method, path):
+        self.id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.mode = mode
+        self.method = method
+        self.path = path
+        self.status = None
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.spans = []
+        self.request_thread = threading.get_ident()
+        self.thread_ids = {self.request_thread: 1} # Thread -> spans open on it
+        self.finished = False
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._cprofile = None
+
+    def watch_thread(self):
+        """Samples the calling thread until the matching unwatch_thread()."""
+        thread_id = threading.get_ident()
+        with self._lock:
+            self.thread_ids[thread_id] = self.thread_ids.get(thread_id, 0) + 1
+
+    def unwatch_thread(self):
+        thread_id = threading.get_ident()
+        with self._lock:
+            depth = self.thread_ids.get(thread_id, 0) - 1
+            if depth > 0 or thread_id == self.request_thread:
+                self.thread_ids[thread_id] = max(depth, 1)
+            else:
+                self.thread_ids.pop(thread_id, None)
+
+    def record_span(self, kind, name, started, elapsed, outcome):
+        with self._lock:
+            self.spans.append({
+                'kind': kind, 'name': name, 'outcome': outcome,
+                'start_ms': round((started - self.started) * 1000, 2),
+                'duration_ms': round(elapsed * 1000, 2),
+                'thread': threading.current_thread().name,
+            })
+
+    def start(self):
+        if self.mode == "cprofile":
+            # Deterministic, but only sees the request thread
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        else:
+            self._sampler = StackSampler(self.thread_ids)
+            self._sampler.start()
+
+    def stop(self):
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+        with self._lock:
+            self.thread_ids.clear() # Spans still open in abandoned pool threads don't count
+        self.elapsed = time.perf_counter() - self.started
+
+    def _cprofile_summary(self):
+        stats = pstats.Stats(self._cprofile)
+        folded = Counter()
+        hot = []
+        for (filename, _, name), (_, calls, tottime, cumtime, callers) in stats.stats.items():
+            label = _frame_label(filename, name)
+            # pstats only has caller -> callee edges, so this is a two-level flame graph
+            for (caller_file, _, caller_name), caller_stats in callers.items():
+                caller = _frame_label(caller_file, caller_name)
+                folded[f"{caller};{label}"] += int(caller_stats[2] * 1_000_000) # microseconds of own time
+            if _is_pandas(label):
+                hot.append({'function': label, 'calls': calls, 'seconds': round(tottime, 4),
+                            'cumulative_seconds': round(cumtime, 4)})
+        hot.sort(key=lambda entry: entry['seconds'], reverse=True)
+        text = "".join(f"{stack} {count}\n" for stack, count in folded.most_common() if count)
+        return text, hot[:HOT_SPOTS]
+
+    def save(self, directory=PROFILE_DIR):
+        """
+        Writes <id>.folded (flame graph input) and <id>.json (summary) to `directory`,
+        plus <id>.pstats for cProfile runs.
+        """
+        os.makedirs(directory, exist_ok=True)
+        if self._cprofile is not None:
+            folded, hot_spots = self._cprofile_summary()
+            self._cprofile.dump_stats(os.path.join(directory, f"{self.id}.pstats"))
+            samples = None
+        else:
+            folded, hot_spots = self._sampler.folded(), self._sampler.pandas_hot_spots()
+            samples = self._sampler.samples
+        summary = {
+            'id': self.id,
+            'mode': self.mode,
+            'created_at': self.wall_started,
+            'method': self.method,
+            'path': self.path,
+            'status': self.status,
+            'elapsed_ms': round(self.elapsed * 1000, 2),
+            'samples': samples,
+            'upstream_ms': round(sum(s['duration_ms'] for s in self.spans if s['kind'] == "upstream"), 2),
+            'spans': sorted(self.spans, key=lambda span: span['start_ms']),
+            'pandas_hot_spots': hot_spots,
+        }
+        with open(os.path.join(directory, f"{self.id}.folded"), "w") as f:
+            f.write(folded)
+        with open(os.path.join(directory, f"{self.id}.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+        _prune(directory)
+
+
+def _prune(directory, keep=PROFILE_KEEP):
+    summaries = sorted(glob.glob(os.path.join(directory, "*.json")))
+    for path in summaries[:-keep]:
+        stem = path[:-len(".json")]
+        for extension in (".json", ".folded", ".pstats"):
+            try:
+                os.remove(stem + extension)
+            except FileNotFoundError:
+                pass
+
+
+def _authorized(value):
+    return value is not None and hmac.compare_digest(value, PROFILE_SECRET)
+
+
+def init_app(app):
+    """
+    Installs the profiling hooks: a request with `X-Tide-Profile: <PROFILE_SECRET>` (or
+    ?profile=<secret>) is sampled (or, with ?profile_mode=cprofile, run under cProfile),
+    and its profile is saved to PROFILE_DIR and served from /_profile/<id>.json|.folded.
+    The response carries the id in an X-Tide-Profile-Id header. Without PROFILE_SECRET
+    nothing is installed, so unprofiled requests pay nothing.
+    """
+    if not PROFILE_SECRET:
+        return
+
+    @app.before_request
+    def _start_profile():
+        if not _authorized(request.headers.get(PROFILE_HEADER) or request.args.get('profile')):
+            return
+        if request.endpoint == 'profile_file' or not _busy.acquire(blocking=False):
+            return
+        mode = "cprofile" if request.args.get('profile_mode') == "cprofile" else "sample"
+        query = urlencode([(k, v) for k, v in request.args.items(multi=True) if k not in PROFILE_PARAMS]) # Not the secret
+        profile = RequestProfile(mode, request.method, request.path + (f"?{query}" if query else ""))
+        g.profile = profile
+        g.profile_token = active_profile.set(profile)
+        profile.start()
+
+    def finish(profile, token):
+        if profile.finished:
+            return
+        profile.finished = True
+        try:
+            active_profile.reset(token)
+        except ValueError: # Closed from another context than the one that set it
+            active_profile.set(None)
+        try:
+            profile.stop()
+            profile.save()
+        except Exception as e:
+            print(f"Error saving profile {profile.id}: {e}")
+        finally:
+            _busy.release()
+
+    @app.after_request
+    def _finish_profile(response):
+        profile = g.get('profile')
+        if profile is None:
+            return response
+        profile.status = response.status_code
+        response.headers['X-Tide-Profile-Id'] = profile.id
+
+        # Streamed bodies are still being generated here, so keep profiling (and keep
+        # the spans flowing in) until the server closes the response
+        token = g.profile_token
+        response.call_on_close(lambda: finish(profile, token))
+        g.profile_closing = True
+        return response
+
+    @app.teardown_request
+    def _abandon_profile(exc):
+        # Runs however the request ended; if no response got the profile to close it
+        # (an after_request hook or the response itself failed), finish it here so the
+        # worker's profiling slot isn't held forever
+        profile = g.pop('profile', None)
+        if profile is not None and not g.pop('profile_closing', False):
+            finish(profile, g.profile_token)
+
+    @app.route('/_profile/<profile_id>.<fmt>')
+    def profile_file(profile_id, fmt):
+        if not _authorized(request.headers.get(PROFILE_HEADER) or request.args.get('profile')):
+            abort(404)
+        if fmt not in ("json", "folded", "pstats") or not profile_id.replace("-", "").isalnum():
+            abort(404)
+        path = os.path.join(PROFILE_DIR, f"{profile_id}.{fmt}")
+        if not os.path.exists(path):
+            abort(404)
+        if fmt == "json":
+            with open(path) as f:
+                return jsonify(json.load(f))
+        if fmt == "folded":
+            with open(path) as f:
+                return Response(f.read(), mimetype="text/plain")
+        return send_file(path, mimetype="application/octet-stream", as_attachment=True)
@@ -0,0 +1,364 @@
+# my_tide_app/resilience.py
+
+import fcntl
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+import requests
+from geopy.exc import GeocoderTimedOut, GeocoderUnavailable
+
+from config import (
+    UPSTREAM_TIMEOUT, MIN_UPSTREAM_TIMEOUT,
+    BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS, RATE_LIMITS,
+    DAILY_QUOTAS, QUOTA_RESERVE_FRACTION, QUOTA_STATE_PATH
+)
+from instrumentation import inc, register_gauge
+
+# Absolute time.monotonic() deadline for the current request, or None for no budget
+_deadline = ContextVar('tide_request_deadline', default=None)
+# True while serving a request that admission control turned away from the upstreams
+_cache_only = ContextVar('tide_request_cache_only', default=False)
+
+
+class CircuitBreaker:
+    """
+    Per-upstream circuit breaker.
+
+    closed    -> calls go through; `failure_threshold` consecutive failures open the circuit
+    open      -> calls are refused immediately until `reset_seconds` have passed
+    half_open -> a single probe call is let through; success closes, failure re-opens
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            inc("tide_circuit_breaker_transitions_total", upstream=self.name, state=state)
+            print(f"Circuit breaker '{self.name}' is now {state}.")
+
+    def allow(self):
+        """Returns True if a call may be made now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_seconds:
+                    return False
+                self._set_state(self.HALF_OPEN)
+            # Half-open: only one probe at a time
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def cancel(self):
+        """Forgets a call allow() let through that isn't being made after all (frees a half-open probe)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    """Returns the process-wide circuit breaker for upstream `name`, creating it on first use."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` calls per second with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait=None):
+        """
+        Takes one token, sleeping until one is available. Returns False without taking
+        a token if that would mean waiting longer than `max_wait` seconds.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+            if max_wait is not None and wait > max_wait:
+                return False
+            # Reserve the token now so concurrent callers queue up behind us
+            self.tokens -= 1
+        if wait:
+            time.sleep(wait)
+        return True
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name):
+    """Returns the process-wide limiter for upstream `name`, or None if it isn't rate limited."""
+    rate = RATE_LIMITS.get(name)
+    if not rate:
+        return None
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = _limiters[name] = RateLimiter(rate)
+        return limiter
+
+
+class QuotaLedger:
+    """
+    Calls made today (UTC) to each quota-limited upstream, kept in a small JSON file.
+
+    Every update takes an exclusive lock on the file, so all gunicorn workers (and CLI
+    runs) on the host draw from the same count, and the count survives restarts. The
+    count resets when the UTC date changes. If the file can't be used, counting falls
+    back to this process only.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = {"day": None, "used": {}}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _today():
+        return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+    def _apply(self, state, update):
+        today = self._today()
+        if state.get("day") != today or not isinstance(state.get("used"), dict):
+            state.clear()
+            state.update(day=today, used={})
+        return update(state["used"])
+
+    def update(self, update):
+        """Calls update(used) with today's {upstream: count} dict, saving any changes. Returns its result."""
+        with self._lock:
+            try:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            except OSError as e:
+                print(f"Quota ledger {self.path} unavailable ({e}); counting in this process only.")
+                return self._apply(self._local, update)
+            with os.fdopen(fd, "r+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    state = json.loads(f.read() or "{}")
+                except ValueError:
+                    state = {} # Torn or hand-edited file; start the day over rather than fail calls
+                result = self._apply(state, update)
+                f.seek(0)
+                f.truncate()
+                json.dump(state, f)
+                return result
+
+    def used(self):
+        """Today's {upstream: count}. Only reads the file (under a shared lock); never rewrites it."""
+        with self._lock:
+            try:
+                with open(self.path) as f:
+                    fcntl.flock(f, fcntl.LOCK_SH)
+                    state = json.loads(f.read() or "{}")
+            except (OSError, ValueError):
+                state = self._local # No usable file: update() has been counting in this process
+            if state.get("day") != self._today() or not isinstance(state.get("used"), dict):
+                return {}
+            return dict(state["used"])
+
+
+class DailyQuota:
+    """
+    Daily call budget for one upstream. Calls marked non-essential (ones that have a stale
+    cached answer to fall back on) stop once `reserve_fraction` of the budget is left.
+    """
+
+    def __init__(self, name, limit, ledger, reserve_fraction=QUOTA_RESERVE_FRACTION):
+        self.name = name
+        self.limit = limit
+        self.ledger = ledger
+        self.soft_limit = int(limit * (1 - reserve_fraction))
+
+    def acquire(self, essential=True):
+        """Counts one call and returns True, or returns False if the budget doesn't allow it."""
+        cap = self.limit if essential else self.soft_limit
+
+        def take(used):
+            if used.get(self.name, 0) >= cap:
+                return False
+            used[self.name] = used.get(self.name, 0) + 1
+            return True
+        return self.ledger.update(take)
+
+    def exhausted(self, essential=True):
+        """True if acquire(essential) would refuse a call right now."""
+        cap = self.limit if essential else self.soft_limit
+        return self.ledger.used().get(self.name, 0) >= cap
+
+    def release(self):
+        """Gives back a call counted by acquire() that wasn't made after all."""
+        def give_back(used):
+            used[self.name] = max(0, used.get(self.name, 0) - 1)
+        self.ledger.update(give_back)
+
+
+quota_ledger = QuotaLedger(QUOTA_STATE_PATH)
+_quotas = {name: DailyQuota(name, limit, quota_ledger) for name, limit in DAILY_QUOTAS.items() if limit}
+
+
+def get_quota(name):
+    """Returns the daily quota for upstream `name`, or None if it has none."""
+    return _quotas.get(name)
+
+
+def quota_usage():
+    """Returns {upstream: (used today, daily limit)} for every quota-limited upstream."""
+    used = quota_ledger.used() if _quotas else {}
+    return {name: (used.get(name, 0), quota.limit) for name, quota in _quotas.items()}
+
+
+register_gauge("tide_upstream_quota_used",
+               lambda: [({"upstream": name}, used) for name, (used, _) in quota_usage().items()])
+register_gauge("tide_upstream_quota_limit",
+               lambda: [({"upstream": name}, limit) for name, (_, limit) in quota_usage().items()])
+
+
+def start_budget(seconds, cache_only=False):
+    """
+    Starts a latency budget of `seconds` for the current request (or CLI task). With
+    cache_only, no upstream calls are made at all: callers get their cached (or stale)
+    answers, or none.
+    """
+    _deadline.set(time.monotonic() + seconds if seconds else None)
+    _cache_only.set(cache_only)
+
+
+def clear_budget():
+    _deadline.set(None)
+    _cache_only.set(False)
+
+
+def cache_only():
+    """True if the current request may not call any upstream (see start_budget())."""
+    return _cache_only.get()
+
+
+def remaining_budget():
+    """Seconds left in the current budget, or None if no budget is active."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def call_timeout(upstream, essential=True):
+    """
+    Decides whether a call to `upstream` should be made and with what timeout.
+
+    Returns the timeout in seconds (the configured per-call timeout, shortened to what is
+    left of the request budget), or None if the call should be skipped because the
+    budget is spent, the upstream's circuit is open, its rate limit can't be met in time,
+    or its daily quota is used up, or the request is being served from cache only (see
+    admission.py). Blocks while waiting for the upstream's rate limiter.
+
+    Pass essential=False when the caller has something to fall back on (a stale cache
+    entry); such calls are refused first as the daily quota runs low.
+    """
+    if _cache_only.get():
+        print(f"Skipping {upstream} call: request admitted for cached data only.")
+        inc("tide_upstream_skipped_total", upstream=upstream, reason="shed")
+        return None
+
+    remaining = remaining_budget()
+    if remaining is not None and remaining < MIN_UPSTREAM_TIMEOUT:
+        print(f"Skipping {upstream} call: request latency budget exhausted.")
+        inc("tide_upstream_skipped_total", upstream=upstream, reason="budget")
+        return None
+
+    # Refusals that cost nothing come before the rate limiter, which may sleep for a token
+    breaker = get_breaker(upstream)
+    if not breaker.allow():
+        print(f"Skipping {upstream} call: circuit open after repeated failures.")
+        inc("tide_upstream_skipped_total", upstream=upstream, reason="circuit_open")
+        return None
+
+    quota = get_quota(upstream)
+    if quota is not None and not quota.acquire(essential):
+        breaker.cancel()
+        print(f"Skipping {upstream} call: daily quota {'used up' if essential else 'reserved for essential calls'}.")
+        inc("tide_upstream_skipped_total", upstream=upstream, reason="quota" if essential else "quota_reserve")
+        return None
+
+    limiter = get_rate_limiter(upstream)
+    if limiter is not None:
+        max_wait = None if remaining is None else remaining - MIN_UPSTREAM_TIMEOUT
+        if not limiter.acquire(max_wait):
+            if quota is not None:
+                quota.release()
+            breaker.cancel()
+            print(f"Skipping {upstream} call: rate limit can't be met within the request budget.")
+            inc("tide_upstream_skipped_total", upstream=upstream, reason="rate_limit")
+            return None
+
+    timeout = UPSTREAM_TIMEOUT
+    remaining = remaining_budget()
+    if remaining is not None:
+        timeout = min(timeout, max(remaining, MIN_UPSTREAM_TIMEOUT))
+    return timeout
+
+
+def is_upstream_failure(exc):
+    """True for errors that say the upstream is unhealthy (timeouts, connection errors, 5xx)."""
+    if isinstance(exc, (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                        GeocoderTimedOut, GeocoderUnavailable)):
+        return True
+    if isinstance(exc, requests.exceptions.HTTPError):
+        return exc.response is None or exc.response.status_code >= 500
+    return False
+
+
+def record_result(upstream, exc=None):
+    """Feeds the outcome of a call into the upstream's circuit breaker."""
+    breaker = get_breaker(upstream)
+    if exc is not None and is_upstream_failure(exc):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
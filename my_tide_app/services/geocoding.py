@@ -1,101 +1,182 @@
 # my_tide_app/services/geocoding.py
 
-import pandas as pd
+import time
+from functools import lru_cache
+
+import pytz
 import requests
 from geopy.geocoders import OpenCage
-from geopy.distance import great_circle
 import json # Import json for potential file loading/saving in debug
 
 # Import API key from config
-from config import OPENCAGE_API_KEY
+from config import (
+    OPENCAGE_API_KEY, OPENCAGE_DOMAIN, OPENCAGE_SCHEME, NOAA_STATIONS_URL,
+    STATIONS_CACHE_TTL, STATION_STORE_PATH, STATIONS_STREAM_CHUNK_BYTES, LOCAL_TIMEZONE
+)
+from instrumentation import upstream_call
+from resilience import call_timeout, record_result
+from cache import geocode_cache, stations_cache
+from station_store import StationStore
+from json_stream import iter_array
 
 def get_coordinates_from_zip(zip_code):
     """
     Converts a ZIP code to latitude and longitude using OpenCage Geocoding API.
+    Successful lookups are cached, and an expired lookup is still used if OpenCage
+    can't be asked (errors, daily quota).
     """
     if OPENCAGE_API_KEY == "YOUR_OPENCAGE_API_KEY":
         print("WARNING: OpenCage API Key not set. Cannot perform ZIP code lookup.")
         return None, None
 
-    geolocator = OpenCage(OPENCAGE_API_KEY)
-    try:
-        location = geolocator.geocode(zip_code)
-        if location:
-            return (location.latitude, location.longitude)
-        else:
-            print(f"Could not find coordinates for ZIP code: {zip_code}")
-            return None, None
-    except Exception as e:
-        print(f"Error getting coordinates for {zip_code}: {e}")
-        return None, None
+    key = str(zip_code).strip()
+    coordinates = geocode_cache.get_or_load(
+        key, lambda: _geocode_zip(zip_code, essential=geocode_cache.get_stale(key) is None)
+    )
+    return coordinates if coordinates is not None else (None, None)
+
+def coordinates_cached(zip_code):
+    """True if get_coordinates_from_zip() has an answer (even an expired one) without asking OpenCage."""
+    return geocode_cache.get_stale(str(zip_code).strip()) is not None
+
+def _geocode_zip(zip_code, essential=True):
+    """Does the actual OpenCage lookup; returns (lat, lon) or None."""
+
+    timeout = call_timeout("opencage", essential=essential)
+    if timeout is None:
+        return None
+
+    geolocator = OpenCage(OPENCAGE_API_KEY, domain=OPENCAGE_DOMAIN, scheme=OPENCAGE_SCHEME)
+    with upstream_call("opencage") as span:
+        try:
+            location = geolocator.geocode(zip_code, timeout=timeout)
+            record_result("opencage")
+            if location:
+                return (location.latitude, location.longitude)
+            else:
+                span.outcome = "not_found"
+                print(f"Could not find coordinates for ZIP code: {zip_code}")
+                return None
+        except Exception as e:
+            span.outcome = "error"
+            record_result("opencage", e)
+            print(f"Error getting coordinates for {zip_code}: {e}")
+            return None
 
 def get_noaa_tide_stations():
     """
     Fetches a list of all NOAA tide stations with their IDs and coordinates.
     Includes robust error handling and filtering for active stations with valid coordinates.
+    The catalog is cached, so this only goes to NOAA about once a day.
+
+    Returns:
+        StationStore: The catalog, memory-mapped from STATION_STORE_PATH when possible,
+                      or None if it couldn't be fetched.
     """
-    stations_url = "https://api.tidesandcurrents.noaa.gov/mdapi/prod/webapi/stations.json"
-    stations_data = None
+    return stations_cache.get_or_load("all", _load_station_store)
 
+def stations_cached():
+    """True if get_noaa_tide_stations() has the catalog in memory."""
+    return stations_cache.get("all") is not None
+
+def _read_station_store():
+    """Maps the shared station store file, or returns None if it is missing or unreadable."""
     try:
-        response = requests.get(stations_url, timeout=10) # Added timeout
-        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-        stations_data = response.json()
-
-        # Debugging prints for initial response structure
-        print(f"DEBUG: NOAA API response received. Top-level keys: {list(stations_data.keys())}")
-        if 'stations' not in stations_data:
-            print("DEBUG: 'stations' key is MISSING from NOAA response. This is unexpected.")
-            return None
-        if not isinstance(stations_data['stations'], list):
-            print("DEBUG: 'stations' value is NOT a list. This is unexpected.")
-            return None
-        print(f"DEBUG: 'stations' list contains {len(stations_data['stations'])} items.")
-
-        stations_list = []
-        total_stations_processed = 0
-        active_valid_stations_count = 0
-
-        for station in stations_data['stations']:
-            total_stations_processed += 1
-            is_active_raw = station.get('active')
-            lat_raw = station.get('lat')
-            lng_raw = station.get('lng') 
-
-            # A station passes the 'active' check if its 'active' field is explicitly True,
-            # OR if its 'active' field is None (as observed in some NOAA data).
-            # It only fails if 'active' is explicitly False.
-            is_active_pass = (is_active_raw is True) or (is_active_raw is None)
-
-            has_lat = lat_raw is not None
-            has_lng = lng_raw is not None
-            
+        return StationStore.load(STATION_STORE_PATH)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Ignoring station store {STATION_STORE_PATH}: {e}")
+        return None
+
+def _load_station_store():
+    """
+    Loader for get_noaa_tide_stations(). Uses the file another worker already wrote if it
+    is fresh; otherwise fetches from NOAA and rewrites it. A stale file is still better
+    than nothing if NOAA can't be reached.
+    """
+    on_disk = _read_station_store()
+    if on_disk is not None and on_disk.age_seconds < STATIONS_CACHE_TTL:
+        return on_disk
+
+    fetched = _fetch_noaa_tide_stations()
+    if fetched is None:
+        if on_disk is not None:
+            print(f"Using station store from {on_disk.age_seconds / 3600:.1f} hours ago; NOAA station list unavailable.")
+        return on_disk
+
+    try:
+        fetched.save(STATION_STORE_PATH)
+    except OSError as e:
+        print(f"Could not write station store {STATION_STORE_PATH}: {e}. Keeping it in memory only.")
+        return fetched
+    # Map the file we just wrote so this worker shares pages with the others too
+    return _read_station_store() or fetched
+
+def _active_station_records(stations, counts):
+    """
+    Filters mdapi station objects down to (id, name, lat, lon) for active stations with
+    coordinates, counting what it sees in `counts` ('processed', 'included').
+    """
+    for station in stations:
+        counts['processed'] += 1
+        is_active_raw = station.get('active')
+        lat_raw = station.get('lat')
+        lng_raw = station.get('lng')
+
+        # A station passes the 'active' check if its 'active' field is explicitly True,
+        # OR if its 'active' field is None (as observed in some NOAA data).
+        # It only fails if 'active' is explicitly False.
+        is_active_pass = (is_active_raw is True) or (is_active_raw is None)
+
+        if not (is_active_pass and lat_raw is not None and lng_raw is not None):
             # Debugging prints for individual stations (first few only, if excluded)
-            if not (is_active_pass and has_lat and has_lng):
-                if total_stations_processed <= 5 or total_stations_processed > len(stations_data['stations']) - 5:
-                    print(f"DEBUG: Station {station.get('id', 'N/A')}: Active={is_active_raw} (Pass:{is_active_pass}), Lat={lat_raw} (Valid:{has_lat}), Lng={lng_raw} (Valid:{has_lng}) - Excluded.")
-            
-            if is_active_pass and has_lat and has_lng:
-                active_valid_stations_count += 1
-                stations_list.append({
-                    'id': station['id'],
-                    'name': station['name'],
-                    'lat': lat_raw,
-                    'lon': lng_raw # Store as 'lon' in DataFrame for consistency with geopy/elsewhere
-                })
-            
-        print(f"DEBUG: Finished processing stations. Total processed: {total_stations_processed}, Included in list: {active_valid_stations_count}")
-
-        if not stations_list:
+            if counts['processed'] - counts['included'] <= 5:
+                print(f"DEBUG: Station {station.get('id', 'N/A')}: Active={is_active_raw} (Pass:{is_active_pass}), Lat={lat_raw}, Lng={lng_raw} - Excluded.")
+            continue
+        counts['included'] += 1
+        yield station['id'], station['name'], lat_raw, lng_raw
+
+def _fetch_noaa_tide_stations():
+    """
+    Does the actual mdapi request for get_noaa_tide_stations().
+
+    The response is decoded one station at a time as it arrives and appended straight
+    into the store's arrays, so neither the document nor a list of station dicts is
+    ever held in memory; peak usage stays close to the size of the finished store.
+    """
+    stations_url = NOAA_STATIONS_URL
+
+    timeout = call_timeout("noaa_mdapi")
+    if timeout is None:
+        return None
+
+    counts = {'processed': 0, 'included': 0}
+    try:
+        with upstream_call("noaa_mdapi") as span:
+            try:
+                with requests.get(stations_url, timeout=timeout, stream=True) as response:
+                    response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+                    chunks = response.iter_content(chunk_size=STATIONS_STREAM_CHUNK_BYTES)
+                    stations = StationStore.from_records(
+                        _active_station_records(iter_array(chunks, 'stations'), counts), fetched_at=time.time())
+            except Exception as e:
+                span.outcome = type(e).__name__
+                record_result("noaa_mdapi", e)
+                raise
+            record_result("noaa_mdapi")
+
+        print(f"DEBUG: Finished processing stations. Total processed: {counts['processed']}, Included in list: {counts['included']}")
+        if stations.empty:
             print("NOAA API returned data, but no active stations with valid coordinates were found after filtering.")
             return None
-        return pd.DataFrame(stations_list)
+        return stations
 
     except requests.exceptions.Timeout:
-        print(f"Timeout Error: Request to NOAA station list API timed out after 10 seconds.")
+        print(f"Timeout Error: Request to NOAA station list API timed out after {timeout:.1f} seconds.")
         return None
     except requests.exceptions.HTTPError as e:
-        print(f"HTTP Error fetching NOAA stations: {e} - Response content: {e.text[:500]}")
+        print(f"HTTP Error fetching NOAA stations: {e} - Response content: {e.response.text[:500]}")
         return None
     except requests.exceptions.ConnectionError as e:
         print(f"Connection Error fetching NOAA stations: {e}")
@@ -103,50 +184,100 @@ def get_noaa_tide_stations():
     except requests.exceptions.RequestException as e:
         print(f"An unknown error occurred while fetching NOAA stations: {e}")
         return None
-    except ValueError as e: # Catch JSON decoding errors
-        print(f"Error parsing JSON from NOAA station list: {e}")
-        print(f"Problematic response content (first 500 chars): {response.text[:500]}")
+    except (ValueError, KeyError, TypeError) as e: # Malformed JSON, or stations missing 'id'/'name'
+        print(f"Error parsing JSON from NOAA station list after {counts['processed']} stations: {e}")
         return None
 
-def find_closest_station(target_lat, target_lon, all_stations_df):
+def find_closest_station(target_lat, target_lon, stations):
     """
     Finds the closest NOAA tide station to a given latitude and longitude.
 
     Args:
         target_lat (float): Latitude of the target location.
         target_lon (float): Longitude of the target location.
-        all_stations_df (pd.DataFrame): DataFrame containing NOAA station data
-                                        with 'id', 'name', 'lat', 'lon' columns.
+        stations (StationStore): The station catalog from get_noaa_tide_stations().
 
     Returns:
         tuple: (station_id, station_name, station_lat, station_lon) of the closest station,
                or (None, None, None, None) if no stations are available.
     """
-    if all_stations_df is None or all_stations_df.empty:
+    if stations is None or stations.empty:
         print("No NOAA stations available to find the closest one.")
         return None, None, None, None
 
-    target_coords = (target_lat, target_lon)
-    
-    closest_station = None
-    min_distance = float('inf')
-
-    # Convert DataFrame to a list of tuples for efficient iteration
-    station_records = all_stations_df[['id', 'name', 'lat', 'lon']].to_records(index=False)
-
-    for record in station_records:
-        station_id, station_name, station_lat, station_lon = record
-        
-        station_coords = (station_lat, station_lon)
-        distance = great_circle(target_coords, station_coords).miles # Distance in miles
-
-        if distance < min_distance:
-            min_distance = distance
-            closest_station = (station_id, station_name, station_lat, station_lon)
-
-    if closest_station:
-        print(f"DEBUG: Closest station found: {closest_station[1]} (ID: {closest_station[0]}) at {min_distance:.2f} miles.")
-        return closest_station
-    else:
-        print("No closest station could be determined.")
-        return None, None, None, None
+    # Great-circle distances to every station at once, same formula as geopy's great_circle
+    closest_index, min_distance = stations.nearest(target_lat, target_lon)
+    closest_station = stations.station(closest_index)
+    print(f"DEBUG: Closest station found: {closest_station[1]} (ID: {closest_station[0]}) at {min_distance:.2f} miles.")
+    return closest_station
+
+def find_closest_stations(target_lat, target_lon, stations, k):
+    """
+    Finds the `k` closest NOAA tide stations to a given latitude and longitude.
+
+    Args:
+        target_lat (float): Latitude of the target location.
+        target_lon (float): Longitude of the target location.
+        stations (StationStore): The station catalog from get_noaa_tide_stations().
+        k (int): How many stations to return.
+
+    Returns:
+        list: (station_id, station_name, station_lat, station_lon, distance_miles) tuples,
+              closest first; empty if no stations are available.
+    """
+    if stations is None or stations.empty:
+        print("No NOAA stations available to find the closest ones.")
+        return []
+    return [stations.station(i) + (distance,) for i, distance in stations.nearest_k(target_lat, target_lon, k)]
+
+# Coarse time zone regions covering NOAA's stations, checked in order; first match wins.
+# (zone, lat_min, lat_max, lon_min, lon_max)
+_TIMEZONE_REGIONS = (
+    ("Pacific/Honolulu", 18.5, 22.5, -161.0, -154.0),
+    ("America/Adak", 50.0, 56.0, -180.0, -169.5),       # Aleutians west of Umnak
+    ("America/Adak", 50.0, 56.0, 172.0, 180.0),         # ... and across the antimeridian
+    ("America/Anchorage", 51.0, 72.0, -169.5, -129.9),
+    ("America/Puerto_Rico", 17.5, 18.8, -68.0, -64.3),  # Puerto Rico and the Virgin Islands
+    ("Pacific/Guam", 13.0, 21.0, 144.0, 146.5),
+    ("Pacific/Pago_Pago", -15.0, -10.0, -172.0, -168.0),
+    ("Pacific/Kwajalein", 5.0, 12.0, 166.0, 172.0),
+    ("America/Los_Angeles", 32.0, 49.5, -125.5, -116.5),
+    ("America/Chicago", 46.3, 49.5, -93.0, -90.4),      # Western Lake Superior
+    ("America/Chicago", 41.5, 46.3, -88.5, -86.8),      # Lake Michigan's west shore
+    ("America/New_York", 41.0, 49.5, -90.4, -66.0),     # Rest of the Great Lakes and the Northeast
+    ("America/Chicago", 24.0, 36.0, -104.0, -85.0),     # Gulf coast as far as the Apalachicola River
+    ("America/New_York", 24.0, 41.0, -85.0, -66.0),
+)
+
+_timezone_finder = None
+
+def get_station_timezone(latitude, longitude):
+    """
+    Returns the pytz time zone for a station's coordinates, without any network call.
+    Uses timezonefinder's offline shapes when it is installed, otherwise a coarse
+    table of US coastal regions, then a plain UTC offset from the longitude.
+    Falls back to LOCAL_TIMEZONE when there are no coordinates.
+    """
+    if latitude is None or longitude is None:
+        return LOCAL_TIMEZONE
+    return _lookup_timezone(round(float(latitude), 2), round(float(longitude), 2))
+
+@lru_cache(maxsize=4096)
+def _lookup_timezone(latitude, longitude):
+    global _timezone_finder
+    try:
+        from timezonefinder import TimezoneFinder # Optional: precise zone shapes
+        if _timezone_finder is None:
+            _timezone_finder = TimezoneFinder()
+        zone = _timezone_finder.timezone_at(lng=longitude, lat=latitude)
+        if zone:
+            return pytz.timezone(zone)
+    except ImportError:
+        pass
+
+    for zone, lat_min, lat_max, lon_min, lon_max in _TIMEZONE_REGIONS:
+        if lat_min <= latitude <= lat_max and lon_min <= longitude <= lon_max:
+            return pytz.timezone(zone)
+    # Etc/GMT signs are inverted: Etc/GMT+5 is five hours behind UTC
+    offset = int(round(-longitude / 15.0))
+    return pytz.timezone(f"Etc/GMT{offset:+d}" if offset else "UTC")
@@ -1,9 +1,16 @@
 # my_tide_app/services/noaa.py
 
+import numpy as np
 import requests
 import pandas as pd
 from datetime import datetime, timedelta, timezone # Keep timezone here for safety, though it's used elsewhere
 
+from config import NOAA_DATAGETTER_URL
+from instrumentation import upstream_call, inc
+from resilience import call_timeout, record_result
+from cache import tide_cache
+from prediction_archive import get_prediction_archive
+
 
 def get_tide_data(station_id, start_date, end_date, product="predictions", datum="MLLW", time_zone="lst", interval="hilo"):
     """
@@ -17,12 +24,133 @@ def get_tide_data(station_id, start_date, end_date, product="predictions", datum
         datum (str): Tidal datum (e.g., "MLLW", "MSL").
         time_zone (str): Time zone for data (e.g., "lst", "gmt").
         interval (str): Interval for predictions (e.g., "hilo" for high/low, "h" for hourly).
+                        Hourly and high/low MLLW predictions in GMT come from the prediction
+                        archive (see prediction_archive.py) when it covers them.
 
     Returns:
         pandas.DataFrame: A DataFrame containing the tidal data, or None if an error occurs.
+                          Predictions are cached; each caller gets its own copy. For
+                          observed products, an empty DataFrame means NOAA answered
+                          that it has no data, while None means it couldn't be asked.
     """
-    base_url = "https://api.tidesandcurrents.noaa.gov/api/prod/datagetter?"
+    if product != "predictions":
+        # Observations change as they come in; don't cache them
+        return _fetch_tide_data(station_id, start_date, end_date, product, datum, time_zone, interval)
+
+    if datum == "MLLW" and time_zone == "gmt" and interval in ("h", "hilo"):
+        df = _archived_predictions(station_id, start_date, end_date, interval)
+        if df is not None:
+            # Empty for the hourly predictions of a station NOAA only has high/lows for,
+            # which is what NOAA would say too
+            return df if not df.empty else None
+
+    key = _prediction_key(station_id, start_date, end_date, datum, time_zone, interval)
+    df = tide_cache.get_or_load(
+        key, lambda: _fetch_tide_data(station_id, start_date, end_date, product, datum, time_zone, interval)
+    )
+    return df.copy() if df is not None else None
+
+
+def _prediction_key(station_id, start_date, end_date, datum, time_zone, interval):
+    return (station_id, start_date, end_date, "predictions", datum, time_zone, interval)
+
+
+def _gmt_day_span(start_date, end_date):
+    """UTC epoch seconds [start, end) of whole GMT days start_date..end_date (YYYYMMDD)."""
+    start = int(datetime.strptime(start_date, "%Y%m%d").replace(tzinfo=timezone.utc).timestamp())
+    end = int(datetime.strptime(end_date, "%Y%m%d").replace(tzinfo=timezone.utc).timestamp()) + 24 * 3600
+    return start, end
 
+
+def predictions_cached(station_id, start_date, end_date, interval, datum="MLLW", time_zone="gmt"):
+    """
+    True if get_tide_data() would answer these predictions without going to NOAA: the
+    prediction archive covers them, or they are in the tide cache. Doesn't count as a lookup.
+    """
+    predictions = get_prediction_archive()
+    if (predictions is not None and datum == "MLLW" and time_zone == "gmt" and interval in ("h", "hilo")
+            and predictions.row(station_id) is not None and predictions.covers(*_gmt_day_span(start_date, end_date))):
+        return True
+    return tide_cache.get(_prediction_key(station_id, start_date, end_date, datum, time_zone, interval)) is not None
+
+
+def _archived_predictions(station_id, start_date, end_date, interval):
+    """
+    The predictions get_tide_data() would fetch for whole GMT days start_date..end_date,
+    sliced from the prediction archive, or None if it doesn't have them.
+    """
+    predictions = get_prediction_archive()
+    if predictions is None:
+        return None
+    start, end = _gmt_day_span(start_date, end_date)
+    if interval == "h":
+        found = predictions.hourly(station_id, start, end)
+    else:
+        found = predictions.hilo(station_id, start, end)
+    if found is None:
+        inc("tide_prediction_archive_total", outcome="miss")
+        return None
+    inc("tide_prediction_archive_total", outcome="hit")
+
+    times, heights = found[0], found[1]
+    df = pd.DataFrame({
+        'datetime': pd.to_datetime(times, unit='s'), # Naive GMT, like a time_zone="gmt" response
+        'tide_type': found[2].astype(str) if interval == "hilo" else '',
+        'height_ft': np.round(heights.astype(np.float64), 3), # NOAA's precision, not float32's
+    })
+    return df[df['height_ft'].notna()].reset_index(drop=True)
+
+
+def _fetch_tide_data(station_id, start_date, end_date, product, datum, time_zone, interval):
+    """Does the actual datagetter request for get_tide_data()."""
+    timeout = call_timeout("noaa_datagetter")
+    if timeout is None:
+        return None
+
+    try:
+        with upstream_call("noaa_datagetter") as span:
+            try:
+                df = request_tide_data(station_id, start_date, end_date, product, datum, time_zone, interval, timeout)
+            except Exception as e:
+                span.outcome = type(e).__name__
+                record_result("noaa_datagetter", e)
+                raise
+            record_result("noaa_datagetter")
+        if df is None and product != "predictions":
+            # NOAA answered but has no observations here (e.g. the station has no sensor)
+            return pd.DataFrame(columns=['datetime', 'height_ft', 'tide_type'])
+        return df
+
+    except requests.exceptions.Timeout:
+        print(f"Timeout Error: Request to NOAA tide data API timed out after {timeout:.1f} seconds.")
+        return None
+    except requests.exceptions.HTTPError as e:
+        print(f"HTTP Error: {e} - Response content: {e.response.text[:500]}")
+        return None
+    except requests.exceptions.ConnectionError as e:
+        print(f"Connection Error: {e}")
+        return None
+    except requests.exceptions.RequestException as e:
+        print(f"An error occurred: {e}")
+        return None
+    except ValueError as e:
+        print(f"Error parsing JSON: {e}")
+        return None
+
+
+def request_tide_data(station_id, start_date, end_date, product, datum, time_zone, interval, timeout):
+    """
+    One datagetter request, straight to NOAA: no cache, archive, circuit breaker, rate
+    limit or request budget. get_tide_data() is the way in for the web app; this is for
+    offline tools that pace themselves and need to know why a request failed.
+
+    Returns:
+        pandas.DataFrame: The data, or None if NOAA answered that it has none.
+
+    Raises:
+        requests.exceptions.RequestException: If NOAA couldn't be asked, or answered with an HTTP error.
+        ValueError: If the response isn't JSON.
+    """
     params = {
         "product": product,
         "application": "PythonSharptownTideTracker",
@@ -35,54 +163,195 @@ def get_tide_data(station_id, start_date, end_date, product="predictions", datum
         "interval": interval,
         "format": "json"
     }
-
+    response = requests.get(NOAA_DATAGETTER_URL, params=params, timeout=timeout)
+    response.raise_for_status()
     try:
-        response = requests.get(base_url, params=params, timeout=10) # Added timeout
-        response.raise_for_status()
         data = response.json()
+    except ValueError:
+        print(f"Response content: {response.text[:500]}")
+        raise
 
-        if "predictions" in data:
-            df = pd.DataFrame(data["predictions"])
-            # FORCE TO BE NAIVE ON CREATION
-            df['t'] = pd.to_datetime(df['t'], utc=False).dt.tz_localize(None)
-            df.rename(columns={'t': 'datetime', 'v': 'height_ft'}, inplace=True)
-
-            df['height_ft'] = pd.to_numeric(df['height_ft'], errors='coerce')
-            df.dropna(subset=['height_ft'], inplace=True)
-
-            if 'type' in df.columns:
-                df.rename(columns={'type': 'tide_type'}, inplace=True)
-                return df[['datetime', 'tide_type', 'height_ft']]
-            else:
-                df['tide_type'] = ''
-                return df[['datetime', 'tide_type', 'height_ft']]
-        elif "data" in data: # This branch is less common for tide predictions but kept for robustness
-            df = pd.DataFrame(data["data"])
-            # FORCE TO BE NAIVE ON CREATION
-            df['t'] = pd.to_datetime(df['t'], utc=False).dt.tz_localize(None)
-            df.rename(columns={'t': 'datetime', 'v': 'height_ft'}, inplace=True)
-            df['height_ft'] = pd.to_numeric(df['height_ft'], errors='coerce')
-            df.dropna(subset=['height_ft'], inplace=True)
+    if "predictions" in data:
+        df = pd.DataFrame(data["predictions"])
+        # FORCE TO BE NAIVE ON CREATION
+        df['t'] = pd.to_datetime(df['t'], utc=False).dt.tz_localize(None)
+        df.rename(columns={'t': 'datetime', 'v': 'height_ft'}, inplace=True)
+
+        df['height_ft'] = pd.to_numeric(df['height_ft'], errors='coerce')
+        df.dropna(subset=['height_ft'], inplace=True)
+
+        if 'type' in df.columns:
+            df.rename(columns={'type': 'tide_type'}, inplace=True)
+            return df[['datetime', 'tide_type', 'height_ft']]
+        else:
             df['tide_type'] = ''
-            return df[['datetime', 'height_ft', 'tide_type']]
+            return df[['datetime', 'tide_type', 'height_ft']]
+    elif "data" in data: # This branch is less common for tide predictions but kept for robustness
+        df = pd.DataFrame(data["data"])
+        # FORCE TO BE NAIVE ON CREATION
+        df['t'] = pd.to_datetime(df['t'], utc=False).dt.tz_localize(None)
+        df.rename(columns={'t': 'datetime', 'v': 'height_ft'}, inplace=True)
+        df['height_ft'] = pd.to_numeric(df['height_ft'], errors='coerce')
+        df.dropna(subset=['height_ft'], inplace=True)
+        if 'ty' in df.columns: # Observed highs/lows ("high_low"): "H ", "HH", "L ", "LL"
+            df['tide_type'] = df['ty'].str.strip().str[0]
         else:
-            print(f"No tidal data found for station {station_id} with the given parameters.")
-            print(f"API Response: {data}")
-            return None
-
-    except requests.exceptions.Timeout:
-        print(f"Timeout Error: Request to NOAA tide data API timed out after 10 seconds.")
-        return None
-    except requests.exceptions.HTTPError as e:
-        print(f"HTTP Error: {e} - Response content: {e.response.text[:500]}")
-        return None
-    except requests.exceptions.ConnectionError as e:
-        print(f"Connection Error: {e}")
-        return None
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred: {e}")
+            df['tide_type'] = ''
+        return df[['datetime', 'height_ft', 'tide_type']]
+    else:
+        print(f"No tidal data found for station {station_id} with the given parameters.")
+        print(f"API Response: {data}")
         return None
-    except ValueError as e:
-        print(f"Error parsing JSON: {e}")
-        print(f"Response content: {response.text[:500]}")
+
+
+def local_day_window(tz, days):
+    """Returns (start, end) aware datetimes in `tz`: midnight today and midnight `days` days later."""
+    today = datetime.now(tz).date()
+    start = tz.localize(datetime.combine(today, datetime.min.time()))
+    end = tz.localize(datetime.combine(today + timedelta(days=days), datetime.min.time()))
+    return start, end
+
+
+def gmt_date_range(start, end):
+    """
+    The begin_date/end_date (YYYYMMDD, GMT) to request for predictions covering the
+    aware datetimes [start, end). Asking in GMT keeps cache keys the same whichever
+    time zone the caller displays in.
+    """
+    last = end.astimezone(timezone.utc) - timedelta(minutes=1)
+    return start.astimezone(timezone.utc).strftime("%Y%m%d"), last.strftime("%Y%m%d")
+
+
+def to_station_time(df, tz, start=None, end=None):
+    """
+    Converts the naive GMT 'datetime' column of a time_zone="gmt" result to `tz` in one
+    vectorized step (no DST inference needed, since GMT has no repeated hours), keeping
+    only rows in [start, end) if given. Returns a new DataFrame, or None.
+    """
+    if df is None:
         return None
+    times = df['datetime'].dt.tz_localize('UTC')
+    keep = pd.Series(True, index=df.index)
+    if start is not None:
+        keep &= times >= start
+    if end is not None:
+        keep &= times < end
+    df = df.loc[keep].copy()
+    df['datetime'] = times[keep].dt.tz_convert(tz)
+    return df
+
+
+# --- Interpolation ---
+
+def to_epoch_seconds(times):
+    """
+    Epoch seconds (float64 array) for datetimes given as a Series, DatetimeIndex, list,
+    datetime64 array or numbers (already epoch seconds). Naive datetimes are taken to be UTC.
+    """
+    if isinstance(times, pd.Series):
+        times = pd.DatetimeIndex(times)
+    if not isinstance(times, pd.DatetimeIndex):
+        array = np.asarray(times)
+        if array.dtype.kind in "iuf":
+            return array.astype(np.float64)
+        times = pd.DatetimeIndex(pd.to_datetime(array.ravel(), utc=True))
+    if times.tz is not None:
+        times = times.tz_convert('UTC').tz_localize(None)
+    return times.values.astype('datetime64[ns]').astype(np.int64) / 1e9
+
+
+def interpolate_tide_heights(times, hilo_df=None, hourly_df=None, method="auto"):
+    """
+    Estimates tide heights at arbitrary times from predictions already fetched, so finer
+    resolution doesn't cost another datagetter call.
+
+    Methods:
+        "spline": natural cubic spline through the hourly predictions.
+        "cosine": half-cosine between consecutive high/low predictions (the classic
+                  rule-of-twelfths shape).
+        "auto":   spline where hourly data covers the time, cosine elsewhere.
+
+    Args:
+        times: Timestamps to evaluate at (anything to_epoch_seconds() accepts).
+        hilo_df (pd.DataFrame): High/low predictions with 'datetime' and 'height_ft'.
+        hourly_df (pd.DataFrame): Hourly predictions with 'datetime' and 'height_ft'.
+        method (str): "auto", "spline" or "cosine".
+
+    Returns:
+        np.ndarray: Heights in feet, NaN where the data doesn't cover the time.
+    """
+    t = to_epoch_seconds(times)
+    heights = np.full(t.shape, np.nan)
+
+    if method in ("auto", "spline") and hourly_df is not None and len(hourly_df) >= 2:
+        knots_t, knots_h = _sorted_samples(hourly_df)
+        heights = _natural_cubic_spline(knots_t, knots_h, t)
+    if method == "spline":
+        return heights
+
+    if method in ("auto", "cosine") and hilo_df is not None and len(hilo_df) >= 2:
+        missing = np.isnan(heights)
+        if missing.any():
+            extrema_t, extrema_h = _sorted_samples(hilo_df)
+            heights[missing] = _cosine_between_extrema(extrema_t, extrema_h, t[missing])
+    elif method not in ("auto", "cosine"):
+        raise ValueError(f"Unknown interpolation method '{method}'")
+    return heights
+
+
+def _sorted_samples(df):
+    t = to_epoch_seconds(df['datetime'])
+    h = df['height_ft'].to_numpy(dtype=np.float64)
+    order = np.argsort(t, kind='stable')
+    t, h = t[order], h[order]
+    keep = np.concatenate(([True], np.diff(t) > 0)) # Drop duplicate timestamps
+    return t[keep], h[keep]
+
+
+def _cosine_between_extrema(extrema_t, extrema_h, t):
+    i = np.searchsorted(extrema_t, t, side='right') - 1
+    inside = (i >= 0) & (i < len(extrema_t) - 1)
+    i = np.clip(i, 0, len(extrema_t) - 2)
+    t0, t1 = extrema_t[i], extrema_t[i + 1]
+    h0, h1 = extrema_h[i], extrema_h[i + 1]
+    phase = (t - t0) / (t1 - t0)
+    heights = h0 + (h1 - h0) * (1 - np.cos(np.pi * phase)) / 2
+    heights[t == extrema_t[-1]] = extrema_h[-1]
+    return np.where(inside | (t == extrema_t[-1]), heights, np.nan)
+
+
+def _natural_cubic_spline(knots_t, knots_h, t):
+    # Work in hours from the first knot so the system is well conditioned
+    x = (knots_t - knots_t[0]) / 3600.0
+    xt = (t - knots_t[0]) / 3600.0
+    n = len(x)
+    step = np.diff(x)
+
+    # Second derivatives M with M[0] = M[-1] = 0, from the tridiagonal system
+    # step[i-1] M[i-1] + 2 (step[i-1] + step[i]) M[i] + step[i] M[i+1] = rhs[i]
+    second = np.zeros(n)
+    if n > 2:
+        slopes = np.diff(knots_h) / step
+        rhs = 6 * np.diff(slopes)
+        diag = 2 * (step[:-1] + step[1:])
+        lower, upper = step[1:-1], step[1:-1]
+        # Thomas algorithm
+        c = np.zeros(n - 2)
+        d = np.zeros(n - 2)
+        c[0] = upper[0] / diag[0] if n > 3 else 0.0
+        d[0] = rhs[0] / diag[0]
+        for i in range(1, n - 2):
+            denom = diag[i] - lower[i - 1] * c[i - 1]
+            c[i] = upper[i] / denom if i < n - 3 else 0.0
+            d[i] = (rhs[i] - lower[i - 1] * d[i - 1]) / denom
+        for i in range(n - 4, -1, -1):
+            d[i] -= c[i] * d[i + 1]
+        second[1:-1] = d
+
+    i = np.clip(np.searchsorted(x, xt, side='right') - 1, 0, n - 2)
+    h = step[i]
+    a = (x[i + 1] - xt) / h
+    b = (xt - x[i]) / h
+    heights = (a * knots_h[i] + b * knots_h[i + 1]
+               + ((a ** 3 - a) * second[i] + (b ** 3 - b) * second[i + 1]) * h ** 2 / 6)
+    return np.where((xt >= x[0]) & (xt <= x[-1]), heights, np.nan)
@@ -1,11 +1,15 @@
 # my_tide_app/services/pirate_weather.py
 
+import time
 import requests
 import pandas as pd
 from datetime import datetime, timedelta, timezone
 
 # Import API key from config
-from config import PIRATE_WEATHER_API_KEY
+from config import PIRATE_WEATHER_API_KEY, PIRATE_WEATHER_BASE_URL, HISTORICAL_WEATHER_CACHE_TTL
+from instrumentation import upstream_call
+from resilience import call_timeout, record_result
+from cache import weather_cache
 
 def get_pirate_weather_report(latitude, longitude, time_unix=None, units="us"):
     """
@@ -22,25 +26,85 @@ def get_pirate_weather_report(latitude, longitude, time_unix=None, units="us"):
 
     Returns:
         dict: A dictionary containing the weather data, or None if an error occurs.
+              Responses are cached and shared between callers, so don't modify them.
+              If Pirate Weather can't be asked (errors, daily quota), a recently expired
+              forecast is returned instead.
     """
     if PIRATE_WEATHER_API_KEY == "YOUR_PIRATE_WEATHER_API_KEY":
         print("WARNING: Pirate Weather API Key not set. Cannot fetch weather data.")
         return None
 
+    key = _report_key(latitude, longitude, time_unix, units)
+    # Past weather never changes
+    ttl = HISTORICAL_WEATHER_CACHE_TTL if time_unix is not None and time_unix < time.time() else None
+    # With a stale copy to fall back on, the call is the first to go when the quota runs low
+    return weather_cache.get_or_load(
+        key,
+        lambda: _fetch_pirate_weather_report(latitude, longitude, time_unix, units,
+                                             essential=weather_cache.get_stale(key) is None),
+        ttl_seconds=ttl
+    )
+
+
+def _report_key(latitude, longitude, time_unix, units):
+    # ~100 m of rounding lets nearby lookups share an entry
+    return (round(float(latitude), 3), round(float(longitude), 3), time_unix, units)
+
+
+def forecast_cached(latitude, longitude, units="us"):
+    """True if get_pirate_weather_report() has a current forecast here without asking Pirate Weather."""
+    return weather_cache.get(_report_key(latitude, longitude, None, units)) is not None
+
+
+def get_time_machine_day(latitude, longitude, time_unix, units="us", essential=False):
+    """
+    Pulls a past day's weather from Pirate Weather's time machine: the conditions at
+    `time_unix` plus the hourly data for the whole (local) day around it, so one call
+    covers every instant of interest on that day.
+
+    Unlike get_pirate_weather_report() this isn't cached; it's meant for bulk jobs that
+    keep their own results and shouldn't push the site's forecasts out of the cache.
+    Calls are non-essential by default, so they stop short of the quota's reserve.
+
+    Returns:
+        dict: The report ('currently' and, if the API has it, 'hourly'), or None if an error
+              occurs or the call was refused (see resilience.get_quota() for why).
+    """
+    if PIRATE_WEATHER_API_KEY == "YOUR_PIRATE_WEATHER_API_KEY":
+        print("WARNING: Pirate Weather API Key not set. Cannot fetch weather data.")
+        return None
+    return _fetch_pirate_weather_report(latitude, longitude, int(time_unix), units, essential=essential,
+                                        exclude="minutely,daily,alerts,flags")
+
+
+def _fetch_pirate_weather_report(latitude, longitude, time_unix, units, essential=True, exclude=None):
+    """Does the actual Pirate Weather request for get_pirate_weather_report()."""
+
     if time_unix is None:
-        url = f"https://api.pirateweather.net/forecast/{PIRATE_WEATHER_API_KEY}/{latitude},{longitude}"
-        params = {"units": units, "exclude": "minutely,alerts,flags"}
+        url = f"{PIRATE_WEATHER_BASE_URL}/forecast/{PIRATE_WEATHER_API_KEY}/{latitude},{longitude}"
+        params = {"units": units, "exclude": exclude or "minutely,alerts,flags"}
     else:
-        url = f"https://api.pirateweather.net/forecast/{PIRATE_WEATHER_API_KEY}/{latitude},{longitude},{time_unix}"
-        params = {"units": units, "exclude": "minutely,hourly,daily,alerts,flags"}
+        url = f"{PIRATE_WEATHER_BASE_URL}/forecast/{PIRATE_WEATHER_API_KEY}/{latitude},{longitude},{time_unix}"
+        params = {"units": units, "exclude": exclude or "minutely,hourly,daily,alerts,flags"}
+
+    timeout = call_timeout("pirate_weather", essential=essential)
+    if timeout is None:
+        return None
 
     try:
-        response = requests.get(url, params=params, timeout=10) # Added timeout
-        response.raise_for_status()
-        data = response.json()
+        with upstream_call("pirate_weather") as span:
+            try:
+                response = requests.get(url, params=params, timeout=timeout)
+                response.raise_for_status()
+                data = response.json()
+            except Exception as e:
+                span.outcome = type(e).__name__
+                record_result("pirate_weather", e)
+                raise
+            record_result("pirate_weather")
         return data
     except requests.exceptions.Timeout:
-        print(f"Pirate Weather Timeout Error: Request timed out after 10 seconds.")
+        print(f"Pirate Weather Timeout Error: Request timed out after {timeout:.1f} seconds.")
         return None
     except requests.exceptions.HTTPError as e:
         print(f"Pirate Weather HTTP Error: {e} - Response content: {e.response.text[:500]}")
@@ -55,3 +119,28 @@ def get_pirate_weather_report(latitude, longitude, time_unix=None, units="us"):
         print(f"Error parsing Pirate Weather JSON: {e}")
         print(f"Pirate Weather Response content: {response.text[:500]}")
         return None
+
+
+def hourly_weather_dataframe(report, tz):
+    """
+    Turns the 'hourly' block of a forecast report into a DataFrame with friendlier
+    column names, times converted to `tz` and percentages on a 0-100 scale.
+
+    Returns:
+        pandas.DataFrame: One row per forecast hour, or None if the report has no hourly data.
+    """
+    if not report or 'hourly' not in report or 'data' not in report['hourly']:
+        return None
+    weather_df = pd.DataFrame(report['hourly']['data'])
+    weather_df['time'] = pd.to_datetime(weather_df['time'], unit='s', utc=True)
+    weather_df['time'] = weather_df['time'].dt.tz_convert(tz)
+    # Rename for consistency
+    weather_df.rename(columns={'time': 'datetime', 'summary': 'weather_summary',
+                               'temperature': 'temp_f', 'apparentTemperature': 'feels_like_f',
+                               'precipProbability': 'precip_prob', 'windSpeed': 'wind_speed_mph',
+                               'humidity': 'humidity_percent', 'pressure': 'pressure_mb',
+                               'dewPoint': 'dew_point_f', 'visibility': 'visibility_miles'}, inplace=True)
+    # Convert percentage fields
+    weather_df['precip_prob'] = weather_df['precip_prob'] * 100
+    weather_df['humidity_percent'] = weather_df['humidity_percent'] * 100
+    return weather_df
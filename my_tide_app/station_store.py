@@ -0,0 +1,219 @@
+# my_tide_app/station_store.py
+
+import mmap
+import os
+import struct
+import time
+from array import array
+
+import numpy as np
+
+# File layout (little-endian), every section starting on an 8-byte boundary:
+#   header        MAGIC, version, count, id_width, fetched_at, names_bytes
+#   lat           float64[count]
+#   lon           float64[count]
+#   name_offsets  int64[count + 1]    name i is names[name_offsets[i]:name_offsets[i + 1]]
+#   ids           S<id_width>[count]  ASCII, NUL-padded
+#   names         uint8[names_bytes]  UTF-8
+MAGIC = b"TIDESTN\0"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8sIIIdQ")
+
+EARTH_RADIUS_KM = 6371.009 # Same mean radius geopy's great_circle uses
+KM_PER_MILE = 1.609344
+
+
+def _aligned(n):
+    return (n + 7) & ~7
+
+
+def _widen(ids, width, new_width):
+    """Re-pads a buffer of `width`-byte IDs to `new_width` bytes each."""
+    old = np.frombuffer(ids, dtype=np.uint8).reshape(-1, width)
+    padded = np.zeros((len(old), new_width), dtype=np.uint8)
+    padded[:, :width] = old
+    return bytearray(padded.tobytes())
+
+
+class StationStore:
+    """
+    The NOAA station catalog as a handful of flat NumPy arrays instead of a DataFrame
+    of Python objects.
+
+    A store is either built in memory from records (after fetching the catalog) or
+    mapped read-only from a file written by save(), in which case the arrays are views
+    onto the page cache and every worker on the host shares the same physical pages.
+    """
+
+    def __init__(self, ids, lat, lon, name_offsets, names, fetched_at=None, _mmap=None):
+        self.ids = ids
+        self.lat = lat
+        self.lon = lon
+        self.name_offsets = name_offsets
+        self.names = names
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+        self._mmap = _mmap # Keeps the mapping alive for as long as the views are
+
+    @classmethod
+    def from_records(cls, records, fetched_at=None):
+        """
+        Builds a store from an iterable of (id, name, lat, lon).
+
+        Records are appended straight into compact buffers as they arrive, so a streamed
+        iterable is never held as Python objects: building takes little more memory
+        than the finished store.
+        """
+        ids, id_width = bytearray(), 1 # IDs fixed-width, NUL-padded, widened if a longer one turns up
+        names, name_ends = bytearray(), array("q")
+        lats, lons = array("d"), array("d")
+        for station_id, name, lat, lon in records:
+            station_id = str(station_id).encode("ascii")
+            if len(station_id) > id_width:
+                ids, id_width = _widen(ids, id_width, len(station_id)), len(station_id)
+            ids += station_id.ljust(id_width, b"\0")
+            names += str(name).encode("utf-8")
+            name_ends.append(len(names))
+            lats.append(lat)
+            lons.append(lon)
+
+        name_offsets = np.zeros(len(name_ends) + 1, dtype=np.int64)
+        if name_ends:
+            name_offsets[1:] = np.frombuffer(name_ends, dtype=np.int64)
+        return cls(
+            ids=np.frombuffer(ids, dtype=f"S{id_width}"),
+            lat=np.frombuffer(lats, dtype=np.float64),
+            lon=np.frombuffer(lons, dtype=np.float64),
+            name_offsets=name_offsets,
+            names=np.frombuffer(names, dtype=np.uint8),
+            fetched_at=fetched_at,
+        )
+
+    def __len__(self):
+        return len(self.lat)
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    @property
+    def age_seconds(self):
+        return time.time() - self.fetched_at
+
+    # --- Lookups ---
+
+    def station_id(self, i):
+        return self.ids[i].decode("ascii")
+
+    def name(self, i):
+        return self.names[self.name_offsets[i]:self.name_offsets[i + 1]].tobytes().decode("utf-8")
+
+    def station(self, i):
+        """Returns (station_id, station_name, lat, lon) for row i."""
+        return self.station_id(i), self.name(i), float(self.lat[i]), float(self.lon[i])
+
+    def index_of(self, station_id):
+        """Row of `station_id`, or None if it isn't in the catalog."""
+        matches = np.flatnonzero(self.ids == str(station_id).encode("ascii"))
+        return int(matches[0]) if len(matches) else None
+
+    def lookup(self, station_id):
+        """Returns (station_id, station_name, lat, lon), or None if it isn't in the catalog."""
+        i = self.index_of(station_id)
+        return None if i is None else self.station(i)
+
+    def distances_miles(self, target_lat, target_lon):
+        """Great-circle distance in miles from the target to every station."""
+        lat1, lon1 = np.radians(target_lat), np.radians(target_lon)
+        lat2, lon2 = np.radians(self.lat), np.radians(self.lon)
+        sin_lat1, cos_lat1 = np.sin(lat1), np.cos(lat1)
+        sin_lat2, cos_lat2 = np.sin(lat2), np.cos(lat2)
+        delta_lon = lon2 - lon1
+        cos_delta, sin_delta = np.cos(delta_lon), np.sin(delta_lon)
+        central_angle = np.arctan2(
+            np.hypot(cos_lat2 * sin_delta, cos_lat1 * sin_lat2 - sin_lat1 * cos_lat2 * cos_delta),
+            sin_lat1 * sin_lat2 + cos_lat1 * cos_lat2 * cos_delta,
+        )
+        return central_angle * (EARTH_RADIUS_KM / KM_PER_MILE)
+
+    def nearest(self, target_lat, target_lon):
+        """Returns (row, distance_miles) of the closest station, or (None, None) if the store is empty."""
+        if self.empty:
+            return None, None
+        distances = self.distances_miles(target_lat, target_lon)
+        i = int(np.argmin(distances))
+        return i, float(distances[i])
+
+    def nearest_k(self, target_lat, target_lon, k):
+        """Returns [(row, distance_miles), ...] for the `k` closest stations, closest first."""
+        k = min(k, len(self))
+        if k <= 0:
+            return []
+        distances = self.distances_miles(target_lat, target_lon)
+        rows = np.argpartition(distances, k - 1)[:k]
+        rows = rows[np.argsort(distances[rows], kind="stable")]
+        return [(int(i), float(distances[i])) for i in rows]
+
+    def to_dataframe(self):
+        """The catalog as the id/name/lat/lon DataFrame the services used to return."""
+        import pandas as pd
+        return pd.DataFrame({
+            'id': [self.station_id(i) for i in range(len(self))],
+            'name': [self.name(i) for i in range(len(self))],
+            'lat': self.lat,
+            'lon': self.lon,
+        })
+
+    # --- Serialization ---
+
+    def save(self, path):
+        """
+        Writes the store to `path`. The file is written alongside and renamed into place,
+        so workers mapping the old file keep a consistent view.
+        """
+        id_width = self.ids.dtype.itemsize
+        sections = [
+            self.lat.astype("<f8", copy=False).tobytes(),
+            self.lon.astype("<f8", copy=False).tobytes(),
+            self.name_offsets.astype("<i8", copy=False).tobytes(),
+            self.ids.tobytes(),
+            self.names.tobytes(),
+        ]
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(self), id_width, self.fetched_at, len(self.names)))
+            for section in sections:
+                f.write(b"\0" * (_aligned(f.tell()) - f.tell()))
+                f.write(section)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Maps a file written by save() read-only. Raises ValueError if it isn't a
+        station store of this version, or is truncated.
+        """
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(mapped) < _HEADER.size:
+                raise ValueError(f"{path} is too short to be a station store")
+            magic, version, count, id_width, fetched_at, names_bytes = _HEADER.unpack_from(mapped, 0)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise ValueError(f"{path} is not a version {FORMAT_VERSION} station store")
+
+            offset = _HEADER.size
+            arrays = []
+            for dtype, length in (("<f8", count), ("<f8", count), ("<i8", count + 1),
+                                  (f"S{id_width}", count), (np.uint8, names_bytes)):
+                offset = _aligned(offset)
+                array = np.frombuffer(mapped, dtype=dtype, count=length, offset=offset)
+                offset += array.nbytes
+                arrays.append(array)
+        except (ValueError, struct.error) as e:
+            raise ValueError(f"Unreadable station store {path}: {e}") from e
+
+        lat, lon, name_offsets, ids, names = arrays
+        return cls(ids=ids, lat=lat, lon=lon, name_offsets=name_offsets, names=names,
+                   fetched_at=fetched_at, _mmap=mapped)
@@ -0,0 +1,220 @@
+# my_tide_app/tide_plot.py
+
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from markupsafe import escape
+
+from config import PIRATE_WEATHER_API_KEY
+from forecast_table import fetch_window
+from services.noaa import get_tide_data, gmt_date_range, to_station_time, to_epoch_seconds, interpolate_tide_heights
+from services.pirate_weather import get_pirate_weather_report, hourly_weather_dataframe
+
+# Plot area margins (px): room for the title, the day labels and both y axes
+MARGIN_LEFT, MARGIN_RIGHT, MARGIN_TOP, MARGIN_BOTTOM = 44, 44, 28, 30
+CURVE_STEP_SECONDS = 360 # The curve is interpolated at NOAA's finest prediction interval
+HILO_LABEL_MAX_DAYS = 7 # Past this, H/L markers are drawn without their heights
+
+
+# --- Downsampling ---
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling: picks `threshold` of the points so the
+    line still looks like the original (peaks and troughs survive, unlike plain striding).
+
+    Args:
+        x, y (np.ndarray): The series, x increasing.
+        threshold (int): Points to keep (the first and last are always kept).
+
+    Returns:
+        np.ndarray: Indices of the points to keep, increasing.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # Points 1 .. n-2 split into threshold-2 buckets; bucket i is [edges[i], edges[i+1])
+    edges = (np.arange(threshold - 1) * ((n - 2) / (threshold - 2))).astype(np.int64) + 1
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        # Twice the area of the triangle (last kept point, candidate, next bucket's average)
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+# --- Data ---
+
+def plot_series(station, start, end, weather=True):
+    """
+    The arrays behind a station's plot from `start` to `end` (aware datetimes in the
+    station's zone): a 6-minute tide curve, high/low tides and (if asked for and
+    available) the hourly precipitation and wind forecast.
+
+    The curve is interpolated from the same hourly and high/low predictions (and so
+    the same cache entries and archive rows) as the station's page and forecast table,
+    and the weather is the page's forecast, so plotting a page just viewed asks no
+    upstream for anything.
+
+    Returns:
+        dict: 'days' (the span, possibly fractional), 'start'/'end', 'times'/'heights' (epoch seconds, ft),
+              'hilo' (list of (epoch seconds, ft, 'H' or 'L')), 'weather_times',
+              'precip_pct', 'wind_mph' (empty arrays without weather), or None if NOAA
+              didn't answer.
+    """
+    start_date_str, end_date_str = gmt_date_range(*fetch_window(station['tz'], end))
+    hourly_df, hilo_df = (
+        get_tide_data(station['id'], start_date_str, end_date_str, product="predictions",
+                      datum="MLLW", time_zone="gmt", interval=interval)
+        for interval in ("h", "hilo")
+    )
+    times = np.arange(int(start.timestamp()), int(end.timestamp()) + 1, CURVE_STEP_SECONDS, dtype=np.int64)
+    heights = interpolate_tide_heights(times, hilo_df=hilo_df, hourly_df=hourly_df)
+    valid = ~np.isnan(heights)
+    if not valid.any():
+        return None
+    hilo_df = to_station_time(hilo_df, station['tz'], start, end)
+    series = {
+        'days': (end - start).total_seconds() / 86400, 'start': start, 'end': end,
+        'times': times[valid], 'heights': heights[valid],
+        'hilo': [] if hilo_df is None else list(zip(to_epoch_seconds(hilo_df['datetime']),
+                                                    hilo_df['height_ft'].to_numpy(dtype=np.float64),
+                                                    hilo_df['tide_type'])),
+        'weather_times': np.array([]), 'precip_pct': np.array([]), 'wind_mph': np.array([]),
+    }
+    if weather and PIRATE_WEATHER_API_KEY != "YOUR_PIRATE_WEATHER_API_KEY" and station.get('lat') is not None:
+        weather_df = hourly_weather_dataframe(
+            get_pirate_weather_report(station['lat'], station['lon'], time_unix=None), timezone.utc)
+        if weather_df is not None and not weather_df.empty:
+            series['weather_times'] = to_epoch_seconds(weather_df['datetime'])
+            series['precip_pct'] = weather_df['precip_prob'].to_numpy(dtype=np.float64)
+            series['wind_mph'] = weather_df['wind_speed_mph'].to_numpy(dtype=np.float64)
+    return series
+
+
+# --- Rendering ---
+
+def _nice_step(span, target_ticks=5):
+    raw = span / target_ticks
+    magnitude = 10 ** np.floor(np.log10(raw))
+    for multiple in (1, 2, 2.5, 5, 10):
+        if raw <= multiple * magnitude:
+            return multiple * magnitude
+    return 10 * magnitude
+
+
+def _polyline(xs, ys):
+    return " ".join(f"{x:.1f},{y:.1f}" for x, y in zip(xs, ys))
+
+
+def render_svg(station, series, width=800, height=300, now=None):
+    """
+    Draws the tide curve (LTTB-downsampled to about one point per 1.5 px), H/L markers,
+    day gridlines, a "now" line and, where forecast, precipitation bars and a wind line.
+
+    Returns:
+        str: A standalone SVG document.
+    """
+    tz = station['tz']
+    left, right = MARGIN_LEFT, width - MARGIN_RIGHT
+    top, bottom = MARGIN_TOP, height - MARGIN_BOTTOM
+    t0, t1 = series['start'].timestamp(), series['end'].timestamp()
+    times, heights = series['times'], series['heights']
+
+    keep = lttb(times, heights, max(3, int((right - left) / 1.5)))
+    times, heights = times[keep], heights[keep]
+
+    low = min(heights.min(), min((h for _, h, _ in series['hilo']), default=heights.min()))
+    high = max(heights.max(), max((h for _, h, _ in series['hilo']), default=heights.max()))
+    step = _nice_step(max(high - low, 0.5))
+    y_min, y_max = np.floor(low / step) * step, np.ceil(high / step) * step
+
+    def x_of(t):
+        return left + (np.asarray(t, dtype=np.float64) - t0) / (t1 - t0) * (right - left)
+
+    def y_of(h):
+        return bottom - (np.asarray(h, dtype=np.float64) - y_min) / (y_max - y_min) * (bottom - top)
+
+    days = series['days']
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}" font-family="sans-serif" font-size="10">',
+        f'<title>Tide predictions for {escape(station["name"])}</title>',
+        f'<text x="{left}" y="16" font-size="12" font-weight="bold">{escape(station["name"])} '
+        f'({escape(station["id"])}), ft above MLLW, {escape(tz.zone)}</text>',
+    ]
+
+    # Day gridlines at local midnight, each day labelled at its start (every few days on
+    # long plots). A plot starting mid-day labels that first part only if there's room.
+    label_every = max(1, int(np.ceil(days * 70 / (right - left))))
+    first = series['start'].date()
+    for i in range(int(np.ceil(days)) + 1):
+        day = tz.localize(datetime.combine(first + timedelta(days=i), datetime.min.time()))
+        if day.timestamp() > t1:
+            break
+        x = float(x_of(max(day.timestamp(), t0)))
+        if day.timestamp() >= t0:
+            parts.append(f'<line x1="{x:.1f}" y1="{top}" x2="{x:.1f}" y2="{bottom}" stroke="#ddd"/>')
+        next_day = tz.localize(datetime.combine(first + timedelta(days=i + 1), datetime.min.time()))
+        room = float(x_of(min(next_day.timestamp(), t1))) - x
+        if day.timestamp() < t1 and i % label_every == 0 and (day.timestamp() >= t0 or room >= 50):
+            parts.append(f'<text x="{x + 3:.1f}" y="{bottom + 14}">{day.strftime("%a %m/%d")}</text>')
+
+    # Height axis
+    for value in np.arange(y_min, y_max + step / 2, step):
+        y = float(y_of(value))
+        parts.append(f'<line x1="{left}" y1="{y:.1f}" x2="{right}" y2="{y:.1f}" stroke="#f0f0f0"/>')
+        parts.append(f'<text x="{left - 4}" y="{y + 3:.1f}" text-anchor="end">{value:g}</text>')
+
+    # Weather overlay: precipitation probability bars (full height = 100%) and wind on the right axis
+    weather_times = series['weather_times']
+    in_range = (weather_times >= t0) & (weather_times < t1)
+    if in_range.any():
+        bar_width = max(1.0, 3600 / (t1 - t0) * (right - left))
+        for t, pct in zip(weather_times[in_range], series['precip_pct'][in_range]):
+            if pct > 0:
+                bar_height = pct / 100 * (bottom - top)
+                parts.append(f'<rect x="{float(x_of(t)):.1f}" y="{bottom - bar_height:.1f}" width="{bar_width:.1f}" '
+                             f'height="{bar_height:.1f}" fill="#9ecae1" fill-opacity="0.35"/>')
+        wind = series['wind_mph'][in_range]
+        wind_max = max(10.0, float(np.nanmax(wind)) if len(wind) else 10.0)
+        wind_step = _nice_step(wind_max, 4)
+        wind_top = np.ceil(wind_max / wind_step) * wind_step
+        wind_y = bottom - wind / wind_top * (bottom - top)
+        parts.append(f'<polyline points="{_polyline(x_of(weather_times[in_range]), wind_y)}" fill="none" '
+                     f'stroke="#888" stroke-dasharray="3,2"/>')
+        for value in np.arange(0, wind_top + wind_step / 2, wind_step):
+            y = bottom - value / wind_top * (bottom - top)
+            parts.append(f'<text x="{right + 4}" y="{y + 3:.1f}" fill="#888">{value:g}</text>')
+        parts.append(f'<text x="{right + 4}" y="{top - 6}" fill="#888">mph</text>')
+
+    parts.append(f'<polyline points="{_polyline(x_of(times), y_of(heights))}" fill="none" '
+                 f'stroke="#1f77b4" stroke-width="1.5"/>')
+
+    # High/low markers
+    show_labels = days <= HILO_LABEL_MAX_DAYS
+    for t, h, tide_type in series['hilo']:
+        if not t0 <= t < t1 or np.isnan(h):
+            continue
+        x, y = float(x_of(t)), float(y_of(h))
+        color = "#d62728" if tide_type == 'H' else "#2ca02c"
+        parts.append(f'<circle cx="{x:.1f}" cy="{y:.1f}" r="2.5" fill="{color}"/>')
+        if show_labels:
+            dy = -5 if tide_type == 'H' else 12
+            parts.append(f'<text x="{x:.1f}" y="{y + dy:.1f}" text-anchor="middle" fill="{color}">{h:.1f}</text>')
+
+    now = (now or datetime.now(timezone.utc)).timestamp()
+    if t0 <= now < t1:
+        x = float(x_of(now))
+        parts.append(f'<line x1="{x:.1f}" y1="{top}" x2="{x:.1f}" y2="{bottom}" stroke="#ff7f0e" stroke-width="1"/>')
+
+    parts.append(f'<rect x="{left}" y="{top}" width="{right - left}" height="{bottom - top}" fill="none" stroke="#999"/>')
+    parts.append('</svg>')
+    return "\n".join(parts)
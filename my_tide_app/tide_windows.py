@@ -0,0 +1,233 @@
+# my_tide_app/tide_windows.py
+
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from config import PIRATE_WEATHER_API_KEY, WINDOW_RESOLUTION_MINUTES, WINDOW_FETCH_WORKERS
+from services.noaa import get_tide_data, predictions_cached, interpolate_tide_heights, to_epoch_seconds
+from services.pirate_weather import get_pirate_weather_report, hourly_weather_dataframe, forecast_cached
+
+
+# --- Engine ---
+
+def find_windows(times, tide_ft, wind_mph=None, precip_pct=None, min_tide_ft=None, max_tide_ft=None,
+                 max_wind_mph=None, max_precip_pct=None, min_duration_minutes=0):
+    """
+    Finds the intervals where every threshold is met, for many stations in one pass.
+
+    Each threshold becomes a margin curve that is >= 0 where it is met (tide - min_tide_ft,
+    max_wind_mph - wind, ...). Windows open and close where the combined condition changes
+    between grid points; the exact time is interpolated from the margin that crossed zero in
+    that step (the latest one to open, the earliest one to close). Weather that is NaN (past
+    the end of the forecast) doesn't block a window, but windows that rely on it are flagged.
+
+    Args:
+        times (np.ndarray): Shared time grid, epoch seconds, shape (T,).
+        tide_ft (np.ndarray): Tide heights, shape (S, T) for S stations (or (T,) for one).
+        wind_mph (np.ndarray): Wind speeds on the same grid, or None.
+        precip_pct (np.ndarray): Precipitation probabilities (0-100) on the same grid, or None.
+        min_tide_ft, max_tide_ft, max_wind_mph, max_precip_pct (float): Thresholds; None to ignore.
+        min_duration_minutes (float): Drop windows shorter than this.
+
+    Returns:
+        list: One dict per window, in station then time order, with 'station' (row index),
+              'start' and 'end' (epoch seconds), 'duration_minutes', 'peak_tide_ft',
+              'low_tide_ft', 'max_wind_mph', 'max_precip_pct' and 'weather_checked'.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    tide_ft = np.atleast_2d(np.asarray(tide_ft, dtype=np.float64))
+    shape = tide_ft.shape
+    wind_mph = None if wind_mph is None else np.broadcast_to(np.atleast_2d(wind_mph), shape)
+    precip_pct = None if precip_pct is None else np.broadcast_to(np.atleast_2d(precip_pct), shape)
+
+    margins = []
+    unknown = np.zeros(shape, dtype=bool)
+    if min_tide_ft is not None:
+        margins.append(tide_ft - min_tide_ft)
+    if max_tide_ft is not None:
+        margins.append(max_tide_ft - tide_ft)
+    for values, limit in ((wind_mph, max_wind_mph), (precip_pct, max_precip_pct)):
+        if values is not None and limit is not None:
+            missing = np.isnan(values)
+            unknown |= missing
+            margins.append(np.where(missing, np.inf, limit - values))
+    if not margins:
+        margins.append(np.where(np.isnan(tide_ft), -np.inf, 0.0)) # No thresholds: wherever there is a tide
+    margins = np.stack(margins) # (K, S, T)
+    margins[np.isnan(margins)] = -np.inf # Missing tide never matches
+
+    ok = (margins >= 0).all(axis=0) # (S, T)
+    if shape[1] < 2:
+        return []
+
+    # Crossing time of each margin within each step [t_j, t_j+1]
+    before, after = margins[:, :, :-1], margins[:, :, 1:]
+    t0, dt = times[:-1], np.diff(times)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing = t0 + dt * (before / (before - after))
+    rising = (before < 0) & (after >= 0)
+    falling = (before >= 0) & (after < 0)
+    # Crossings into or out of infinite margins (missing data) happen at the grid point itself
+    crossing = np.where(np.isfinite(crossing), crossing, np.where(rising, t0 + dt, t0))
+
+    open_at = np.where(rising, crossing, -np.inf).max(axis=0)  # (S, T-1)
+    close_at = np.where(falling, crossing, np.inf).min(axis=0)
+
+    # Edges of runs of True in `ok`, padded so runs touching either end are closed
+    padded = np.zeros((shape[0], shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = ok
+    edges = np.diff(padded, axis=1)
+    start_rows, start_cols = np.nonzero(edges == 1)  # First True index of each run
+    end_rows, end_cols = np.nonzero(edges == -1)     # One past the last True index
+    last_cols = end_cols - 1
+
+    starts = np.where(start_cols > 0, open_at[start_rows, np.maximum(start_cols - 1, 0)], times[start_cols])
+    ends = np.where(last_cols < shape[1] - 1,
+                    close_at[end_rows, np.minimum(last_cols, shape[1] - 2)], times[last_cols])
+    # A window can't open before the previous sample or close after the next one
+    starts = np.where(np.isfinite(starts), starts, times[start_cols])
+    ends = np.where(np.isfinite(ends), ends, times[last_cols])
+
+    durations = (ends - starts) / 60.0
+    keep = durations >= min_duration_minutes
+    if not keep.any():
+        return []
+
+    # Per-window stats in one reduceat over the flattened (S, T) arrays; each window is
+    # the flat range [row * T + first, row * T + last + 1)
+    bounds = np.empty(2 * len(start_rows), dtype=np.int64)
+    bounds[0::2] = start_rows * shape[1] + start_cols
+    bounds[1::2] = end_rows * shape[1] + end_cols
+    peak_tide = _window_reduce(np.fmax, tide_ft, bounds)
+    low_tide = _window_reduce(np.fmin, tide_ft, bounds)
+    max_wind = _window_reduce(np.fmax, wind_mph, bounds)
+    max_precip = _window_reduce(np.fmax, precip_pct, bounds)
+    weather_checked = _window_reduce(np.logical_or, unknown, bounds) == 0
+
+    return [
+        {
+            'station': int(start_rows[i]),
+            'start': float(starts[i]),
+            'end': float(ends[i]),
+            'duration_minutes': float(durations[i]),
+            'peak_tide_ft': float(peak_tide[i]),
+            'low_tide_ft': float(low_tide[i]),
+            'max_wind_mph': _none_if_nan(max_wind, i),
+            'max_precip_pct': _none_if_nan(max_precip, i),
+            'weather_checked': bool(weather_checked[i]),
+        }
+        for i in np.flatnonzero(keep)
+    ]
+
+
+def _window_reduce(ufunc, values, bounds):
+    """ufunc.reduceat over each window's flat range, or None if `values` is None."""
+    if values is None:
+        return None
+    flat = np.append(np.ravel(values), values.dtype.type(0)) # Room for a range ending at S * T
+    if flat.dtype == np.bool_:
+        flat = flat.astype(np.int8)
+    return ufunc.reduceat(flat, bounds)[0::2]
+
+
+def _none_if_nan(values, i):
+    if values is None or np.isnan(values[i]):
+        return None
+    return float(values[i])
+
+
+# --- Inputs ---
+
+def time_grid(start, end, resolution_minutes=WINDOW_RESOLUTION_MINUTES):
+    """Epoch-second grid from `start` to `end` (aware datetimes) at the given resolution."""
+    step = resolution_minutes * 60
+    first = int(start.timestamp()) // step * step
+    return np.arange(first, int(end.timestamp()) + 1, step, dtype=np.int64)
+
+
+def station_curves(station, start, end, grid):
+    """
+    Tide and weather for one station interpolated onto `grid`.
+
+    Tides are a cubic spline through the hourly predictions, falling back to cosine
+    interpolation between the high/low predictions where hourly data is missing.
+    Weather is NaN outside the forecast's range.
+
+    Returns:
+        tuple: (tide_ft, wind_mph, precip_pct) arrays shaped like `grid`.
+    """
+    start_date, end_date = start.strftime("%Y%m%d"), end.strftime("%Y%m%d")
+    hourly_df, hilo_df = (
+        get_tide_data(station['id'], start_date, end_date, product="predictions",
+                      datum="MLLW", time_zone="gmt", interval=interval)
+        for interval in ("h", "hilo")
+    )
+    tide_ft = interpolate_tide_heights(grid, hilo_df=hilo_df, hourly_df=hourly_df)
+
+    wind_mph = np.full(len(grid), np.nan)
+    precip_pct = np.full(len(grid), np.nan)
+    if PIRATE_WEATHER_API_KEY != "YOUR_PIRATE_WEATHER_API_KEY" and station.get('lat') is not None:
+        report = get_pirate_weather_report(station['lat'], station['lon'], time_unix=None)
+        weather_df = hourly_weather_dataframe(report, timezone.utc)
+        if weather_df is not None and not weather_df.empty:
+            weather_times = to_epoch_seconds(weather_df['datetime'])
+            wind_mph = np.interp(grid, weather_times, weather_df['wind_speed_mph'].to_numpy(np.float64),
+                                 left=np.nan, right=np.nan)
+            precip_pct = np.interp(grid, weather_times, weather_df['precip_prob'].to_numpy(np.float64),
+                                   left=np.nan, right=np.nan)
+    return tide_ft, wind_mph, precip_pct
+
+
+def windows_cached(stations, days, start=None):
+    """True if query_windows() can answer without calling any upstream."""
+    start = start or datetime.now(timezone.utc)
+    start_date, end_date = start.strftime("%Y%m%d"), (start + timedelta(days=days)).strftime("%Y%m%d")
+    for station in stations:
+        if not all(predictions_cached(station['id'], start_date, end_date, interval) for interval in ("h", "hilo")):
+            return False
+        if (PIRATE_WEATHER_API_KEY != "YOUR_PIRATE_WEATHER_API_KEY" and station.get('lat') is not None
+                and not forecast_cached(station['lat'], station['lon'])):
+            return False
+    return True
+
+
+def query_windows(stations, days, start=None, max_workers=WINDOW_FETCH_WORKERS, **thresholds):
+    """
+    Fetches tide and weather for every station concurrently (through the usual caches),
+    aligns them on one grid and runs find_windows() over all of them at once.
+
+    Args:
+        stations (list): Dicts with 'id', 'name', 'lat' and 'lon'.
+        days (float): How far ahead to look from `start`.
+        start (datetime): Aware start time (default: now).
+        max_workers (int): Stations fetched in parallel.
+        **thresholds: min_tide_ft, max_tide_ft, max_wind_mph, max_precip_pct, min_duration_minutes.
+
+    Returns:
+        list: find_windows() results with 'station_id' and 'station_name' added and
+              'start'/'end' as aware UTC datetimes.
+    """
+    start = start or datetime.now(timezone.utc)
+    end = start + timedelta(days=days)
+    grid = time_grid(start, end)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(stations)))) as pool:
+        # copy_context() carries the caller's request budget into the worker threads
+        futures = [pool.submit(contextvars.copy_context().run, station_curves, station, start, end, grid)
+                   for station in stations]
+        curves = [future.result() for future in futures]
+
+    if not curves:
+        return []
+    tide_ft, wind_mph, precip_pct = (np.stack(arrays) for arrays in zip(*curves))
+    windows = find_windows(grid, tide_ft, wind_mph, precip_pct, **thresholds)
+    for window in windows:
+        station = stations[window['station']]
+        window['station_id'] = station['id']
+        window['station_name'] = station['name']
+        window['start'] = datetime.fromtimestamp(window['start'], timezone.utc)
+        window['end'] = datetime.fromtimestamp(window['end'], timezone.utc)
+    return windows
@@ -0,0 +1,21 @@
+# tests/conftest.py
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The app's modules import each other as top-level modules (from config import ...), the
+# way gunicorn runs them from my_tide_app/; the CLI scripts live at the repo root
+sys.path.insert(0, os.path.join(ROOT, "my_tide_app"))
+sys.path.insert(0, ROOT)
+
+# config.py asks AWS Secrets Manager for keys on import; don't wait on instance metadata
+os.environ.setdefault("AWS_EC2_METADATA_DISABLED", "true")
+# Keep the files workers share on a host out of the way of a running app
+_scratch = tempfile.mkdtemp(prefix="tide-tests-")
+os.environ.setdefault("QUOTA_STATE_PATH", os.path.join(_scratch, "quota.json"))
+os.environ.setdefault("STATION_STORE_PATH", os.path.join(_scratch, "stations.bin"))
+os.environ.setdefault("ADMISSION_LOCK_DIR", _scratch)
+os.environ.setdefault("PROFILE_DIR", os.path.join(_scratch, "profiles"))
@@ -0,0 +1,101 @@
+# tests/test_backfill_store.py
+
+import os
+from datetime import date
+
+import numpy as np
+import pytest
+
+from backfill import COLUMNS, BackfillStore, month_chunks
+
+
+def chunk(times, summary="Clear"):
+    count = len(times)
+    rows = {name: np.full(count, 1.5) for name, dtype in COLUMNS.items() if dtype == "<f4"}
+    rows.update(time=np.asarray(times, dtype=np.int64), tide_type=np.full(count, b"H"),
+                weather_time=np.asarray(times, dtype=np.int64), summary_text=[summary] * count)
+    return rows
+
+
+def test_append_and_read_back(tmp_path):
+    with BackfillStore(str(tmp_path)) as store:
+        store.append("8571858", date(2024, 1, 1), date(2024, 1, 31), chunk([100, 200]))
+        store.append("8575512", date(2024, 1, 1), date(2024, 1, 31), chunk([150], summary=None))
+    store = BackfillStore(str(tmp_path), readonly=True)
+    assert len(store) == 3
+    assert store.column("time").tolist() == [100, 200, 150]
+    assert store.column("station").tolist() == [0, 0, 1]
+    assert store.column("summary").tolist() == [0, 0, -1]
+    df = store.to_dataframe()
+    assert df["station"].tolist() == ["8571858", "8571858", "8575512"]
+    assert df["summary"].isna().tolist() == [False, False, True]
+
+
+def test_empty_store_and_empty_chunk(tmp_path):
+    with BackfillStore(str(tmp_path)) as store:
+        assert len(store) == 0
+        assert len(store.column("time")) == 0
+        store.append("8571858", date(2024, 1, 1), date(2024, 1, 31), chunk([]))
+        assert len(store) == 0
+        assert store.missing("8571858", date(2024, 1, 1), date(2024, 1, 31)) == []
+
+
+def test_missing_days_and_merged_ranges(tmp_path):
+    with BackfillStore(str(tmp_path)) as store:
+        store.append("s", date(2024, 1, 10), date(2024, 1, 19), chunk([]))
+        store.append("s", date(2024, 1, 20), date(2024, 1, 25), chunk([]))
+        assert store.manifest["done"]["s"] == [[date(2024, 1, 10).toordinal(), date(2024, 1, 25).toordinal()]]
+        assert store.missing("s", date(2024, 1, 1), date(2024, 1, 31)) == [
+            (date(2024, 1, 1), date(2024, 1, 9)), (date(2024, 1, 26), date(2024, 1, 31))]
+        assert store.missing("s", date(2024, 1, 12), date(2024, 1, 12)) == []
+        assert store.missing("other", date(2024, 1, 1), date(2024, 1, 2)) == [(date(2024, 1, 1), date(2024, 1, 2))]
+
+
+def test_a_torn_append_is_invisible_and_cut_off_by_the_next(tmp_path):
+    path = str(tmp_path)
+    with BackfillStore(path) as store:
+        store.append("s", date(2024, 1, 1), date(2024, 1, 31), chunk([100, 200]))
+    # A run killed mid-append: some columns got bytes, the manifest never did
+    for name in ("time", "height_ft", "station"):
+        with open(os.path.join(path, f"{name}.bin"), "ab") as f:
+            f.write(b"\xff" * 13)
+
+    with BackfillStore(path) as store:
+        assert len(store) == 2
+        assert store.column("time").tolist() == [100, 200]
+        assert store.missing("s", date(2024, 2, 1), date(2024, 2, 29)) == [(date(2024, 2, 1), date(2024, 2, 29))]
+        store.append("s", date(2024, 2, 1), date(2024, 2, 29), chunk([300]))
+
+    store = BackfillStore(path, readonly=True)
+    assert store.column("time").tolist() == [100, 200, 300]
+    assert store.column("height_ft").tolist() == [1.5, 1.5, 1.5]
+    for name, dtype in COLUMNS.items():
+        assert os.path.getsize(os.path.join(path, f"{name}.bin")) == 3 * np.dtype(dtype).itemsize
+
+
+def test_one_writer_at_a_time(tmp_path):
+    with BackfillStore(str(tmp_path)):
+        with pytest.raises(ValueError):
+            BackfillStore(str(tmp_path))
+
+
+def test_settings_must_match(tmp_path):
+    with BackfillStore(str(tmp_path), settings={"source": "predictions"}) as store:
+        store.append("s", date(2024, 1, 1), date(2024, 1, 1), chunk([]))
+    with pytest.raises(ValueError):
+        BackfillStore(str(tmp_path), settings={"source": "observed"})
+
+
+def test_readonly_needs_an_existing_store(tmp_path):
+    with pytest.raises(ValueError):
+        BackfillStore(str(tmp_path / "nothing"), readonly=True)
+
+
+def test_month_chunks():
+    assert list(month_chunks(date(2023, 12, 15), date(2024, 2, 10))) == [
+        (date(2023, 12, 15), date(2023, 12, 31)),
+        (date(2024, 1, 1), date(2024, 1, 31)),
+        (date(2024, 2, 1), date(2024, 2, 10)),
+    ]
+    assert list(month_chunks(date(2024, 3, 5), date(2024, 3, 5))) == [(date(2024, 3, 5), date(2024, 3, 5))]
+    assert list(month_chunks(date(2024, 3, 5), date(2024, 3, 4))) == []
@@ -0,0 +1,86 @@
+# tests/test_cache.py
+
+import threading
+import time
+
+from cache import TTLCache
+
+
+def test_get_or_load_caches_the_loaded_value():
+    cache = TTLCache("test", ttl_seconds=60)
+    calls = []
+    assert cache.get_or_load("k", lambda: calls.append(1) or "v") == "v"
+    assert cache.get_or_load("k", lambda: calls.append(1) or "other") == "v"
+    assert len(calls) == 1
+
+
+def test_failed_loads_are_not_cached():
+    cache = TTLCache("test", ttl_seconds=60)
+    assert cache.get_or_load("k", lambda: None) is None
+    assert cache.get("k") is None
+    assert cache.get_or_load("k", lambda: "v") == "v"
+
+
+def test_expired_entries_are_loaded_again():
+    cache = TTLCache("test", ttl_seconds=60)
+    cache.set("k", "old", ttl_seconds=-1)
+    assert cache.get("k") is None
+    assert cache.get_or_load("k", lambda: "new") == "new"
+
+
+def test_max_entries_evicts_least_recently_set():
+    cache = TTLCache("test", ttl_seconds=60, max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.set(key, key)
+    assert cache.get("a") is None
+    assert cache.get("b") == "b" and cache.get("c") == "c"
+    assert len(cache) == 2
+
+
+def test_concurrent_misses_share_one_load():
+    cache = TTLCache("test", ttl_seconds=60)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_load():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "v"
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(cache.get_or_load("k", slow_load)))
+    first.start()
+    assert started.wait(5)
+    waiters = [threading.Thread(target=lambda: results.append(cache.get_or_load("k", slow_load)))
+               for _ in range(4)]
+    for thread in waiters:
+        thread.start()
+    time.sleep(0.05) # Let the waiters reach the in-flight load
+    release.set()
+    for thread in [first] + waiters:
+        thread.join(5)
+    assert results == ["v"] * 5
+    assert len(calls) == 1
+
+
+def test_waiters_retry_after_a_failed_load():
+    cache = TTLCache("test", ttl_seconds=60)
+    started, release = threading.Event(), threading.Event()
+
+    def failing_load():
+        started.set()
+        release.wait(5)
+        return None
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(cache.get_or_load("k", failing_load)))
+    first.start()
+    assert started.wait(5)
+    waiter = threading.Thread(target=lambda: results.append(cache.get_or_load("k", lambda: "v")))
+    waiter.start()
+    time.sleep(0.05)
+    release.set()
+    first.join(5)
+    waiter.join(5)
+    assert sorted(results, key=str) == [None, "v"]
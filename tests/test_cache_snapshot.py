@@ -0,0 +1,70 @@
+# tests/test_cache_snapshot.py
+
+import pytest
+
+import cache_snapshot
+from cache import tide_cache
+from config import DEV_SECRET_KEY
+
+
+@pytest.fixture
+def snapshot_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_snapshot, "SECRET_KEY", "test-secret")
+    tide_cache.clear()
+    yield str(tmp_path / "caches.snap")
+    tide_cache.clear()
+
+
+def test_round_trip(snapshot_path):
+    tide_cache.set(("9414290", "20260101"), {"height_ft": [1.5, 2.5]})
+    assert cache_snapshot.write_snapshot(snapshot_path) == 1
+    tide_cache.clear()
+    assert cache_snapshot.restore(snapshot_path) == {"geocode": 0, "tides": 1, "weather": 0}
+    assert tide_cache.get(("9414290", "20260101")) == {"height_ft": [1.5, 2.5]}
+
+
+def test_tampered_payload_is_rejected(snapshot_path):
+    tide_cache.set("key", "value")
+    cache_snapshot.write_snapshot(snapshot_path)
+    with open(snapshot_path, "r+b") as f:
+        f.seek(-1, 2)
+        last = f.read(1)
+        f.seek(-1, 2)
+        f.write(bytes([last[0] ^ 1]))
+    with pytest.raises(ValueError, match="integrity"):
+        cache_snapshot.read_snapshot(snapshot_path)
+    tide_cache.clear()
+    assert cache_snapshot.restore(snapshot_path) == {}
+    assert tide_cache.get("key") is None
+
+
+def test_file_signed_with_another_key_is_rejected(snapshot_path, monkeypatch):
+    tide_cache.set("key", "value")
+    cache_snapshot.write_snapshot(snapshot_path)
+    monkeypatch.setattr(cache_snapshot, "SECRET_KEY", "another-secret")
+    with pytest.raises(ValueError, match="integrity"):
+        cache_snapshot.read_snapshot(snapshot_path)
+
+
+def test_truncated_file_is_rejected(snapshot_path):
+    tide_cache.set("key", "value")
+    cache_snapshot.write_snapshot(snapshot_path)
+    with open(snapshot_path, "r+b") as f:
+        f.truncate(f.seek(0, 2) - 1)
+    with pytest.raises(ValueError, match="truncated"):
+        cache_snapshot.read_snapshot(snapshot_path)
+
+
+def test_development_key_is_refused(snapshot_path, monkeypatch, capsys):
+    tide_cache.set("key", "value")
+    cache_snapshot.write_snapshot(snapshot_path)
+    monkeypatch.setattr(cache_snapshot, "SECRET_KEY", DEV_SECRET_KEY)
+    with pytest.raises(ValueError, match="development"):
+        cache_snapshot.read_snapshot(snapshot_path)
+    with pytest.raises(ValueError, match="development"):
+        cache_snapshot.write_snapshot(snapshot_path)
+
+    monkeypatch.setattr(cache_snapshot, "_started", False)
+    cache_snapshot.start(snapshot_path)
+    assert not cache_snapshot._started
+    assert "Cache snapshots disabled" in capsys.readouterr().out
@@ -0,0 +1,114 @@
+# tests/test_forecast_table.py
+
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from forecast_table import ForecastTable, build_forecast_table, match_weather, parse_duration
+
+HOUR = 3600
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+T0 = int(START.timestamp())
+
+
+def table(times):
+    times = np.asarray(times, dtype=np.int64)
+    return ForecastTable(times, np.zeros(len(times)), np.full(len(times), b"", dtype="S1"), 60)
+
+
+def all_pages(forecast_table, limit):
+    rows, cursor = [], None
+    while True:
+        page = forecast_table.page(cursor, limit)
+        rows.extend(range(page['offset'], page['stop']))
+        if page['next_cursor'] is None:
+            return rows
+        cursor = page['next_cursor']
+
+
+def test_empty_table():
+    page = table([]).page(None, 10)
+    assert page == {'offset': 0, 'stop': 0, 'next_cursor': None, 'prev_cursor': None}
+
+
+def test_single_row():
+    page = table([T0]).page(None, 10)
+    assert page == {'offset': 0, 'stop': 1, 'next_cursor': None, 'prev_cursor': None}
+
+
+@pytest.mark.parametrize("rows, limit", [(10, 3), (10, 5), (10, 10), (10, 100), (7306, 100)])
+def test_paging_forward_visits_every_row_once(rows, limit):
+    forecast_table = table(T0 + 360 * np.arange(rows))
+    assert all_pages(forecast_table, limit) == list(range(rows))
+
+
+def test_paging_back_retraces_the_pages():
+    forecast_table = table(T0 + HOUR * np.arange(10))
+    forward, cursor = [], None
+    while True:
+        page = forecast_table.page(cursor, 3)
+        forward.append((page['offset'], page['stop']))
+        if page['next_cursor'] is None:
+            break
+        cursor = page['next_cursor']
+    backward = [forward[-1]]
+    cursor = forecast_table.page(forecast_table.times[forward[-1][0]], 3)['prev_cursor']
+    while cursor is not None:
+        page = forecast_table.page(cursor, 3)
+        backward.append((page['offset'], page['stop']))
+        cursor = page['prev_cursor']
+    assert backward[::-1] == forward
+
+
+def test_cursor_between_rows_starts_at_the_next_one():
+    forecast_table = table(T0 + HOUR * np.arange(5))
+    assert forecast_table.page(T0 + HOUR + 1, 2)['offset'] == 2
+    assert forecast_table.page(T0 - 10 * HOUR, 2)['offset'] == 0
+
+
+def test_cursor_past_the_end_gives_an_empty_last_page():
+    forecast_table = table(T0 + HOUR * np.arange(5))
+    page = forecast_table.page(T0 + 100 * HOUR, 2)
+    assert (page['offset'], page['stop'], page['next_cursor']) == (5, 5, None)
+    assert page['prev_cursor'] == T0 + 3 * HOUR # Back to the last full page
+
+
+def test_build_merges_highs_and_lows_into_the_grid():
+    hourly = pd.DataFrame({'datetime': pd.to_datetime(T0 + HOUR * np.arange(7), unit='s'),
+                           'height_ft': [0.0, 1.0, 2.0, 3.0, 2.0, 1.0, 0.0]})
+    hilo = pd.DataFrame({'datetime': pd.to_datetime([T0 + 3 * HOUR, T0 + 4 * HOUR + 1800], unit='s'),
+                         'height_ft': [3.1, 1.4], 'tide_type': ["H", "L"]})
+    built = build_forecast_table(START, datetime.fromtimestamp(T0 + 6 * HOUR, timezone.utc), 60,
+                                 hourly_df=hourly, hilo_df=hilo)
+    # The 03:00 grid row gives way to the high tide at the same time
+    assert (built.times - T0).tolist() == [0, HOUR, 2 * HOUR, 3 * HOUR, 4 * HOUR, 4 * HOUR + 1800, 5 * HOUR]
+    assert built.events.tolist() == [b"", b"", b"", b"H", b"", b"L", b""]
+    assert built.heights[3] == pytest.approx(3.1)
+    assert built.grid_rank.tolist() == [0, 1, 2, -1, 3, -1, 4]
+
+
+def test_build_without_predictions():
+    end = datetime.fromtimestamp(T0 + 6 * HOUR, timezone.utc)
+    assert build_forecast_table(START, end, 60) is None
+
+
+def test_match_weather():
+    weather = pd.DataFrame({'datetime': pd.to_datetime(T0 + HOUR * np.array([2, 0, 1]), unit='s')})
+    found = match_weather([T0 - HOUR, T0 + 10, T0 + HOUR + 1799, T0 + 2 * HOUR + 1801], weather)
+    assert found.tolist() == [-1, 1, 2, -1]
+    assert match_weather([T0], None).tolist() == [-1]
+    assert match_weather([], weather).tolist() == []
+
+
+@pytest.mark.parametrize("raw, unit, minutes", [
+    ("6m", "h", 6), ("36h", "m", 36 * 60), ("7d", "h", 7 * 24 * 60), (" 2 ", "h", 120), ("1.5H", "m", 90)])
+def test_parse_duration(raw, unit, minutes):
+    assert parse_duration(raw, unit) == minutes
+
+
+@pytest.mark.parametrize("raw", ["", "h", "abc", "nan", "inf", "-infd"])
+def test_parse_duration_rejects(raw):
+    with pytest.raises(ValueError):
+        parse_duration(raw, "h")
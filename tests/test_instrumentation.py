@@ -0,0 +1,131 @@
+# tests/test_instrumentation.py
+
+import pytest
+from flask import Flask
+
+import instrumentation
+from instrumentation import inc, observe, record_cache, register_gauge, render_prometheus, stage, upstream_call
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    """Metrics on, starting from nothing recorded."""
+    monkeypatch.setattr(instrumentation, "METRICS_ENABLED", True)
+    monkeypatch.setattr(instrumentation, "_counters", {})
+    monkeypatch.setattr(instrumentation, "_histograms", {})
+    monkeypatch.setattr(instrumentation, "_gauges", {})
+
+
+def make_app():
+    app = Flask(__name__)
+
+    @app.route('/work')
+    def work():
+        with stage("join"):
+            pass
+        record_cache("tides", True)
+        with upstream_call("noaa") as span:
+            span.outcome = "timeout"
+        return "done"
+
+    instrumentation.init_app(app)
+    return app
+
+
+def test_label_values_are_escaped(metrics):
+    inc("tide_test_total", path='say "hi"\\now\nthen')
+    assert 'tide_test_total{path="say \\"hi\\"\\\\now\\nthen"} 1' in render_prometheus().splitlines()
+
+
+def test_counters_share_one_help_and_type(metrics):
+    inc("tide_upstream_skipped_total", upstream="noaa", reason="budget")
+    inc("tide_upstream_skipped_total", 2, upstream="noaa", reason="shed")
+    lines = render_prometheus().splitlines()
+    assert lines == [
+        "# HELP tide_upstream_skipped_total Upstream calls not made, by reason.",
+        "# TYPE tide_upstream_skipped_total counter",
+        'tide_upstream_skipped_total{reason="budget",upstream="noaa"} 1',
+        'tide_upstream_skipped_total{reason="shed",upstream="noaa"} 2',
+    ]
+
+
+def test_histogram_buckets_are_cumulative(metrics):
+    for seconds in (0.003, 0.03, 0.3, 0.5, 20):
+        observe("tide_stage_duration_seconds", seconds, stage="render")
+    lines = render_prometheus().splitlines()
+    assert "# TYPE tide_stage_duration_seconds histogram" in lines
+    buckets = {line.split('le="')[1].split('"')[0]: int(line.rsplit(" ", 1)[1])
+               for line in lines if line.startswith("tide_stage_duration_seconds_bucket")}
+    assert buckets == {"0.005": 1, "0.01": 1, "0.025": 1, "0.05": 2, "0.1": 2, "0.25": 2, "0.5": 4,
+                       "1.0": 4, "2.5": 4, "5.0": 4, "10.0": 4, "+Inf": 5} # A bound counts as inside
+    assert 'tide_stage_duration_seconds_count{stage="render"} 5' in lines
+    assert float(next(line for line in lines if line.startswith("tide_stage_duration_seconds_sum")).split()[1]) \
+        == pytest.approx(20.833)
+
+
+def test_a_broken_gauge_doesnt_take_the_others_down(metrics):
+    register_gauge("tide_admission_in_flight", lambda: [({}, 3)])
+    register_gauge("tide_upstream_quota_used", lambda: 1 / 0)
+    lines = render_prometheus().splitlines()
+    assert "tide_admission_in_flight 3" in lines
+    assert not any(line.startswith("tide_upstream_quota_used") for line in lines)
+
+
+def test_server_timing_and_metrics_endpoint(metrics):
+    client = make_app().test_client()
+    response = client.get('/work')
+    entries = [entry.strip() for entry in response.headers['Server-Timing'].split(",")]
+    assert [entry.split(";")[0] for entry in entries] == ["join", "cache-tides", "noaa", "total"]
+    assert entries[0].startswith("join;dur=")
+    assert entries[1] == 'cache-tides;desc="hit"'
+    assert entries[2].startswith("noaa;dur=") and entries[2].endswith(';desc="timeout"')
+
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'tide_http_requests_total{endpoint="work",status="200"} 1' in text
+    assert 'tide_upstream_requests_total{outcome="timeout",upstream="noaa"} 1' in text
+    assert 'tide_cache_requests_total{cache="tides",result="hit"} 1' in text
+
+
+def test_disabled_metrics_cost_nothing(monkeypatch):
+    monkeypatch.setattr(instrumentation, "METRICS_ENABLED", False)
+    monkeypatch.setattr(instrumentation, "_counters", {})
+    monkeypatch.setattr(instrumentation, "_histograms", {})
+    app = make_app()
+    assert 'metrics' not in app.view_functions and not app.after_request_funcs
+
+    assert stage("join") is instrumentation._NOOP_SPAN
+    with upstream_call("noaa") as span:
+        span.outcome = "timeout" # Ignored
+    assert span.outcome == "ok"
+
+    response = app.test_client().get('/work')
+    assert response.status_code == 200 and 'Server-Timing' not in response.headers
+    assert instrumentation._counters == {} and instrumentation._histograms == {}
+
+
+def test_profiled_request_gets_spans_without_metrics(monkeypatch):
+    monkeypatch.setattr(instrumentation, "METRICS_ENABLED", False)
+    monkeypatch.setattr(instrumentation, "_histograms", {})
+
+    class Profile:
+        def __init__(self):
+            self.spans = []
+
+        def watch_thread(self):
+            pass
+
+        def unwatch_thread(self):
+            pass
+
+        def record_span(self, kind, name, started, elapsed, outcome):
+            self.spans.append((kind, name, outcome))
+
+    profile = Profile()
+    token = instrumentation.active_profile.set(profile)
+    try:
+        with stage("join"):
+            pass
+    finally:
+        instrumentation.active_profile.reset(token)
+    assert profile.spans == [("stage", "join", "ok")]
+    assert instrumentation._histograms == {}
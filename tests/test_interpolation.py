@@ -0,0 +1,92 @@
+# tests/test_interpolation.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.noaa import interpolate_tide_heights, to_epoch_seconds
+
+HOUR = 3600
+START = 1_700_000_000 # Epoch seconds on the hour
+
+
+def frame(times, heights):
+    return pd.DataFrame({'datetime': pd.to_datetime(np.asarray(times), unit='s'), 'height_ft': heights})
+
+
+def test_to_epoch_seconds_accepts_numbers_naive_and_aware_datetimes():
+    naive = pd.Series(pd.to_datetime([START], unit='s'))
+    aware = naive.dt.tz_localize('UTC').dt.tz_convert('America/New_York')
+    assert to_epoch_seconds([START]).tolist() == [START]
+    assert to_epoch_seconds(naive).tolist() == [START]
+    assert to_epoch_seconds(aware).tolist() == [START]
+
+
+def test_spline_passes_through_the_hourly_predictions():
+    knots = START + HOUR * np.arange(6)
+    heights = np.array([1.0, 2.5, 3.0, 2.0, 0.5, 0.2])
+    assert interpolate_tide_heights(knots, hourly_df=frame(knots, heights), method="spline") == pytest.approx(heights)
+
+
+def test_spline_through_two_points_is_a_straight_line():
+    knots = [START, START + HOUR]
+    at = [START + HOUR / 4, START + HOUR / 2]
+    assert interpolate_tide_heights(at, hourly_df=frame(knots, [0.0, 4.0]), method="spline") == pytest.approx([1.0, 2.0])
+
+
+def test_spline_follows_a_semidiurnal_tide():
+    period = 12.42 * HOUR
+    knots = START + HOUR * np.arange(25)
+    at = START + 6 * 60 * np.arange(1, 240) # Every 6 minutes
+    def tide(t):
+        return 2 + 1.5 * np.sin(2 * np.pi * (t - START) / period)
+    heights = interpolate_tide_heights(at, hourly_df=frame(knots, tide(knots)), method="spline")
+    assert np.max(np.abs(heights - tide(at))) < 0.01
+
+
+def test_spline_is_nan_outside_the_hourly_data():
+    knots = START + HOUR * np.arange(3)
+    heights = interpolate_tide_heights([START - 1, START + 2 * HOUR + 1], hourly_df=frame(knots, [1, 2, 1]),
+                                       method="spline")
+    assert np.isnan(heights).all()
+
+
+def test_spline_ignores_duplicate_timestamps():
+    knots = [START, START, START + HOUR, START + 2 * HOUR]
+    heights = interpolate_tide_heights([START + HOUR], hourly_df=frame(knots, [1.0, 9.0, 2.0, 3.0]), method="spline")
+    assert heights == pytest.approx([2.0])
+
+
+def test_cosine_between_a_high_and_a_low():
+    hilo = frame([START, START + 6 * HOUR], [4.0, 0.0])
+    at = START + np.array([0, 1.5, 3, 4.5, 6]) * HOUR
+    heights = interpolate_tide_heights(at, hilo_df=hilo, method="cosine")
+    expected = 2 + 2 * np.cos(np.pi * np.array([0, 0.25, 0.5, 0.75, 1]))
+    assert heights == pytest.approx(expected)
+
+
+def test_cosine_is_nan_outside_the_extrema_and_with_one_extremum():
+    hilo = frame([START, START + 6 * HOUR], [4.0, 0.0])
+    heights = interpolate_tide_heights([START - 1, START + 6 * HOUR + 1], hilo_df=hilo, method="cosine")
+    assert np.isnan(heights).all()
+    single = interpolate_tide_heights([START], hilo_df=frame([START], [4.0]), method="cosine")
+    assert np.isnan(single).all()
+
+
+def test_auto_uses_the_spline_and_falls_back_to_cosine():
+    hourly = frame(START + HOUR * np.arange(4), [0.0, 1.0, 2.0, 3.0])
+    hilo = frame([START, START + 12 * HOUR], [0.0, 6.0])
+    at = [START + HOUR, START + 6 * HOUR]
+    heights = interpolate_tide_heights(at, hilo_df=hilo, hourly_df=hourly)
+    assert heights[0] == pytest.approx(1.0) # Spline
+    assert heights[1] == pytest.approx(3.0) # Cosine, halfway between the extrema
+
+
+def test_no_data_or_no_times():
+    assert np.isnan(interpolate_tide_heights([START])).all()
+    assert interpolate_tide_heights([], hourly_df=frame([START, START + HOUR], [1, 2])).shape == (0,)
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        interpolate_tide_heights([START], hilo_df=frame([START, START + HOUR], [1, 2]), method="linear")
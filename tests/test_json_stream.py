@@ -0,0 +1,77 @@
+# tests/test_json_stream.py
+
+import json
+
+import pytest
+
+from json_stream import iter_array
+
+DOCUMENT = {
+    "count": 3,
+    "meta": {"nested": [1, {"stations": "not this one"}], "text": "a ] , } b"},
+    "stations": [
+        {"id": "8571858", "name": "Sharptown", "lat": 38.5367, "lng": -75.7233},
+        {"id": "8575512", "name": "Chesapeake Bay Bridge — Sandy Point", "lat": 39.0133, "lng": -76.3983},
+        {"id": "9414290", "name": "San Francisco", "lat": 37.806302, "lng": -122.465},
+    ],
+    "after": "ignored",
+}
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def items(text, key="stations", size=None):
+    data = text.encode("utf-8")
+    return list(iter_array(chunked(data, size) if size else [data], key))
+
+
+def test_whole_document():
+    assert items(json.dumps(DOCUMENT)) == DOCUMENT["stations"]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_any_chunking_gives_the_same_items(size):
+    # Size 1 splits every number and the multi-byte em dash across chunks
+    assert items(json.dumps(DOCUMENT, ensure_ascii=False), size=size) == DOCUMENT["stations"]
+
+
+def test_numbers_split_across_chunks():
+    chunks = [b'{"values": [12', b'34, 5.', b'25, -', b'1e', b'3]}']
+    assert list(iter_array(chunks, "values")) == [1234, 5.25, -1000.0]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3])
+def test_bare_numbers_at_any_chunking(size):
+    values = [38.5367, -75.7233, 1e-05, 2.5e+30, 0, -7, True, None]
+    assert items(json.dumps({"values": values}), key="values", size=size) == values
+
+
+def test_empty_chunks_and_whitespace():
+    chunks = [b"", b' \n{ "values" ', b"", b': [ ', b'1 ,\t2 ', b"]", b"", b" }"]
+    assert list(iter_array(chunks, "values")) == [1, 2]
+
+
+def test_empty_and_single_item_arrays():
+    assert items('{"stations": []}') == []
+    assert items('{"stations": [ ]}', size=1) == []
+    assert items('{"stations": [{"id": "1"}]}') == [{"id": "1"}]
+
+
+def test_stops_at_the_end_of_the_array():
+    assert items('{"stations": [1, 2], "after": this is never read') == [1, 2]
+
+
+@pytest.mark.parametrize("text", [
+    "",                                  # Nothing at all
+    "[1, 2]",                            # Not an object
+    "{}",                                # No keys
+    '{"other": [1]}',                    # No such key
+    '{"stations": {"id": 1}}',           # Not an array
+    '{"stations": [1, 2',                # Truncated
+    '{"stations": [1 2]}',               # Missing comma
+])
+def test_malformed_documents_raise_value_error(text):
+    with pytest.raises(ValueError):
+        items(text)
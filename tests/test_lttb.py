@@ -0,0 +1,45 @@
+# tests/test_lttb.py
+
+import numpy as np
+import pytest
+
+from tide_plot import lttb
+
+
+def test_empty_and_single_point():
+    assert lttb(np.array([]), np.array([]), 10).tolist() == []
+    assert lttb(np.array([5.0]), np.array([1.0]), 10).tolist() == [0]
+
+
+def test_short_series_and_tiny_thresholds_are_kept_whole():
+    x = np.arange(5.0)
+    assert lttb(x, x, 5).tolist() == [0, 1, 2, 3, 4]
+    assert lttb(x, x, 50).tolist() == [0, 1, 2, 3, 4]
+    assert lttb(x, x, 2).tolist() == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.parametrize("n, threshold", [(4, 3), (10, 3), (1000, 7), (1000, 999), (24 * 240, 600)])
+def test_keeps_threshold_increasing_points_including_the_ends(n, threshold):
+    x = np.arange(n, dtype=np.float64)
+    y = np.sin(x / 25.0)
+    keep = lttb(x, y, threshold)
+    assert len(keep) == threshold
+    assert keep[0] == 0 and keep[-1] == n - 1
+    assert (np.diff(keep) > 0).all()
+
+
+def test_peaks_survive():
+    x = np.arange(1000, dtype=np.float64)
+    y = np.zeros(1000)
+    y[137], y[612] = 10.0, -8.0
+    keep = lttb(x, y, 20)
+    assert 137 in keep and 612 in keep
+
+
+def test_tide_extremes_are_kept_closely():
+    # Three days of 6-minute heights down to a plot's worth of points
+    x = np.arange(0, 3 * 24 * 3600, 360, dtype=np.float64)
+    y = 2 + 1.5 * np.sin(2 * np.pi * x / (12.42 * 3600))
+    keep = lttb(x, y, 150)
+    assert y[keep].max() == pytest.approx(y.max(), abs=0.01)
+    assert y[keep].min() == pytest.approx(y.min(), abs=0.01)
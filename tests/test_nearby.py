@@ -0,0 +1,98 @@
+# tests/test_nearby.py
+
+import time
+from datetime import timezone
+
+import pandas as pd
+import pytest
+
+import nearby
+import resilience
+from nearby import compare_nearby
+from station_store import StationStore
+
+ORIGIN = (38.40, -75.76)
+# Due north of the origin, a little further each time
+RECORDS = [(f"86{i:05d}", f"Station {i}", ORIGIN[0] + 0.1 * i, ORIGIN[1]) for i in (4, 1, 3, 2, 5)]
+TODAY = pd.Timestamp.now(tz="UTC").normalize().tz_localize(None) # Naive GMT, like NOAA's answers
+
+
+def hilo(first_high_hour):
+    """High/lows 6h12m apart over three days from midnight GMT today."""
+    times = pd.date_range(TODAY, periods=12, freq="372min") + pd.Timedelta(hours=first_high_hour)
+    return pd.DataFrame({'datetime': times, 'height_ft': [2.0, 0.5] * 6, 'tide_type': ['H', 'L'] * 6})
+
+
+@pytest.fixture
+def noaa(monkeypatch):
+    """Station catalog and high/low predictions; `answers` maps station ID to a DataFrame, None or an exception."""
+    store = StationStore.from_records(RECORDS, fetched_at=0)
+    monkeypatch.setattr(nearby, "get_noaa_tide_stations", lambda: store)
+    answers = {}
+    delays = {}
+    seen_cache_only = []
+
+    def get_tide_data(station_id, *args, **kwargs):
+        time.sleep(delays.get(station_id, 0))
+        seen_cache_only.append(resilience.cache_only())
+        answer = answers.get(station_id, hilo(0))
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+    monkeypatch.setattr(nearby, "get_tide_data", get_tide_data)
+    return answers, delays, seen_cache_only
+
+
+def test_k_nearest_closest_first(noaa):
+    stations = compare_nearby(*ORIGIN, 3)
+    assert [station['id'] for station in stations] == ["8600001", "8600002", "8600003"]
+    distances = [station['distance_miles'] for station in stations]
+    assert distances == sorted(distances) and distances[0] == pytest.approx(6.9, abs=0.1)
+
+
+def test_order_doesnt_depend_on_which_fetch_finishes_first(noaa):
+    _, delays, _ = noaa
+    delays.update({"8600001": 0.2, "8600002": 0.1}) # The closest answers last
+    stations = compare_nearby(*ORIGIN, 3, max_workers=3)
+    assert [station['id'] for station in stations] == ["8600001", "8600002", "8600003"]
+    assert all(station['tides'] is not None for station in stations)
+
+
+def test_more_stations_asked_for_than_there_are(noaa):
+    assert len(compare_nearby(*ORIGIN, 10)) == len(RECORDS)
+
+
+def test_next_high_and_low_after_now(noaa):
+    answers, _, _ = noaa
+    answers["8600001"] = hilo(1) # Highs at 01:00, 13:24...; lows at 07:12, 19:36... GMT
+    station = nearby.nearest_stations(*ORIGIN, 1)[0]
+    tides = nearby.next_tides(station, now=TODAY.tz_localize("UTC") + pd.Timedelta(hours=12))
+    (high_time, high_ft), (low_time, low_ft) = tides['high'], tides['low']
+    assert high_time.astimezone(timezone.utc).strftime("%H:%M") == "13:24" and high_ft == 2.0
+    assert low_time.astimezone(timezone.utc).strftime("%H:%M") == "19:36" and low_ft == 0.5
+    assert high_time.tzinfo.zone == "America/New_York" # In the station's zone
+
+
+def test_one_failing_station_doesnt_sink_the_rest(noaa):
+    answers, _, _ = noaa
+    answers["8600001"] = None # NOAA didn't answer
+    answers["8600002"] = KeyError("datetime") # A worker blew up
+    stations = compare_nearby(*ORIGIN, 3)
+    assert [station['id'] for station in stations] == ["8600001", "8600002", "8600003"]
+    assert stations[0]['tides'] is None and stations[1]['tides'] is None
+    assert stations[2]['tides']['high'] is not None
+
+
+def test_workers_run_in_the_callers_request_budget(noaa):
+    _, _, seen_cache_only = noaa
+    resilience.start_budget(5, cache_only=True)
+    try:
+        compare_nearby(*ORIGIN, 3)
+    finally:
+        resilience.clear_budget()
+    assert seen_cache_only == [True, True, True]
+
+
+def test_no_catalog(monkeypatch):
+    monkeypatch.setattr(nearby, "get_noaa_tide_stations", lambda: None)
+    assert compare_nearby(*ORIGIN, 3) == []
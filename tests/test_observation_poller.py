@@ -0,0 +1,37 @@
+# tests/test_observation_poller.py
+
+import pytest
+
+import observations
+import resilience
+from observations import ObservationPoller, _Subscription
+
+
+@pytest.fixture
+def noaa(monkeypatch):
+    calls = []
+
+    def get_tide_data(*args, **kwargs):
+        calls.append(args)
+        return None
+    monkeypatch.setattr(observations, "get_tide_data", get_tide_data)
+    return calls
+
+
+def test_failed_poll_backs_off(noaa):
+    sub = _Subscription("9414290")
+    assert ObservationPoller().poll(sub) == 0
+    assert len(noaa) == 1
+    assert sub.failures == 1 and sub.retry_after > 0
+
+
+def test_cache_only_request_neither_polls_nor_backs_off(noaa):
+    sub = _Subscription("9414290")
+    resilience.start_budget(5, cache_only=True)
+    try:
+        assert ObservationPoller().poll(sub) == 0
+    finally:
+        resilience.clear_budget()
+    assert noaa == []
+    assert sub.failures == 0 and sub.retry_after == 0
+    assert sub.last_polled == 0 # So the next request (or the poller) still fetches it
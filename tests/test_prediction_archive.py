@@ -0,0 +1,104 @@
+# tests/test_prediction_archive.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import build_prediction_archive
+import services.noaa as noaa
+from build_prediction_archive import assemble, build_station
+from prediction_archive import PredictionArchive, DAY, HOUR
+
+START = 1767225600 # 2026-01-01 00:00 UTC
+DAYS = 3
+
+
+def frames(station_id, start, days, interval):
+    """Stands in for build_prediction_archive._fetch: hourly heights of day + hour / 100, two tides a day."""
+    first = pd.Timestamp(start, unit="s")
+    if interval == "h":
+        times = pd.date_range(first, periods=days * 24, freq="h")
+        return [pd.DataFrame({'datetime': times, 'height_ft': [t.day + t.hour / 100 for t in times]})]
+    times = [first + pd.Timedelta(days=d, hours=h) for d in range(days) for h in (3, 15)]
+    return [pd.DataFrame({'datetime': times, 'height_ft': [d + 0.5 for d in range(len(times))],
+                          'tide_type': ['H', 'L'] * days})]
+
+
+@pytest.fixture
+def archive(monkeypatch):
+    monkeypatch.setattr(build_prediction_archive, "_fetch", frames)
+    return assemble([build_station(station_id, START, DAYS) for station_id in ("8571858", "8575512")],
+                    START, DAYS)
+
+
+def test_covers_exactly_its_days(archive):
+    assert archive.end == START + DAYS * DAY
+    assert archive.covers(START, archive.end)
+    assert archive.covers(START + DAY, START + 2 * DAY)
+    assert not archive.covers(START - 1, START + DAY)
+    assert not archive.covers(archive.end - DAY, archive.end + DAY) # The day after the last
+
+
+def test_unknown_station_or_range(archive):
+    assert archive.row("0000000") is None
+    assert archive.hourly("0000000", START, START + DAY) is None
+    assert archive.hourly("8571858", START - DAY, START) is None
+    assert archive.hilo("8571858", archive.end, archive.end + DAY) is None
+
+
+def test_hourly_rows_are_offset_by_day_and_hour(archive):
+    times, heights = archive.hourly("8571858", START + DAY + 6 * HOUR, START + DAY + 9 * HOUR)
+    assert times.tolist() == [START + DAY + h * HOUR for h in (6, 7, 8)]
+    assert heights.tolist() == pytest.approx([2.06, 2.07, 2.08])
+
+
+def test_hourly_at_the_edges(archive):
+    times, heights = archive.hourly("8575512", START, START + DAY)
+    assert times[0] == START and heights[0] == pytest.approx(1.0)
+    times, heights = archive.hourly("8575512", archive.end - HOUR, archive.end)
+    assert times.tolist() == [archive.end - HOUR] and heights[0] == pytest.approx(3.23)
+    # A start between hours begins at the next one
+    times, _ = archive.hourly("8575512", START + 30 * 60, START + 3 * HOUR)
+    assert times.tolist() == [START + HOUR, START + 2 * HOUR]
+
+
+def test_hilo_by_day_and_trimmed_to_the_range(archive):
+    times, heights, types = archive.hilo("8571858", START + DAY, START + 2 * DAY)
+    assert times.tolist() == [START + DAY + 3 * HOUR, START + DAY + 15 * HOUR]
+    assert heights.tolist() == [2.5, 3.5] and types.tolist() == [b"H", b"L"]
+    times, _, _ = archive.hilo("8571858", START + 12 * HOUR, START + DAY + 12 * HOUR)
+    assert times.tolist() == [START + 15 * HOUR, START + DAY + 3 * HOUR]
+    times, _, _ = archive.hilo("8571858", START, archive.end)
+    assert len(times) == 2 * DAYS
+
+
+def test_save_and_load(archive, tmp_path):
+    path = str(tmp_path / "predictions.bin")
+    archive.save(path)
+    loaded = PredictionArchive.load(path)
+    assert loaded.ids.tolist() == archive.ids.tolist() and loaded.days == DAYS
+    assert np.array_equal(loaded.hourly("8571858", START, archive.end)[1],
+                          archive.hourly("8571858", START, archive.end)[1])
+
+
+def test_station_with_only_high_lows_is_kept(monkeypatch):
+    def hilo_only(station_id, start, days, interval):
+        return None if interval == "h" else frames(station_id, start, days, interval)
+    monkeypatch.setattr(build_prediction_archive, "_fetch", hilo_only)
+    built = build_station("8571900", START, DAYS)
+    assert built is not None and np.isnan(built[1]).all()
+    archive = assemble([built], START, DAYS)
+    assert len(archive.hilo("8571900", START, archive.end)[0]) == 2 * DAYS
+
+    # get_tide_data() says there are no hourly predictions, as NOAA would, without asking it
+    monkeypatch.setattr(noaa, "get_prediction_archive", lambda: archive)
+    monkeypatch.setattr(noaa, "_fetch_tide_data", lambda *args: pytest.fail("asked NOAA"))
+    assert noaa.get_tide_data("8571900", "20260101", "20260102", product="predictions", datum="MLLW",
+                              time_zone="gmt", interval="h") is None
+    assert len(noaa.get_tide_data("8571900", "20260101", "20260102", product="predictions", datum="MLLW",
+                                  time_zone="gmt", interval="hilo")) == 4
+
+
+def test_station_without_predictions_is_left_out(monkeypatch):
+    monkeypatch.setattr(build_prediction_archive, "_fetch", lambda *args: None)
+    assert build_station("8571901", START, DAYS) is None
@@ -0,0 +1,128 @@
+# tests/test_profiling.py
+
+import json
+import os
+import time
+
+import pytest
+from flask import Flask
+
+import profiling
+
+SECRET = "test-profile-secret"
+
+
+def busy_work(seconds=0.05):
+    deadline = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < deadline:
+        total += sum(range(100))
+    return str(total)
+
+
+def make_app(monkeypatch, secret):
+    monkeypatch.setattr(profiling, "PROFILE_SECRET", secret)
+    app = Flask(__name__)
+
+    @app.route('/work')
+    def work():
+        return busy_work()
+
+    @app.route('/fail')
+    def fail():
+        raise RuntimeError("boom")
+
+    profiling.init_app(app)
+    return app
+
+
+def profiled(client, url, **kwargs):
+    """GETs `url` and closes the response, which is when a profile is saved. Returns its id or None."""
+    with client.get(url, **kwargs) as response:
+        assert response.status_code == 200
+    return response.headers.get('X-Tide-Profile-Id')
+
+
+def saved_profiles():
+    if not os.path.isdir(profiling.PROFILE_DIR):
+        return set()
+    return set(os.listdir(profiling.PROFILE_DIR))
+
+
+def test_nothing_is_installed_without_a_secret(monkeypatch):
+    app = make_app(monkeypatch, None)
+    assert not app.before_request_funcs and 'profile_file' not in app.view_functions
+    before = saved_profiles()
+    assert profiled(app.test_client(), '/work', headers={profiling.PROFILE_HEADER: SECRET}) is None
+    assert saved_profiles() == before
+
+
+@pytest.mark.parametrize("headers, query", [
+    ({profiling.PROFILE_HEADER: "wrong"}, ""),
+    ({}, "?profile=wrong"),
+    ({}, ""),
+])
+def test_wrong_or_missing_secret_isnt_profiled(monkeypatch, headers, query):
+    client = make_app(monkeypatch, SECRET).test_client()
+    before = saved_profiles()
+    assert profiled(client, '/work' + query, headers=headers) is None
+    assert saved_profiles() == before
+
+
+def test_profile_files_are_written_and_served(monkeypatch):
+    client = make_app(monkeypatch, SECRET).test_client()
+    profile_id = profiled(client, '/work?x=1', headers={profiling.PROFILE_HEADER: SECRET})
+    assert {f"{profile_id}.json", f"{profile_id}.folded"} <= saved_profiles()
+
+    with open(os.path.join(profiling.PROFILE_DIR, f"{profile_id}.json")) as f:
+        summary = json.load(f)
+    assert summary['mode'] == "sample" and summary['status'] == 200 and summary['path'] == "/work?x=1"
+    assert summary['samples'] > 0
+    with open(os.path.join(profiling.PROFILE_DIR, f"{profile_id}.folded")) as f:
+        folded = f.read()
+    assert "test_profiling.py:busy_work" in folded
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in folded.splitlines())
+
+    served = client.get(f'/_profile/{profile_id}.json', headers={profiling.PROFILE_HEADER: SECRET})
+    assert served.get_json()['id'] == profile_id
+    assert client.get(f'/_profile/{profile_id}.json').status_code == 404 # Needs the secret too
+
+
+def test_secret_in_the_query_isnt_saved(monkeypatch):
+    client = make_app(monkeypatch, SECRET).test_client()
+    profile_id = profiled(client, f'/work?profile={SECRET}&day=2')
+    with open(os.path.join(profiling.PROFILE_DIR, f"{profile_id}.json")) as f:
+        assert json.load(f)['path'] == "/work?day=2"
+
+
+def test_cprofile_mode_writes_pstats(monkeypatch):
+    client = make_app(monkeypatch, SECRET).test_client()
+    profile_id = profiled(client, '/work?profile_mode=cprofile', headers={profiling.PROFILE_HEADER: SECRET})
+    assert f"{profile_id}.pstats" in saved_profiles()
+
+
+def test_a_failed_request_still_frees_the_profiling_slot(monkeypatch):
+    client = make_app(monkeypatch, SECRET).test_client()
+    with client.get('/fail', headers={profiling.PROFILE_HEADER: SECRET}) as response:
+        assert response.status_code == 500
+    profile_id = response.headers['X-Tide-Profile-Id']
+    with open(os.path.join(profiling.PROFILE_DIR, f"{profile_id}.json")) as f:
+        assert json.load(f)['status'] == 500
+    # Would go unprofiled if the slot were still held
+    assert profiled(client, '/work', headers={profiling.PROFILE_HEADER: SECRET}) is not None
+
+
+def test_a_failing_response_hook_still_frees_the_profiling_slot(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_SECRET", SECRET)
+    app = Flask(__name__)
+    app.route('/work')(busy_work)
+
+    @app.after_request
+    def broken(response): # Registered first, so it runs after the profiling hook
+        raise RuntimeError("hook failed")
+    profiling.init_app(app)
+
+    client = app.test_client()
+    with client.get('/work', headers={profiling.PROFILE_HEADER: SECRET}) as response:
+        assert response.status_code == 500
+    assert not profiling._busy.locked()
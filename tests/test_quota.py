@@ -0,0 +1,103 @@
+# tests/test_quota.py
+
+import json
+import os
+
+import pytest
+
+from cache import TTLCache
+from resilience import DailyQuota, QuotaLedger
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return QuotaLedger(str(tmp_path / "quota.json"))
+
+
+def test_acquire_counts_up_to_the_limit(ledger):
+    quota = DailyQuota("weather", 3, ledger, reserve_fraction=0)
+    assert [quota.acquire() for _ in range(4)] == [True, True, True, False]
+    assert ledger.used() == {"weather": 3}
+    assert quota.exhausted()
+
+
+def test_non_essential_calls_stop_at_the_reserve(ledger):
+    quota = DailyQuota("weather", 10, ledger, reserve_fraction=0.2)
+    assert all(quota.acquire(essential=False) for _ in range(8))
+    assert not quota.acquire(essential=False)
+    assert quota.exhausted(essential=False) and not quota.exhausted()
+    assert quota.acquire() and quota.acquire() # The reserve is still there for essential calls
+    assert not quota.acquire()
+
+
+def test_release_gives_a_call_back_but_never_goes_negative(ledger):
+    quota = DailyQuota("weather", 1, ledger, reserve_fraction=0)
+    quota.acquire()
+    quota.release()
+    quota.release()
+    assert ledger.used() == {"weather": 0}
+    assert quota.acquire()
+
+
+def test_quotas_share_the_file(tmp_path):
+    path = str(tmp_path / "quota.json")
+    first = DailyQuota("geocode", 2, QuotaLedger(path), reserve_fraction=0)
+    second = DailyQuota("geocode", 2, QuotaLedger(path), reserve_fraction=0) # Another worker
+    assert first.acquire() and second.acquire()
+    assert not first.acquire()
+
+
+def test_count_resets_when_the_day_changes(ledger, monkeypatch):
+    quota = DailyQuota("weather", 1, ledger, reserve_fraction=0)
+    monkeypatch.setattr(QuotaLedger, "_today", staticmethod(lambda: "2026-01-01"))
+    assert quota.acquire() and not quota.acquire()
+    monkeypatch.setattr(QuotaLedger, "_today", staticmethod(lambda: "2026-01-02"))
+    assert quota.acquire()
+    with open(ledger.path) as f:
+        assert json.load(f) == {"day": "2026-01-02", "used": {"weather": 1}}
+
+
+def test_a_torn_file_starts_the_day_over(ledger):
+    with open(ledger.path, "w") as f:
+        f.write('{"day": "20')
+    assert DailyQuota("weather", 1, ledger, reserve_fraction=0).acquire()
+    assert ledger.used() == {"weather": 1}
+
+
+def test_unusable_file_counts_in_this_process(tmp_path):
+    ledger = QuotaLedger(str(tmp_path / "missing" / "quota.json"))
+    quota = DailyQuota("weather", 1, ledger, reserve_fraction=0)
+    assert quota.acquire() and not quota.acquire()
+    assert quota.exhausted()
+
+
+def test_reading_usage_never_writes_the_file(ledger, monkeypatch):
+    assert ledger.used() == {}
+    assert not os.path.exists(ledger.path) # Not even created
+
+    monkeypatch.setattr(QuotaLedger, "_today", staticmethod(lambda: "2026-01-01"))
+    DailyQuota("weather", 5, ledger, reserve_fraction=0).acquire()
+    mtime = os.stat(ledger.path).st_mtime_ns
+    monkeypatch.setattr(QuotaLedger, "_today", staticmethod(lambda: "2026-01-02"))
+    assert ledger.used() == {} # Yesterday's count doesn't apply...
+    assert not DailyQuota("weather", 1, ledger, reserve_fraction=0).exhausted()
+    with open(ledger.path) as f:
+        assert json.load(f) == {"day": "2026-01-01", "used": {"weather": 1}} # ...but is left alone
+    assert os.stat(ledger.path).st_mtime_ns == mtime
+
+
+def test_get_or_load_falls_back_to_a_stale_entry():
+    cache = TTLCache("test", ttl_seconds=60, stale_seconds=300)
+    cache.set("k", "old", ttl_seconds=-1) # Expired a second ago
+    assert cache.get("k") is None
+    assert cache.get_stale("k") == "old"
+    assert cache.get_or_load("k", lambda: None) == "old"
+    assert cache.get_or_load("k", lambda: "new") == "new"
+
+
+def test_entries_past_the_stale_window_are_gone():
+    cache = TTLCache("test", ttl_seconds=60, stale_seconds=10)
+    cache.set("k", "old", ttl_seconds=-11)
+    assert cache.get_stale("k") is None
+    assert cache.get_or_load("k", lambda: None) is None
+    assert len(cache) == 0
@@ -0,0 +1,113 @@
+# tests/test_rate_limiter.py
+
+import pytest
+
+import resilience
+from resilience import RateLimiter
+
+
+class Clock:
+    """Stands in for time.monotonic and time.sleep; sleeping moves the clock on."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(resilience.time, "sleep", clock.sleep)
+    return clock
+
+
+def test_burst_goes_through_without_waiting(clock):
+    limiter = RateLimiter(rate=2, burst=3)
+    assert all(limiter.acquire() for _ in range(3))
+    assert clock.slept == []
+
+
+def test_waits_for_the_next_token(clock):
+    limiter = RateLimiter(rate=2, burst=1)
+    assert limiter.acquire()
+    assert limiter.acquire()
+    assert clock.slept == [pytest.approx(0.5)]
+
+
+def test_refuses_rather_than_wait_past_max_wait(clock):
+    limiter = RateLimiter(rate=1, burst=1)
+    assert limiter.acquire()
+    assert not limiter.acquire(max_wait=0.5)
+    assert clock.slept == []
+    assert limiter.acquire(max_wait=1.0) # A refusal doesn't take the token
+    assert clock.slept == [pytest.approx(1.0)]
+
+
+def test_tokens_refill_up_to_burst_only(clock):
+    limiter = RateLimiter(rate=1, burst=2)
+    limiter.acquire()
+    limiter.acquire()
+    clock.now += 60
+    assert limiter.acquire(max_wait=0) and limiter.acquire(max_wait=0)
+    assert not limiter.acquire(max_wait=0)
+
+
+def test_concurrent_callers_queue_behind_reserved_tokens(clock, monkeypatch):
+    limiter = RateLimiter(rate=1, burst=1)
+    limiter.acquire()
+    # Another caller takes the next token and is still sleeping for it...
+    monkeypatch.setattr(resilience.time, "sleep", lambda seconds: None)
+    assert limiter.acquire()
+    # ...so this one would wait two intervals
+    assert not limiter.acquire(max_wait=1.5)
+    assert limiter.acquire(max_wait=2.0)
+
+
+def test_open_circuit_refuses_before_waiting_for_a_token(clock, monkeypatch):
+    limiter = RateLimiter(rate=1, burst=1)
+    limiter.acquire()
+    monkeypatch.setitem(resilience._limiters, "test-upstream", limiter)
+    monkeypatch.setitem(resilience.RATE_LIMITS, "test-upstream", 1)
+    breaker = resilience.CircuitBreaker("test-upstream")
+    breaker.state = resilience.CircuitBreaker.OPEN
+    breaker.opened_at = clock.now
+    monkeypatch.setitem(resilience._breakers, "test-upstream", breaker)
+
+    assert resilience.call_timeout("test-upstream") is None
+    assert clock.slept == []
+
+
+def test_rate_limit_refusal_frees_the_half_open_probe(clock, monkeypatch):
+    limiter = RateLimiter(rate=1, burst=1)
+    limiter.acquire()
+    monkeypatch.setitem(resilience._limiters, "test-upstream", limiter)
+    monkeypatch.setitem(resilience.RATE_LIMITS, "test-upstream", 1)
+    breaker = resilience.CircuitBreaker("test-upstream")
+    breaker.state = resilience.CircuitBreaker.HALF_OPEN
+    monkeypatch.setitem(resilience._breakers, "test-upstream", breaker)
+    resilience.start_budget(resilience.MIN_UPSTREAM_TIMEOUT + 0.1)
+    try:
+        assert resilience.call_timeout("test-upstream") is None
+    finally:
+        resilience.clear_budget()
+    assert breaker.allow() # The probe wasn't used, so it's still on offer
+
+
+def test_spent_quota_refuses_before_waiting_for_a_token(clock, monkeypatch, tmp_path):
+    limiter = RateLimiter(rate=1, burst=1)
+    limiter.acquire()
+    monkeypatch.setitem(resilience._limiters, "test-upstream", limiter)
+    monkeypatch.setitem(resilience.RATE_LIMITS, "test-upstream", 1)
+    quota = resilience.DailyQuota("test-upstream", 0, resilience.QuotaLedger(str(tmp_path / "quota.json")))
+    monkeypatch.setitem(resilience._quotas, "test-upstream", quota)
+
+    assert resilience.call_timeout("test-upstream") is None
+    assert clock.slept == []
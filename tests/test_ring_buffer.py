@@ -0,0 +1,77 @@
+# tests/test_ring_buffer.py
+
+import numpy as np
+
+from observations import RingBuffer
+
+
+def test_empty():
+    buffer = RingBuffer(4)
+    assert len(buffer) == 0
+    assert buffer.last_time is None
+    times, values = buffer.arrays()
+    assert len(times) == 0 and len(values) == 0
+    assert buffer.extend([], []) == 0
+
+
+def test_single_sample():
+    buffer = RingBuffer(4)
+    assert buffer.extend([100], [1.5]) == 1
+    assert buffer.last_time == 100
+    times, values = buffer.arrays()
+    assert times.tolist() == [100] and values.tolist() == [1.5]
+
+
+def test_capacity_of_one():
+    buffer = RingBuffer(1)
+    buffer.extend([100, 200], [1.0, 2.0])
+    buffer.extend([300], [3.0])
+    times, values = buffer.arrays()
+    assert times.tolist() == [300] and values.tolist() == [3.0]
+
+
+def test_wraps_around_oldest_first():
+    buffer = RingBuffer(4)
+    buffer.extend([1, 2, 3], [10, 20, 30])
+    assert buffer.extend([4, 5, 6], [40, 50, 60]) == 3
+    assert len(buffer) == 4
+    times, values = buffer.arrays()
+    assert times.tolist() == [3, 4, 5, 6]
+    assert values.tolist() == [30, 40, 50, 60]
+    assert buffer.last_time == 6
+
+
+def test_more_samples_than_capacity_keeps_the_newest():
+    buffer = RingBuffer(3)
+    buffer.extend(np.arange(10), np.arange(10) * 1.5)
+    times, values = buffer.arrays()
+    assert times.tolist() == [7, 8, 9]
+    assert values.tolist() == [10.5, 12.0, 13.5]
+
+
+def test_only_newer_samples_are_added():
+    buffer = RingBuffer(5)
+    buffer.extend([10, 20], [1, 2])
+    # An overlapping poll: 10 and 20 are already held
+    assert buffer.extend([10, 20, 30], [9, 9, 3]) == 1
+    times, values = buffer.arrays()
+    assert times.tolist() == [10, 20, 30]
+    assert values.tolist() == [1, 2, 3]
+    assert buffer.extend([5, 15], [0, 0]) == 0
+
+
+def test_arrays_since():
+    buffer = RingBuffer(4)
+    buffer.extend([1, 2, 3, 4, 5, 6], [1, 2, 3, 4, 5, 6])
+    times, _ = buffer.arrays(since=5)
+    assert times.tolist() == [5, 6]
+    times, _ = buffer.arrays(since=100)
+    assert times.tolist() == []
+
+
+def test_arrays_are_copies():
+    buffer = RingBuffer(2)
+    buffer.extend([1], [1.0])
+    times, values = buffer.arrays()
+    values[0] = 99
+    assert buffer.arrays()[1].tolist() == [1.0]
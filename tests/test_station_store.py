@@ -0,0 +1,84 @@
+# tests/test_station_store.py
+
+import pytest
+
+from station_store import StationStore
+
+RECORDS = [
+    ("8571858", "Sharptown", 38.5367, -75.7233),
+    ("8575512", "Annapolis", 38.9833, -76.4816),
+    ("TEC4633", "Léon's Point", 37.0, -76.0), # A longer ID widens every ID; non-ASCII name
+    ("9414290", "San Francisco", 37.8063, -122.4659),
+]
+
+
+@pytest.fixture
+def store():
+    return StationStore.from_records(RECORDS, fetched_at=1234.5)
+
+
+def test_from_records_keeps_every_field(store):
+    assert len(store) == 4
+    assert [store.station(i) for i in range(len(store))] == [
+        (station_id, name, lat, lon) for station_id, name, lat, lon in RECORDS]
+
+
+def test_lookup(store):
+    assert store.lookup("8575512") == RECORDS[1]
+    assert store.lookup("TEC4633") == RECORDS[2]
+    assert store.lookup("0000000") is None
+    assert store.lookup("857185") is None # A prefix isn't a match
+
+
+def test_save_and_load_round_trip(store, tmp_path):
+    path = str(tmp_path / "stations.bin")
+    store.save(path)
+    loaded = StationStore.load(path)
+    assert loaded.fetched_at == 1234.5
+    assert [loaded.station(i) for i in range(len(loaded))] == [store.station(i) for i in range(len(store))]
+
+
+def test_empty_store(tmp_path):
+    store = StationStore.from_records([])
+    assert store.empty
+    assert store.nearest(38.5, -75.7) == (None, None)
+    assert store.nearest_k(38.5, -75.7, 3) == []
+    path = str(tmp_path / "stations.bin")
+    store.save(path)
+    assert StationStore.load(path).empty
+
+
+def test_nearest(store):
+    row, miles = store.nearest(38.54, -75.72)
+    assert store.station_id(row) == "8571858"
+    assert miles < 1
+
+
+def test_nearest_k_is_sorted_and_capped(store):
+    nearest = store.nearest_k(38.54, -75.72, 10)
+    assert len(nearest) == len(store)
+    distances = [miles for _, miles in nearest]
+    assert distances == sorted(distances)
+    assert store.station_id(nearest[-1][0]) == "9414290"
+    assert store.nearest_k(38.54, -75.72, 0) == []
+
+
+def test_distances_match_geopy(store):
+    from geopy.distance import great_circle
+    expected = [great_circle((38.9833, -76.4816), (lat, lon)).miles for _, _, lat, lon in RECORDS]
+    assert list(store.distances_miles(38.9833, -76.4816)) == pytest.approx(expected, rel=1e-9)
+
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / "stations.bin"
+    path.write_bytes(b"not a station store at all, but long enough to have a header")
+    with pytest.raises(ValueError):
+        StationStore.load(str(path))
+
+
+def test_load_rejects_a_truncated_file(store, tmp_path):
+    path = tmp_path / "stations.bin"
+    store.save(str(path))
+    path.write_bytes(path.read_bytes()[:-10])
+    with pytest.raises(ValueError):
+        StationStore.load(str(path))
@@ -0,0 +1,94 @@
+# tests/test_station_time.py
+
+import sys
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+import pytz
+
+import services.geocoding as geocoding
+from config import LOCAL_TIMEZONE
+from services.noaa import gmt_date_range, to_station_time
+
+NEW_YORK = pytz.timezone("America/New_York")
+
+
+def gmt_frame(first, hours):
+    times = pd.date_range(first, periods=hours, freq="h")
+    return pd.DataFrame({'datetime': times, 'height_ft': range(hours)})
+
+
+def local_times(df):
+    return [(t.strftime("%H:%M"), t.utcoffset() / timedelta(hours=1)) for t in df['datetime']]
+
+
+def test_spring_forward_skips_the_missing_hour():
+    df = to_station_time(gmt_frame("2026-03-08 05:00", 5), NEW_YORK)
+    assert local_times(df) == [("00:00", -5), ("01:00", -5), ("03:00", -4), ("04:00", -4), ("05:00", -4)]
+
+
+def test_fall_back_keeps_both_copies_of_the_repeated_hour_in_order():
+    df = to_station_time(gmt_frame("2026-11-01 04:00", 5), NEW_YORK)
+    assert local_times(df) == [("00:00", -4), ("01:00", -4), ("01:00", -5), ("02:00", -5), ("03:00", -5)]
+    assert df['height_ft'].tolist() == [0, 1, 2, 3, 4]
+
+
+def test_window_across_a_change_keeps_start_and_drops_end():
+    start = NEW_YORK.localize(datetime(2026, 11, 1))
+    end = NEW_YORK.localize(datetime(2026, 11, 2))
+    df = to_station_time(gmt_frame("2026-10-31 23:00", 30), NEW_YORK, start, end)
+    assert len(df) == 25 # The day has an extra hour
+    assert df['datetime'].iloc[0] == start
+    assert df['datetime'].iloc[-1] == end - timedelta(hours=1)
+    assert df.index.tolist() == list(range(5, 30)) # Rows keep their index labels
+
+
+def test_missing_data_stays_missing():
+    assert to_station_time(None, NEW_YORK) is None
+
+
+def test_gmt_dates_for_local_days():
+    start = NEW_YORK.localize(datetime(2026, 3, 8))
+    end = NEW_YORK.localize(datetime(2026, 3, 9))
+    assert gmt_date_range(start, end) == ("20260308", "20260309") # Local midnight is 04:00 or 05:00 GMT
+    hawaii = pytz.timezone("Pacific/Honolulu")
+    assert gmt_date_range(hawaii.localize(datetime(2026, 1, 1, 15)),
+                          hawaii.localize(datetime(2026, 1, 1, 16))) == ("20260102", "20260102")
+
+
+@pytest.fixture
+def region_table(monkeypatch):
+    """get_station_timezone() without timezonefinder, so the region table answers."""
+    monkeypatch.setitem(sys.modules, "timezonefinder", None) # Makes the import fail
+    geocoding._lookup_timezone.cache_clear()
+    yield geocoding.get_station_timezone
+    geocoding._lookup_timezone.cache_clear()
+
+
+@pytest.mark.parametrize("lat, lon, zone", [
+    (38.54, -75.72, "America/New_York"),     # Sharptown, MD
+    (47.60, -122.34, "America/Los_Angeles"), # Seattle
+    (21.31, -157.87, "Pacific/Honolulu"),
+    (51.86, -176.63, "America/Adak"),
+    (52.94, 173.20, "America/Adak"),         # Attu, across the antimeridian
+    (61.24, -149.89, "America/Anchorage"),
+    (18.46, -66.12, "America/Puerto_Rico"),
+    (46.78, -92.09, "America/Chicago"),      # Duluth
+    (43.04, -87.90, "America/Chicago"),      # Milwaukee
+    (30.69, -88.04, "America/Chicago"),      # Mobile
+    (29.72, -84.98, "America/New_York"),     # Just east of the Apalachicola
+    (13.44, 144.65, "Pacific/Guam"),
+])
+def test_region_table(region_table, lat, lon, zone):
+    assert region_table(lat, lon).zone == zone
+
+
+def test_outside_every_region_uses_the_longitude(region_table):
+    assert region_table(0.0, -30.0).zone == "Etc/GMT+2"
+    assert region_table(0.0, 45.0).zone == "Etc/GMT-3"
+    assert region_table(0.0, 3.0).zone == "UTC"
+
+
+def test_no_coordinates(region_table):
+    assert region_table(None, -75.0) is LOCAL_TIMEZONE
@@ -0,0 +1,92 @@
+# tests/test_streaming.py
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app as tide_app
+from admission import admission
+from app import LazyHtml, STREAM_FLUSH_MARKER, _buffered
+from cache import table_cache
+
+
+@pytest.fixture
+def events(monkeypatch):
+    """Fakes NOAA for the page, logging each request in order with the chunks the client receives."""
+    events = []
+
+    def get_tide_data(station_id, start_date, end_date, product, datum, time_zone, interval):
+        events.append(("fetch", interval))
+        first = datetime.strptime(start_date, "%Y%m%d")
+        last = datetime.strptime(end_date, "%Y%m%d") + timedelta(days=1)
+        if interval == "h":
+            times = pd.date_range(first, last, freq="h", inclusive="left")
+            return pd.DataFrame({'datetime': times, 'height_ft': 2 + np.sin(np.arange(len(times)) / 2.0)})
+        times = pd.date_range(first, last, freq="372min", inclusive="left")
+        return pd.DataFrame({'datetime': times, 'height_ft': np.where(np.arange(len(times)) % 2, 1.0, 3.0),
+                             'tide_type': np.where(np.arange(len(times)) % 2, 'L', 'H')})
+
+    monkeypatch.setattr(tide_app, "get_tide_data", get_tide_data)
+    monkeypatch.setattr(tide_app, "fetch_observation_summary", lambda station_id: None)
+    table_cache.clear()
+    yield events
+    table_cache.clear()
+
+
+def stream(query, events):
+    client = tide_app.app.test_client()
+    with client.get(query, buffered=False) as response:
+        assert response.status_code == 200
+        for chunk in response.response:
+            events.append(("chunk", chunk.decode("utf-8") if isinstance(chunk, bytes) else chunk))
+    return [item for kind, item in events if kind == "chunk"]
+
+
+def test_shell_goes_out_before_any_fetch_and_the_summary_before_the_table(events):
+    chunks = stream("/?stream=1", events)
+    body = "".join(chunks)
+    assert STREAM_FLUSH_MARKER not in body
+    assert body.rstrip().endswith("</html>")
+    assert len(chunks) > 2
+    assert admission.in_flight == 0
+
+    kinds = [kind for kind, _ in events]
+    assert kinds[0] == "chunk" # The page starts before NOAA is asked for anything
+    assert [item for kind, item in events if kind == "fetch"] == ["hilo", "h"]
+
+    def first_chunk_with(text):
+        return next(i for i, (kind, item) in enumerate(events) if kind == "chunk" and text in item)
+    summary, table = first_chunk_with("Next High Tide"), first_chunk_with("<tbody")
+    assert summary < table
+    assert summary < events.index(("fetch", "h")) # Sent while the hourly predictions were still to come
+    assert body.index("Next High Tide") < body.index("combined-forecast")
+
+
+def test_upstream_failure_partway_through_still_finishes_the_page(events, monkeypatch):
+    fake = tide_app.get_tide_data
+
+    def hourly_fails(**kwargs):
+        return None if kwargs['interval'] == "h" else fake(**kwargs)
+    monkeypatch.setattr(tide_app, "get_tide_data", hourly_fails)
+
+    body = "".join(stream("/?stream=1", events))
+    assert "Next High Tide" in body
+    assert body.rstrip().endswith("</html>")
+    # Flashed after the headers went out, so shown at the end of the page instead
+    assert "Hourly tide predictions are unavailable right now" in body
+    assert admission.in_flight == 0 # The admission slot went back when the stream closed
+
+
+def test_buffered_flushes_at_markers_and_joins_the_rest():
+    chunks = ["<a>", "b", f"c{STREAM_FLUSH_MARKER}d", "e", f"{STREAM_FLUSH_MARKER}", "f"]
+    assert list(_buffered(iter(chunks))) == ["<a>bc", "de", "f"]
+
+
+def test_lazy_html_is_computed_once_when_rendered():
+    calls = []
+    html = LazyHtml(lambda: calls.append(1) or "<p>late</p>")
+    assert calls == []
+    assert html.__html__() == "<p>late</p>" and str(html) == "<p>late</p>"
+    assert calls == [1]
@@ -0,0 +1,69 @@
+# tests/test_tide_plot.py
+
+import re
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytz
+
+import tide_plot
+from tide_plot import plot_series, render_svg
+
+TZ = pytz.timezone("America/New_York")
+STATION = {'id': "8571858", 'name': "Sharptown", 'tz': TZ}
+
+
+def series(start, end):
+    times = np.arange(int(start.timestamp()), int(end.timestamp()) + 1, 360)
+    return {
+        'days': (end - start).total_seconds() / 86400, 'start': start, 'end': end,
+        'times': times, 'heights': np.sin(times / 22357.0) + 1.5, 'hilo': [],
+        'weather_times': np.array([]), 'precip_pct': np.array([]), 'wind_mph': np.array([]),
+    }
+
+
+def day_labels(svg):
+    return re.findall(r'>(\w{3} \d\d/\d\d)<', svg)
+
+
+def test_whole_days_are_gridded_and_labelled_at_midnight():
+    start = TZ.localize(datetime(2026, 3, 7))
+    svg = render_svg(STATION, series(start, TZ.localize(datetime(2026, 3, 10))))
+    assert day_labels(svg) == ["Sat 03/07", "Sun 03/08", "Mon 03/09"]
+    assert svg.count('stroke="#ddd"') == 4 # Both edges and two midnights, across the DST change
+
+
+def test_a_plot_from_the_current_hour_covers_the_table_range():
+    start = TZ.localize(datetime(2026, 3, 7, 15))
+    svg = render_svg(STATION, series(start, start + timedelta(hours=30)))
+    assert day_labels(svg) == ["Sat 03/07", "Sun 03/08"]
+    assert svg.count('stroke="#ddd"') == 1 # Only Sunday's midnight falls inside
+
+
+def test_a_sliver_of_a_first_day_is_left_unlabelled():
+    start = TZ.localize(datetime(2026, 3, 7, 23))
+    svg = render_svg(STATION, series(start, start + timedelta(hours=30)))
+    assert day_labels(svg) == ["Sun 03/08", "Mon 03/09"]
+
+
+def test_curve_is_interpolated_from_the_pages_predictions(monkeypatch):
+    requested = []
+
+    def get_tide_data(station_id, start_date, end_date, **kwargs):
+        requested.append((start_date, end_date, kwargs['interval']))
+        first = datetime.strptime(start_date, "%Y%m%d")
+        if kwargs['interval'] == "h":
+            times = pd.date_range(first, periods=24 * 5, freq="h")
+            return pd.DataFrame({'datetime': times, 'height_ft': np.sin(np.arange(len(times)) / 2.0) + 2})
+        times = pd.date_range(first, periods=20, freq="372min")
+        return pd.DataFrame({'datetime': times, 'height_ft': [3.0, 1.0] * 10, 'tide_type': ['H', 'L'] * 10})
+    monkeypatch.setattr(tide_plot, "get_tide_data", get_tide_data)
+
+    start = TZ.normalize(datetime.now(TZ).replace(minute=0, second=0, microsecond=0))
+    series_ = plot_series(STATION, start, start + timedelta(hours=30), weather=False)
+    assert sorted(interval for _, _, interval in requested) == ["h", "hilo"] # No 6-minute fetch
+    assert series_['times'][0] == start.timestamp()
+    assert series_['times'][-1] == (start + timedelta(hours=30)).timestamp()
+    assert np.all(np.diff(series_['times']) == 360)
+    assert not np.isnan(series_['heights']).any()
@@ -0,0 +1,79 @@
+# tests/test_tide_windows.py
+
+import numpy as np
+import pytest
+
+from tide_windows import find_windows
+
+TIMES = np.arange(0, 3600 + 1, 600) # Seven points, 10 minutes apart
+
+
+def test_no_grid_or_a_single_point_finds_nothing():
+    assert find_windows([], np.empty((1, 0)), min_tide_ft=1) == []
+    assert find_windows([0], [5.0], min_tide_ft=1) == []
+
+
+def test_open_and_close_are_interpolated():
+    tide = [0, 2, 2, 2, 2, 0, 0]
+    [window] = find_windows(TIMES, tide, min_tide_ft=1)
+    assert window['station'] == 0
+    assert window['start'] == pytest.approx(300) # Halfway from 0 ft to 2 ft
+    assert window['end'] == pytest.approx(2700)
+    assert window['duration_minutes'] == pytest.approx(40)
+    assert window['peak_tide_ft'] == 2 and window['low_tide_ft'] == 2
+
+
+def test_windows_touching_the_ends_are_closed_there():
+    [window] = find_windows(TIMES, np.full(len(TIMES), 3.0), min_tide_ft=1)
+    assert (window['start'], window['end']) == (TIMES[0], TIMES[-1])
+
+
+def test_no_thresholds_means_wherever_there_is_a_tide():
+    tide = [1, 1, np.nan, np.nan, 1, 1, 1]
+    windows = find_windows(TIMES, tide)
+    assert [(w['start'], w['end']) for w in windows] == [(0, 600), (2400, 3600)]
+
+
+def test_several_stations_in_one_pass():
+    tide = np.array([
+        [0, 2, 2, 0, 0, 0, 0],
+        [0, 0, 0, 0, 0, 0, 0],
+        [0, 0, 0, 0, 2, 2, 0],
+    ])
+    windows = find_windows(TIMES, tide, min_tide_ft=1)
+    assert [w['station'] for w in windows] == [0, 2]
+
+
+def test_latest_opening_and_earliest_closing_margin_win():
+    tide = [0, 2, 2, 2, 2, 2, 2]
+    wind = [0, 20, 0, 0, 0, 20, 20]
+    [window] = find_windows(TIMES, tide, wind_mph=wind, min_tide_ft=1, max_wind_mph=10)
+    # Wind drops below 10 mph halfway from 600 to 1200, after the tide has risen
+    assert window['start'] == pytest.approx(900)
+    assert window['end'] == pytest.approx(2700)
+    assert window['max_wind_mph'] == 0
+
+
+def test_missing_weather_doesnt_block_but_is_flagged():
+    tide = np.full(len(TIMES), 2.0)
+    wind = [0, 0, 0, np.nan, np.nan, np.nan, np.nan]
+    [window] = find_windows(TIMES, tide, wind_mph=wind, min_tide_ft=1, max_wind_mph=10)
+    assert (window['start'], window['end']) == (TIMES[0], TIMES[-1])
+    assert not window['weather_checked']
+    [checked] = find_windows(TIMES[:3], tide[:3], wind_mph=wind[:3], min_tide_ft=1, max_wind_mph=10)
+    assert checked['weather_checked']
+
+
+def test_min_duration_drops_short_windows():
+    tide = [0, 2, 0, 2, 2, 2, 0]
+    windows = find_windows(TIMES, tide, min_tide_ft=1, min_duration_minutes=15)
+    assert len(windows) == 1
+    assert windows[0]['start'] == pytest.approx(1500)
+    assert find_windows(TIMES, tide, min_tide_ft=1, min_duration_minutes=1000) == []
+
+
+def test_max_tide():
+    tide = [4, 4, 0, 0, 4, 4, 4]
+    [window] = find_windows(TIMES, tide, max_tide_ft=2)
+    assert window['start'] == pytest.approx(900)
+    assert window['end'] == pytest.approx(2100)
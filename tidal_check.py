@@ -1,473 +1,472 @@
-import requests
-import pandas as pd
+"""
+Tide and weather report from the command line.
+
+    python tidal_check.py                                   # prompt for a ZIP code, print a report
+    python tidal_check.py --zip 21871                       # same, without the prompt
+    python tidal_check.py --station 8571858 --days 3
+    python tidal_check.py --batch marinas.txt --output marinas.csv
+    python tidal_check.py --batch marinas.txt --output marinas.parquet --workers 8 --report run.csv
+    python tidal_check.py --batch marinas.txt --min-tide 3 --max-wind 12 --max-precip 30 --days 14
+
+Batch files list one location per line: "zip:21871", "station:8571858", or a bare
+5-digit ZIP code / 7-digit station ID. Blank lines and "#" comments are ignored.
+Giving any of --min-tide, --max-tide, --max-wind or --max-precip switches to a
+"good tide window" search: it lists the times in the next --days days when every
+condition holds, for all the stations given.
+
+Items are resolved and fetched concurrently through the web app's services, so they
+share its caches (station catalog, geocodes, predictions, weather) and per-provider
+rate limits. Rows are appended to the output as each item finishes.
+
+API keys come from the same place as the web app: AWS Secrets Manager, or
+PIRATE_WEATHER_API_KEY / OPENCAGE_API_KEY in the environment or my_tide_app/.env.
+"""
+
+import argparse
+import contextlib
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta, timezone
-import json
-import pytz
-from geopy.geocoders import OpenCage # New Import
-from geopy.distance import great_circle # New Import
-
-# --- API Keys ---
 
-PIRATE_WEATHER_API_KEY = "lmTROGhlgrRkf7IzzTOm37PcyPg4xKoK" # Your actual API key goes here
-if PIRATE_WEATHER_API_KEY == "YOUR_PIRATE_WEATHER_API_KEY":
-    print("WARNING: Please replace 'YOUR_PIRATE_WEATHER_API_KEY' with your actual API key from pirate-weather.apiable.io to get weather data.")
+import pandas as pd
 
-OPENCAGE_API_KEY = "455daa915a4744acb649dc96f6f4a4d6" # Your actual OpenCage API key goes here
-if OPENCAGE_API_KEY == "YOUR_OPENCAGE_API_KEY":
-    print("WARNING: Please replace 'YOUR_OPENCAGE_API_KEY' with your actual OpenCage API key to use ZIP code search.")
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "my_tide_app")
+sys.path.insert(0, APP_DIR)
 
+from config import ( # noqa: E402
+    PIRATE_WEATHER_API_KEY, OPENCAGE_API_KEY,
+    DEFAULT_STATION_ID, DEFAULT_STATION_NAME, DEFAULT_LATITUDE, DEFAULT_LONGITUDE
+)
+from services.geocoding import ( # noqa: E402
+    get_coordinates_from_zip, get_noaa_tide_stations, find_closest_station, get_station_timezone
+)
+from services.noaa import get_tide_data, local_day_window, gmt_date_range, to_station_time # noqa: E402
+from services.pirate_weather import get_pirate_weather_report, hourly_weather_dataframe # noqa: E402
+from tide_windows import query_windows # noqa: E402
 
-# Define the local timezone (used for all output and calculations)
-LOCAL_TIMEZONE = pytz.timezone('America/New_York')
+# Columns of the tidy batch output, in order
+TIDY_COLUMNS = [
+    "query", "station_id", "station_name", "station_lat", "station_lon",
+    "time_utc", "time_local", "event", "height_ft",
+    "weather_summary", "temp_f", "precip_prob", "wind_speed_mph", "humidity_percent",
+]
 
-# Define the date range (e.g., today and the next two days for a good plot)
-today = datetime.now()
-end_date = today + timedelta(days=2) # Get data for today and the next two days
-start_date_str = today.strftime("%Y%m%d")
-end_date_str = end_date.strftime("%Y%m%d")
+# Weather is only attached to a tide row if the forecast hour is this close
+WEATHER_MATCH_TOLERANCE = pd.Timedelta(minutes=30)
 
 
-#ZIP Code to Station Search
-def get_coordinates_from_zip(zip_code, api_key):
-    """
-    Converts a ZIP code to latitude and longitude using OpenCage Geocoding API.
-    """
-    geolocator = OpenCage(api_key)
-    try:
-        # REMOVED 'countrycode="us"' as it causes an error with your geopy version
-        location = geolocator.geocode(zip_code)
-        if location:
-            return (location.latitude, location.longitude)
-        else:
-            print(f"Could not find coordinates for ZIP code: {zip_code}")
-            return None
-    except Exception as e:
-        print(f"Error getting coordinates for {zip_code}: {e}")
-        return None
+class ItemError(Exception):
+    """A batch item that couldn't be resolved or fetched."""
 
-def find_closest_station(target_lat, target_lon, all_stations_df):
-    """
-    Finds the closest NOAA tide station to a given latitude and longitude.
 
-    Args:
-        target_lat (float): Latitude of the target location.
-        target_lon (float): Longitude of the target location.
-        all_stations_df (pd.DataFrame): DataFrame containing NOAA station data
-                                        with 'id', 'name', 'lat', 'lon' columns.
+# --- Resolving locations ---
 
-    Returns:
-        tuple: (station_id, station_name, station_lat, station_lon) of the closest station,
-               or (None, None, None, None) if no stations are available.
-    """
-    if all_stations_df is None or all_stations_df.empty:
-        print("No NOAA stations available to find the closest one.")
-        return None, None, None, None
-
-    target_coords = (target_lat, target_lon)
-    
-    closest_station = None
-    min_distance = float('inf')
-
-    # Convert DataFrame to a list of tuples for efficient iteration
-    # This avoids repeated .iterrows() which can be slow for large DFs
-    # And ensures we're only working with the necessary columns
-    station_records = all_stations_df[['id', 'name', 'lat', 'lon']].to_records(index=False)
-
-    for record in station_records:
-        station_id, station_name, station_lat, station_lon = record
-        
-        station_coords = (station_lat, station_lon)
-        distance = great_circle(target_coords, station_coords).miles # Distance in miles
-
-        if distance < min_distance:
-            min_distance = distance
-            closest_station = (station_id, station_name, station_lat, station_lon)
-
-    if closest_station:
-        print(f"DEBUG: Closest station found: {closest_station[1]} (ID: {closest_station[0]}) at {min_distance:.2f} miles.")
-        return closest_station
-    else:
-        print("No closest station could be determined.")
-        return None, None, None, None
-    
-def get_noaa_tide_stations():
+def parse_batch_file(path):
     """
-    Fetches a list of all NOAA tide stations with their IDs and coordinates.
+    Reads a batch file into a list of (kind, value) pairs, kind being "zip" or "station".
     """
-    stations_url = "https://api.tidesandcurrents.noaa.gov/mdapi/prod/webapi/stations.json"
-    try:
-        response = requests.get(stations_url, timeout=10)
-        response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
-        stations_data = response.json()
-
-        stations_list = []
-        
-        # --- DEBUGGING PRINTS ---
-        print(f"DEBUG: NOAA API response received. Top-level keys: {list(stations_data.keys())}")
-        if 'stations' not in stations_data:
-            print("DEBUG: 'stations' key is MISSING from NOAA response. This is unexpected.")
-            return None
-        if not isinstance(stations_data['stations'], list):
-            print("DEBUG: 'stations' value is NOT a list. This is unexpected.")
-            return None
-        print(f"DEBUG: 'stations' list contains {len(stations_data['stations'])} items.")
-        # --- END DEBUGGING PRINTS ---
-
-        total_stations_processed = 0
-        active_valid_stations_count = 0
-
-        for station in stations_data['stations']:
-            total_stations_processed += 1
-            is_active_raw = station.get('active') # Get raw value
-            lat_raw = station.get('lat')
-            lng_raw = station.get('lng') # Use lng as confirmed
-
-            # --- CRITICAL FIX: Modified logic for 'is_active_pass' ---
-            # A station passes the 'active' check if its 'active' field is explicitly True,
-            # OR if its 'active' field is None (as observed in the truncated data).
-            # It only fails if 'active' is explicitly False.
-            is_active_pass = (is_active_raw is True) or (is_active_raw is None)
-
-            has_lat = lat_raw is not None
-            has_lng = lng_raw is not None
-
-            # Debugging prints for a few problematic stations (first 5 and last 5)
-            # This print statement is only triggered if the station IS BEING EXCLUDED.
-            if not (is_active_pass and has_lat and has_lng):
-                if total_stations_processed <= 5 or total_stations_processed > len(stations_data['stations']) - 5:
-                    print(f"DEBUG: Station {station.get('id', 'N/A')}: Active={is_active_raw} (Pass:{is_active_pass}), Lat={lat_raw} (Valid:{has_lat}), Lng={lng_raw} (Valid:{has_lng}) - Excluded.")
-
-            if is_active_pass and has_lat and has_lng:
-                active_valid_stations_count += 1
-                stations_list.append({
-                    'id': station['id'],
-                    'name': station['name'],
-                    'lat': lat_raw,
-                    'lon': lng_raw # Store as 'lon' in DataFrame for consistency with geopy/elsewhere
-                })
-
-        print(f"DEBUG: Finished processing stations. Total processed: {total_stations_processed}, Included in list: {active_valid_stations_count}")
-
-        if not stations_list:
-            print("NOAA API returned data, but no active stations with valid coordinates were found.")
-            return None
-        return pd.DataFrame(stations_list)
-
-    except requests.exceptions.Timeout:
-        print(f"Timeout Error: Request to NOAA station list API timed out after 10 seconds.")
-        return None
-    except requests.exceptions.HTTPError as e:
-        print(f"HTTP Error fetching NOAA stations: {e} - Response content: {e.text[:500]}")
-        return None
-    except requests.exceptions.ConnectionError as e:
-        print(f"Connection Error fetching NOAA stations: {e}")
-        return None
-    except requests.exceptions.RequestException as e:
-        print(f"An unknown error occurred while fetching NOAA stations: {e}")
-        return None
-    except ValueError as e: # Catch JSON decoding errors
-        print(f"Error parsing JSON from NOAA station list: {e}")
-        print(f"Problematic response content (first 500 chars): {response.text[:500]}")
-        return None
-    
-# Set default values to Sharptown, MD
-your_station_id = "8571858"
-station_name = "Sharptown, Nanticoke River, MD"
-sharptown_latitude = 38.3970
-sharptown_longitude = -75.7600
-
-# Attempt to find station via ZIP code if API key is provided
-if OPENCAGE_API_KEY != "YOUR_OPENCAGE_API_KEY":
-    zip_code_input = input("Enter a ZIP code to find the closest tide station (e.g., 21871 for Sharptown, MD): ")
-    if zip_code_input:
-        print(f"Searching for closest tide station to ZIP code {zip_code_input}...")
-        target_lat, target_lon = get_coordinates_from_zip(zip_code_input, OPENCAGE_API_KEY)
-
-        if target_lat is not None and target_lon is not None:
-            all_noaa_stations = get_noaa_tide_stations()
-            if all_noaa_stations is not None:
-                found_id, found_name, found_lat, found_lon = \
-                    find_closest_station(target_lat, target_lon, all_noaa_stations)
-
-                if found_id: # If a station was successfully found
-                    your_station_id = found_id
-                    station_name = found_name
-                    sharptown_latitude = found_lat
-                    sharptown_longitude = found_lon
-                    print(f"Closest station found: {station_name} (ID: {your_station_id}) at Lat: {sharptown_latitude:.4f}, Lon: {sharptown_longitude:.4f}")
-                else:
-                    print("Could not find a closest station. Using default Sharptown, MD station.")
+    items = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            kind, sep, value = line.partition(":")
+            if sep:
+                kind, value = kind.strip().lower(), value.strip()
+                if kind not in ("zip", "station"):
+                    raise SystemExit(f"{path}:{line_number}: unknown item type '{kind}'")
+            elif line.isdigit() and len(line) == 5:
+                kind, value = "zip", line
+            elif len(line) == 7:
+                kind, value = "station", line
             else:
-                print("Failed to retrieve NOAA station list. Using default Sharptown, MD station.")
-        else:
-            print("Failed to convert ZIP code to coordinates. Using default Sharptown, MD station.")
-    else:
-        print("No ZIP code entered. Using default Sharptown, MD station.")
-else:
-    print("\nNo OpenCage API Key provided. Using default Sharptown, MD station.")
+                raise SystemExit(f"{path}:{line_number}: can't tell whether '{line}' is a ZIP code or station ID")
+            items.append((kind, value))
+    return items
 
-def get_tide_data(station_id, start_date, end_date, product="predictions", datum="MLLW", time_zone="lst", interval="hilo"):
-    """
-    Pulls tidal data from the NOAA CO-OPS API.
 
-    Args:
-        station_id (str): The 7-character NOAA tide station ID.
-        start_date (str): Start date in YYYYMMDD format.
-        end_date (str): End date in YYYYMMDD format.
-        product (str): Type of data (e.g., "predictions", "high_low").
-        datum (str): Tidal datum (e.g., "MLLW", "MSL").
-        time_zone (str): Time zone for data (e.g., "lst", "gmt").
-        interval (str): Interval for predictions (e.g., "hilo" for high/low, "h" for hourly).
+def make_station(station_id, name, lat, lon):
+    """Station dict with its local time zone looked up from the coordinates."""
+    return {'id': station_id, 'name': name, 'lat': lat, 'lon': lon,
+            'tz': get_station_timezone(lat, lon)}
 
-    Returns:
-        pandas.DataFrame: A DataFrame containing the tidal data, or None if an error occurs.
-    """
-    base_url = "https://api.tidesandcurrents.noaa.gov/api/prod/datagetter?"
-
-    params = {
-        "product": product,
-        "application": "PythonSharptownTideTracker",
-        "station": station_id,
-        "begin_date": start_date,
-        "end_date": end_date,
-        "datum": datum,
-        "units": "english",  # or "metric"
-        "time_zone": time_zone,
-        "interval": interval,
-        "format": "json"
-    }
 
-    try:
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()
-        data = response.json()
+def default_station():
+    return make_station(DEFAULT_STATION_ID, DEFAULT_STATION_NAME, DEFAULT_LATITUDE, DEFAULT_LONGITUDE)
 
-        if "predictions" in data:
-            df = pd.DataFrame(data["predictions"])
-            df['t'] = pd.to_datetime(df['t'], utc=False).dt.tz_localize(None)
-            df.rename(columns={'t': 'datetime', 'v': 'height_ft'}, inplace=True)
 
-            df['height_ft'] = pd.to_numeric(df['height_ft'], errors='coerce')
-            df.dropna(subset=['height_ft'], inplace=True)
+def station_from_zip(zip_code):
+    """Geocodes a ZIP code and returns the closest station, or raises ItemError."""
+    if OPENCAGE_API_KEY == "YOUR_OPENCAGE_API_KEY":
+        raise ItemError("OpenCage API key not set; can't look up ZIP codes")
+    target_lat, target_lon = get_coordinates_from_zip(zip_code)
+    if target_lat is None or target_lon is None:
+        raise ItemError(f"couldn't convert ZIP code {zip_code} to coordinates")
+    all_noaa_stations = get_noaa_tide_stations()
+    if all_noaa_stations is None:
+        raise ItemError("couldn't retrieve the NOAA station list")
+    found_id, found_name, found_lat, found_lon = find_closest_station(target_lat, target_lon, all_noaa_stations)
+    if not found_id:
+        raise ItemError(f"no station found near ZIP code {zip_code}")
+    return make_station(found_id, found_name, found_lat, found_lon)
 
-            if 'type' in df.columns:
-                df.rename(columns={'type': 'tide_type'}, inplace=True)
-                return df[['datetime', 'tide_type', 'height_ft']]
-            else:
-                df['tide_type'] = ''
-                return df[['datetime', 'tide_type', 'height_ft']]
-        elif "data" in data:
-            df = pd.DataFrame(data["data"])
-            df['t'] = pd.to_datetime(df['t'])
-            # --- NEW ROBUST FIX: Strip timezone information if it exists ---
-            if df['t'].dt.tz is not None:
-                df['t'] = df['t'].dt.tz_localize(None)
-            # --- END NEW ROBUST FIX ---
-            df.rename(columns={'t': 'datetime', 'v': 'height_ft'}, inplace=True)
-            df['height_ft'] = pd.to_numeric(df['height_ft'], errors='coerce')
-            df.dropna(subset=['height_ft'], inplace=True)
-            df['tide_type'] = ''
-            return df[['datetime', 'height_ft', 'tide_type']]
-        else:
-            print(f"No tidal data found for station {station_id} with the given parameters.")
-            print(f"API Response: {data}")
-            return None
-
-    except requests.exceptions.HTTPError as e:
-        print(f"HTTP Error: {e}")
-        print(f"Response content: {response.text}")
-        return None
-    except requests.exceptions.ConnectionError as e:
-        print(f"Connection Error: {e}")
-        return None
-    except requests.exceptions.Timeout as e:
-        print(f"Timeout Error: {e}")
-        return None
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred: {e}")
-        return None
-    except ValueError as e:
-        print(f"Error parsing JSON: {e}")
-        print(f"Response content: {response.text}")
-        return None
-
-def get_pirate_weather_report(api_key, latitude, longitude, time_unix=None, units="us"):
-    """
-    Pulls weather data from the Pirate Weather API.
-    If time_unix is provided, gets data for that specific time (historical/current).
-    If time_unix is None, gets the current forecast (including hourly/daily data).
-
-    Args:
-        api_key (str): Your Pirate Weather API key.
-        latitude (float): Latitude of the location.
-        longitude (float): Longitude of the location.
-        time_unix (int, optional): Unix timestamp for the desired weather report. Defaults to None.
-                                  If None, a general forecast including hourly/daily data is retrieved.
-        units (str): Units for the weather data (e.g., "us", "si", "ca", "uk").
 
-    Returns:
-        dict: A dictionary containing the weather data, or None if an error occurs.
-    """
-    if time_unix is None:
-        # This endpoint returns current, minutely, hourly, and daily data for the location
-        url = f"https://api.pirateweather.net/forecast/{api_key}/{latitude},{longitude}"
-        # We generally want hourly and daily, so exclude only minutely and flags
-        params = {"units": units, "exclude": "minutely,alerts,flags"}
-    else:
-        # This endpoint is for specific historical or very recent past/current time lookups.
-        # Future times with this specific timestamp endpoint cause the "Requested Time is in the Future" error.
-        url = f"https://api.pirateweather.net/forecast/{api_key}/{latitude},{longitude},{time_unix}"
-        # For a specific time, we primarily want the 'currently' block
-        params = {"units": units, "exclude": "minutely,hourly,daily,alerts,flags"}
-
-    try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        return data
-    except requests.exceptions.HTTPError as e:
-        print(f"Pirate Weather HTTP Error: {e}")
-        print(f"Pirate Weather Response content: {response.text}")
-        return None
-    except requests.exceptions.ConnectionError as e:
-        print(f"Pirate Weather Connection Error: {e}")
-        return None
-    except requests.exceptions.Timeout as e:
-        print(f"Pirate Weather Timeout Error: {e}")
-        return None
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred with Pirate Weather: {e}")
-        return None
-    except ValueError as e:
-        print(f"Error parsing Pirate Weather JSON: {e}")
-        print(f"Pirate Weather Response content: {response.text}")
-        return None
-
-# %%
-# --- Get High/Low Tide Predictions (for labeling points on graph and weather lookup) ---
-print(f"Fetching high/low tide predictions for {station_name} from {start_date_str} to {end_date_str}...")
-hilo_tide_predictions_df = get_tide_data(
-    station_id=your_station_id,
-    start_date=start_date_str,
-    end_date=end_date_str,
-    product="predictions",
-    datum="MLLW",
-    time_zone="lst",
-    interval="hilo"
-)
+def station_from_id(station_id):
+    """Looks a station up in the catalog; falls back to the bare ID (no weather) if it isn't there."""
+    if station_id == DEFAULT_STATION_ID:
+        return default_station()
+    all_noaa_stations = get_noaa_tide_stations()
+    found = all_noaa_stations.lookup(station_id) if all_noaa_stations is not None else None
+    if found is not None:
+        return make_station(*found)
+    return make_station(station_id, f"Station {station_id}", None, None)
 
-# --- Get Hourly Tide Predictions (not needed for text output, but keeping if you process it later) ---
-print(f"\nFetching hourly tide predictions for {station_name} from {start_date_str} to {end_date_str} (optional, for processing)...")
-hourly_predictions_df = get_tide_data(
-    station_id=your_station_id,
-    start_date=start_date_str,
-    end_date=end_date_str,
-    product="predictions",
-    datum="MLLW",
-    time_zone="lst",
-    interval="h"
-)
 
-# --- Safeguard: Ensure datetime columns are naive before localizing ---
-if hilo_tide_predictions_df is not None:
-    if hilo_tide_predictions_df['datetime'].dt.tz is not None:
-        print("DEBUG: hilo_tide_predictions_df 'datetime' column found to be tz-aware upon return. Stripping timezone.")
-        hilo_tide_predictions_df['datetime'] = hilo_tide_predictions_df['datetime'].dt.tz_localize(None)
-    hilo_tide_predictions_df['datetime'] = hilo_tide_predictions_df['datetime'].dt.tz_localize(LOCAL_TIMEZONE, ambiguous='infer', nonexistent='shift_forward')
+def resolve(kind, value):
+    return station_from_zip(value) if kind == "zip" else station_from_id(value)
 
 
-if hourly_predictions_df is not None:
-    if hourly_predictions_df['datetime'].dt.tz is not None:
-        print("DEBUG: hourly_predictions_df 'datetime' column found to be tz-aware upon return. Stripping timezone.")
-        hourly_predictions_df['datetime'] = hourly_predictions_df['datetime'].dt.tz_localize(None)
-    hourly_predictions_df['datetime'] = hourly_predictions_df['datetime'].dt.tz_localize(LOCAL_TIMEZONE, ambiguous='infer', nonexistent='shift_forward')
+# --- Fetching ---
 
+def date_range(tz, days):
+    """Returns (start, end) aware datetimes in `tz` covering today and the next `days` days."""
+    return local_day_window(tz, days + 1)
 
-# --- Process and Display Tide Predictions (Text Output) ---
-if hilo_tide_predictions_df is not None:
-    print(f"\n--- High and Low Tide Predictions for {station_name} ---")
-    print(hilo_tide_predictions_df.to_string(index=False))
 
-    current_time = datetime.now(LOCAL_TIMEZONE)
-    future_tides = hilo_tide_predictions_df[hilo_tide_predictions_df['datetime'] > current_time].copy()
+def fetch_station_data(station, days):
+    """
+    Fetches hourly and high/low predictions plus the hourly weather forecast for a station.
 
-    # --- Get Weather Reports for High Tides ---
-    print("\n--- Pirate Weather Reports for High Tides ---")
-    if PIRATE_WEATHER_API_KEY != "YOUR_PIRATE_WEATHER_API_KEY":
-        print("Fetching general Pirate Weather forecast for the period...")
-        general_weather_forecast = get_pirate_weather_report(
-            PIRATE_WEATHER_API_KEY,
-            sharptown_latitude,
-            sharptown_longitude,
-            time_unix=None
-        )
-
-        if general_weather_forecast and 'hourly' in general_weather_forecast and 'data' in general_weather_forecast['hourly']:
-            hourly_weather_data = general_weather_forecast['hourly']['data']
-            weather_df = pd.DataFrame(hourly_weather_data)
-            weather_df['time'] = pd.to_datetime(weather_df['time'], unit='s', utc=True)
-            weather_df['time'] = weather_df['time'].dt.tz_convert(LOCAL_TIMEZONE)
-
-            if not future_tides.empty:
-                high_tides_for_weather = future_tides[future_tides['tide_type'] == 'H']
-                if not high_tides_for_weather.empty:
-                    for index, row in high_tides_for_weather.iterrows():
-                        tide_time = row['datetime']
-
-                        closest_weather_idx = (weather_df['time'] - tide_time).abs().idxmin()
-                        closest_weather = weather_df.loc[closest_weather_idx]
-
-                        print(f"\nWeather at High Tide ({tide_time.strftime('%Y-%m-%d %I:%M %p %Z')}):")
-                        if abs(closest_weather['time'] - tide_time) <= timedelta(hours=1):
-                            print(f"  (Matched to forecast for {closest_weather['time'].strftime('%Y-%m-%d %I:%M %p %Z')})")
-                            print(f"  Summary: {closest_weather.get('summary', 'N/A')}")
-                            print(f"  Temperature: {closest_weather.get('temperature', 'N/A')}°F")
-                            print(f"  Feels Like: {closest_weather.get('apparentTemperature', 'N/A')}°F")
-                            print(f"  Precipitation Probability: {closest_weather.get('precipProbability', 'N/A') * 100:.0f}%")
-                            print(f"  Wind Speed: {closest_weather.get('windSpeed', 'N/A')} mph")
-                            print(f"  Humidity: {closest_weather.get('humidity', 'N/A') * 100:.0f}%")
-                            print(f"  Pressure: {closest_weather.get('pressure', 'N/A')} mb")
-                            print(f"  Dew Point: {closest_weather.get('dewPoint', 'N/A')}°F")
-                            print(f"  Visibility: {closest_weather.get('visibility', 'N/A')} miles")
-                        else:
-                            print(f"  No sufficiently close hourly forecast data found for this high tide.")
-                            print(f"  Closest forecast available is for {closest_weather['time'].strftime('%Y-%m-%d %I:%M %p %Z')}")
-
-                else:
-                    print("No future High Tides found to fetch weather for.")
-            else:
-                print("No future tides to fetch weather for.")
+    Returns:
+        tuple: (hourly_df, hilo_df, weather_df); weather_df is None if unavailable.
+    """
+    start, end = date_range(station['tz'], days)
+    start_date_str, end_date_str = gmt_date_range(start, end)
+    hourly_df, hilo_df = (
+        to_station_time(get_tide_data(
+            station['id'], start_date_str, end_date_str,
+            product="predictions", datum="MLLW", time_zone="gmt", interval=interval
+        ), station['tz'], start, end)
+        for interval in ("h", "hilo")
+    )
+
+    weather_df = None
+    if PIRATE_WEATHER_API_KEY != "YOUR_PIRATE_WEATHER_API_KEY" and station['lat'] is not None:
+        report = get_pirate_weather_report(station['lat'], station['lon'], time_unix=None)
+        weather_df = hourly_weather_dataframe(report, station['tz'])
+    return hourly_df, hilo_df, weather_df
+
+
+def tidy_frame(query, station, hourly_df, hilo_df, weather_df):
+    """Combines one station's tides and weather into rows with the TIDY_COLUMNS layout."""
+    frames = []
+    if hourly_df is not None:
+        frames.append(hourly_df.assign(event="hourly"))
+    if hilo_df is not None:
+        frames.append(hilo_df.assign(event=hilo_df['tide_type']))
+    if not frames:
+        raise ItemError(f"no tide predictions for station {station['id']}")
+
+    tides = pd.concat(frames, ignore_index=True)
+    tides['time_utc'] = tides['datetime'].dt.tz_convert('UTC')
+    tides = tides.sort_values('time_utc', kind='stable')
+
+    weather_columns = ['weather_summary', 'temp_f', 'precip_prob', 'wind_speed_mph', 'humidity_percent']
+    if weather_df is not None and not weather_df.empty:
+        weather = weather_df.reindex(columns=['datetime'] + weather_columns).copy()
+        weather['time_utc'] = weather['datetime'].dt.tz_convert('UTC')
+        weather = weather.drop(columns='datetime').sort_values('time_utc')
+        tides = pd.merge_asof(tides, weather, on='time_utc', direction='nearest',
+                              tolerance=WEATHER_MATCH_TOLERANCE)
+    else:
+        for column in weather_columns:
+            tides[column] = None
+
+    tides['time_local'] = tides['datetime'].map(lambda t: t.isoformat())
+    tides['query'] = query
+    tides['station_id'] = station['id']
+    tides['station_name'] = station['name']
+    tides['station_lat'] = station['lat']
+    tides['station_lon'] = station['lon']
+    out = tides[TIDY_COLUMNS].reset_index(drop=True)
+    for column in ('station_lat', 'station_lon', 'height_ft', 'temp_f', 'precip_prob', 'wind_speed_mph', 'humidity_percent'):
+        out[column] = pd.to_numeric(out[column], errors='coerce').astype('float64')
+    for column in ('query', 'station_id', 'station_name', 'event', 'weather_summary'):
+        out[column] = out[column].astype('object').where(out[column].notna(), None)
+    return out
+
+
+def process_item(kind, value, days):
+    """Resolves and fetches one batch item. Returns (tidy_df, station, seconds)."""
+    start = time.perf_counter()
+    station = resolve(kind, value)
+    hourly_df, hilo_df, weather_df = fetch_station_data(station, days)
+    frame = tidy_frame(f"{kind}:{value}", station, hourly_df, hilo_df, weather_df)
+    return frame, station, time.perf_counter() - start
+
+
+# --- Output ---
+
+class CsvSink:
+    def __init__(self, path):
+        self._file = open(path, "w", newline="")
+        self._header_written = False
+
+    def write(self, df):
+        df.to_csv(self._file, header=not self._header_written, index=False)
+        self._header_written = True
+        self._file.flush()
+
+    def close(self):
+        if not self._header_written:
+            pd.DataFrame(columns=TIDY_COLUMNS).to_csv(self._file, index=False)
+        self._file.close()
+
+
+class ParquetSink:
+    """Writes one row group per item, so nothing but the current item is held in memory."""
+
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow (pip install pyarrow), or use a .csv output.")
+        self._pa = pa
+        self._schema = pa.schema([
+            ("query", pa.string()), ("station_id", pa.string()), ("station_name", pa.string()),
+            ("station_lat", pa.float64()), ("station_lon", pa.float64()),
+            ("time_utc", pa.timestamp("us", tz="UTC")), ("time_local", pa.string()),
+            ("event", pa.string()), ("height_ft", pa.float64()),
+            ("weather_summary", pa.string()), ("temp_f", pa.float64()), ("precip_prob", pa.float64()),
+            ("wind_speed_mph", pa.float64()), ("humidity_percent", pa.float64()),
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, df):
+        table = self._pa.Table.from_pandas(df, schema=self._schema, preserve_index=False, safe=False)
+        self._writer.write_table(table)
+
+    def close(self):
+        self._writer.close()
+
+
+def open_sink(path, output_format):
+    output_format = output_format or ("parquet" if path.endswith((".parquet", ".pq")) else "csv")
+    return ParquetSink(path) if output_format == "parquet" else CsvSink(path)
+
+
+# --- Modes ---
+
+def run_batch(args):
+    items = parse_batch_file(args.batch)
+    if not items:
+        raise SystemExit(f"No items in {args.batch}")
+
+    sink = open_sink(args.output, args.format)
+    report_file = open(args.report, "w", newline="") if args.report else None
+    report = csv.writer(report_file) if report_file else None
+    if report:
+        report.writerow(["query", "status", "station_id", "rows", "seconds", "error"])
+
+    failures = 0
+    total_rows = 0
+    run_start = time.perf_counter()
+    # The services print debug lines; keep stdout clean unless asked for them
+    quiet = contextlib.redirect_stdout(open(os.devnull, "w")) if not args.verbose else contextlib.nullcontext()
+    with quiet, ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(process_item, kind, value, args.days): (kind, value) for kind, value in items}
+        for future in as_completed(futures):
+            kind, value = futures[future]
+            query = f"{kind}:{value}"
+            try:
+                frame, station, seconds = future.result()
+            except ItemError as e:
+                failures += 1
+                print(f"FAIL {query}: {e}", file=sys.stderr)
+                if report:
+                    report.writerow([query, "failed", "", 0, "", str(e)])
+                continue
+            except Exception as e: # Keep going; one bad item shouldn't sink the run
+                failures += 1
+                print(f"FAIL {query}: unexpected {type(e).__name__}: {e}", file=sys.stderr)
+                if report:
+                    report.writerow([query, "failed", "", 0, "", f"{type(e).__name__}: {e}"])
+                continue
+
+            sink.write(frame)
+            total_rows += len(frame)
+            print(f"OK   {query} -> {station['id']} {station['name']} ({len(frame)} rows, {seconds:.2f}s)", file=sys.stderr)
+            if report:
+                report.writerow([query, "ok", station['id'], len(frame), f"{seconds:.3f}", ""])
+
+    sink.close()
+    if report_file:
+        report_file.close()
+    elapsed = time.perf_counter() - run_start
+    print(f"Done: {len(items) - failures}/{len(items)} items, {total_rows} rows in {elapsed:.1f}s -> {args.output}",
+          file=sys.stderr)
+    return 1 if failures else 0
+
+
+def run_windows(args):
+    if args.batch:
+        items = parse_batch_file(args.batch)
+    elif args.zip:
+        items = [("zip", args.zip)]
+    else:
+        items = [("station", args.station or DEFAULT_STATION_ID)]
+
+    thresholds = {
+        'min_tide_ft': args.min_tide, 'max_tide_ft': args.max_tide,
+        'max_wind_mph': args.max_wind, 'max_precip_pct': args.max_precip,
+        'min_duration_minutes': args.min_duration,
+    }
+    quiet = contextlib.redirect_stdout(open(os.devnull, "w")) if not args.verbose else contextlib.nullcontext()
+    stations = []
+    failures = 0
+    with quiet:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            futures = [pool.submit(resolve, kind, value) for kind, value in items]
+            for (kind, value), future in zip(items, futures):
+                try:
+                    stations.append(future.result())
+                except Exception as e:
+                    failures += 1
+                    print(f"FAIL {kind}:{value}: {e}", file=sys.stderr)
+        start = time.perf_counter()
+        windows = query_windows(stations, args.days, max_workers=args.workers, **thresholds) if stations else []
+    print(f"{len(windows)} windows across {len(stations)} stations in {time.perf_counter() - start:.2f}s",
+          file=sys.stderr)
+
+    timezones = {station['id']: station['tz'] for station in stations}
+    rows = pd.DataFrame([{
+        'station_id': w['station_id'],
+        'station_name': w['station_name'],
+        'start_local': w['start'].astimezone(timezones[w['station_id']]).strftime('%Y-%m-%d %I:%M %p %Z'),
+        'end_local': w['end'].astimezone(timezones[w['station_id']]).strftime('%Y-%m-%d %I:%M %p %Z'),
+        'start_utc': w['start'],
+        'end_utc': w['end'],
+        'hours': round(w['duration_minutes'] / 60, 2),
+        'peak_tide_ft': round(w['peak_tide_ft'], 2),
+        'max_wind_mph': None if w['max_wind_mph'] is None else round(w['max_wind_mph'], 1),
+        'max_precip_pct': None if w['max_precip_pct'] is None else round(w['max_precip_pct'], 1),
+        'weather_checked': w['weather_checked'],
+    } for w in windows])
+
+    if args.output:
+        if (args.format or ("parquet" if args.output.endswith((".parquet", ".pq")) else "csv")) == "parquet":
+            rows.to_parquet(args.output, index=False)
         else:
-            print("Could not retrieve general weather forecast or hourly data from Pirate Weather.")
-            if general_weather_forecast:
-                print(f"Pirate Weather API Response (Partial): {list(general_weather_forecast.keys())}")
-            else:
-                print("General weather forecast retrieval failed.")
+            rows.to_csv(args.output, index=False)
+    elif rows.empty:
+        print("No times meet all of the conditions.")
     else:
-        print("Skipping Pirate Weather requests. Please provide your API key.")
+        print(rows.drop(columns=['start_utc', 'end_utc']).to_string(index=False))
+    return 1 if failures else 0
 
 
-    # --- Find and Display Next High/Low Tide (Text Output, after weather) ---
-    if not future_tides.empty:
-        if not future_tides[future_tides['tide_type'] == 'H'].empty:
-            next_high_tide = future_tides[future_tides['tide_type'] == 'H'].sort_values(by='datetime').iloc[0]
-            if pd.notna(next_high_tide['height_ft']):
-                print(f"\nNext High Tide: {next_high_tide['datetime'].strftime('%Y-%m-%d %I:%M %p %Z')} (Height: {next_high_tide['height_ft']:.2f} ft)")
-            else:
-                print(f"\nNext High Tide: {next_high_tide['datetime'].strftime('%Y-%m-%d %I:%M %p %Z')} (Height: N/A ft)")
-        else:
-            print("\nNo future High Tides found in the data.")
+def print_report(station, days):
+    """The original interactive output: hi/lo table, weather at high tides, next high/low tide."""
+    hourly_df, hilo_df, weather_df = fetch_station_data(station, days)
+    if hilo_df is None:
+        print("Failed to retrieve high/low tide data for text output.")
+        return 1
+
+    print(f"\n--- High and Low Tide Predictions for {station['name']} ---")
+    print(hilo_df.to_string(index=False))
+
+    current_time = datetime.now(timezone.utc)
+    future_tides = hilo_df[hilo_df['datetime'] > current_time]
 
-        if not future_tides[future_tides['tide_type'] == 'L'].empty:
-            next_low_tide = future_tides[future_tides['tide_type'] == 'L'].sort_values(by='datetime').iloc[0]
-            if pd.notna(next_low_tide['height_ft']):
-                print(f"Next Low Tide: {next_low_tide['datetime'].strftime('%Y-%m-%d %I:%M %p %Z')} (Height: {next_low_tide['height_ft']:.2f} ft)")
+    print("\n--- Pirate Weather Reports for High Tides ---")
+    if weather_df is None:
+        print("Could not retrieve general weather forecast or hourly data from Pirate Weather.")
+    else:
+        high_tides = future_tides[future_tides['tide_type'] == 'H']
+        if high_tides.empty:
+            print("No future High Tides found to fetch weather for.")
+        for _, row in high_tides.iterrows():
+            tide_time = row['datetime']
+            closest_weather = weather_df.loc[(weather_df['datetime'] - tide_time).abs().idxmin()]
+            print(f"\nWeather at High Tide ({tide_time.strftime('%Y-%m-%d %I:%M %p %Z')}):")
+            if abs(closest_weather['datetime'] - tide_time) <= timedelta(hours=1):
+                print(f"  (Matched to forecast for {closest_weather['datetime'].strftime('%Y-%m-%d %I:%M %p %Z')})")
+                print(f"  Summary: {closest_weather.get('weather_summary', 'N/A')}")
+                print(f"  Temperature: {closest_weather.get('temp_f', 'N/A')}°F")
+                print(f"  Feels Like: {closest_weather.get('feels_like_f', 'N/A')}°F")
+                print(f"  Precipitation Probability: {closest_weather.get('precip_prob', 0):.0f}%")
+                print(f"  Wind Speed: {closest_weather.get('wind_speed_mph', 'N/A')} mph")
+                print(f"  Humidity: {closest_weather.get('humidity_percent', 0):.0f}%")
+                print(f"  Pressure: {closest_weather.get('pressure_mb', 'N/A')} mb")
+                print(f"  Dew Point: {closest_weather.get('dew_point_f', 'N/A')}°F")
+                print(f"  Visibility: {closest_weather.get('visibility_miles', 'N/A')} miles")
             else:
-                print(f"Next Low Tide: {next_low_tide['datetime'].strftime('%Y-%m-%d %I:%M %p %Z')} (Height: N/A ft)")
-        else:
-            print("No future Low Tides found in the data.")
+                print(f"  No sufficiently close hourly forecast data found for this high tide.")
+
+    for tide_type, label in (('H', 'High'), ('L', 'Low')):
+        upcoming = future_tides[future_tides['tide_type'] == tide_type].sort_values(by='datetime')
+        if upcoming.empty:
+            print(f"No future {label} Tides found in the data.")
+            continue
+        next_tide = upcoming.iloc[0]
+        height = f"{next_tide['height_ft']:.2f}" if pd.notna(next_tide['height_ft']) else "N/A"
+        print(f"Next {label} Tide: {next_tide['datetime'].strftime('%Y-%m-%d %I:%M %p %Z')} (Height: {height} ft)")
+    return 0
+
+
+def run_single(args):
+    if args.station:
+        station = station_from_id(args.station)
     else:
-        print("\nNo future tide predictions available for the specified date range.")
-else:
-    print("Failed to retrieve high/low tide data for text output.")
-
+        zip_code = args.zip
+        if zip_code is None and OPENCAGE_API_KEY != "YOUR_OPENCAGE_API_KEY":
+            zip_code = input("Enter a ZIP code to find the closest tide station (e.g., 21871 for Sharptown, MD): ")
+        station = default_station()
+        if zip_code:
+            print(f"Searching for closest tide station to ZIP code {zip_code}...")
+            try:
+                station = station_from_zip(zip_code)
+                print(f"Closest station found: {station['name']} (ID: {station['id']}) at Lat: {station['lat']:.4f}, Lon: {station['lon']:.4f}")
+            except ItemError as e:
+                print(f"{e}. Using default Sharptown, MD station.")
+        else:
+            print("No ZIP code entered. Using default Sharptown, MD station.")
+    return print_report(station, args.days)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tide predictions and weather for a ZIP code or NOAA station.")
+    where = parser.add_mutually_exclusive_group()
+    where.add_argument("--zip", help="ZIP code to find the closest station to")
+    where.add_argument("--station", help="NOAA station ID")
+    where.add_argument("--batch", metavar="FILE", help="File of ZIP codes / station IDs to process together")
+    parser.add_argument("--days", type=int, default=2, help="Days after today to include (default: 2)")
+    parser.add_argument("--output", help="Batch output file (.csv or .parquet)")
+    parser.add_argument("--format", choices=("csv", "parquet"), help="Batch output format (default: from --output)")
+    parser.add_argument("--workers", type=int, default=8, help="Batch items processed concurrently (default: 8)")
+    parser.add_argument("--report", metavar="FILE", help="Write per-item status and timing to this CSV")
+    parser.add_argument("--verbose", action="store_true", help="Show the services' debug output in batch mode")
+    windows = parser.add_argument_group("good tide windows")
+    windows.add_argument("--min-tide", type=float, help="Tide at least this high (ft above MLLW)")
+    windows.add_argument("--max-tide", type=float, help="Tide no higher than this (ft above MLLW)")
+    windows.add_argument("--max-wind", type=float, help="Wind no faster than this (mph)")
+    windows.add_argument("--max-precip", type=float, help="Chance of rain no higher than this (%%)")
+    windows.add_argument("--min-duration", type=float, default=0, help="Only windows at least this long (minutes)")
+    args = parser.parse_args(argv)
+
+    if any(v is not None for v in (args.min_tide, args.max_tide, args.max_wind, args.max_precip)):
+        return run_windows(args)
+    if args.batch:
+        if not args.output:
+            parser.error("--batch needs --output")
+        return run_batch(args)
+    return run_single(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
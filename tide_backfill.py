@@ -0,0 +1,179 @@
+"""
+Historical backfill: past high tides paired with the weather at the time.
+
+    python tide_backfill.py --station 8571858 --start 2023-01-01 --end 2024-12-31 --store backfill/
+    python tide_backfill.py --batch marinas.txt --start 2024-01-01 --store backfill/ --workers 8
+    python tide_backfill.py --station 8571858 --start 2024-01-01 --source observed --lows --store obs/
+    python tide_backfill.py --store backfill/ --summary
+
+Each station's range is split into chunks of at most a month. A chunk's high tides
+(NOAA hi/lo predictions, or its verified observed highs/lows with --source observed)
+are fetched, then Pirate Weather's time machine is asked for the weather at each; one
+call returns a whole day's hourly weather, so it's about one call per station-day.
+Chunks run concurrently through the web app's services, sharing its per-provider rate
+limits and the host's daily quotas. Time-machine calls are non-essential, so they stop
+short of the reserve the site keeps for itself.
+
+Rows go to an append-only columnar store (see my_tide_app/backfill.py). Finished
+chunks are committed as they complete, so an interrupted run, or one that runs out of
+today's quota, picks up where it left off when started again with the same --store.
+
+Batch files use tidal_check.py's format: "zip:21871", "station:8571858", or a bare
+ZIP code / station ID per line.
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timezone
+
+from tidal_check import ItemError, parse_batch_file, resolve # Also puts my_tide_app on sys.path
+
+from config import PIRATE_WEATHER_API_KEY # noqa: E402
+from backfill import BackfillStore, ChunkFailed, QuotaExhausted, backfill_chunk, pending_chunks # noqa: E402
+from resilience import quota_usage # noqa: E402
+
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a YYYY-MM-DD date: {value}")
+
+
+def resolve_stations(args):
+    items = parse_batch_file(args.batch) if args.batch else [("station", s) for s in args.station]
+    stations = {}
+    for kind, value in items:
+        try:
+            station = resolve(kind, value)
+        except ItemError as e:
+            print(f"FAIL {kind}:{value}: {e}", file=sys.stderr)
+            continue
+        if station['lat'] is None:
+            print(f"FAIL {kind}:{value}: station {station['id']} isn't in the catalog; no coordinates for weather",
+                  file=sys.stderr)
+            continue
+        stations[station['id']] = station
+    return list(stations.values())
+
+
+def run_backfill(args):
+    if PIRATE_WEATHER_API_KEY == "YOUR_PIRATE_WEATHER_API_KEY":
+        raise SystemExit("Pirate Weather API key not set; nothing to pair the tides with.")
+    tide_types = ("H", "L") if args.lows else ("H",)
+    try:
+        store = BackfillStore(args.store, settings={"source": args.source, "tide_types": list(tide_types)})
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+    quiet = contextlib.redirect_stdout(open(os.devnull, "w")) if not args.verbose else contextlib.nullcontext()
+    with store, quiet:
+        stations = resolve_stations(args)
+        chunks = pending_chunks(store, stations, args.start, args.end or datetime.now(timezone.utc).date())
+        print(f"{len(chunks)} chunks to fetch for {len(stations)} stations ({len(store)} rows stored already).",
+              file=sys.stderr)
+
+        done = failed = rows = calls = 0
+        stopped = None
+        run_start = time.perf_counter()
+        pool = ThreadPoolExecutor(max_workers=args.workers)
+        try:
+            futures = {pool.submit(backfill_chunk, station, first_day, last_day, args.source, tide_types):
+                       (station, first_day, last_day) for station, first_day, last_day in chunks}
+            for future in as_completed(futures):
+                station, first_day, last_day = futures[future]
+                if future.cancelled():
+                    continue
+                label = f"{station['id']} {first_day}..{last_day}"
+                status = "OK  "
+                try:
+                    chunk_rows, chunk_calls = future.result()
+                except QuotaExhausted as e:
+                    if stopped is None:
+                        stopped = str(e)
+                        pool.shutdown(wait=False, cancel_futures=True)
+                    if e.partial is None:
+                        continue
+                    first_day, last_day, chunk_rows, chunk_calls = e.partial
+                    label = f"{station['id']} {first_day}..{last_day}"
+                    status = "PART"
+                except ChunkFailed as e:
+                    failed += 1
+                    print(f"FAIL {label}: {e}", file=sys.stderr)
+                    continue
+                except Exception as e: # Keep going; the chunk is retried on the next run
+                    failed += 1
+                    print(f"FAIL {label}: unexpected {type(e).__name__}: {e}", file=sys.stderr)
+                    continue
+                # Commits happen here, on one thread, as chunks finish in whatever order
+                store.append(station['id'], first_day, last_day, chunk_rows)
+                done += status == "OK  "
+                rows += len(chunk_rows['time'])
+                calls += chunk_calls
+                print(f"{status} {label}: {len(chunk_rows['time'])} tides, {chunk_calls} weather calls", file=sys.stderr)
+        except KeyboardInterrupt:
+            stopped = "interrupted"
+            pool.shutdown(wait=False, cancel_futures=True)
+        finally:
+            pool.shutdown(wait=True)
+
+    elapsed = time.perf_counter() - run_start
+    print(f"Done: {done}/{len(chunks)} chunks, {rows} rows, {calls} weather calls in {elapsed:.1f}s "
+          f"-> {args.store} ({len(store)} rows in total)", file=sys.stderr)
+    for upstream, (used, limit) in quota_usage().items():
+        print(f"  {upstream} quota: {used}/{limit} used today", file=sys.stderr)
+    if stopped:
+        print(f"Stopped early ({stopped}); run again to resume.", file=sys.stderr)
+        return 2
+    return 1 if failed else 0
+
+
+def print_summary(args):
+    try:
+        store = BackfillStore(args.store, readonly=True)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    df = store.to_dataframe()
+    print(f"{len(df)} rows, settings {store.manifest['settings']}")
+    if df.empty:
+        return 0
+    paired = df['weather_time'].notna()
+    summary = df.groupby('station', observed=True).agg(
+        first=('time', 'min'), last=('time', 'max'), tides=('time', 'size'),
+        paired=('weather_time', 'count'), mean_height_ft=('height_ft', 'mean'),
+        mean_wind_mph=('wind_speed_mph', 'mean'), mean_precip_pct=('precip_prob', 'mean'),
+    )
+    print(summary.round(2).to_string())
+    print(f"{paired.mean():.1%} of tides paired with weather")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill past tides paired with the weather at the time.")
+    parser.add_argument("--store", required=True, help="Backfill store directory (created if missing)")
+    where = parser.add_mutually_exclusive_group()
+    where.add_argument("--station", action="append", default=[], help="NOAA station ID (repeatable)")
+    where.add_argument("--batch", metavar="FILE", help="File of ZIP codes / station IDs")
+    parser.add_argument("--start", type=parse_date, help="First day (UTC, YYYY-MM-DD)")
+    parser.add_argument("--end", type=parse_date, help="Last day (UTC, YYYY-MM-DD; default: yesterday)")
+    parser.add_argument("--source", choices=("predictions", "observed"), default="predictions",
+                        help="Tide times from NOAA's predictions or its observed highs/lows (default: predictions)")
+    parser.add_argument("--lows", action="store_true", help="Pair low tides too")
+    parser.add_argument("--workers", type=int, default=4, help="Chunks fetched concurrently (default: 4)")
+    parser.add_argument("--summary", action="store_true", help="Summarize what the store holds and exit")
+    parser.add_argument("--verbose", action="store_true", help="Show the services' debug output")
+    args = parser.parse_args(argv)
+
+    if args.summary:
+        return print_summary(args)
+    if not (args.station or args.batch) or args.start is None:
+        parser.error("a backfill needs --station or --batch, and --start")
+    return run_backfill(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())